@@ -4,9 +4,10 @@ from flask_migrate import Migrate
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from app.config import config
+from app.utils.db_routing import RoutingSession
 import traceback
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 migrate = Migrate()
 jwt = JWTManager()
 
@@ -23,6 +24,10 @@ def create_app(config_name="default"):
     CORS(app, origins=app.config["CORS_ORIGINS"])
     jwt.init_app(app)
     
+    # Query count / DB time / pool wait per request (Server-Timing, /api/metrics/db)
+    from app.utils.db_metrics import init_db_metrics
+    init_db_metrics(app, db)
+    
     # Register blueprints
     from app.routes import (
         auth_bp,
@@ -32,6 +37,8 @@ def create_app(config_name="default"):
         orders_bp,
         reports_bp,
         sales_bp,
+        metrics_bp,
+        health_bp,
         supplier_bp,
     )
     
@@ -42,12 +49,18 @@ def create_app(config_name="default"):
     app.register_blueprint(orders_bp, url_prefix="/api/orders")
     app.register_blueprint(reports_bp, url_prefix="/api/reports")
     app.register_blueprint(sales_bp, url_prefix="/api/sales")
+    app.register_blueprint(metrics_bp, url_prefix="/api/metrics")
+    app.register_blueprint(health_bp, url_prefix="/api/health")
     app.register_blueprint(supplier_bp, url_prefix="/api/suppliers")
     
     # Register error handlers
     from app.utils.error_handlers import register_error_handlers
     register_error_handlers(app)
     
+    # CLI commands (flask rollups / stock-summary)
+    from app.commands import register_commands
+    register_commands(app)
+    
     @app.errorhandler(Exception)
     def handle_exception(e):
         """Global exception handler"""
@@ -0,0 +1,72 @@
+"""
+Flask CLI commands (``flask <group> <command>``)
+
+- flask rollups rebuild: dựng lại TongHopBanHang từ lịch sử hóa đơn
+  (sau migration tạo bảng hoặc khi nghi ngờ lệch số liệu).
+- flask stock-summary check: so TonKhoTongHop với LoSP, mã thoát 1 nếu lệch.
+- flask stock-summary rebuild: dựng lại TonKhoTongHop từ LoSP.
+"""
+
+import time
+
+import click
+from flask.cli import AppGroup
+
+rollups_cli = AppGroup('rollups', help='Sales rollup tables (TongHopBanHang)')
+stock_summary_cli = AppGroup('stock-summary', help='Stock summary per product/warehouse (TonKhoTongHop)')
+
+
+@rollups_cli.command('rebuild')
+def rebuild_rollups():
+    """Regenerate the hourly/daily sales rollups from invoice history"""
+    from app import db
+    from app.services import sales_rollup
+
+    started = time.perf_counter()
+    try:
+        written = sales_rollup.rebuild()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    for name, count in written.items():
+        click.echo(f"{name:30s} {count:>10d} rows")
+    click.echo(f"Rebuilt sales rollups in {time.perf_counter() - started:.1f}s")
+
+
+@stock_summary_cli.command('check')
+@click.option('--limit', default=50, show_default=True, help='Differences to print')
+def check_stock_summary(limit):
+    """Compare the stock summary with LoSP"""
+    from app.services import stock_summary
+
+    differences = stock_summary.check()
+    for diff in differences[:limit]:
+        click.echo(f"{diff['MaSP']:20s} {diff['MaKho'] or '-':20s} "
+                   f"expected={diff['expected']} actual={diff['actual']}")
+    if differences:
+        click.echo(f"{len(differences)} rows differ - run `flask stock-summary rebuild`")
+        raise SystemExit(1)
+    click.echo("Stock summary matches LoSP")
+
+
+@stock_summary_cli.command('rebuild')
+def rebuild_stock_summary():
+    """Regenerate the stock summary from LoSP"""
+    from app import db
+    from app.services import stock_summary
+
+    started = time.perf_counter()
+    try:
+        written = stock_summary.rebuild()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    click.echo(f"Rebuilt stock summary ({written} rows) in {time.perf_counter() - started:.1f}s")
+
+
+def register_commands(app):
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(stock_summary_cli)
@@ -23,6 +23,29 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = False
     
+    # Connection pool (applies to the primary and the replica)
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", 10)),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 20)),
+        "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", 30)),  # seconds to wait for a connection
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800)),  # seconds, below MySQL wait_timeout
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes"),
+    }
+    
+    # Per-request DB metrics (query count, DB time, pool wait)
+    DB_METRICS_ENABLED = os.getenv("DB_METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+    DB_METRICS_SERVER_TIMING = os.getenv("DB_METRICS_SERVER_TIMING", "true").lower() in ("1", "true", "yes")
+    
+    # @query_budget routes: raise when over budget (tests) or log a sampled warning
+    QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT", "false").lower() in ("1", "true", "yes")
+    QUERY_BUDGET_SAMPLE_RATE = float(os.getenv("QUERY_BUDGET_SAMPLE_RATE", 0.1))
+    
+    # Read replica for reports / read-only lists (see app.utils.db_routing)
+    REPLICA_DATABASE_URL = os.getenv("REPLICA_DATABASE_URL")
+    SQLALCHEMY_BINDS = {"replica": REPLICA_DATABASE_URL} if REPLICA_DATABASE_URL else {}
+    REPLICA_MAX_LAG = int(os.getenv("REPLICA_MAX_LAG", 5))  # seconds behind primary
+    REPLICA_CHECK_INTERVAL = int(os.getenv("REPLICA_CHECK_INTERVAL", 10))  # seconds
+    
     # JWT
     JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "jwt-secret-key-change-in-production")
     JWT_ACCESS_TOKEN_EXPIRES = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRES", 86400))  # 24 hours
@@ -37,6 +60,27 @@ class Config:
     DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", 20))
     MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 100))
     
+    # In-memory caches
+    WAREHOUSE_REGISTRY_TTL = int(os.getenv("WAREHOUSE_REGISTRY_TTL", 300))  # seconds, 0 = no expiry
+    BARCODE_INDEX_TTL = int(os.getenv("BARCODE_INDEX_TTL", 60))  # seconds, 0 = no expiry
+    PRODUCT_SEARCH_TTL = int(os.getenv("PRODUCT_SEARCH_TTL", 300))  # seconds, 0 = no expiry
+    PRODUCT_SEARCH_MAX_RESULTS = int(os.getenv("PRODUCT_SEARCH_MAX_RESULTS", 500))  # POS type-ahead candidates
+    INVOICE_CACHE_TTL = int(os.getenv("INVOICE_CACHE_TTL", 300))  # seconds, 0 = no expiry
+    INVOICE_CACHE_SIZE = int(os.getenv("INVOICE_CACHE_SIZE", 2000))  # cached invoice details
+    
+    # Document codes (HD, PXK, PNK...) reserved per worker at a time
+    ID_BLOCK_SIZE = int(os.getenv("ID_BLOCK_SIZE", 50))
+    
+    # EAN-13 barcodes for new batches: company prefix + item reference + check digit
+    BARCODE_COMPANY_PREFIX = os.getenv("BARCODE_COMPANY_PREFIX", "8930000")
+    BARCODE_BLOCK_SIZE = int(os.getenv("BARCODE_BLOCK_SIZE", 200))
+    
+    # Bulk goods receipt: lines per transaction
+    BULK_IMPORT_CHUNK_SIZE = int(os.getenv("BULK_IMPORT_CHUNK_SIZE", 500))
+    
+    # Warm-up before serving (wsgi.py)
+    WARMUP_POOL_CONNECTIONS = int(os.getenv("WARMUP_POOL_CONNECTIONS", 2))  # per worker and engine
+    
     # JSON
     JSON_AS_ASCII = False
     JSON_SORT_KEYS = False
@@ -63,11 +107,23 @@ class TestingConfig(Config):
     
     TESTING = True
     SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
+    SQLALCHEMY_ENGINE_OPTIONS = {}  # in-memory SQLite uses a single static connection
+    QUERY_BUDGET_STRICT = True
+
+
+class BenchmarkConfig(TestingConfig):
+    """Benchmark configuration (python -m benchmarks.run)"""
+    
+    TESTING = False  # errors are reported as 500 responses, not raised
+    SQLALCHEMY_DATABASE_URI = os.getenv("BENCHMARK_DATABASE_URL", "sqlite:///benchmark.sqlite")
+    QUERY_BUDGET_STRICT = False  # over-budget routes are reported, not failed
+    QUERY_BUDGET_SAMPLE_RATE = 0.0
 
 
 config = {
     "development": DevelopmentConfig,
     "production": ProductionConfig,
     "testing": TestingConfig,
+    "benchmark": BenchmarkConfig,
     "default": DevelopmentConfig,
 }
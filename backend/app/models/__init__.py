@@ -41,6 +41,32 @@ class TrangThaiDonHang(Enum):
     TU_CHOI = "Từ chối"
 
 
+class LoaiBienDong(Enum):
+    """Loại biến động tồn kho"""
+    TON_DAU = "Tồn đầu kỳ"
+    NHAP_KHO = "Nhập kho"
+    XUAT_KHO = "Xuất kho"
+    CHUYEN_DI = "Chuyển kho đi"
+    CHUYEN_DEN = "Chuyển kho đến"
+    BAN_HANG = "Bán hàng"
+    TRA_HANG = "Trả hàng"
+    DIEU_CHINH = "Điều chỉnh"
+    HUY_HANG = "Hủy hàng"
+
+
+class KyTongHop(Enum):
+    """Độ chi tiết thời gian của bảng tổng hợp bán hàng"""
+    GIO = "Giờ"
+    NGAY = "Ngày"
+
+
+class ChieuTongHop(Enum):
+    """Chiều tổng hợp bán hàng (Khoa là MaSP, MaNV thu ngân hoặc LoaiSP)"""
+    SAN_PHAM = "Sản phẩm"
+    THU_NGAN = "Thu ngân"
+    LOAI_SP = "Loại sản phẩm"
+
+
 # =============================================
 # NHÂN VIÊN
 # =============================================
@@ -363,6 +389,7 @@ class HoaDon(db.Model):
     NgayTao = db.Column(db.DateTime, default=datetime.utcnow)
     MaNVThuNgan = db.Column(db.String(20), db.ForeignKey("ThuNgan.MaNV"))
     MaYCTraHang = db.Column(db.String(20), db.ForeignKey("YeuCauTraHang.MaYC"))
+    TongTien = db.Column(db.Numeric(15, 2))  # Snapshot at sale time
     
     # Relationships
     thu_ngan = db.relationship("ThuNgan", back_populates="hoa_dons")
@@ -375,6 +402,7 @@ class HoaDon(db.Model):
             "NgayTao": self.NgayTao.isoformat() if self.NgayTao else None,
             "MaNVThuNgan": self.MaNVThuNgan,
             "MaYCTraHang": self.MaYCTraHang,
+            "TongTien": float(self.TongTien) if self.TongTien is not None else None,
         }
 
 
@@ -429,6 +457,98 @@ class LoSP(db.Model):
         }
 
 
+class BienDongKho(db.Model):
+    """Append-only stock movement ledger - see app.services.stock_ledger"""
+    __tablename__ = "BienDongKho"
+    
+    MaBienDong = db.Column(db.BigInteger().with_variant(db.Integer, "sqlite"), primary_key=True, autoincrement=True)
+    MaSP = db.Column(db.String(20), nullable=False)
+    MaLo = db.Column(db.String(20), nullable=False)
+    MaKho = db.Column(db.String(20))
+    Loai = db.Column(db.Enum(LoaiBienDong, values_callable=lambda x: [e.value for e in x]), nullable=False)
+    SoLuong = db.Column(db.Integer, nullable=False)  # signed: + into MaKho, - out of MaKho
+    MaPhieu = db.Column(db.String(20))  # PNK/PXK slip of the movement
+    MaThamChieu = db.Column(db.String(50))  # HD, PCK, PKK... behind the slip
+    ThoiGian = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    LyDo = db.Column(db.String(200))
+    
+    __table_args__ = (
+        db.Index("idx_biendong_lo", "MaSP", "MaLo", "ThoiGian"),
+        db.Index("idx_biendong_thoigian", "ThoiGian"),
+        db.Index("idx_biendong_kho_thoigian", "MaKho", "ThoiGian"),
+        db.Index("idx_biendong_loai_thoigian", "Loai", "ThoiGian"),
+        db.Index("idx_biendong_phieu", "MaPhieu"),
+    )
+    
+    def to_dict(self):
+        return {
+            "MaBienDong": self.MaBienDong,
+            "MaSP": self.MaSP,
+            "MaLo": self.MaLo,
+            "MaKho": self.MaKho,
+            "Loai": self.Loai.value if self.Loai else None,
+            "SoLuong": self.SoLuong,
+            "MaPhieu": self.MaPhieu,
+            "MaThamChieu": self.MaThamChieu,
+            "ThoiGian": self.ThoiGian.isoformat() if self.ThoiGian else None,
+            "LyDo": self.LyDo,
+        }
+
+
+class TongHopBanHang(db.Model):
+    """Hourly/daily sales rollup per product, cashier and category - see app.services.sales_rollup"""
+    __tablename__ = "TongHopBanHang"
+    
+    Ky = db.Column(db.Enum(KyTongHop, values_callable=lambda x: [e.value for e in x]), primary_key=True)
+    Chieu = db.Column(db.Enum(ChieuTongHop, values_callable=lambda x: [e.value for e in x]), primary_key=True)
+    ThoiDiem = db.Column(db.DateTime, primary_key=True)  # Start of the hour/day
+    Khoa = db.Column(db.String(100), primary_key=True)  # MaSP, MaNV or LoaiSP ('' if none)
+    SoHoaDon = db.Column(db.Integer, nullable=False, default=0)
+    SoLuong = db.Column(db.Integer, nullable=False, default=0)
+    DoanhThu = db.Column(db.Numeric(15, 2), nullable=False, default=0)
+    SoLuongTra = db.Column(db.Integer, nullable=False, default=0)
+    GiaTriTra = db.Column(db.Numeric(15, 2), nullable=False, default=0)
+    
+    __table_args__ = (
+        db.Index("idx_tonghop_khoa", "Ky", "Chieu", "Khoa", "ThoiDiem"),
+    )
+    
+    def to_dict(self):
+        return {
+            "Ky": self.Ky.value if self.Ky else None,
+            "Chieu": self.Chieu.value if self.Chieu else None,
+            "ThoiDiem": self.ThoiDiem.isoformat() if self.ThoiDiem else None,
+            "Khoa": self.Khoa,
+            "SoHoaDon": self.SoHoaDon,
+            "SoLuong": self.SoLuong,
+            "DoanhThu": float(self.DoanhThu) if self.DoanhThu is not None else 0,
+            "SoLuongTra": self.SoLuongTra,
+            "GiaTriTra": float(self.GiaTriTra) if self.GiaTriTra is not None else 0,
+        }
+
+
+class TonKhoTongHop(db.Model):
+    """Stock per product and warehouse, kept in step with LoSP - see app.services.stock_summary"""
+    __tablename__ = "TonKhoTongHop"
+
+    MaSP = db.Column(db.String(20), primary_key=True)
+    MaKho = db.Column(db.String(20), primary_key=True)  # '' for batches without a warehouse
+    SLTon = db.Column(db.Integer, nullable=False, default=0)
+    SoLo = db.Column(db.Integer, nullable=False, default=0)  # Batches in the warehouse (any stock)
+    HSDSomNhat = db.Column(db.Date)  # Earliest HSD among those batches
+    GiaTri = db.Column(db.Numeric(15, 2), nullable=False, default=0)  # SLTon × SanPham.GiaBan
+
+    def to_dict(self):
+        return {
+            "MaSP": self.MaSP,
+            "MaKho": self.MaKho or None,
+            "SLTon": self.SLTon,
+            "SoLo": self.SoLo,
+            "HSDSomNhat": self.HSDSomNhat.isoformat() if self.HSDSomNhat else None,
+            "GiaTri": float(self.GiaTri) if self.GiaTri is not None else 0,
+        }
+
+
 # =============================================
 # BẢNG QUAN HỆ
 # =============================================
@@ -541,6 +661,7 @@ class HoaDonSP(db.Model):
     MaSP = db.Column(db.String(20), db.ForeignKey("SanPham.MaSP"), primary_key=True)
     MaHD = db.Column(db.String(20), db.ForeignKey("HoaDon.MaHD"), primary_key=True)
     SoLuong = db.Column(db.Integer, nullable=False)
+    DonGia = db.Column(db.Numeric(15, 2))  # SanPham.GiaBan at sale time
     
     # Relationships
     san_pham = db.relationship("SanPham", back_populates="hoa_don_sps")
@@ -551,4 +672,17 @@ class HoaDonSP(db.Model):
             "MaSP": self.MaSP,
             "MaHD": self.MaHD,
             "SoLuong": self.SoLuong,
+            "DonGia": float(self.DonGia) if self.DonGia is not None else None,
         }
+
+
+# =============================================
+# BỘ ĐẾM MÃ CHỨNG TỪ
+# =============================================
+
+class BoDemMa(db.Model):
+    """Next free number per ID prefix (HD, PXK, PNK, ...) - see app.services.id_allocator"""
+    __tablename__ = "BoDemMa"
+    
+    TienTo = db.Column(db.String(10), primary_key=True)
+    GiaTriTiep = db.Column(db.BigInteger, nullable=False, default=1)
@@ -7,6 +7,8 @@ from app.routes.warehouse_inventory import warehouse_inventory_bp
 from app.routes.orders import orders_bp
 from app.routes.reports import reports_bp
 from app.routes.sales import sales_bp
+from app.routes.metrics import metrics_bp
+from app.routes.health import health_bp
 
 # Import các routes khác khi đã tạo
 # from app.routes.orders import order_bp
@@ -26,5 +28,7 @@ __all__ = [
     'orders_bp',
     'reports_bp',
     'sales_bp',
+    'metrics_bp',
+    'health_bp',
     'supplier_bp',
 ]
@@ -0,0 +1,24 @@
+"""
+Health check routes
+Liveness và readiness cho load balancer / orchestrator (xem app.utils.warmup)
+"""
+
+from flask import Blueprint
+from app.utils.helpers import success_response, error_response
+from app.utils.warmup import warmup_state
+
+health_bp = Blueprint('health', __name__)
+
+
+@health_bp.route('', methods=['GET'])
+def liveness():
+    """The process is up and serving requests"""
+    return success_response({'status': 'ok'})
+
+
+@health_bp.route('/ready', methods=['GET'])
+def readiness():
+    """Ready once warm-up has completed (503 before)"""
+    if not warmup_state.ready:
+        return error_response("Warm-up in progress", 503)
+    return success_response(warmup_state.stats())
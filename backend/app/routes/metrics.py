@@ -0,0 +1,39 @@
+"""
+Internal metrics routes
+Số liệu truy vấn DB theo endpoint (xem app.utils.db_metrics)
+"""
+
+from flask import Blueprint
+from flask_jwt_extended import jwt_required
+from app import db
+from app.utils.auth import role_required
+from app.utils.helpers import success_response
+from app.utils.db_metrics import db_metrics
+from app.utils.db_routing import replica_router
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('/db', methods=['GET'])
+@jwt_required()
+@role_required('Quản lý')
+def get_db_metrics():
+    """Per-endpoint query count, DB time and pool wait since start/reset"""
+    pools = {
+        (name or 'primary'): engine.pool.status()
+        for name, engine in db.engines.items()
+    }
+    return success_response({
+        'endpoints': db_metrics.stats(),
+        'pools': pools,
+        'replica': replica_router.stats() if replica_router.configured() else None,
+    })
+
+
+@metrics_bp.route('/db', methods=['DELETE'])
+@jwt_required()
+@role_required('Quản lý')
+def reset_db_metrics():
+    """Clear the per-endpoint aggregates"""
+    db_metrics.reset()
+    return success_response(message="DB metrics reset")
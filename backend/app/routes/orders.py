@@ -8,9 +8,12 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models import NhaCungCap, SanPham, NhanVienKho, DatHang
 from app import db
 from app.utils.auth import role_required
-from app.utils.helpers import success_response, error_response, generate_id
+from app.utils.helpers import success_response, error_response
+from app.utils.db_routing import read_replica
+from app.utils.db_metrics import query_budget
+from app.services import id_allocator, stock_summary
 from datetime import datetime
-from sqlalchemy import func, text
+from sqlalchemy import text
 import json
 
 orders_bp = Blueprint('orders', __name__)
@@ -47,6 +50,7 @@ def get_supplier(ten):
 
 @orders_bp.route('/suggest-order', methods=['GET'])
 @jwt_required()
+@query_budget(2)
 def suggest_order():
     """
     UC02: Gợi ý sản phẩm cần đặt dựa trên mức cảnh báo
@@ -54,16 +58,13 @@ def suggest_order():
     Response: List of products with stock below warning level
     """
     try:
-        from app.models import LoSP
-        
         products = SanPham.query.all()
+        # Total stock across all warehouses, per product (stock summary)
+        stock = stock_summary.totals()
         suggestions = []
         
         for product in products:
-            # Calculate total stock across all warehouses
-            total_stock = db.session.query(func.sum(LoSP.SLTon))\
-                .filter(LoSP.MaSP == product.MaSP)\
-                .scalar() or 0
+            total_stock = stock.get(product.MaSP) or 0
             
             # Check if below warning level
             if total_stock < product.MucCanhBaoDatHang:
@@ -160,7 +161,7 @@ def create_order():
             })
         
         # Generate order ID
-        ma_don_hang = generate_id('DH', 6)
+        ma_don_hang = id_allocator.next_id('DH')
         
         # Check if relationship exists
         existing_dat_hang = DatHang.query.filter_by(
@@ -223,6 +224,7 @@ def create_order():
 
 @orders_bp.route('/orders', methods=['GET'])
 @jwt_required()
+@read_replica
 def get_orders():
     """Get all purchase orders"""
     try:
@@ -470,6 +472,7 @@ def delete_order(ma_don_hang):
 
 @orders_bp.route('/orders/statistics', methods=['GET'])
 @jwt_required()
+@read_replica
 def get_order_statistics():
     """Get order statistics"""
     try:
@@ -5,14 +5,17 @@ from flask_jwt_extended import jwt_required
 from app.models import SanPham, LoSP
 from app import db
 from app.utils.auth import role_required
-from app.utils.helpers import success_response, error_response, paginate, generate_id
-from sqlalchemy import or_
+from app.utils.helpers import success_response, error_response, paginate
+from app.utils.db_routing import read_replica
+from app.utils.db_metrics import query_budget
+from app.services import product_search, id_allocator, stock_summary
 
 product_bp = Blueprint('products', __name__)
 
 
 @product_bp.route('', methods=['GET'])
 @jwt_required()
+@read_replica
 def get_products():
     """
     Get list of products with pagination and filtering
@@ -30,17 +33,38 @@ def get_products():
     loai = request.args.get('loai', '')
     trang_thai = request.args.get('trang_thai', '')
     
-    query = SanPham.query
-    
-    # Apply filters
+    # Search - ranked, accent-insensitive index
     if search:
-        query = query.filter(
-            or_(
-                SanPham.TenSP.contains(search),
-                SanPham.MaSP.contains(search)
-            )
+        page = max(1, page)
+        per_page = min(max(1, per_page), 100)
+        ranked, total = product_search.search(
+            search,
+            loai=loai or None,
+            trang_thai=trang_thai or None,
+            limit=page * per_page
         )
+        page_ids = ranked[(page - 1) * per_page:]
+        products = {}
+        if page_ids:
+            products = {
+                p.MaSP: p
+                for p in SanPham.query.filter(SanPham.MaSP.in_(page_ids)).all()
+            }
+        pages = (total + per_page - 1) // per_page
+        
+        return success_response({
+            'items': [products[ma_sp].to_dict() for ma_sp in page_ids if ma_sp in products],
+            'total': total,
+            'page': page,
+            'per_page': per_page,
+            'pages': pages,
+            'has_next': page < pages,
+            'has_prev': page > 1,
+        })
     
+    query = SanPham.query
+    
+    # Apply filters
     if loai:
         query = query.filter(SanPham.LoaiSP == loai)
     
@@ -99,10 +123,7 @@ def create_product():
     # Generate product code if not provided
     ma_sp = data.get('MaSP')
     if not ma_sp:
-        ma_sp = generate_id('SP', 4)
-        # Ensure uniqueness
-        while SanPham.query.get(ma_sp):
-            ma_sp = generate_id('SP', 4)
+        ma_sp = id_allocator.next_id('SP', 4)
     else:
         # Check if product code already exists
         if SanPham.query.get(ma_sp):
@@ -187,9 +208,8 @@ def delete_product(ma_sp):
     if not product:
         return error_response("Product not found", 404)
     
-    # Check if product has stock
-    batches = LoSP.query.filter_by(MaSP=ma_sp).all()
-    total_stock = sum(batch.SLTon for batch in batches)
+    # Check if product has stock (summary rows of the product)
+    total_stock = stock_summary.totals([ma_sp]).get(ma_sp) or 0
     
     if total_stock > 0:
         return error_response(
@@ -224,18 +244,20 @@ def get_categories():
 
 @product_bp.route('/low-stock', methods=['GET'])
 @jwt_required()
+@read_replica
+@query_budget(2)
 def get_low_stock_products():
     """
     Get products with stock below warning level
     Used for ordering suggestions
     """
-    # Query products and their total stock
+    # Query products and their total stock (stock summary)
     products = SanPham.query.all()
+    stock = stock_summary.totals()
     low_stock_products = []
     
     for product in products:
-        batches = LoSP.query.filter_by(MaSP=product.MaSP).all()
-        total_stock = sum(batch.SLTon for batch in batches)
+        total_stock = stock.get(product.MaSP) or 0
         
         if total_stock < product.MucCanhBaoDatHang:
             product_data = product.to_dict()
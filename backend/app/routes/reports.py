@@ -7,295 +7,66 @@ from flask import Blueprint, request, send_file
 from flask_jwt_extended import jwt_required
 from app.models import (
     SanPham, LoSP, KhoHang, PhieuNhapKho, PhieuXuatKho, 
-    PhieuChuyenKho, HoaDon, HoaDonSP, PhieuKiemKho, DatHang
+    PhieuChuyenKho, HoaDonSP, PhieuKiemKho, DatHang,
+    BienDongKho, LoaiBienDong, TonKhoTongHop
 )
 from app import db
 from app.utils.auth import role_required
 from app.utils.helpers import success_response, error_response
+from app.utils.db_routing import use_read_replica, release_read_replica
+from app.utils.db_metrics import query_budget
+from app.services.exporters import exporters
+from app.services import stock_ledger, sales_report
 from datetime import datetime, timedelta
-from sqlalchemy import func, and_, or_, text, desc
-import io
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.lib.units import cm
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+from sqlalchemy import func, and_, or_, desc
 
 reports_bp = Blueprint('reports', __name__)
 
-
-# =============================================
-# HELPER FUNCTIONS FOR EXPORT
-# =============================================
-
-def create_excel_inventory_report(data):
-    """Create Excel file for inventory report"""
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Báo cáo tồn kho"
-    
-    # Header style
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF", size=12)
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    
-    # Title
-    ws.merge_cells('A1:I1')
-    ws['A1'] = 'BÁO CÁO TỒN KHO'
-    ws['A1'].font = Font(bold=True, size=16)
-    ws['A1'].alignment = header_alignment
-    
-    # Date
-    ws.merge_cells('A2:I2')
-    ws['A2'] = f'Ngày tạo: {datetime.now().strftime("%d/%m/%Y %H:%M")}'
-    ws['A2'].alignment = header_alignment
-    
-    # Headers
-    headers = ['Mã kho', 'Mã SP', 'Tên sản phẩm', 'Loại', 'ĐVT', 'Số lô', 'Tồn kho', 'HSD gần nhất', 'Trạng thái']
-    ws.append([])  # Empty row
-    ws.append(headers)
-    
-    # Style headers
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=4, column=col_num)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = header_alignment
-    
-    # Data rows
-    for item in data['inventory']:
-        ws.append([
-            item['MaKho'],
-            item['MaSP'],
-            item['TenSP'],
-            item['LoaiSP'],
-            item['DVT'],
-            item['total_batches'],
-            item['total_stock'],
-            item['earliest_expiry'] or '',
-            item['status']
-        ])
-    
-    # Summary
-    ws.append([])
-    ws.append(['TỔNG KẾT'])
-    ws.append(['Tổng sản phẩm:', data['summary']['total_products']])
-    ws.append(['Tổng tồn kho:', data['summary']['total_stock']])
-    
-    # Auto-adjust column widths
-    for column in ws.columns:
-        max_length = 0
-        column = [cell for cell in column]
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(cell.value)
-            except:
-                pass
-        adjusted_width = (max_length + 2)
-        ws.column_dimensions[column[0].column_letter].width = adjusted_width
-    
-    # Save to bytes
-    excel_file = io.BytesIO()
-    wb.save(excel_file)
-    excel_file.seek(0)
-    return excel_file
+# Report queries run on the read replica when one is configured and healthy
+reports_bp.before_request(use_read_replica)
+reports_bp.teardown_request(release_read_replica)
 
 
-def create_excel_sales_report(data):
-    """Create Excel file for sales report"""
-    wb = Workbook()
-    
-    # Sheet 1: Summary
-    ws1 = wb.active
-    ws1.title = "Tổng quan"
-    
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    
-    ws1['A1'] = 'BÁO CÁO BÁN HÀNG'
-    ws1['A1'].font = Font(bold=True, size=16)
-    ws1.merge_cells('A1:D1')
-    
-    ws1['A2'] = f'Từ ngày: {data["period"]["from_date"]} đến {data["period"]["to_date"]}'
-    ws1.merge_cells('A2:D2')
-    
-    ws1.append([])
-    ws1.append(['Chỉ tiêu', 'Giá trị'])
-    ws1['A4'].fill = header_fill
-    ws1['A4'].font = header_font
-    ws1['B4'].fill = header_fill
-    ws1['B4'].font = header_font
-    
-    summary = data['summary']
-    ws1.append(['Tổng doanh thu', f"{summary['total_revenue']:,.0f} VNĐ"])
-    ws1.append(['Tổng số lượng', summary['total_quantity']])
-    ws1.append(['Số hóa đơn', summary['total_invoices']])
-    ws1.append(['TB doanh thu/ngày', f"{summary['average_revenue_per_day']:,.0f} VNĐ"])
-    ws1.append(['TB giá trị hóa đơn', f"{summary['average_invoice_value']:,.0f} VNĐ"])
-    
-    # Sheet 2: Daily Sales
-    if data.get('daily_sales'):
-        ws2 = wb.create_sheet(title="Theo ngày")
-        ws2.append(['Ngày', 'Doanh thu', 'Số lượng', 'Số hóa đơn'])
-        
-        for col_num in range(1, 5):
-            cell = ws2.cell(row=1, column=col_num)
-            cell.fill = header_fill
-            cell.font = header_font
-        
-        for sale in data['daily_sales']:
-            ws2.append([
-                sale['date'],
-                sale['total_revenue'],
-                sale['total_quantity'],
-                sale['total_invoices']
-            ])
-    
-    # Sheet 3: Top Products
-    if data.get('top_products'):
-        ws3 = wb.create_sheet(title="Sản phẩm bán chạy")
-        ws3.append(['#', 'Mã SP', 'Tên sản phẩm', 'Giá bán', 'Đã bán', 'Doanh thu'])
-        
-        for col_num in range(1, 7):
-            cell = ws3.cell(row=1, column=col_num)
-            cell.fill = header_fill
-            cell.font = header_font
-        
-        for idx, product in enumerate(data['top_products'], 1):
-            ws3.append([
-                idx,
-                product['MaSP'],
-                product['TenSP'],
-                product['GiaBan'],
-                product['total_quantity'],
-                product['total_revenue']
-            ])
-    
-    excel_file = io.BytesIO()
-    wb.save(excel_file)
-    excel_file.seek(0)
-    return excel_file
+def send_export(report, format_type, data, file_prefix):
+    """Render ``data`` with the registered exporter and send it as a download"""
+    buffer, mimetype, extension = exporters.export(report, format_type, data)
+    return send_file(
+        buffer,
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=f'{file_prefix}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+    )
 
 
-def create_excel_expiry_report(data):
-    """Create Excel file for expiry report"""
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Báo cáo HSD"
-    
-    header_fill = PatternFill(start_color="C00000", end_color="C00000", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    
-    ws['A1'] = 'BÁO CÁO HẠN SỬ DỤNG'
-    ws['A1'].font = Font(bold=True, size=16)
-    ws.merge_cells('A1:H1')
-    
-    ws['A2'] = f'Ngày tạo: {datetime.now().strftime("%d/%m/%Y %H:%M")}'
-    ws.merge_cells('A2:H2')
-    
-    # Summary
-    ws.append([])
-    ws.append(['Đã hết hạn:', data['summary']['total_expired'], 'Sắp hết hạn:', data['summary']['total_expiring']])
-    
-    # Expired items
-    if data['expired']:
-        ws.append([])
-        ws.append(['ĐÃ HẾT HẠN'])
-        ws.cell(row=ws.max_row, column=1).font = Font(bold=True, color="C00000", size=14)
-        
-        headers = ['Mã kho', 'Sản phẩm', 'Mã lô', 'Barcode', 'HSD', 'SL tồn', 'Quá hạn (ngày)']
-        ws.append(headers)
-        
-        for col_num in range(1, len(headers) + 1):
-            cell = ws.cell(row=ws.max_row, column=col_num)
-            cell.fill = header_fill
-            cell.font = header_font
-        
-        for item in data['expired']:
-            ws.append([
-                item['MaKho'],
-                item['TenSP'],
-                item['MaLo'],
-                item['MaVach'],
-                item['HSD'],
-                item['SLTon'],
-                abs(item['days_to_expiry'])
-            ])
-    
-    # Expiring soon
-    if data['expiring']:
-        ws.append([])
-        ws.append(['SẮP HẾT HẠN'])
-        ws.cell(row=ws.max_row, column=1).font = Font(bold=True, color="FF6600", size=14)
-        
-        headers = ['Mã kho', 'Sản phẩm', 'Mã lô', 'Barcode', 'HSD', 'SL tồn', 'Còn lại (ngày)']
-        ws.append(headers)
-        
-        header_fill2 = PatternFill(start_color="FF6600", end_color="FF6600", fill_type="solid")
-        for col_num in range(1, len(headers) + 1):
-            cell = ws.cell(row=ws.max_row, column=col_num)
-            cell.fill = header_fill2
-            cell.font = header_font
-        
-        for item in data['expiring']:
-            ws.append([
-                item['MaKho'],
-                item['TenSP'],
-                item['MaLo'],
-                item['MaVach'],
-                item['HSD'],
-                item['SLTon'],
-                item['days_to_expiry']
-            ])
-    
-    excel_file = io.BytesIO()
-    wb.save(excel_file)
-    excel_file.seek(0)
-    return excel_file
-
+# =============================================
+# UC08: BÁO CÁO TỒN KHO
+# =============================================
 
-def create_pdf_simple_report(title, data, headers, filename):
-    """Create a simple PDF report"""
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-    
-    # Title
-    p.setFont("Helvetica-Bold", 16)
-    p.drawString(100, height - 50, title)
-    
-    # Date
-    p.setFont("Helvetica", 10)
-    p.drawString(100, height - 70, f'Ngay tao: {datetime.now().strftime("%d/%m/%Y %H:%M")}')
+def _inventory_rows(ma_kho=None, ma_sp=None):
+    """Stock per warehouse and product, read from the stock summary"""
+    query = db.session.query(
+        TonKhoTongHop.MaKho,
+        TonKhoTongHop.MaSP,
+        SanPham.TenSP,
+        SanPham.LoaiSP,
+        SanPham.DVT,
+        TonKhoTongHop.SoLo.label('total_batches'),
+        TonKhoTongHop.SLTon.label('total_stock'),
+        TonKhoTongHop.HSDSomNhat.label('earliest_expiry'),
+        TonKhoTongHop.GiaTri.label('stock_value')
+    ).join(SanPham, TonKhoTongHop.MaSP == SanPham.MaSP)
     
-    # Note about Vietnamese characters
-    p.setFont("Helvetica", 8)
-    p.drawString(100, height - 85, '(Xuat Excel de xem day du tieng Viet)')
+    if ma_kho:
+        query = query.filter(TonKhoTongHop.MaKho == ma_kho)
+    if ma_sp:
+        query = query.filter(TonKhoTongHop.MaSP == ma_sp)
     
-    # Simple data display
-    y_position = height - 120
-    p.setFont("Helvetica", 10)
-    p.drawString(100, y_position, f'Total records: {len(data)}')
-    
-    p.showPage()
-    p.save()
-    
-    buffer.seek(0)
-    return buffer
+    return query.order_by(TonKhoTongHop.MaKho, TonKhoTongHop.MaSP).all()
 
 
-reports_bp = Blueprint('reports', __name__)
-
-
-# =============================================
-# UC08: BÁO CÁO TỒN KHO
-# =============================================
-
 @reports_bp.route('/inventory', methods=['GET'])
 @jwt_required()
+@query_budget(1)
 def get_inventory_report():
     """
     Báo cáo tồn kho theo kho, theo sản phẩm, theo lô
@@ -312,34 +83,7 @@ def get_inventory_report():
         from_date = request.args.get('from_date')
         to_date = request.args.get('to_date')
         
-        # Build query
-        query = db.session.query(
-            LoSP.MaKho,
-            LoSP.MaSP,
-            SanPham.TenSP,
-            SanPham.LoaiSP,
-            SanPham.DVT,
-            func.count(LoSP.MaLo).label('total_batches'),
-            func.sum(LoSP.SLTon).label('total_stock'),
-            func.min(LoSP.HSD).label('earliest_expiry')
-        ).join(SanPham, LoSP.MaSP == SanPham.MaSP)
-        
-        # Apply filters
-        if ma_kho:
-            query = query.filter(LoSP.MaKho == ma_kho)
-        if ma_sp:
-            query = query.filter(LoSP.MaSP == ma_sp)
-        
-        # Group by
-        query = query.group_by(
-            LoSP.MaKho, 
-            LoSP.MaSP, 
-            SanPham.TenSP, 
-            SanPham.LoaiSP, 
-            SanPham.DVT
-        )
-        
-        results = query.all()
+        results = _inventory_rows(ma_kho, ma_sp)
         
         # Format results
         inventory_data = []
@@ -352,13 +96,14 @@ def get_inventory_report():
                 days_to_expiry = (row.earliest_expiry - datetime.utcnow().date()).days
             
             inventory_data.append({
-                'MaKho': row.MaKho,
+                'MaKho': row.MaKho or None,
                 'MaSP': row.MaSP,
                 'TenSP': row.TenSP,
                 'LoaiSP': row.LoaiSP,
                 'DVT': row.DVT,
                 'total_batches': row.total_batches,
                 'total_stock': row.total_stock,
+                'stock_value': float(row.stock_value),
                 'earliest_expiry': row.earliest_expiry.isoformat() if row.earliest_expiry else None,
                 'days_to_expiry': days_to_expiry,
                 'status': 'critical' if days_to_expiry and days_to_expiry <= 7 else 'warning' if days_to_expiry and days_to_expiry <= 30 else 'normal'
@@ -389,10 +134,14 @@ def get_inventory_report():
 
 @reports_bp.route('/warehouse-movements', methods=['GET'])
 @jwt_required()
+@query_budget(2)
 def get_warehouse_movements():
     """
     Báo cáo xuất nhập tồn theo thời gian
     
+    Đọc sổ biến động (BienDongKho) theo khoảng thời gian: số lượng là số
+    lượng thực sự nhập/xuất của từng phiếu, không phải tồn hiện tại của lô.
+    
     Query params:
         - from_date: From date (required)
         - to_date: To date (required)
@@ -409,99 +158,64 @@ def get_warehouse_movements():
         from_date = datetime.strptime(from_date_str, '%Y-%m-%d')
         to_date = datetime.strptime(to_date_str, '%Y-%m-%d') + timedelta(days=1)
         
-        # Get imports
-        imports_query = db.session.query(
-            PhieuNhapKho.MaPhieu,
-            PhieuNhapKho.NgayTao,
-            PhieuNhapKho.MucDich,
-            LoSP.MaKho,
-            LoSP.MaSP,
-            SanPham.TenSP,
-            func.sum(LoSP.SLTon).label('SoLuong')
-        ).join(LoSP, PhieuNhapKho.MaPhieu == LoSP.MaPhieuNK)\
-         .join(SanPham, LoSP.MaSP == SanPham.MaSP)\
-         .filter(and_(
-             PhieuNhapKho.NgayTao >= from_date,
-             PhieuNhapKho.NgayTao < to_date
-         ))
-        
-        if ma_kho:
-            imports_query = imports_query.filter(LoSP.MaKho == ma_kho)
-        
-        imports_query = imports_query.group_by(
-            PhieuNhapKho.MaPhieu,
-            PhieuNhapKho.NgayTao,
-            PhieuNhapKho.MucDich,
-            LoSP.MaKho,
-            LoSP.MaSP,
-            SanPham.TenSP
+        # Movements per slip, warehouse and product (range scan on ThoiGian)
+        query = db.session.query(
+            BienDongKho.MaPhieu,
+            BienDongKho.MaKho,
+            BienDongKho.MaSP,
+            BienDongKho.Loai,
+            BienDongKho.LyDo,
+            func.min(BienDongKho.ThoiGian).label('NgayTao'),
+            func.sum(BienDongKho.SoLuong).label('SoLuong')
+        ).filter(
+            BienDongKho.ThoiGian >= from_date,
+            BienDongKho.ThoiGian < to_date,
+            BienDongKho.Loai != LoaiBienDong.TON_DAU
         )
         
-        imports = imports_query.all()
-        
-        # Get exports
-        exports_query = db.session.query(
-            PhieuXuatKho.MaPhieu,
-            PhieuXuatKho.NgayTao,
-            PhieuXuatKho.MucDich,
-            LoSP.MaKho,
-            LoSP.MaSP,
-            SanPham.TenSP,
-            func.sum(LoSP.SLTon).label('SoLuong')
-        ).join(LoSP, PhieuXuatKho.MaPhieu == LoSP.MaPhieuXK)\
-         .join(SanPham, LoSP.MaSP == SanPham.MaSP)\
-         .filter(and_(
-             PhieuXuatKho.NgayTao >= from_date,
-             PhieuXuatKho.NgayTao < to_date
-         ))
-        
         if ma_kho:
-            exports_query = exports_query.filter(LoSP.MaKho == ma_kho)
+            query = query.filter(BienDongKho.MaKho == ma_kho)
         
-        exports_query = exports_query.group_by(
-            PhieuXuatKho.MaPhieu,
-            PhieuXuatKho.NgayTao,
-            PhieuXuatKho.MucDich,
-            LoSP.MaKho,
-            LoSP.MaSP,
-            SanPham.TenSP
-        )
+        rows = query.group_by(
+            BienDongKho.MaPhieu,
+            BienDongKho.MaKho,
+            BienDongKho.MaSP,
+            BienDongKho.Loai,
+            BienDongKho.LyDo
+        ).order_by(func.min(BienDongKho.ThoiGian)).all()
         
-        exports = exports_query.all()
+        product_ids = {row.MaSP for row in rows}
+        names = dict(
+            db.session.query(SanPham.MaSP, SanPham.TenSP).filter(SanPham.MaSP.in_(product_ids))
+        ) if product_ids else {}
         
         # Format data
-        movements = {
-            'imports': [{
-                'MaPhieu': imp.MaPhieu,
-                'NgayTao': imp.NgayTao.isoformat(),
-                'MucDich': imp.MucDich,
-                'MaKho': imp.MaKho,
-                'MaSP': imp.MaSP,
-                'TenSP': imp.TenSP,
-                'SoLuong': imp.SoLuong,
-                'type': 'import'
-            } for imp in imports],
-            'exports': [{
-                'MaPhieu': exp.MaPhieu,
-                'NgayTao': exp.NgayTao.isoformat(),
-                'MucDich': exp.MucDich,
-                'MaKho': exp.MaKho,
-                'MaSP': exp.MaSP,
-                'TenSP': exp.TenSP,
-                'SoLuong': exp.SoLuong,
-                'type': 'export'
-            } for exp in exports]
-        }
+        movements = {'imports': [], 'exports': []}
+        for row in rows:
+            if not row.SoLuong:
+                continue
+            is_import = row.SoLuong > 0
+            movements['imports' if is_import else 'exports'].append({
+                'MaPhieu': row.MaPhieu,
+                'NgayTao': row.NgayTao.isoformat(),
+                'MucDich': row.LyDo,
+                'Loai': row.Loai.value,
+                'MaKho': row.MaKho,
+                'MaSP': row.MaSP,
+                'TenSP': names.get(row.MaSP),
+                'SoLuong': abs(row.SoLuong),
+                'type': 'import' if is_import else 'export'
+            })
         
         # Calculate summary
-        total_imported = sum(imp.SoLuong for imp in imports)
-        total_exported = sum(exp.SoLuong for exp in exports)
+        total_imported = sum(imp['SoLuong'] for imp in movements['imports'])
+        total_exported = sum(exp['SoLuong'] for exp in movements['exports'])
         
         return success_response({
             'movements': movements,
             'summary': {
-                'total_imports': len(imports),
-                'total_exports': len(exports),
+                'total_imports': len(movements['imports']),
+                'total_exports': len(movements['exports']),
                 'total_imported_quantity': total_imported,
                 'total_exported_quantity': total_exported,
                 'net_change': total_imported - total_exported
@@ -630,6 +344,7 @@ def get_expiry_report():
 
 @reports_bp.route('/sales', methods=['GET'])
 @jwt_required()
+@query_budget(2)
 def get_sales_report():
     """
     Báo cáo doanh thu bán hàng theo thời gian
@@ -646,98 +361,20 @@ def get_sales_report():
         
         if not from_date_str or not to_date_str:
             return error_response("from_date and to_date are required", 400)
+        if group_by not in sales_report.GROUP_BY:
+            return error_response("Invalid group_by. Use 'day', 'week' or 'month'", 400)
         
         from_date = datetime.strptime(from_date_str, '%Y-%m-%d')
         to_date = datetime.strptime(to_date_str, '%Y-%m-%d') + timedelta(days=1)
         
-        # Get sales data
-        query = db.session.query(
-            HoaDon.MaHD,
-            HoaDon.NgayTao,
-            HoaDonSP.MaSP,
-            SanPham.TenSP,
-            SanPham.GiaBan,
-            HoaDonSP.SoLuong,
-            (SanPham.GiaBan * HoaDonSP.SoLuong).label('ThanhTien')
-        ).join(HoaDonSP, HoaDon.MaHD == HoaDonSP.MaHD)\
-         .join(SanPham, HoaDonSP.MaSP == SanPham.MaSP)\
-         .filter(and_(
-             HoaDon.NgayTao >= from_date,
-             HoaDon.NgayTao < to_date
-         ))
-        
-        results = query.all()
-        
-        # Group data
-        sales_by_date = {}
-        product_sales = {}
-        
-        for row in results:
-            date_key = row.NgayTao.date().isoformat()
-            
-            # Group by date
-            if date_key not in sales_by_date:
-                sales_by_date[date_key] = {
-                    'date': date_key,
-                    'total_revenue': 0,
-                    'total_quantity': 0,
-                    'total_invoices': set()
-                }
-            
-            sales_by_date[date_key]['total_revenue'] += float(row.ThanhTien)
-            sales_by_date[date_key]['total_quantity'] += row.SoLuong
-            sales_by_date[date_key]['total_invoices'].add(row.MaHD)
-            
-            # Group by product
-            if row.MaSP not in product_sales:
-                product_sales[row.MaSP] = {
-                    'MaSP': row.MaSP,
-                    'TenSP': row.TenSP,
-                    'GiaBan': float(row.GiaBan),
-                    'total_quantity': 0,
-                    'total_revenue': 0
-                }
-            
-            product_sales[row.MaSP]['total_quantity'] += row.SoLuong
-            product_sales[row.MaSP]['total_revenue'] += float(row.ThanhTien)
-        
-        # Format daily sales
-        daily_sales = []
-        for date_key, data in sorted(sales_by_date.items()):
-            daily_sales.append({
-                'date': data['date'],
-                'total_revenue': data['total_revenue'],
-                'total_quantity': data['total_quantity'],
-                'total_invoices': len(data['total_invoices'])
-            })
-        
-        # Sort products by revenue
-        top_products = sorted(
-            product_sales.values(),
-            key=lambda x: x['total_revenue'],
-            reverse=True
-        )
+        # Periods and top products are grouped in the database
+        data = sales_report.build(from_date, to_date, group_by)
+        data['period'] = {
+            'from_date': from_date_str,
+            'to_date': to_date_str
+        }
         
-        # Calculate summary
-        total_revenue = sum(item['total_revenue'] for item in daily_sales)
-        total_quantity = sum(item['total_quantity'] for item in daily_sales)
-        total_invoices = len(set(row.MaHD for row in results))
-        
-        return success_response({
-            'daily_sales': daily_sales,
-            'top_products': top_products[:10],  # Top 10
-            'summary': {
-                'total_revenue': total_revenue,
-                'total_quantity': total_quantity,
-                'total_invoices': total_invoices,
-                'average_revenue_per_day': total_revenue / len(daily_sales) if daily_sales else 0,
-                'average_invoice_value': total_revenue / total_invoices if total_invoices > 0 else 0
-            },
-            'period': {
-                'from_date': from_date_str,
-                'to_date': to_date_str
-            }
-        })
+        return success_response(data)
         
     except Exception as e:
         print(f"Sales report error: {str(e)}")
@@ -752,10 +389,14 @@ def get_sales_report():
 
 @reports_bp.route('/batch-history', methods=['GET'])
 @jwt_required()
+@query_budget(3)
 def get_batch_history():
     """
     Lịch sử di chuyển của lô hàng
     
+    Toàn bộ dòng sổ biến động của lô theo thứ tự thời gian, kèm tồn sau mỗi
+    biến động (TonSau).
+    
     Query params:
         - ma_lo: Batch code (required)
         - ma_sp: Product code (required)
@@ -767,50 +408,30 @@ def get_batch_history():
         if not ma_lo or not ma_sp:
             return error_response("ma_lo and ma_sp are required", 400)
         
-        # Get batch info
-        batch = LoSP.query.filter_by(MaSP=ma_sp, MaLo=ma_lo).first()
+        # Get batch info (the timeline outlives deleted batches)
+        batch = db.session.get(LoSP, (ma_sp, ma_lo))
+        timeline = stock_ledger.batch_timeline(ma_sp, ma_lo)
         
-        if not batch:
+        if not batch and not timeline:
             return error_response("Batch not found", 404)
         
-        san_pham = SanPham.query.get(ma_sp)
-        
-        history = []
-        
-        # Import history
-        if batch.MaPhieuNK:
-            phieu_nhap = PhieuNhapKho.query.get(batch.MaPhieuNK)
-            if phieu_nhap:
-                history.append({
-                    'type': 'import',
-                    'date': phieu_nhap.NgayTao.isoformat(),
-                    'ma_phieu': phieu_nhap.MaPhieu,
-                    'muc_dich': phieu_nhap.MucDich,
-                    'ma_kho': batch.MaKho,
-                    'so_luong': batch.SLTon,
-                    'action': 'Nhập kho'
-                })
-        
-        # Export history
-        if batch.MaPhieuXK:
-            phieu_xuat = PhieuXuatKho.query.get(batch.MaPhieuXK)
-            if phieu_xuat:
-                history.append({
-                    'type': 'export',
-                    'date': phieu_xuat.NgayTao.isoformat(),
-                    'ma_phieu': phieu_xuat.MaPhieu,
-                    'muc_dich': phieu_xuat.MucDich,
-                    'ma_kho': batch.MaKho,
-                    'so_luong': batch.SLTon,
-                    'action': 'Xuất kho'
-                })
+        san_pham = db.session.get(SanPham, ma_sp)
         
-        # Sort by date
-        history.sort(key=lambda x: x['date'])
+        history = [{
+            'type': stock_ledger.TYPE_CODES[LoaiBienDong(row['Loai'])],
+            'date': row['ThoiGian'],
+            'ma_phieu': row['MaPhieu'],
+            'ma_tham_chieu': row['MaThamChieu'],
+            'muc_dich': row['LyDo'],
+            'ma_kho': row['MaKho'],
+            'so_luong': row['SoLuong'],
+            'ton_sau': row['TonSau'],
+            'action': row['Loai']
+        } for row in timeline]
         
         return success_response({
             'batch_info': {
-                **batch.to_dict(),
+                **(batch.to_dict() if batch else {'MaSP': ma_sp, 'MaLo': ma_lo}),
                 'product': san_pham.to_dict() if san_pham else None
             },
             'history': history,
@@ -837,22 +458,18 @@ def get_dashboard_statistics():
         total_products = SanPham.query.count()
         
         # Total stock
-        total_stock = db.session.query(func.sum(LoSP.SLTon)).scalar() or 0
-        
-        # Low stock products - Fixed SQL query
-        low_stock_query = text("""
-            SELECT COUNT(*) as count
-            FROM SanPham sp
-            INNER JOIN (
-                SELECT MaSP, SUM(SLTon) as total_stock
-                FROM LoSP
-                GROUP BY MaSP
-            ) AS stock_summary ON sp.MaSP = stock_summary.MaSP
-            WHERE stock_summary.total_stock < sp.MucCanhBaoDatHang
-        """)
-        
-        low_stock_result = db.session.execute(low_stock_query).fetchone()
-        low_stock_products = low_stock_result.count if low_stock_result else 0
+        total_stock = db.session.query(func.sum(TonKhoTongHop.SLTon)).scalar() or 0
+        
+        # Low stock products (products with batches, total below warning level)
+        stock = db.session.query(
+            TonKhoTongHop.MaSP,
+            func.sum(TonKhoTongHop.SLTon).label('total_stock')
+        ).group_by(TonKhoTongHop.MaSP).subquery()
+        low_stock_products = db.session.query(func.count())\
+            .select_from(SanPham)\
+            .join(stock, SanPham.MaSP == stock.c.MaSP)\
+            .filter(stock.c.total_stock < SanPham.MucCanhBaoDatHang)\
+            .scalar() or 0
         
         # Expired batches
         today = datetime.utcnow().date()
@@ -914,10 +531,14 @@ def get_dashboard_statistics():
 
 @reports_bp.route('/returns', methods=['GET'])
 @jwt_required()
+@query_budget(1)
 def get_returns_report():
     """
     Báo cáo trả hàng theo thời gian
     
+    Đọc các dòng "Trả hàng" của sổ biến động; giá trị trả tính theo đơn giá
+    trên hóa đơn (HoaDonSP.DonGia), thiếu thì theo giá bán hiện tại.
+    
     Query params:
         - from_date: From date (optional)
         - to_date: To date (optional)
@@ -926,32 +547,35 @@ def get_returns_report():
         from_date_str = request.args.get('from_date')
         to_date_str = request.args.get('to_date')
         
-        # Build query for returns (Phiếu nhập có mục đích trả hàng)
+        don_gia = func.coalesce(HoaDonSP.DonGia, SanPham.GiaBan)
         query = db.session.query(
-            PhieuNhapKho.MaPhieu,
-            PhieuNhapKho.NgayTao,
-            PhieuNhapKho.MucDich,
-            PhieuNhapKho.MaThamChieu,
-            LoSP.MaKho,
-            LoSP.MaSP,
-            LoSP.MaLo,
+            BienDongKho.MaPhieu,
+            BienDongKho.ThoiGian,
+            BienDongKho.LyDo,
+            BienDongKho.MaThamChieu,
+            BienDongKho.MaKho,
+            BienDongKho.MaSP,
+            BienDongKho.MaLo,
+            BienDongKho.SoLuong,
             SanPham.TenSP,
-            SanPham.GiaBan,
-            LoSP.SLTon
-        ).join(LoSP, PhieuNhapKho.MaPhieu == LoSP.MaPhieuNK)\
-         .join(SanPham, LoSP.MaSP == SanPham.MaSP)\
-         .filter(PhieuNhapKho.MucDich.like('%trả hàng%'))
+            don_gia.label('DonGia')
+        ).join(SanPham, BienDongKho.MaSP == SanPham.MaSP)\
+         .outerjoin(HoaDonSP, and_(
+             HoaDonSP.MaHD == BienDongKho.MaThamChieu,
+             HoaDonSP.MaSP == BienDongKho.MaSP
+         ))\
+         .filter(BienDongKho.Loai == LoaiBienDong.TRA_HANG)
         
         # Apply date filters
         if from_date_str:
             from_date = datetime.strptime(from_date_str, '%Y-%m-%d')
-            query = query.filter(PhieuNhapKho.NgayTao >= from_date)
+            query = query.filter(BienDongKho.ThoiGian >= from_date)
         
         if to_date_str:
             to_date = datetime.strptime(to_date_str, '%Y-%m-%d') + timedelta(days=1)
-            query = query.filter(PhieuNhapKho.NgayTao < to_date)
+            query = query.filter(BienDongKho.ThoiGian < to_date)
         
-        query = query.order_by(desc(PhieuNhapKho.NgayTao))
+        query = query.order_by(desc(BienDongKho.ThoiGian))
         
         results = query.all()
         
@@ -961,22 +585,22 @@ def get_returns_report():
         total_returned_value = 0
         
         for row in results:
-            returned_value = float(row.GiaBan * row.SLTon)
+            returned_value = float(row.DonGia * row.SoLuong)
             returns.append({
                 'MaPhieu': row.MaPhieu,
-                'NgayTao': row.NgayTao.isoformat(),
-                'MucDich': row.MucDich,
+                'NgayTao': row.ThoiGian.isoformat(),
+                'MucDich': row.LyDo,
                 'MaThamChieu': row.MaThamChieu,
                 'MaKho': row.MaKho,
                 'MaSP': row.MaSP,
                 'TenSP': row.TenSP,
                 'MaLo': row.MaLo,
-                'SoLuong': row.SLTon,
-                'GiaBan': float(row.GiaBan),
+                'SoLuong': row.SoLuong,
+                'GiaBan': float(row.DonGia),
                 'GiaTriTra': returned_value
             })
             
-            total_returned_quantity += row.SLTon
+            total_returned_quantity += row.SoLuong
             total_returned_value += returned_value
         
         return success_response({
@@ -1028,65 +652,39 @@ def get_warehouse_activities():
         
         activities = []
         
-        # Get imports
-        imports_query = PhieuNhapKho.query.filter(
-            and_(
-                PhieuNhapKho.NgayTao >= from_date,
-                PhieuNhapKho.NgayTao < to_date
-            )
+        # Imports / exports: ledger rows per slip (range scan on ThoiGian)
+        movements_query = db.session.query(
+            BienDongKho.MaPhieu,
+            BienDongKho.Loai,
+            func.min(BienDongKho.ThoiGian).label('NgayTao'),
+            func.min(BienDongKho.LyDo).label('MucDich'),
+            func.min(BienDongKho.MaThamChieu).label('MaThamChieu'),
+            func.min(BienDongKho.MaKho).label('MaKho'),
+            func.sum(BienDongKho.SoLuong).label('SoLuong'),
+            func.count().label('batches_count')
+        ).filter(
+            BienDongKho.ThoiGian >= from_date,
+            BienDongKho.ThoiGian < to_date,
+            BienDongKho.Loai != LoaiBienDong.TON_DAU
         )
         
-        for phieu in imports_query.all():
-            # Get batches for this import
-            batches = LoSP.query.filter_by(MaPhieuNK=phieu.MaPhieu)
-            
-            if ma_kho:
-                batches = batches.filter_by(MaKho=ma_kho)
-            
-            batches = batches.all()
-            
-            if batches:
-                total_quantity = sum(b.SLTon for b in batches)
-                activities.append({
-                    'type': 'import',
-                    'MaPhieu': phieu.MaPhieu,
-                    'NgayTao': phieu.NgayTao.isoformat(),
-                    'MucDich': phieu.MucDich,
-                    'MaThamChieu': phieu.MaThamChieu,
-                    'MaKho': batches[0].MaKho if batches else None,
-                    'total_quantity': total_quantity,
-                    'batches_count': len(batches)
-                })
-        
-        # Get exports
-        exports_query = PhieuXuatKho.query.filter(
-            and_(
-                PhieuXuatKho.NgayTao >= from_date,
-                PhieuXuatKho.NgayTao < to_date
-            )
-        )
+        if ma_kho:
+            movements_query = movements_query.filter(BienDongKho.MaKho == ma_kho)
         
-        for phieu in exports_query.all():
-            # Get batches for this export
-            batches = LoSP.query.filter_by(MaPhieuXK=phieu.MaPhieu)
-            
-            if ma_kho:
-                batches = batches.filter_by(MaKho=ma_kho)
-            
-            batches = batches.all()
-            
-            if batches:
-                total_quantity = sum(b.SLTon for b in batches)
-                activities.append({
-                    'type': 'export',
-                    'MaPhieu': phieu.MaPhieu,
-                    'NgayTao': phieu.NgayTao.isoformat(),
-                    'MucDich': phieu.MucDich,
-                    'MaThamChieu': phieu.MaThamChieu,
-                    'MaKho': batches[0].MaKho if batches else None,
-                    'total_quantity': total_quantity,
-                    'batches_count': len(batches)
-                })
+        for row in movements_query.group_by(BienDongKho.MaPhieu, BienDongKho.Loai).all():
+            if not row.SoLuong:
+                continue
+            activities.append({
+                'type': 'import' if row.SoLuong > 0 else 'export',
+                'Loai': row.Loai.value,
+                'MaPhieu': row.MaPhieu,
+                'NgayTao': row.NgayTao.isoformat(),
+                'MucDich': row.MucDich,
+                'MaThamChieu': row.MaThamChieu,
+                'MaKho': row.MaKho,
+                'total_quantity': abs(row.SoLuong),
+                'batches_count': row.batches_count
+            })
         
         # Get transfers
         transfers_query = PhieuChuyenKho.query.filter(
@@ -1257,6 +855,7 @@ def get_supplier_orders_report():
 
 @reports_bp.route('/top-products', methods=['GET'])
 @jwt_required()
+@query_budget(1)
 def get_top_products():
     """
     Báo cáo sản phẩm bán chạy
@@ -1282,47 +881,8 @@ def get_top_products():
         else:
             to_date = datetime.strptime(to_date_str, '%Y-%m-%d') + timedelta(days=1)
         
-        # Query top selling products
-        query = db.session.query(
-            SanPham.MaSP,
-            SanPham.TenSP,
-            SanPham.LoaiSP,
-            SanPham.DVT,
-            SanPham.GiaBan,
-            func.sum(HoaDonSP.SoLuong).label('total_quantity'),
-            func.count(HoaDonSP.MaHD).label('total_invoices'),
-            (func.sum(HoaDonSP.SoLuong) * SanPham.GiaBan).label('total_revenue')
-        ).join(HoaDonSP, SanPham.MaSP == HoaDonSP.MaSP)\
-         .join(HoaDon, HoaDonSP.MaHD == HoaDon.MaHD)\
-         .filter(and_(
-             HoaDon.NgayTao >= from_date,
-             HoaDon.NgayTao < to_date
-         ))\
-         .group_by(
-             SanPham.MaSP,
-             SanPham.TenSP,
-             SanPham.LoaiSP,
-             SanPham.DVT,
-             SanPham.GiaBan
-         )\
-         .order_by(desc('total_quantity'))\
-         .limit(limit)
-        
-        results = query.all()
-        
-        # Format results
-        top_products = []
-        for row in results:
-            top_products.append({
-                'MaSP': row.MaSP,
-                'TenSP': row.TenSP,
-                'LoaiSP': row.LoaiSP,
-                'DVT': row.DVT,
-                'GiaBan': float(row.GiaBan),
-                'total_quantity': row.total_quantity,
-                'total_invoices': row.total_invoices,
-                'total_revenue': float(row.total_revenue)
-            })
+        # Per-product rollup, product info attached to the top rows only
+        top_products = sales_report.top_products(from_date, to_date, limit, order_by='quantity')
         
         return success_response({
             'top_products': top_products,
@@ -1345,6 +905,7 @@ def get_top_products():
 
 @reports_bp.route('/stock-forecast', methods=['GET'])
 @jwt_required()
+@query_budget(2)
 def get_stock_forecast():
     """
     Dự báo thời gian hết hàng dựa trên tốc độ bán
@@ -1352,53 +913,42 @@ def get_stock_forecast():
     Query params:
         - ma_sp: Product code (optional)
         - days: Number of days to analyze sales velocity (default: 30)
+        - method: 'average', 'ewma', 'seasonal' (default: 'ewma')
+        - alpha: Smoothing factor for ewma/seasonal (default: 0.3)
+        - confidence: Band level 0.8, 0.9 or 0.95 (default: 0.8)
     """
     try:
+        # NumPy is imported on the first forecast, not at start-up
+        from app.services import forecast as forecast_engine
+        
         ma_sp = request.args.get('ma_sp')
         days = request.args.get('days', 30, type=int)
-        
-        # Calculate date range
-        to_date = datetime.utcnow()
-        from_date = to_date - timedelta(days=days)
-        
-        # Get products query
-        products_query = SanPham.query
-        if ma_sp:
-            products_query = products_query.filter_by(MaSP=ma_sp)
-        
-        products = products_query.all()
+        method = request.args.get('method', 'ewma')
+        alpha = request.args.get('alpha', 0.3, type=float)
+        confidence = request.args.get('confidence', 0.8, type=float)
+        
+        if days < 1 or days > 366:
+            return error_response("days must be between 1 and 366", 400)
+        if method not in forecast_engine.METHODS:
+            return error_response("Invalid method. Use 'average', 'ewma' or 'seasonal'", 400)
+        if not 0 < alpha <= 1:
+            return error_response("alpha must be in (0, 1]", 400)
+        if confidence not in forecast_engine.Z_SCORES:
+            return error_response("confidence must be 0.8, 0.9 or 0.95", 400)
+        
+        # Stock and the per-day sales matrix in two grouped queries,
+        # velocities for the whole catalog in NumPy
+        result = forecast_engine.forecast(ma_sp, days, method, alpha, confidence)
+        
+        def days_or_none(value):
+            return round(float(value), 1) if value != float('inf') else None
         
         forecasts = []
         
-        for product in products:
-            # Get current stock
-            current_stock = db.session.query(
-                func.sum(LoSP.SLTon)
-            ).filter_by(MaSP=product.MaSP).scalar() or 0
-            
-            if current_stock == 0:
-                continue
-            
-            # Get sales in the period
-            total_sold = db.session.query(
-                func.sum(HoaDonSP.SoLuong)
-            ).join(HoaDon, HoaDonSP.MaHD == HoaDon.MaHD)\
-             .filter(
-                 and_(
-                     HoaDonSP.MaSP == product.MaSP,
-                     HoaDon.NgayTao >= from_date,
-                     HoaDon.NgayTao < to_date
-                 )
-             ).scalar() or 0
-            
-            # Calculate daily average
-            daily_average = total_sold / days if days > 0 else 0
-            
-            # Calculate days until out of stock
-            if daily_average > 0:
-                days_until_out = current_stock / daily_average
-            else:
-                days_until_out = None
+        for i, product in enumerate(result['products']):
+            current_stock = int(result['current_stock'][i])
+            daily_average = float(result['daily_velocity'][i])
+            days_until_out = days_or_none(result['days_until_out'][i])
             
             # Calculate suggested order quantity
             suggested_order = max(0, product.MucCanhBaoDatHang - current_stock)
@@ -1409,7 +959,11 @@ def get_stock_forecast():
                 'LoaiSP': product.LoaiSP,
                 'current_stock': current_stock,
                 'daily_average_sales': round(daily_average, 2),
-                'days_until_out_of_stock': round(days_until_out, 1) if days_until_out else None,
+                'days_until_out_of_stock': days_until_out,
+                'confidence_band': {
+                    'earliest': days_or_none(result['earliest'][i]),
+                    'latest': days_or_none(result['latest'][i])
+                },
                 'reorder_level': product.MucCanhBaoDatHang,
                 'suggested_order_quantity': suggested_order,
                 'needs_reorder': current_stock < product.MucCanhBaoDatHang,
@@ -1425,10 +979,16 @@ def get_stock_forecast():
         return success_response({
             'forecasts': forecasts,
             'analysis_period': {
-                'from_date': from_date.date().isoformat(),
-                'to_date': to_date.date().isoformat(),
+                'from_date': result['from_date'].isoformat(),
+                'to_date': result['to_date'].isoformat(),
                 'days': days
             },
+            'model': {
+                'method': method,
+                'alpha': alpha if method != 'average' else None,
+                'seasonal': result['seasonal'],
+                'confidence': confidence
+            },
             'summary': {
                 'total_products': len(forecasts),
                 'critical_products': sum(1 for f in forecasts if f['urgency'] == 'critical'),
@@ -1460,32 +1020,14 @@ def export_inventory_report():
     """
     try:
         format_type = request.args.get('format', 'excel').lower()
+        if not exporters.supports('inventory', format_type):
+            return error_response("Invalid format. Use 'excel' or 'pdf'", 400)
         
         # Get report data (reuse existing function logic)
         ma_kho = request.args.get('ma_kho')
         ma_sp = request.args.get('ma_sp')
         
-        query = db.session.query(
-            LoSP.MaKho,
-            LoSP.MaSP,
-            SanPham.TenSP,
-            SanPham.LoaiSP,
-            SanPham.DVT,
-            func.count(LoSP.MaLo).label('total_batches'),
-            func.sum(LoSP.SLTon).label('total_stock'),
-            func.min(LoSP.HSD).label('earliest_expiry')
-        ).join(SanPham, LoSP.MaSP == SanPham.MaSP)
-        
-        if ma_kho:
-            query = query.filter(LoSP.MaKho == ma_kho)
-        if ma_sp:
-            query = query.filter(LoSP.MaSP == ma_sp)
-        
-        query = query.group_by(
-            LoSP.MaKho, LoSP.MaSP, SanPham.TenSP, SanPham.LoaiSP, SanPham.DVT
-        )
-        
-        results = query.all()
+        results = _inventory_rows(ma_kho, ma_sp)
         
         inventory_data = []
         total_stock = 0
@@ -1497,13 +1039,14 @@ def export_inventory_report():
                 days_to_expiry = (row.earliest_expiry - datetime.utcnow().date()).days
             
             inventory_data.append({
-                'MaKho': row.MaKho,
+                'MaKho': row.MaKho or None,
                 'MaSP': row.MaSP,
                 'TenSP': row.TenSP,
                 'LoaiSP': row.LoaiSP,
                 'DVT': row.DVT,
                 'total_batches': row.total_batches,
                 'total_stock': row.total_stock,
+                'stock_value': float(row.stock_value),
                 'earliest_expiry': row.earliest_expiry.isoformat() if row.earliest_expiry else None,
                 'days_to_expiry': days_to_expiry,
                 'status': 'critical' if days_to_expiry and days_to_expiry <= 7 else 'warning' if days_to_expiry and days_to_expiry <= 30 else 'normal'
@@ -1521,29 +1064,7 @@ def export_inventory_report():
             }
         }
         
-        if format_type == 'excel':
-            excel_file = create_excel_inventory_report(data)
-            return send_file(
-                excel_file,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                as_attachment=True,
-                download_name=f'bao_cao_ton_kho_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-            )
-        elif format_type == 'pdf':
-            pdf_file = create_pdf_simple_report(
-                'BAO CAO TON KHO',
-                inventory_data,
-                ['MaKho', 'MaSP', 'TenSP'],
-                'inventory'
-            )
-            return send_file(
-                pdf_file,
-                mimetype='application/pdf',
-                as_attachment=True,
-                download_name=f'bao_cao_ton_kho_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
-            )
-        else:
-            return error_response("Invalid format. Use 'excel' or 'pdf'", 400)
+        return send_export('inventory', format_type, data, 'bao_cao_ton_kho')
             
     except Exception as e:
         print(f"Export inventory error: {str(e)}")
@@ -1554,6 +1075,7 @@ def export_inventory_report():
 
 @reports_bp.route('/export/sales', methods=['GET'])
 @jwt_required()
+@query_budget(2)
 def export_sales_report():
     """
     Export sales report to Excel or PDF
@@ -1562,124 +1084,31 @@ def export_sales_report():
         - format: 'excel' or 'pdf' (default: 'excel')
         - from_date: From date (required)
         - to_date: To date (required)
+        - group_by: 'day', 'week', 'month' (default: 'day')
     """
     try:
         format_type = request.args.get('format', 'excel').lower()
+        if not exporters.supports('sales', format_type):
+            return error_response("Invalid format. Use 'excel' or 'pdf'", 400)
         from_date_str = request.args.get('from_date')
         to_date_str = request.args.get('to_date')
+        group_by = request.args.get('group_by', 'day')
         
         if not from_date_str or not to_date_str:
             return error_response("from_date and to_date are required", 400)
+        if group_by not in sales_report.GROUP_BY:
+            return error_response("Invalid group_by. Use 'day', 'week' or 'month'", 400)
         
         from_date = datetime.strptime(from_date_str, '%Y-%m-%d')
         to_date = datetime.strptime(to_date_str, '%Y-%m-%d') + timedelta(days=1)
         
-        # Get sales data
-        query = db.session.query(
-            HoaDon.MaHD,
-            HoaDon.NgayTao,
-            HoaDonSP.MaSP,
-            SanPham.TenSP,
-            SanPham.GiaBan,
-            HoaDonSP.SoLuong,
-            (SanPham.GiaBan * HoaDonSP.SoLuong).label('ThanhTien')
-        ).join(HoaDonSP, HoaDon.MaHD == HoaDonSP.MaHD)\
-         .join(SanPham, HoaDonSP.MaSP == SanPham.MaSP)\
-         .filter(and_(
-             HoaDon.NgayTao >= from_date,
-             HoaDon.NgayTao < to_date
-         ))
-        
-        results = query.all()
-        
-        sales_by_date = {}
-        product_sales = {}
-        
-        for row in results:
-            date_key = row.NgayTao.date().isoformat()
-            
-            if date_key not in sales_by_date:
-                sales_by_date[date_key] = {
-                    'date': date_key,
-                    'total_revenue': 0,
-                    'total_quantity': 0,
-                    'total_invoices': set()
-                }
-            
-            sales_by_date[date_key]['total_revenue'] += float(row.ThanhTien)
-            sales_by_date[date_key]['total_quantity'] += row.SoLuong
-            sales_by_date[date_key]['total_invoices'].add(row.MaHD)
-            
-            if row.MaSP not in product_sales:
-                product_sales[row.MaSP] = {
-                    'MaSP': row.MaSP,
-                    'TenSP': row.TenSP,
-                    'GiaBan': float(row.GiaBan),
-                    'total_quantity': 0,
-                    'total_revenue': 0
-                }
-            
-            product_sales[row.MaSP]['total_quantity'] += row.SoLuong
-            product_sales[row.MaSP]['total_revenue'] += float(row.ThanhTien)
-        
-        daily_sales = []
-        for date_key, data in sorted(sales_by_date.items()):
-            daily_sales.append({
-                'date': data['date'],
-                'total_revenue': data['total_revenue'],
-                'total_quantity': data['total_quantity'],
-                'total_invoices': len(data['total_invoices'])
-            })
-        
-        top_products = sorted(
-            product_sales.values(),
-            key=lambda x: x['total_revenue'],
-            reverse=True
-        )[:10]
-        
-        total_revenue = sum(item['total_revenue'] for item in daily_sales)
-        total_quantity = sum(item['total_quantity'] for item in daily_sales)
-        total_invoices = len(set(row.MaHD for row in results))
-        
-        data = {
-            'daily_sales': daily_sales,
-            'top_products': top_products,
-            'summary': {
-                'total_revenue': total_revenue,
-                'total_quantity': total_quantity,
-                'total_invoices': total_invoices,
-                'average_revenue_per_day': total_revenue / len(daily_sales) if daily_sales else 0,
-                'average_invoice_value': total_revenue / total_invoices if total_invoices > 0 else 0
-            },
-            'period': {
-                'from_date': from_date_str,
-                'to_date': to_date_str
-            }
+        data = sales_report.build(from_date, to_date, group_by)
+        data['period'] = {
+            'from_date': from_date_str,
+            'to_date': to_date_str
         }
         
-        if format_type == 'excel':
-            excel_file = create_excel_sales_report(data)
-            return send_file(
-                excel_file,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                as_attachment=True,
-                download_name=f'bao_cao_ban_hang_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-            )
-        elif format_type == 'pdf':
-            pdf_file = create_pdf_simple_report(
-                'BAO CAO BAN HANG',
-                daily_sales,
-                ['date', 'total_revenue'],
-                'sales'
-            )
-            return send_file(
-                pdf_file,
-                mimetype='application/pdf',
-                as_attachment=True,
-                download_name=f'bao_cao_ban_hang_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
-            )
-        else:
-            return error_response("Invalid format. Use 'excel' or 'pdf'", 400)
+        return send_export('sales', format_type, data, 'bao_cao_ban_hang')
             
     except Exception as e:
         print(f"Export sales error: {str(e)}")
@@ -1702,6 +1131,8 @@ def export_expiry_report():
     """
     try:
         format_type = request.args.get('format', 'excel').lower()
+        if not exporters.supports('expiry', format_type):
+            return error_response("Invalid format. Use 'excel' or 'pdf'", 400)
         days = request.args.get('days', 30, type=int)
         ma_kho = request.args.get('ma_kho')
         status_filter = request.args.get('status', 'all')
@@ -1780,30 +1211,7 @@ def export_expiry_report():
             }
         }
         
-        if format_type == 'excel':
-            excel_file = create_excel_expiry_report(data)
-            return send_file(
-                excel_file,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                as_attachment=True,
-                download_name=f'bao_cao_han_su_dung_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-            )
-        elif format_type == 'pdf':
-            all_items = expired + expiring
-            pdf_file = create_pdf_simple_report(
-                'BAO CAO HAN SU DUNG',
-                all_items,
-                ['MaKho', 'TenSP', 'HSD'],
-                'expiry'
-            )
-            return send_file(
-                pdf_file,
-                mimetype='application/pdf',
-                as_attachment=True,
-                download_name=f'bao_cao_han_su_dung_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
-            )
-        else:
-            return error_response("Invalid format. Use 'excel' or 'pdf'", 400)
+        return send_export('expiry', format_type, data, 'bao_cao_han_su_dung')
             
     except Exception as e:
         print(f"Export expiry error: {str(e)}")
@@ -1,15 +1,26 @@
 """Sales routes (UC11: Mua hàng - Point of Sale)"""
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from app.models import (
-    HoaDon, HoaDonSP, SanPham, LoSP, KhoHang, 
+    HoaDon, HoaDonSP, SanPham, LoSP,
     PhieuXuatKho, PhieuNhapKho, ThuNgan, NhanVienKho,
-    YeuCauTraHang, XuLyTraHang
+    YeuCauTraHang, XuLyTraHang, LoaiBienDong, TongHopBanHang, ChieuTongHop,
+    TonKhoTongHop
 )
 from app import db
-from app.utils.helpers import success_response, error_response, paginate, generate_id
-from sqlalchemy import and_, or_, func
+from app.utils.helpers import (
+    success_response, error_response, paginate,
+    encode_cursor, decode_cursor
+)
+from app.utils.db_routing import read_replica
+from app.services import (
+    warehouse_registry, barcode_index, product_search, invoice_cache, id_allocator,
+    InsufficientStockError, decrement_batches, increment_batches, allocate_fefo,
+    sales_rollup
+)
+from sqlalchemy import and_, or_, func, insert, tuple_
+from sqlalchemy.orm import selectinload, joinedload
 from datetime import datetime, date, timedelta
 
 sales_bp = Blueprint('sales', __name__)
@@ -26,72 +37,174 @@ def search_products():
         - barcode: Tìm theo mã vạch
         - page: Trang (default: 1)
         - per_page: Số items/trang (default: 20)
+        - cursor: Phân trang keyset - truyền rỗng cho trang đầu, sau đó
+          truyền next_cursor của trang trước (thay cho page)
+        - count: exact | estimate | none - cách tính total
+          (default: exact khi dùng page, none khi dùng cursor)
+    
+    Không có search: sắp xếp theo (TenSP, MaSP). Có search: theo độ khớp.
     """
     search = request.args.get('search', '')
     barcode = request.args.get('barcode', '')
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 20, type=int)
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = min(
+        max(1, request.args.get('per_page', 20, type=int)),
+        current_app.config.get('MAX_PAGE_SIZE', 100)
+    )
+    use_cursor = 'cursor' in request.args
+    count_mode = request.args.get('count', 'none' if use_cursor else 'exact')
+    
+    if count_mode not in ('exact', 'estimate', 'none'):
+        return error_response("count phải là exact, estimate hoặc none", 400)
+    
+    try:
+        position = decode_cursor(request.args.get('cursor')) if use_cursor else None
+    except ValueError:
+        return error_response("Cursor không hợp lệ", 400)
+    position = position or {}
+    if not isinstance(position, dict) \
+            or not isinstance(position.get('o', 0), int) \
+            or (position.get('k') is not None and len(position['k']) != 2):
+        return error_response("Cursor không hợp lệ", 400)
+    
+    def build_response(items, total, next_cursor, total_is_estimate=False):
+        result_items = []
+        for product, total_stock in items:
+            product_dict = product.to_dict()
+            product_dict['total_stock'] = int(total_stock) if total_stock else 0
+            result_items.append(product_dict)
+        
+        if use_cursor:
+            return success_response({
+                'items': result_items,
+                'per_page': per_page,
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None,
+                'total': total,
+                'total_is_estimate': total_is_estimate
+            })
+        
+        return success_response({
+            'items': result_items,
+            'total': total,
+            'page': page,
+            'per_page': per_page,
+            'pages': (total + per_page - 1) // per_page if total is not None else None,
+            'has_more': next_cursor is not None,
+            'total_is_estimate': total_is_estimate
+        })
     
     try:
-        # Get "Kho thường" warehouse
-        kho_thuong = KhoHang.query.filter_by(Loai='Kho thường').first()
-        if not kho_thuong:
+        # Get "Kho thường" warehouses (resolved in memory)
+        kho_thuong_ids = warehouse_registry.normal_ids()
+        if not kho_thuong_ids:
             return error_response("Không tìm thấy Kho thường", 404)
         
-        # Base query - products with stock in Kho thường
-        query = db.session.query(
-            SanPham,
-            func.sum(LoSP.SLTon).label('total_stock')
-        ).join(
-            LoSP, SanPham.MaSP == LoSP.MaSP
-        ).filter(
-            LoSP.MaKho == kho_thuong.MaKho,
-            LoSP.SLTon > 0,
-            SanPham.TrangThai == 'Còn hàng'
+        # Stock summary rows with stock in Kho thường
+        in_stock = and_(
+            TonKhoTongHop.MaKho.in_(kho_thuong_ids),
+            TonKhoTongHop.SLTon > 0
         )
         
+        def stock_of(ma_sp_list):
+            """Total stock per product (primary-key reads of the stock summary)"""
+            if not ma_sp_list:
+                return {}
+            return dict(
+                db.session.query(TonKhoTongHop.MaSP, func.sum(TonKhoTongHop.SLTon))
+                .filter(TonKhoTongHop.MaSP.in_(ma_sp_list), in_stock)
+                .group_by(TonKhoTongHop.MaSP)
+                .all()
+            )
+        
         # Search by barcode
+        barcode_ma_sp = None
         if barcode:
-            lo = LoSP.query.filter_by(MaVach=barcode).first()
-            if lo:
-                query = query.filter(SanPham.MaSP == lo.MaSP)
-            else:
-                return success_response({
-                    'items': [],
-                    'total': 0,
-                    'page': page,
-                    'per_page': per_page,
-                    'pages': 0
-                })
+            batch, _ = barcode_index.lookup(barcode)
+            if not batch:
+                return build_response([], 0, None)
+            barcode_ma_sp = batch['MaSP']
         
-        # Search by name or code
+        # Search by name or code - ranked, accent-insensitive index
         if search:
-            query = query.filter(
-                or_(
-                    SanPham.TenSP.contains(search),
-                    SanPham.MaSP.contains(search)
-                )
+            candidates, _ = product_search.search(
+                search,
+                trang_thai='Còn hàng',
+                limit=current_app.config.get('PRODUCT_SEARCH_MAX_RESULTS', 500)
             )
+            if barcode_ma_sp:
+                candidates = [ma_sp for ma_sp in candidates if ma_sp == barcode_ma_sp]
+            
+            # Keep rank order, drop products without stock
+            stock = stock_of(candidates)
+            ranked = [ma_sp for ma_sp in candidates if ma_sp in stock]
+            
+            # Cursor = position in the ranked list
+            offset = (page - 1) * per_page
+            if use_cursor:
+                offset = max(0, position.get('o', 0))
+            page_ids = ranked[offset:offset + per_page]
+            
+            products = {}
+            if page_ids:
+                products = {
+                    p.MaSP: p
+                    for p in SanPham.query.filter(SanPham.MaSP.in_(page_ids)).all()
+                }
+            items = [(products[ma_sp], stock[ma_sp]) for ma_sp in page_ids if ma_sp in products]
+            
+            next_cursor = None
+            if offset + per_page < len(ranked):
+                next_cursor = encode_cursor({'o': offset + per_page})
+            total = len(ranked) if count_mode != 'none' else None
+            
+            return build_response(items, total, next_cursor)
         
-        query = query.group_by(SanPham.MaSP)
+        # Browse - products with stock, ordered by (TenSP, MaSP)
+        query = SanPham.query.filter(
+            SanPham.TrangThai == 'Còn hàng',
+            db.session.query(TonKhoTongHop.MaSP).filter(TonKhoTongHop.MaSP == SanPham.MaSP, in_stock).exists()
+        )
+        if barcode_ma_sp:
+            query = query.filter(SanPham.MaSP == barcode_ma_sp)
+        
+        # Total
+        total = None
+        total_is_estimate = False
+        if count_mode == 'exact':
+            total = query.order_by(None).count()
+        elif count_mode == 'estimate':
+            # Sellable catalog size from the in-memory index (ignores stock)
+            total = 1 if barcode_ma_sp else product_search.count(trang_thai='Còn hàng')
+            total_is_estimate = True
+        
+        # Keyset: rows strictly after the last (TenSP, MaSP) of the previous page
+        if use_cursor:
+            key = position.get('k')
+            if key:
+                ten_sp, ma_sp = key
+                query = query.filter(or_(
+                    SanPham.TenSP > ten_sp,
+                    and_(SanPham.TenSP == ten_sp, SanPham.MaSP > ma_sp)
+                ))
+            query = query.order_by(SanPham.TenSP, SanPham.MaSP)
+        else:
+            query = query.order_by(SanPham.TenSP, SanPham.MaSP)\
+                .offset((page - 1) * per_page)
         
-        # Paginate
-        total = query.count()
-        items = query.offset((page - 1) * per_page).limit(per_page).all()
+        products = query.limit(per_page + 1).all()
+        has_more = len(products) > per_page
+        products = products[:per_page]
         
-        result_items = []
-        for product, total_stock in items:
-            product_dict = product.to_dict()
-            product_dict['total_stock'] = int(total_stock) if total_stock else 0
-            result_items.append(product_dict)
+        stock = stock_of([p.MaSP for p in products])
+        items = [(p, stock.get(p.MaSP, 0)) for p in products]
         
-        return success_response({
-            'items': result_items,
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'pages': (total + per_page - 1) // per_page
-        })
+        next_cursor = None
+        if has_more:
+            last = products[-1]
+            next_cursor = encode_cursor({'k': [last.TenSP, last.MaSP]})
+        
+        return build_response(items, total, next_cursor, total_is_estimate)
         
     except Exception as e:
         return error_response(f"Lỗi tìm kiếm sản phẩm: {str(e)}", 500)
@@ -110,14 +223,14 @@ def get_product_batches_fefo(ma_sp):
             return error_response("Không tìm thấy sản phẩm", 404)
         
         # Get Kho thường
-        kho_thuong = KhoHang.query.filter_by(Loai='Kho thường').first()
-        if not kho_thuong:
+        kho_thuong_ids = warehouse_registry.normal_ids()
+        if not kho_thuong_ids:
             return error_response("Không tìm thấy Kho thường", 404)
         
         # Get batches with stock, sorted by HSD (FEFO)
         batches = LoSP.query.filter(
             LoSP.MaSP == ma_sp,
-            LoSP.MaKho == kho_thuong.MaKho,
+            LoSP.MaKho.in_(kho_thuong_ids),
             LoSP.SLTon > 0
         ).order_by(LoSP.HSD.asc()).all()
         
@@ -169,38 +282,35 @@ def scan_barcode():
         return error_response("Barcode là bắt buộc", 400)
     
     try:
-        # Find batch by barcode
-        batch = LoSP.query.filter_by(MaVach=barcode).first()
+        # Find batch by barcode (in-memory index, DB fallback)
+        batch, product = barcode_index.lookup(barcode)
         
         if not batch:
             return error_response("Không tìm thấy sản phẩm với mã vạch này", 404)
         
         # Check if batch is in Kho thường
-        kho_thuong = KhoHang.query.filter_by(Loai='Kho thường').first()
-        if not kho_thuong or batch.MaKho != kho_thuong.MaKho:
+        if batch['MaKho'] not in warehouse_registry.normal_ids():
             return error_response("Sản phẩm không có sẵn tại Kho thường", 400)
         
         # Check stock
-        if batch.SLTon <= 0:
+        if batch['SLTon'] <= 0:
             return error_response("Sản phẩm đã hết hàng", 400)
         
-        # Get product info
-        product = SanPham.query.get(batch.MaSP)
         if not product:
             return error_response("Không tìm thấy thông tin sản phẩm", 404)
         
         # Check expiry
         expiry_warning = None
-        if batch.HSD:
-            days_to_expire = (batch.HSD - date.today()).days
+        if batch['HSD']:
+            days_to_expire = (date.fromisoformat(batch['HSD']) - date.today()).days
             if days_to_expire < 0:
                 expiry_warning = "Sản phẩm đã hết hạn sử dụng"
             elif days_to_expire <= 7:
                 expiry_warning = f"Sản phẩm sắp hết hạn (còn {days_to_expire} ngày)"
         
         return success_response({
-            'product': product.to_dict(),
-            'batch': batch.to_dict(),
+            'product': product,
+            'batch': batch,
             'expiry_warning': expiry_warning
         })
         
@@ -227,12 +337,15 @@ def create_invoice():
             "items": [
                 {
                     "MaSP": "string",
-                    "MaLo": "string",
+                    "MaLo": "string" (optional - bỏ trống để hệ thống tự phân bổ lô FEFO),
                     "MaVach": "string" (optional),
                     "SoLuong": int
                 }
             ]
         }
+    
+    Dòng không có MaLo được phân bổ vào các lô còn hạn ở Kho thường theo HSD
+    gần nhất, có thể tách thành nhiều lô; kết quả trả về trong "allocation".
     """
     data = request.get_json()
     items = data.get('items', [])
@@ -254,33 +367,58 @@ def create_invoice():
             return error_response("Không tìm thấy thông tin Thu Ngân", 404)
         
         # Get Kho thường
-        kho_thuong = KhoHang.query.filter_by(Loai='Kho thường').first()
-        if not kho_thuong:
+        kho_thuong_ids = warehouse_registry.normal_ids()
+        if not kho_thuong_ids:
             return error_response("Không tìm thấy Kho thường", 404)
         
-        # Validate all items first
-        validated_items = []
-        total_amount = 0
-        
+        # Parse items - gộp các dòng trùng lô (quét cùng mã vạch nhiều lần)
+        quantities = {}        # (MaSP, MaLo) -> SoLuong, lô do thu ngân chọn
+        fefo_quantities = {}   # MaSP -> SoLuong, hệ thống tự chọn lô
         for item in items:
             ma_sp = item.get('MaSP')
             ma_lo = item.get('MaLo')
             so_luong = item.get('SoLuong', 0)
             
-            if not ma_sp or not ma_lo or so_luong <= 0:
+            if not ma_sp or so_luong <= 0:
                 return error_response(f"Thông tin sản phẩm {ma_sp} không hợp lệ", 400)
             
-            # Check product exists
-            product = SanPham.query.get(ma_sp)
+            if ma_lo:
+                quantities[(ma_sp, ma_lo)] = quantities.get((ma_sp, ma_lo), 0) + so_luong
+            else:
+                fefo_quantities[ma_sp] = fefo_quantities.get(ma_sp, 0) + so_luong
+        
+        # Load all products and batches of the basket (one IN query each)
+        ma_sp_list = {ma_sp for ma_sp, _ in quantities} | set(fefo_quantities)
+        products = {
+            p.MaSP: p
+            for p in SanPham.query.filter(SanPham.MaSP.in_(ma_sp_list)).all()
+        }
+        batches = {}
+        if quantities:
+            batches = {
+                (b.MaSP, b.MaLo): b
+                for b in LoSP.query.filter(tuple_(LoSP.MaSP, LoSP.MaLo).in_(list(quantities))).all()
+            }
+        
+        # Validate all items in memory
+        validated_items = []
+        total_amount = 0
+        today = date.today()
+        
+        for ma_sp in fefo_quantities:
+            if ma_sp not in products:
+                return error_response(f"Không tìm thấy sản phẩm {ma_sp}", 404)
+        
+        for (ma_sp, ma_lo), so_luong in quantities.items():
+            product = products.get(ma_sp)
             if not product:
                 return error_response(f"Không tìm thấy sản phẩm {ma_sp}", 404)
             
-            # Check batch exists and has enough stock
-            batch = LoSP.query.filter_by(MaSP=ma_sp, MaLo=ma_lo).first()
+            batch = batches.get((ma_sp, ma_lo))
             if not batch:
                 return error_response(f"Không tìm thấy lô {ma_lo} của sản phẩm {ma_sp}", 404)
             
-            if batch.MaKho != kho_thuong.MaKho:
+            if batch.MaKho not in kho_thuong_ids:
                 return error_response(f"Lô {ma_lo} không ở Kho thường", 400)
             
             if batch.SLTon < so_luong:
@@ -290,7 +428,7 @@ def create_invoice():
                 )
             
             # Check expiry
-            if batch.HSD and batch.HSD < date.today():
+            if batch.HSD and batch.HSD < today:
                 return error_response(f"Lô {ma_lo} đã hết hạn sử dụng", 400)
             
             validated_items.append({
@@ -303,33 +441,50 @@ def create_invoice():
             
             total_amount += product.GiaBan * so_luong
         
+        # FEFO allocation for lines without MaLo (one ordered query), skipping
+        # units already taken by explicitly chosen batches
+        fefo_allocations = allocate_fefo(
+            fefo_quantities, kho_thuong_ids, reserved=quantities, today=today
+        )
+        allocation_data = []
+        for ma_sp, allocated in fefo_allocations.items():
+            product = products[ma_sp]
+            for batch, so_luong in allocated:
+                validated_items.append({
+                    'product': product,
+                    'batch': batch,
+                    'so_luong': so_luong,
+                    'gia_ban': product.GiaBan,
+                    'thanh_tien': product.GiaBan * so_luong
+                })
+                total_amount += product.GiaBan * so_luong
+            
+            allocation_data.append({
+                'MaSP': ma_sp,
+                'SoLuong': fefo_quantities[ma_sp],
+                'batches': [{
+                    'MaLo': batch.MaLo,
+                    'MaVach': batch.MaVach,
+                    'HSD': batch.HSD.isoformat() if batch.HSD else None,
+                    'SoLuong': so_luong
+                } for batch, so_luong in allocated]
+            })
+        
         # Generate invoice ID
-        ma_hd = generate_id('HD', 6)
-        while HoaDon.query.get(ma_hd):
-            ma_hd = generate_id('HD', 6)
+        ma_hd = id_allocator.next_id('HD')
+        
+        # Create export slip ID (Phiếu Xuất Kho - mục đích: Xuất bán hàng)
+        ma_phieu_xk = id_allocator.next_id('PXK')
         
         # Create invoice
         invoice = HoaDon(
             MaHD=ma_hd,
             NgayTao=datetime.now(),
-            MaNVThuNgan=thu_ngan.MaNV
+            MaNVThuNgan=thu_ngan.MaNV,
+            TongTien=total_amount
         )
         db.session.add(invoice)
         
-        # Create invoice items
-        for item in validated_items:
-            invoice_item = HoaDonSP(
-                MaSP=item['product'].MaSP,
-                MaHD=ma_hd,
-                SoLuong=item['so_luong']
-            )
-            db.session.add(invoice_item)
-        
-        # Create export slip (Phiếu Xuất Kho - mục đích: Xuất bán hàng)
-        ma_phieu_xk = generate_id('PXK', 6)
-        while PhieuXuatKho.query.get(ma_phieu_xk):
-            ma_phieu_xk = generate_id('PXK', 6)
-        
         export_slip = PhieuXuatKho(
             MaPhieu=ma_phieu_xk,
             NgayTao=datetime.now(),
@@ -337,16 +492,38 @@ def create_invoice():
             MaThamChieu=ma_hd  # Reference to invoice
         )
         db.session.add(export_slip)
+        db.session.flush()
         
-        # Update batch stock
+        # Bulk insert invoice items (HoaDonSP: một dòng cho mỗi sản phẩm)
+        line_quantities = {}
         for item in validated_items:
-            batch = item['batch']
-            batch.SLTon -= item['so_luong']
-            batch.MaPhieuXK = ma_phieu_xk
+            ma_sp = item['product'].MaSP
+            line_quantities[ma_sp] = line_quantities.get(ma_sp, 0) + item['so_luong']
         
-        db.session.commit()
+        db.session.execute(
+            insert(HoaDonSP.__table__),
+            [
+                {
+                    'MaSP': ma_sp,
+                    'MaHD': ma_hd,
+                    'SoLuong': so_luong,
+                    'DonGia': products[ma_sp].GiaBan
+                }
+                for ma_sp, so_luong in line_quantities.items()
+            ]
+        )
         
-        # Prepare response
+        # Update batch stock (one conditional statement - fails if another
+        # lane sold the same units in the meantime)
+        decrement_batches(
+            [(item['batch'], item['so_luong']) for item in validated_items],
+            ma_phieu_xk=ma_phieu_xk,
+            ma_kho_ids=kho_thuong_ids,
+            loai=LoaiBienDong.BAN_HANG,
+            ma_tham_chieu=ma_hd
+        )
+        
+        # Prepare response (before commit expires the loaded objects)
         invoice_data = invoice.to_dict()
         invoice_data['items'] = [{
             'MaSP': item['product'].MaSP,
@@ -358,21 +535,81 @@ def create_invoice():
         } for item in validated_items]
         invoice_data['TongTien'] = float(total_amount)
         invoice_data['MaPhieuXK'] = ma_phieu_xk
+        invoice_data['allocation'] = allocation_data
         invoice_data['TenThuNgan'] = thu_ngan.Ten
         
+        # Sales rollups last: the shared day/category rows stay locked only
+        # until the commit below
+        sales_rollup.record_sale(invoice.NgayTao, thu_ngan.MaNV, [
+            (ma_sp, products[ma_sp].LoaiSP, so_luong, products[ma_sp].GiaBan)
+            for ma_sp, so_luong in line_quantities.items()
+        ])
+        
+        db.session.commit()
+        
         return success_response(
             invoice_data,
             message="Tạo hóa đơn thành công",
             status=201
         )
         
+    except InsufficientStockError as e:
+        db.session.rollback()
+        shortage = e.shortages[0]
+        if shortage['MaLo'] is None:
+            return error_response(
+                f"Sản phẩm {shortage['MaSP']} không đủ hàng còn hạn tại Kho thường "
+                f"(tồn: {shortage['available']}, cần: {shortage['requested']})",
+                400
+            )
+        return error_response(
+            f"Lô {shortage['MaLo']} không đủ hàng (tồn: {shortage['available']}, cần: {shortage['requested']})",
+            400
+        )
     except Exception as e:
         db.session.rollback()
         return error_response(f"Lỗi tạo hóa đơn: {str(e)}", 500)
 
 
+def _with_lines(query):
+    """Eager-load invoice lines with their products, and the cashier"""
+    return query.options(
+        selectinload(HoaDon.hoa_don_sps).joinedload(HoaDonSP.san_pham),
+        joinedload(HoaDon.thu_ngan)
+    )
+
+
+def _invoice_items(invoice, with_dvt=False):
+    """
+    Build line items of an invoice loaded with _with_lines()
+    
+    Prices come from the HoaDonSP.DonGia snapshot, not the live catalog.
+    
+    Returns:
+        tuple: (items, total)
+    """
+    items = []
+    total = 0
+    for hd_sp in invoice.hoa_don_sps:
+        product = hd_sp.san_pham
+        item_total = hd_sp.DonGia * hd_sp.SoLuong
+        item = {
+            'MaSP': hd_sp.MaSP,
+            'TenSP': product.TenSP,
+            'SoLuong': hd_sp.SoLuong,
+            'DonGia': float(hd_sp.DonGia),
+            'ThanhTien': float(item_total)
+        }
+        if with_dvt:
+            item['DVT'] = product.DVT
+        items.append(item)
+        total += item_total
+    return items, total
+
+
 @sales_bp.route('/invoices', methods=['GET'])
 @jwt_required()
+@read_replica
 def get_invoices():
     """
     Get list of invoices with pagination
@@ -406,35 +643,21 @@ def get_invoices():
         if ma_nv:
             query = query.filter(HoaDon.MaNVThuNgan == ma_nv)
         
-        query = query.order_by(HoaDon.NgayTao.desc())
+        query = _with_lines(query).order_by(HoaDon.NgayTao.desc(), HoaDon.MaHD.desc())
         
-        # Paginate
-        result = paginate(query, page=page, per_page=per_page)
+        def serialize(invoice):
+            invoice_dict = invoice.to_dict()
+            items, total = _invoice_items(invoice)
+            invoice_dict['items'] = items
+            invoice_dict['TongTien'] = float(total)
+            
+            # Add cashier name
+            if invoice.thu_ngan:
+                invoice_dict['TenThuNgan'] = invoice.thu_ngan.Ten
+            return invoice_dict
         
-        # Add items and total for each invoice
-        for invoice_dict in result['items']:
-            invoice = HoaDon.query.get(invoice_dict['MaHD'])
-            if invoice:
-                items = []
-                total = 0
-                for hd_sp in invoice.hoa_don_sps:
-                    product = hd_sp.san_pham
-                    item_total = product.GiaBan * hd_sp.SoLuong
-                    items.append({
-                        'MaSP': hd_sp.MaSP,
-                        'TenSP': product.TenSP,
-                        'SoLuong': hd_sp.SoLuong,
-                        'DonGia': float(product.GiaBan),
-                        'ThanhTien': float(item_total)
-                    })
-                    total += item_total
-                
-                invoice_dict['items'] = items
-                invoice_dict['TongTien'] = float(total)
-                
-                # Add cashier name
-                if invoice.thu_ngan:
-                    invoice_dict['TenThuNgan'] = invoice.thu_ngan.Ten
+        # Paginate (count + page + lines/products: fixed number of queries)
+        result = paginate(query, page=page, per_page=per_page, serialize=serialize)
         
         return success_response(result)
         
@@ -445,47 +668,51 @@ def get_invoices():
 @sales_bp.route('/invoices/<string:ma_hd>', methods=['GET'])
 @jwt_required()
 def get_invoice_detail(ma_hd):
-    """Get invoice detail by ID"""
+    """
+    Get invoice detail by ID
+    
+    The serialized response is cached with a strong ETag (see
+    app.services.invoice_cache); send If-None-Match to get 304 Not Modified.
+    """
     try:
-        invoice = HoaDon.query.get(ma_hd)
-        if not invoice:
-            return error_response("Không tìm thấy hóa đơn", 404)
-        
-        invoice_data = invoice.to_dict()
-        
-        # Get items
-        items = []
-        total = 0
-        for hd_sp in invoice.hoa_don_sps:
-            product = hd_sp.san_pham
-            item_total = product.GiaBan * hd_sp.SoLuong
-            items.append({
-                'MaSP': hd_sp.MaSP,
-                'TenSP': product.TenSP,
-                'DVT': product.DVT,
-                'SoLuong': hd_sp.SoLuong,
-                'DonGia': float(product.GiaBan),
-                'ThanhTien': float(item_total)
-            })
-            total += item_total
-        
-        invoice_data['items'] = items
-        invoice_data['TongTien'] = float(total)
-        
-        # Add cashier info
-        if invoice.thu_ngan:
-            invoice_data['ThuNgan'] = {
-                'MaNV': invoice.thu_ngan.MaNV,
-                'Ten': invoice.thu_ngan.Ten,
-                'SDT': invoice.thu_ngan.SDT
-            }
-        
-        # Find related export slip
-        export_slip = PhieuXuatKho.query.filter_by(MaThamChieu=ma_hd).first()
-        if export_slip:
-            invoice_data['MaPhieuXK'] = export_slip.MaPhieu
+        cached = invoice_cache.get(ma_hd)
+        if cached is None:
+            invoice = _with_lines(HoaDon.query).filter(HoaDon.MaHD == ma_hd).first()
+            if not invoice:
+                return error_response("Không tìm thấy hóa đơn", 404)
+            
+            invoice_data = invoice.to_dict()
+            
+            # Get items
+            items, total = _invoice_items(invoice, with_dvt=True)
+            
+            invoice_data['items'] = items
+            invoice_data['TongTien'] = float(total)
+            
+            # Add cashier info
+            if invoice.thu_ngan:
+                invoice_data['ThuNgan'] = {
+                    'MaNV': invoice.thu_ngan.MaNV,
+                    'Ten': invoice.thu_ngan.Ten,
+                    'SDT': invoice.thu_ngan.SDT
+                }
+            
+            # Find related export slip
+            export_slip = PhieuXuatKho.query.filter_by(MaThamChieu=ma_hd).first()
+            if export_slip:
+                invoice_data['MaPhieuXK'] = export_slip.MaPhieu
+            
+            body, _ = success_response(invoice_data)
+            cached = invoice_cache.put(ma_hd, current_app.json.dumps(body).encode('utf-8'))
         
-        return success_response(invoice_data)
+        body, etag = cached
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+        else:
+            response = current_app.response_class(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
         
     except Exception as e:
         return error_response(f"Lỗi lấy chi tiết hóa đơn: {str(e)}", 500)
@@ -493,6 +720,7 @@ def get_invoice_detail(ma_hd):
 
 @sales_bp.route('/stats/daily', methods=['GET'])
 @jwt_required()
+@read_replica
 def get_daily_stats():
     """
     Get daily sales statistics
@@ -508,25 +736,15 @@ def get_daily_stats():
         else:
             target_date = date.today()
         
-        # Get invoices for the date
+        # Read the day's cashier rollups (one row per cashier)
         start_time = datetime.combine(target_date, datetime.min.time())
-        end_time = datetime.combine(target_date, datetime.max.time())
+        end_time = start_time + timedelta(days=1)
         
-        invoices = HoaDon.query.filter(
-            HoaDon.NgayTao >= start_time,
-            HoaDon.NgayTao <= end_time
-        ).all()
-        
-        # Calculate stats
-        total_invoices = len(invoices)
-        total_revenue = 0
-        total_items = 0
-        
-        for invoice in invoices:
-            for hd_sp in invoice.hoa_don_sps:
-                product = hd_sp.san_pham
-                total_revenue += product.GiaBan * hd_sp.SoLuong
-                total_items += hd_sp.SoLuong
+        total_invoices, total_revenue, total_items = db.session.query(
+            func.coalesce(func.sum(TongHopBanHang.SoHoaDon), 0),
+            func.coalesce(func.sum(TongHopBanHang.DoanhThu), 0),
+            func.coalesce(func.sum(TongHopBanHang.SoLuong), 0)
+        ).filter(sales_rollup.window(ChieuTongHop.THU_NGAN, start_time, end_time)).one()
         
         return success_response({
             'date': target_date.isoformat(),
@@ -559,45 +777,35 @@ def search_invoice_for_return():
         return error_response("Mã hóa đơn là bắt buộc", 400)
     
     try:
-        invoice = HoaDon.query.get(ma_hd)
+        invoice = _with_lines(HoaDon.query)\
+            .options(joinedload(HoaDon.yeu_cau_tra_hang))\
+            .filter(HoaDon.MaHD == ma_hd)\
+            .first()
         if not invoice:
             return error_response("Không tìm thấy hóa đơn", 404)
         
         # Get invoice details
         invoice_data = invoice.to_dict()
         
+        # Batch info from the export slip of this invoice (one query for all lines)
+        batch_by_sp = {}
+        export_slip = PhieuXuatKho.query.filter_by(MaThamChieu=ma_hd).first()
+        if export_slip:
+            batches = LoSP.query.filter(
+                LoSP.MaPhieuXK == export_slip.MaPhieu,
+                LoSP.MaSP.in_([hd_sp.MaSP for hd_sp in invoice.hoa_don_sps])
+            ).order_by(LoSP.MaSP, LoSP.MaLo).all()
+            for batch in batches:
+                batch_by_sp.setdefault(batch.MaSP, {
+                    'MaLo': batch.MaLo,
+                    'HSD': batch.HSD.isoformat() if batch.HSD else None,
+                    'NSX': batch.NSX.isoformat() if batch.NSX else None
+                })
+        
         # Get items with product details
-        items = []
-        for hd_sp in invoice.hoa_don_sps:
-            product = hd_sp.san_pham
-            
-            # Find the export slip to get batch info
-            export_slip = PhieuXuatKho.query.filter_by(MaThamChieu=ma_hd).first()
-            batch_info = None
-            
-            if export_slip:
-                # Try to find batch info
-                batches = LoSP.query.filter_by(
-                    MaSP=hd_sp.MaSP,
-                    MaPhieuXK=export_slip.MaPhieu
-                ).all()
-                
-                if batches:
-                    batch_info = {
-                        'MaLo': batches[0].MaLo,
-                        'HSD': batches[0].HSD.isoformat() if batches[0].HSD else None,
-                        'NSX': batches[0].NSX.isoformat() if batches[0].NSX else None
-                    }
-            
-            items.append({
-                'MaSP': hd_sp.MaSP,
-                'TenSP': product.TenSP,
-                'DVT': product.DVT,
-                'SoLuong': hd_sp.SoLuong,
-                'DonGia': float(product.GiaBan),
-                'ThanhTien': float(product.GiaBan * hd_sp.SoLuong),
-                'batch_info': batch_info
-            })
+        items, _ = _invoice_items(invoice, with_dvt=True)
+        for item in items:
+            item['batch_info'] = batch_by_sp.get(item['MaSP'])
         
         invoice_data['items'] = items
         invoice_data['TongTien'] = sum(item['ThanhTien'] for item in items)
@@ -611,7 +819,7 @@ def search_invoice_for_return():
         
         # Check if already returned
         if invoice.MaYCTraHang:
-            yeu_cau = YeuCauTraHang.query.get(invoice.MaYCTraHang)
+            yeu_cau = invoice.yeu_cau_tra_hang
             if yeu_cau:
                 invoice_data['da_tra_hang'] = True
                 invoice_data['yeu_cau_tra_hang'] = yeu_cau.to_dict()
@@ -656,6 +864,7 @@ def create_return():
                 }
             ],
             "kho_nhap": "Kho thường" | "Kho lỗi",
+            "ma_kho_nhap": "string" (optional - specific warehouse of that type),
             "return_policy_days": int (default: 7)
         }
     """
@@ -664,6 +873,7 @@ def create_return():
     ly_do = data.get('ly_do', '')
     items = data.get('items', [])
     kho_nhap_type = data.get('kho_nhap', 'Kho thường')
+    ma_kho_nhap = data.get('ma_kho_nhap')
     return_policy_days = data.get('return_policy_days', 7)
     
     if not ma_hd or not items:
@@ -704,7 +914,16 @@ def create_return():
             )
         
         # Get warehouse
-        kho = KhoHang.query.filter_by(Loai=kho_nhap_type).first()
+        try:
+            if ma_kho_nhap:
+                if not warehouse_registry.is_type(ma_kho_nhap, kho_nhap_type):
+                    return error_response(f"Kho {ma_kho_nhap} không phải {kho_nhap_type}", 400)
+                kho = warehouse_registry.get(ma_kho_nhap)
+            else:
+                kho = warehouse_registry.get_default(kho_nhap_type)
+        except ValueError:
+            return error_response(f"Loại kho không hợp lệ: {kho_nhap_type}", 400)
+        
         if not kho:
             return error_response(f"Không tìm thấy {kho_nhap_type}", 404)
         
@@ -757,20 +976,19 @@ def create_return():
                 else:
                     return error_response("Không tìm thấy phiếu xuất kho tương ứng", 404)
             
+            # Refund at the price paid (invoice snapshot)
             validated_items.append({
                 'product': product,
                 'batch': batch,
                 'so_luong': so_luong,
-                'gia_ban': product.GiaBan,
-                'thanh_tien': product.GiaBan * so_luong
+                'gia_ban': hd_sp.DonGia,
+                'thanh_tien': hd_sp.DonGia * so_luong
             })
             
-            total_refund += product.GiaBan * so_luong
+            total_refund += hd_sp.DonGia * so_luong
         
         # Generate return request ID
-        ma_yc = generate_id('YC', 6)
-        while YeuCauTraHang.query.get(ma_yc):
-            ma_yc = generate_id('YC', 6)
+        ma_yc = id_allocator.next_id('YC')
         
         # Create return request
         yeu_cau = YeuCauTraHang(
@@ -784,9 +1002,7 @@ def create_return():
         invoice.MaYCTraHang = ma_yc
         
         # Create import slip (Phiếu Nhập Kho - mục đích: Khách trả hàng)
-        ma_phieu_nk = generate_id('PNK', 6)
-        while PhieuNhapKho.query.get(ma_phieu_nk):
-            ma_phieu_nk = generate_id('PNK', 6)
+        ma_phieu_nk = id_allocator.next_id('PNK')
         
         import_slip = PhieuNhapKho(
             MaPhieu=ma_phieu_nk,
@@ -798,17 +1014,18 @@ def create_return():
         
         # Update batch stock
         # Note: In this database design, each batch (MaSP, MaLo) can only exist in ONE warehouse
-        # So we update the warehouse location and increase stock
-        for item in validated_items:
-            batch = item['batch']
-            
-            # Simply update the batch:
-            # - Increase stock by returned quantity
-            # - Update warehouse to target warehouse
-            # - Update import slip reference
-            batch.SLTon += item['so_luong']
-            batch.MaKho = kho.MaKho  # Move batch to target warehouse
-            batch.MaPhieuNK = ma_phieu_nk
+        # So we update the warehouse location and increase stock:
+        # - Increase stock by returned quantity
+        # - Update warehouse to target warehouse
+        # - Update import slip reference
+        increment_batches(
+            [(item['batch'], item['so_luong']) for item in validated_items],
+            ma_phieu_nk=ma_phieu_nk,
+            ma_kho=kho['MaKho'],  # Move batch to target warehouse
+            loai=LoaiBienDong.TRA_HANG,
+            ma_tham_chieu=ma_hd,
+            ly_do=import_slip.MucDich
+        )
         
         # Create XuLyTraHang record if user is NhanVienKho
         if user_type == 'NhanVienKho':
@@ -818,6 +1035,11 @@ def create_return():
             )
             db.session.add(xu_ly)
         
+        sales_rollup.record_return(yeu_cau.NgayTao, invoice.MaNVThuNgan, [
+            (item['product'].MaSP, item['product'].LoaiSP, item['so_luong'], item['gia_ban'])
+            for item in validated_items
+        ])
+        
         db.session.commit()
         
         # Prepare response
@@ -828,6 +1050,7 @@ def create_return():
             'NgayTao': yeu_cau.NgayTao.isoformat(),
             'LyDo': ly_do,
             'KhoNhap': kho_nhap_type,
+            'MaKhoNhap': kho['MaKho'],
             'items': [{
                 'MaSP': item['product'].MaSP,
                 'TenSP': item['product'].TenSP,
@@ -853,6 +1076,7 @@ def create_return():
 
 @sales_bp.route('/returns', methods=['GET'])
 @jwt_required()
+@read_replica
 def get_returns():
     """
     Get list of return requests
@@ -880,48 +1104,43 @@ def get_returns():
             end_date = end_date.replace(hour=23, minute=59, second=59)
             query = query.filter(YeuCauTraHang.NgayTao <= end_date)
         
-        query = query.order_by(YeuCauTraHang.NgayTao.desc())
+        query = query.options(
+            selectinload(YeuCauTraHang.hoa_dons)
+            .selectinload(HoaDon.hoa_don_sps).joinedload(HoaDonSP.san_pham),
+            selectinload(YeuCauTraHang.hoa_dons).joinedload(HoaDon.thu_ngan)
+        ).order_by(YeuCauTraHang.NgayTao.desc(), YeuCauTraHang.MaYC.desc())
         
-        # Paginate
-        result = paginate(query, page=page, per_page=per_page)
-        
-        # Add additional info for each return
-        for return_dict in result['items']:
-            yeu_cau = YeuCauTraHang.query.get(return_dict['MaYC'])
-            if yeu_cau:
-                # Find related invoice
-                invoice = HoaDon.query.filter_by(MaYCTraHang=yeu_cau.MaYC).first()
-                if invoice:
-                    return_dict['MaHD'] = invoice.MaHD
-                    
-                    # Calculate total refund
-                    total = 0
-                    items = []
-                    for hd_sp in invoice.hoa_don_sps:
-                        product = hd_sp.san_pham
-                        item_total = product.GiaBan * hd_sp.SoLuong
-                        items.append({
-                            'MaSP': hd_sp.MaSP,
-                            'TenSP': product.TenSP,
-                            'SoLuong': hd_sp.SoLuong,
-                            'DonGia': float(product.GiaBan),
-                            'ThanhTien': float(item_total)
-                        })
-                        total += item_total
-                    
-                    return_dict['items'] = items
-                    return_dict['TongTienHoanTra'] = float(total)
-                    
-                    # Add cashier info
-                    if invoice.thu_ngan:
-                        return_dict['ThuNgan'] = invoice.thu_ngan.Ten
+        def serialize(yeu_cau):
+            return_dict = yeu_cau.to_dict()
+            
+            # Related invoice
+            invoice = yeu_cau.hoa_dons[0] if yeu_cau.hoa_dons else None
+            if invoice:
+                return_dict['MaHD'] = invoice.MaHD
+                
+                # Calculate total refund
+                items, total = _invoice_items(invoice)
+                return_dict['items'] = items
+                return_dict['TongTienHoanTra'] = float(total)
                 
-                # Find related import slip
-                import_slip = PhieuNhapKho.query.filter_by(
-                    MaThamChieu=invoice.MaHD if invoice else None
-                ).first()
-                if import_slip:
-                    return_dict['MaPhieuNK'] = import_slip.MaPhieu
+                # Add cashier info
+                if invoice.thu_ngan:
+                    return_dict['ThuNgan'] = invoice.thu_ngan.Ten
+            return return_dict
+        
+        # Paginate
+        result = paginate(query, page=page, per_page=per_page, serialize=serialize)
+        
+        # Related import slips for the whole page (one query)
+        ma_hd_list = [r['MaHD'] for r in result['items'] if r.get('MaHD')]
+        if ma_hd_list:
+            import_slips = {
+                slip.MaThamChieu: slip.MaPhieu
+                for slip in PhieuNhapKho.query.filter(PhieuNhapKho.MaThamChieu.in_(ma_hd_list))
+            }
+            for return_dict in result['items']:
+                if return_dict.get('MaHD') in import_slips:
+                    return_dict['MaPhieuNK'] = import_slips[return_dict['MaHD']]
         
         return success_response(result)
         
@@ -941,26 +1160,13 @@ def get_return_detail(ma_yc):
         return_data = yeu_cau.to_dict()
         
         # Find related invoice
-        invoice = HoaDon.query.filter_by(MaYCTraHang=ma_yc).first()
+        invoice = _with_lines(HoaDon.query).filter(HoaDon.MaYCTraHang == ma_yc).first()
         if invoice:
             return_data['MaHD'] = invoice.MaHD
             return_data['NgayMua'] = invoice.NgayTao.isoformat()
             
             # Get items
-            items = []
-            total = 0
-            for hd_sp in invoice.hoa_don_sps:
-                product = hd_sp.san_pham
-                item_total = product.GiaBan * hd_sp.SoLuong
-                items.append({
-                    'MaSP': hd_sp.MaSP,
-                    'TenSP': product.TenSP,
-                    'DVT': product.DVT,
-                    'SoLuong': hd_sp.SoLuong,
-                    'DonGia': float(product.GiaBan),
-                    'ThanhTien': float(item_total)
-                })
-                total += item_total
+            items, total = _invoice_items(invoice, with_dvt=True)
             
             return_data['items'] = items
             return_data['TongTienHoanTra'] = float(total)
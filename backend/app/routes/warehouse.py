@@ -8,20 +8,26 @@ UC07: Điều chỉnh kho
 UC09: Hủy hàng
 """
 
-from flask import Blueprint, request
+from flask import Blueprint, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models import (
     PhieuNhapKho, PhieuXuatKho, PhieuChuyenKho, PhieuKiemKho,
-    BaoCao, LoSP, SanPham, KhoHang, TaoPhieu, DuyetPhieu
+    BaoCao, LoSP, SanPham, KhoHang, TaoPhieu, DuyetPhieu, LoaiBienDong
 )
 from app import db
 from app.utils.auth import role_required
 from app.utils.helpers import (
-    success_response, error_response, generate_id, 
-    generate_barcode, parse_date
+    success_response, error_response, parse_date
 )
-from datetime import datetime
+from app.utils.db_routing import read_replica
+from app.utils.db_metrics import query_budget
+from app.services import (
+    barcode_index, id_allocator, barcode_allocator, InsufficientStockError,
+    decrement_batches, increment_batches, move_batch, goods_receipt, stock_ledger
+)
+from datetime import datetime, date
 from sqlalchemy import and_, or_
+from sqlalchemy.orm import joinedload, selectinload
 
 warehouse_bp = Blueprint('warehouse', __name__)
 
@@ -45,15 +51,16 @@ def get_warehouses():
 
 @warehouse_bp.route('/warehouses/<string:ma_kho>/inventory', methods=['GET'])
 @jwt_required()
+@query_budget(2)
 def get_warehouse_inventory(ma_kho):
     """Get inventory of a specific warehouse"""
-    batches = LoSP.query.filter_by(MaKho=ma_kho).all()
+    batches = LoSP.query.options(joinedload(LoSP.san_pham)).filter_by(MaKho=ma_kho).all()
     
     inventory = []
     for batch in batches:
         batch_data = batch.to_dict()
         # Include product information
-        san_pham = SanPham.query.get(batch.MaSP)
+        san_pham = batch.san_pham
         if san_pham:
             batch_data['product'] = san_pham.to_dict()
         inventory.append(batch_data)
@@ -66,12 +73,13 @@ def get_warehouse_inventory(ma_kho):
 
 @warehouse_bp.route('/batches', methods=['GET'])
 @jwt_required()
+@query_budget(2)
 def get_batches():
     """Get all batches with filters"""
     ma_kho = request.args.get('ma_kho')
     ma_sp = request.args.get('ma_sp')
     
-    query = LoSP.query
+    query = LoSP.query.options(joinedload(LoSP.san_pham))
     
     if ma_kho:
         query = query.filter_by(MaKho=ma_kho)
@@ -83,7 +91,7 @@ def get_batches():
     result = []
     for batch in batches:
         batch_data = batch.to_dict()
-        san_pham = SanPham.query.get(batch.MaSP)
+        san_pham = batch.san_pham
         if san_pham:
             batch_data['product'] = san_pham.to_dict()
         result.append(batch_data)
@@ -100,19 +108,22 @@ def get_batches():
 
 @warehouse_bp.route('/import', methods=['GET'])
 @jwt_required()
+@read_replica
+@query_budget(3)
 def get_imports():
     """Get all import receipts"""
-    phieu_list = PhieuNhapKho.query.order_by(PhieuNhapKho.NgayTao.desc()).all()
+    phieu_list = PhieuNhapKho.query.options(
+        selectinload(PhieuNhapKho.lo_sps).joinedload(LoSP.san_pham)
+    ).order_by(PhieuNhapKho.NgayTao.desc()).all()
     
     result = []
     for phieu in phieu_list:
         phieu_data = phieu.to_dict()
-        # Get batches for this import
-        batches = LoSP.query.filter_by(MaPhieuNK=phieu.MaPhieu).all()
+        # Batches of this import (loaded with the slips)
         phieu_data['items'] = []
-        for batch in batches:
+        for batch in phieu.lo_sps:
             batch_data = batch.to_dict()
-            san_pham = SanPham.query.get(batch.MaSP)
+            san_pham = batch.san_pham
             if san_pham:
                 batch_data['product'] = san_pham.to_dict()
             phieu_data['items'].append(batch_data)
@@ -126,18 +137,20 @@ def get_imports():
 
 @warehouse_bp.route('/import/<string:ma_phieu>', methods=['GET'])
 @jwt_required()
+@query_budget(2)
 def get_import(ma_phieu):
     """Get specific import receipt details"""
-    phieu = PhieuNhapKho.query.get(ma_phieu)
+    phieu = PhieuNhapKho.query.options(
+        selectinload(PhieuNhapKho.lo_sps).joinedload(LoSP.san_pham)
+    ).filter_by(MaPhieu=ma_phieu).first()
     if not phieu:
         return error_response("Import receipt not found", 404)
     
     phieu_data = phieu.to_dict()
-    batches = LoSP.query.filter_by(MaPhieuNK=ma_phieu).all()
     phieu_data['items'] = []
-    for batch in batches:
+    for batch in phieu.lo_sps:
         batch_data = batch.to_dict()
-        san_pham = SanPham.query.get(batch.MaSP)
+        san_pham = batch.san_pham
         if san_pham:
             batch_data['product'] = san_pham.to_dict()
         phieu_data['items'].append(batch_data)
@@ -155,7 +168,9 @@ def delete_import(ma_phieu):
         return error_response("Import receipt not found", 404)
     
     try:
-        # Delete related batches first
+        # Delete related batches first (their stock is written off in the ledger)
+        batches = LoSP.query.filter_by(MaPhieuNK=ma_phieu).all()
+        stock_ledger.record_deleted(batches, ma_phieu=ma_phieu, ly_do=f"Xóa phiếu nhập {ma_phieu}")
         LoSP.query.filter_by(MaPhieuNK=ma_phieu).delete()
         
         # Delete tao phieu record
@@ -214,9 +229,7 @@ def import_warehouse():
         return error_response("Warehouse not found", 404)
     
     # Generate phiếu nhập kho
-    ma_phieu = generate_id('PNK', 6)
-    while PhieuNhapKho.query.get(ma_phieu):
-        ma_phieu = generate_id('PNK', 6)
+    ma_phieu = id_allocator.next_id('PNK')
     
     phieu = PhieuNhapKho(
         MaPhieu=ma_phieu,
@@ -242,20 +255,20 @@ def import_warehouse():
         # Generate or use provided batch code
         ma_lo = item.get('MaLo')
         if not ma_lo:
-            ma_lo = generate_id('LO', 6)
+            ma_lo = id_allocator.next_id('LO')
         
         # Check if batch already exists
         existing_batch = LoSP.query.filter_by(MaSP=ma_sp, MaLo=ma_lo).first()
         if existing_batch:
             # Update existing batch
-            existing_batch.SLTon += so_luong
-            existing_batch.MaPhieuNK = ma_phieu
+            increment_batches(
+                [(existing_batch, so_luong)], ma_phieu_nk=ma_phieu,
+                loai=LoaiBienDong.NHAP_KHO, ma_tham_chieu=phieu.MaThamChieu, ly_do=phieu.MucDich
+            )
             batch = existing_batch
         else:
             # Create new batch
-            ma_vach = generate_barcode()
-            while LoSP.query.filter_by(MaVach=ma_vach).first():
-                ma_vach = generate_barcode()
+            ma_vach = barcode_allocator.next_barcode()
             
             batch = LoSP(
                 MaSP=ma_sp,
@@ -268,6 +281,10 @@ def import_warehouse():
                 MaPhieuNK=ma_phieu
             )
             db.session.add(batch)
+            stock_ledger.record(
+                LoaiBienDong.NHAP_KHO, [(ma_sp, ma_lo, data['MaKho'], so_luong)],
+                ma_phieu=ma_phieu, ma_tham_chieu=phieu.MaThamChieu, ly_do=phieu.MucDich
+            )
         
         created_batches.append(batch.to_dict())
     
@@ -286,6 +303,88 @@ def import_warehouse():
     }, message="Import successful", status=201)
 
 
+@warehouse_bp.route('/import/bulk', methods=['POST'])
+@jwt_required()
+@role_required('Quản lý', 'Nhân viên')
+def import_warehouse_bulk():
+    """
+    Nhập kho số lượng lớn (UC03) - CSV/XLSX upload or large JSON body
+    
+    Lines are imported in chunks, each committed on its own (see
+    app.services.goods_receipt). Invalid lines are reported and skipped.
+    
+    multipart/form-data:
+        file: .csv or .xlsx with columns MaSP, SoLuong, NSX, HSD, MaLo
+        MaKho, MucDich, MaThamChieu, MaPhieu, resume_from, chunk_size
+    
+    application/json:
+        Same fields, with "items": [{MaSP, SoLuong, NSX, HSD, MaLo}]
+    
+    A chunk failure stops the import with 207 and the same report as a
+    successful import (earlier chunks stay committed). To resume, send the
+    same data again with the returned MaPhieu and
+    resume_from = completed_lines + 1; MaPhieu must be an existing slip of
+    the same MaKho (404 / 409 otherwise).
+    """
+    upload = request.files.get('file')
+    params = request.form if upload else (request.get_json(silent=True) or {})
+    
+    ma_kho = params.get('MaKho')
+    ma_phieu = params.get('MaPhieu') or None
+    try:
+        resume_from = max(1, int(params.get('resume_from') or 1))
+        chunk_size = int(params.get('chunk_size') or current_app.config.get('BULK_IMPORT_CHUNK_SIZE', 500))
+    except (TypeError, ValueError):
+        return error_response("resume_from and chunk_size must be integers", 400)
+    
+    if not ma_kho:
+        return error_response("MaKho is required", 400)
+    
+    if upload:
+        filename = (upload.filename or '').lower()
+        if filename.endswith('.csv'):
+            rows = goods_receipt.iter_csv_rows(upload.stream)
+        elif filename.endswith('.xlsx'):
+            rows = goods_receipt.iter_xlsx_rows(upload.stream)
+        else:
+            return error_response("Only .csv and .xlsx files are supported", 400)
+    else:
+        rows = params.get('items')
+        if not rows or not isinstance(rows, list):
+            return error_response("file or items is required", 400)
+    
+    if not KhoHang.query.get(ma_kho):
+        return error_response("Warehouse not found", 404)
+    
+    try:
+        report = goods_receipt.import_goods_receipt(
+            rows,
+            ma_kho=ma_kho,
+            ma_nv=get_jwt_identity(),
+            ma_phieu=ma_phieu,
+            muc_dich=params.get('MucDich'),
+            ma_tham_chieu=params.get('MaThamChieu'),
+            chunk_size=chunk_size,
+            resume_from=resume_from
+        )
+    except goods_receipt.ReceiptNotFound as e:
+        return error_response(str(e), 404)
+    except goods_receipt.ReceiptWarehouseMismatch as e:
+        return error_response(str(e), 409)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Bulk import error: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return error_response(f"Error importing: {str(e)}", 500)
+    
+    if report['error']:
+        # Earlier chunks are committed - return the report so the client can resume
+        return error_response(f"Import stopped: {report['error']}", 207, data=report)
+    
+    return success_response(report, message="Import successful", status=201)
+
+
 # =============================================
 # UC04: XUẤT KHO (FEFO)
 # =============================================
@@ -347,9 +446,7 @@ def transfer_warehouse():
             return error_response("Warehouse not found", 404)
         
         # Generate phiếu chuyển kho
-        ma_phieu_ck = generate_id('PCK', 6)
-        while PhieuChuyenKho.query.get(ma_phieu_ck):
-            ma_phieu_ck = generate_id('PCK', 6)
+        ma_phieu_ck = id_allocator.next_id('PCK')
         
         phieu_ck = PhieuChuyenKho(
             MaPhieu=ma_phieu_ck,
@@ -361,8 +458,8 @@ def transfer_warehouse():
         db.session.add(phieu_ck)
         
         # Generate phiếu xuất and phiếu nhập (for tracking only)
-        ma_phieu_xuat = generate_id('PXK', 6)
-        ma_phieu_nhap = generate_id('PNK', 6)
+        ma_phieu_xuat = id_allocator.next_id('PXK')
+        ma_phieu_nhap = id_allocator.next_id('PNK')
         
         phieu_xuat = PhieuXuatKho(
             MaPhieu=ma_phieu_xuat,
@@ -418,8 +515,11 @@ def transfer_warehouse():
             if so_luong == batch_xuat.SLTon:
                 # Transfer entire batch - just update MaKho
                 print(f"Transferring entire batch {ma_lo}: {so_luong} units")
-                batch_xuat.MaKho = data['KhoNhap']
-                batch_xuat.MaPhieuNK = ma_phieu_nhap
+                move_batch(
+                    batch_xuat, so_luong, data['KhoXuat'], data['KhoNhap'],
+                    ma_phieu_nk=ma_phieu_nhap, ma_phieu_xk=ma_phieu_xuat,
+                    ma_tham_chieu=ma_phieu_ck, ly_do=phieu_ck.MucDich
+                )
                 # Keep existing MaPhieuXK reference
                 
                 transferred_items.append({
@@ -435,8 +535,14 @@ def transfer_warehouse():
                 print(f"Partial transfer batch {ma_lo}: {so_luong}/{batch_xuat.SLTon} units")
                 
                 # Deduct from source
-                batch_xuat.SLTon -= so_luong
-                batch_xuat.MaPhieuXK = ma_phieu_xuat
+                decrement_batches(
+                    [(batch_xuat, so_luong)],
+                    ma_phieu_xk=ma_phieu_xuat,
+                    ma_kho_ids={data['KhoXuat']},
+                    loai=LoaiBienDong.CHUYEN_DI,
+                    ma_tham_chieu=ma_phieu_ck,
+                    ly_do=phieu_ck.MucDich
+                )
                 
                 # Check if batch already exists in destination
                 batch_nhap = LoSP.query.filter_by(
@@ -447,8 +553,10 @@ def transfer_warehouse():
                 
                 if batch_nhap:
                     # Batch already exists in destination - just add quantity
-                    batch_nhap.SLTon += so_luong
-                    batch_nhap.MaPhieuNK = ma_phieu_nhap
+                    increment_batches(
+                        [(batch_nhap, so_luong)], ma_phieu_nk=ma_phieu_nhap,
+                        loai=LoaiBienDong.CHUYEN_DEN, ma_tham_chieu=ma_phieu_ck, ly_do=phieu_ck.MucDich
+                    )
                 else:
                     # Create new batch in destination with DIFFERENT batch code to avoid PRIMARY KEY conflict
                     # Generate new batch code with suffix
@@ -460,9 +568,7 @@ def transfer_warehouse():
                         new_ma_lo = f"{ma_lo}_CK{int(time.time() % 10000)}"
                     
                     # Generate new barcode
-                    new_ma_vach = generate_barcode()
-                    while LoSP.query.filter_by(MaVach=new_ma_vach).first():
-                        new_ma_vach = generate_barcode()
+                    new_ma_vach = barcode_allocator.next_barcode()
                     
                     batch_nhap = LoSP(
                         MaSP=ma_sp,
@@ -475,6 +581,10 @@ def transfer_warehouse():
                         MaPhieuNK=ma_phieu_nhap
                     )
                     db.session.add(batch_nhap)
+                    stock_ledger.record(
+                        LoaiBienDong.CHUYEN_DEN, [(ma_sp, new_ma_lo, data['KhoNhap'], so_luong)],
+                        ma_phieu=ma_phieu_nhap, ma_tham_chieu=ma_phieu_ck, ly_do=phieu_ck.MucDich
+                    )
                     
                     print(f"Created new batch {new_ma_lo} in {data['KhoNhap']} with {so_luong} units")
                 
@@ -509,6 +619,9 @@ def transfer_warehouse():
             'transferred_items': transferred_items
         }, message="Transfer successful", status=201)
         
+    except InsufficientStockError as e:
+        db.session.rollback()
+        return error_response(str(e), 400)
     except Exception as e:
         db.session.rollback()
         print(f"Transfer error: {str(e)}")
@@ -543,14 +656,12 @@ def scan_barcode_for_export():
     if not ma_vach or not ma_kho:
         return error_response("MaVach and MaKho are required", 400)
     
-    # Find batch by barcode
-    query = LoSP.query.filter_by(MaVach=ma_vach, MaKho=ma_kho)
+    # Find batch by barcode (in-memory index, DB fallback)
+    batch, san_pham = barcode_index.lookup(ma_vach)
     
-    # Add product filter if provided
-    if ma_sp:
-        query = query.filter_by(MaSP=ma_sp)
-    
-    batch = query.first()
+    # Batch must be in the requested warehouse (and product, if provided)
+    if batch and (batch['MaKho'] != ma_kho or (ma_sp and batch['MaSP'] != ma_sp)):
+        batch = None
     
     # UC04 Luồng thay thế: Quét barcode không hợp lệ
     if not batch:
@@ -566,7 +677,7 @@ def scan_barcode_for_export():
             )
     
     # Check if batch has stock
-    if batch.SLTon <= 0:
+    if batch['SLTon'] <= 0:
         return error_response(
             f"Batch with barcode {ma_vach} has no available stock", 
             400
@@ -575,20 +686,18 @@ def scan_barcode_for_export():
     # Check if batch is expired
     is_expired = False
     days_to_expiry = None
-    if batch.HSD:
-        days_to_expiry = (batch.HSD - datetime.utcnow().date()).days
+    hsd = date.fromisoformat(batch['HSD']) if batch['HSD'] else None
+    if hsd:
+        days_to_expiry = (hsd - datetime.utcnow().date()).days
         is_expired = days_to_expiry < 0
     
     # Business rule: Warning for expired batches
     if is_expired:
         return error_response(
-            f"Cannot export expired batch {batch.MaLo}. Expiry date: {batch.HSD}",
+            f"Cannot export expired batch {batch['MaLo']}. Expiry date: {hsd}",
             400
         )
     
-    # Get product info
-    san_pham = SanPham.query.get(batch.MaSP)
-    
     # Calculate status
     status = 'normal'
     if days_to_expiry is not None:
@@ -599,12 +708,12 @@ def scan_barcode_for_export():
     
     return success_response({
         'batch_info': {
-            **batch.to_dict(),
+            **batch,
             'days_to_expiry': days_to_expiry,
             'status': status,
-            'is_exportable': not is_expired and batch.SLTon > 0
+            'is_exportable': not is_expired and batch['SLTon'] > 0
         },
-        'product_info': san_pham.to_dict() if san_pham else None,
+        'product_info': san_pham,
         'scan_timestamp': datetime.utcnow().isoformat(),
         'warnings': [
             f"Batch expires in {days_to_expiry} days" if days_to_expiry and days_to_expiry <= 30 else None
@@ -614,20 +723,23 @@ def scan_barcode_for_export():
 
 @warehouse_bp.route('/export', methods=['GET'])
 @jwt_required()
+@read_replica
+@query_budget(3)
 def get_exports():
     """Get all export receipts"""
     try:
-        phieu_list = PhieuXuatKho.query.order_by(PhieuXuatKho.NgayTao.desc()).all()
+        phieu_list = PhieuXuatKho.query.options(
+            selectinload(PhieuXuatKho.lo_sps).joinedload(LoSP.san_pham)
+        ).order_by(PhieuXuatKho.NgayTao.desc()).all()
         
         result = []
         for phieu in phieu_list:
             phieu_data = phieu.to_dict()
-            # Get batches for this export
-            batches = LoSP.query.filter_by(MaPhieuXK=phieu.MaPhieu).all()
+            # Batches of this export (loaded with the slips)
             phieu_data['items'] = []
-            for batch in batches:
+            for batch in phieu.lo_sps:
                 batch_data = batch.to_dict()
-                san_pham = SanPham.query.get(batch.MaSP)
+                san_pham = batch.san_pham
                 if san_pham:
                     batch_data['TenSP'] = san_pham.TenSP
                     batch_data['DVT'] = san_pham.DVT
@@ -644,18 +756,20 @@ def get_exports():
 
 @warehouse_bp.route('/export/<string:ma_phieu>', methods=['GET'])
 @jwt_required()
+@query_budget(2)
 def get_export(ma_phieu):
     """Get specific export receipt details"""
-    phieu = PhieuXuatKho.query.get(ma_phieu)
+    phieu = PhieuXuatKho.query.options(
+        selectinload(PhieuXuatKho.lo_sps).joinedload(LoSP.san_pham)
+    ).filter_by(MaPhieu=ma_phieu).first()
     if not phieu:
         return error_response("Export receipt not found", 404)
     
     phieu_data = phieu.to_dict()
-    batches = LoSP.query.filter_by(MaPhieuXK=ma_phieu).all()
     phieu_data['items'] = []
-    for batch in batches:
+    for batch in phieu.lo_sps:
         batch_data = batch.to_dict()
-        san_pham = SanPham.query.get(batch.MaSP)
+        san_pham = batch.san_pham
         if san_pham:
             batch_data['TenSP'] = san_pham.TenSP
             batch_data['DVT'] = san_pham.DVT
@@ -789,9 +903,7 @@ def export_warehouse():
             return error_response("Warehouse not found", 404)
         
         # Generate phiếu xuất kho
-        ma_phieu = generate_id('PXK', 6)
-        while PhieuXuatKho.query.get(ma_phieu):
-            ma_phieu = generate_id('PXK', 6)
+        ma_phieu = id_allocator.next_id('PXK')
         
         phieu = PhieuXuatKho(
             MaPhieu=ma_phieu,
@@ -804,6 +916,7 @@ def export_warehouse():
         
         # Process items
         exported_items = []
+        allocations = []
         for item in data['items']:
             ma_sp = item.get('MaSP')
             ma_lo = item.get('MaLo')
@@ -857,10 +970,7 @@ def export_warehouse():
                         400
                     )
             
-            # Update stock
-            batch.SLTon -= so_luong
-            batch.MaPhieuXK = ma_phieu
-            
+            allocations.append((batch, so_luong))
             exported_items.append({
                 'MaSP': ma_sp,
                 'TenSP': san_pham.TenSP,
@@ -869,10 +979,23 @@ def export_warehouse():
                 'SoLuong': so_luong,
                 'DVT': san_pham.DVT,
                 'NSX': batch.NSX.isoformat() if batch.NSX else None,
-                'HSD': batch.HSD.isoformat() if batch.HSD else None,
-                'SLTonConLai': batch.SLTon
+                'HSD': batch.HSD.isoformat() if batch.HSD else None
             })
         
+        # Remaining stock from the values read above: the UPDATE expires SLTon
+        con_lai = {}
+        for batch, so_luong in allocations:
+            key = (batch.MaSP, batch.MaLo)
+            con_lai[key] = con_lai.get(key, batch.SLTon) - so_luong
+        
+        # Update stock (conditional - fails if the batch was drained meanwhile)
+        decrement_batches(
+            allocations, ma_phieu_xk=ma_phieu, ma_kho_ids={data['MaKho']},
+            loai=LoaiBienDong.XUAT_KHO, ma_tham_chieu=phieu.MaThamChieu, ly_do=phieu.MucDich
+        )
+        for (batch, _), exported_item in zip(allocations, exported_items):
+            exported_item['SLTonConLai'] = con_lai[(batch.MaSP, batch.MaLo)]
+        
         # Record who created this phiếu
         tao_phieu = TaoPhieu(
             MaNV=ma_nv,
@@ -891,6 +1014,9 @@ def export_warehouse():
         
         return success_response(result, message="Export successful", status=201)
         
+    except InsufficientStockError as e:
+        db.session.rollback()
+        return error_response(str(e), 400)
     except Exception as e:
         db.session.rollback()
         print(f"Export error: {str(e)}")
@@ -995,12 +1121,7 @@ def generate_batch_code():
         return error_response("MaSP is required", 400)
     
     # Generate unique batch code
-    import time
-    ma_lo = f"LO{int(time.time() * 1000) % 1000000:06d}"
-    
-    # Ensure uniqueness
-    while LoSP.query.filter_by(MaSP=ma_sp, MaLo=ma_lo).first():
-        ma_lo = f"LO{int(time.time() * 1000) % 1000000:06d}"
+    ma_lo = id_allocator.next_id('LO')
     
     return success_response({
         'MaLo': ma_lo,
@@ -1100,27 +1221,50 @@ def preview_import():
 
 @warehouse_bp.route('/transfer', methods=['GET'])
 @jwt_required()
+@read_replica
+@query_budget(5)
 def get_transfers():
     """Get all transfer receipts with proper item details"""
     try:
         phieu_list = PhieuChuyenKho.query.order_by(PhieuChuyenKho.NgayTao.desc()).all()
         
+        # Related export/import receipts and their batches, loaded once
+        phieu_xuat_by_ck = {}
+        for px in PhieuXuatKho.query.filter(PhieuXuatKho.MaPhieuCK.isnot(None)):
+            phieu_xuat_by_ck.setdefault(px.MaPhieuCK, px)
+        phieu_nhap_by_ck = {}
+        for pn in PhieuNhapKho.query.filter(PhieuNhapKho.MaPhieuCK.isnot(None)):
+            phieu_nhap_by_ck.setdefault(pn.MaPhieuCK, pn)
+        
+        batches_by_xk = {}
+        batches_by_nk = {}
+        ma_xk = {px.MaPhieu for px in phieu_xuat_by_ck.values()}
+        ma_nk = {pn.MaPhieu for pn in phieu_nhap_by_ck.values()}
+        if ma_xk or ma_nk:
+            for batch in LoSP.query.options(joinedload(LoSP.san_pham)).filter(
+                or_(LoSP.MaPhieuXK.in_(list(ma_xk)), LoSP.MaPhieuNK.in_(list(ma_nk)))
+            ):
+                if batch.MaPhieuXK in ma_xk:
+                    batches_by_xk.setdefault(batch.MaPhieuXK, []).append(batch)
+                if batch.MaPhieuNK in ma_nk:
+                    batches_by_nk.setdefault(batch.MaPhieuNK, []).append(batch)
+        
         result = []
         for phieu in phieu_list:
             phieu_data = phieu.to_dict()
             
             # Get related export and import receipts
-            phieu_xuat = PhieuXuatKho.query.filter_by(MaPhieuCK=phieu.MaPhieu).first()
-            phieu_nhap = PhieuNhapKho.query.filter_by(MaPhieuCK=phieu.MaPhieu).first()
+            phieu_xuat = phieu_xuat_by_ck.get(phieu.MaPhieu)
+            phieu_nhap = phieu_nhap_by_ck.get(phieu.MaPhieu)
             
             phieu_data['items'] = []
             
             # Strategy 1: Get items from export receipt (partial transfers)
             if phieu_xuat:
-                batches_xuat = LoSP.query.filter_by(MaPhieuXK=phieu_xuat.MaPhieu).all()
+                batches_xuat = batches_by_xk.get(phieu_xuat.MaPhieu, [])
                 
                 for batch in batches_xuat:
-                    san_pham = SanPham.query.get(batch.MaSP)
+                    san_pham = batch.san_pham
                     if san_pham:
                         # This is a partial transfer - batch still in source warehouse
                         phieu_data['items'].append({
@@ -1137,10 +1281,10 @@ def get_transfers():
             
             # Strategy 2: Get items from import receipt (for both full and partial)
             if phieu_nhap:
-                batches_nhap = LoSP.query.filter_by(MaPhieuNK=phieu_nhap.MaPhieu).all()
+                batches_nhap = batches_by_nk.get(phieu_nhap.MaPhieu, [])
                 
                 for batch in batches_nhap:
-                    san_pham = SanPham.query.get(batch.MaSP)
+                    san_pham = batch.san_pham
                     if san_pham:
                         # Check if this batch already in items (from partial transfer)
                         existing_item = next(
@@ -1172,13 +1316,13 @@ def get_transfers():
             if not phieu_data['items']:
                 # Look for batches that were moved to destination warehouse
                 # and have this transfer as reference
-                moved_batches = LoSP.query.filter(
-                    LoSP.MaKho == phieu.KhoNhap,
-                    LoSP.MaPhieuNK == phieu_nhap.MaPhieu if phieu_nhap else None
-                ).all()
+                moved_batches = [
+                    batch for batch in batches_by_nk.get(phieu_nhap.MaPhieu, [])
+                    if batch.MaKho == phieu.KhoNhap
+                ] if phieu_nhap else []
                 
                 for batch in moved_batches:
-                    san_pham = SanPham.query.get(batch.MaSP)
+                    san_pham = batch.san_pham
                     if san_pham:
                         phieu_data['items'].append({
                             'MaSP': batch.MaSP,
@@ -1323,6 +1467,10 @@ def delete_transfer(ma_phieu):
             db.session.delete(phieu_xuat)
         
         if phieu_nhap:
+            batches = LoSP.query.filter_by(MaPhieuNK=phieu_nhap.MaPhieu).all()
+            stock_ledger.record_deleted(
+                batches, ma_phieu=phieu_nhap.MaPhieu, ly_do=f"Xóa phiếu chuyển kho {ma_phieu}"
+            )
             LoSP.query.filter_by(MaPhieuNK=phieu_nhap.MaPhieu).delete()
             TaoPhieu.query.filter_by(MaPhieuTao=phieu_nhap.MaPhieu).delete()
             db.session.delete(phieu_nhap)
@@ -1455,14 +1603,12 @@ def scan_barcode_for_transfer():
     if not ma_vach or not ma_kho:
         return error_response("MaVach and MaKho are required", 400)
     
-    # Find batch by barcode
-    query = LoSP.query.filter_by(MaVach=ma_vach, MaKho=ma_kho)
+    # Find batch by barcode (in-memory index, DB fallback)
+    batch, san_pham = barcode_index.lookup(ma_vach)
     
-    # Add product filter if provided
-    if ma_sp:
-        query = query.filter_by(MaSP=ma_sp)
-    
-    batch = query.first()
+    # Batch must be in the requested warehouse (and product, if provided)
+    if batch and (batch['MaKho'] != ma_kho or (ma_sp and batch['MaSP'] != ma_sp)):
+        batch = None
     
     if not batch:
         if ma_sp:
@@ -1477,7 +1623,7 @@ def scan_barcode_for_transfer():
             )
     
     # Check if batch has stock
-    if batch.SLTon <= 0:
+    if batch['SLTon'] <= 0:
         return error_response(
             f"Batch with barcode {ma_vach} has no available stock", 
             400
@@ -1488,18 +1634,16 @@ def scan_barcode_for_transfer():
     days_to_expiry = None
     warnings = []
     
-    if batch.HSD:
-        days_to_expiry = (batch.HSD - datetime.utcnow().date()).days
+    hsd = date.fromisoformat(batch['HSD']) if batch['HSD'] else None
+    if hsd:
+        days_to_expiry = (hsd - datetime.utcnow().date()).days
         is_expired = days_to_expiry < 0
         
         if is_expired:
-            warnings.append(f"Lô hàng đã hết hạn từ ngày {batch.HSD}")
+            warnings.append(f"Lô hàng đã hết hạn từ ngày {hsd}")
         elif days_to_expiry <= 7:
             warnings.append(f"Lô hàng sắp hết hạn trong {days_to_expiry} ngày")
     
-    # Get product info
-    san_pham = SanPham.query.get(batch.MaSP)
-    
     # Calculate status
     status = 'normal'
     if days_to_expiry is not None:
@@ -1512,13 +1656,13 @@ def scan_barcode_for_transfer():
     
     return success_response({
         'batch_info': {
-            **batch.to_dict(),
+            **batch,
             'days_to_expiry': days_to_expiry,
             'status': status,
             'is_expired': is_expired,
-            'is_transferable': batch.SLTon > 0  # Có thể chuyển nếu còn tồn kho
+            'is_transferable': batch['SLTon'] > 0  # Có thể chuyển nếu còn tồn kho
         },
-        'product_info': san_pham.to_dict() if san_pham else None,
+        'product_info': san_pham,
         'scan_timestamp': datetime.utcnow().isoformat(),
         'warnings': warnings
     })
@@ -7,11 +7,20 @@ UC09: Hủy hàng
 
 from flask import Blueprint, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import PhieuKiemKho, BaoCao, LoSP, PhieuNhapKho, PhieuXuatKho, TaoPhieu, DuyetPhieu
+from app.models import (
+    PhieuKiemKho, BaoCao, LoSP, PhieuNhapKho, PhieuXuatKho, TaoPhieu, DuyetPhieu, LoaiBienDong
+)
 from app import db
 from app.utils.auth import role_required
-from app.utils.helpers import success_response, error_response, generate_id
-from datetime import datetime
+from app.utils.helpers import success_response, error_response
+from app.utils.db_routing import read_replica
+from app.utils.db_metrics import query_budget
+from app.services import (
+    warehouse_registry, barcode_index, id_allocator,
+    InsufficientStockError, decrement_batches, increment_batches
+)
+from datetime import datetime, date
+from sqlalchemy.orm import joinedload
 
 warehouse_inventory_bp = Blueprint('warehouse_inventory', __name__)
 
@@ -23,6 +32,7 @@ warehouse_inventory_bp = Blueprint('warehouse_inventory', __name__)
 @warehouse_inventory_bp.route('/inventory/start', methods=['POST'])
 @jwt_required()
 @role_required('Quản lý', 'Nhân viên')
+@query_budget(9)
 def start_inventory():
     """
     Bắt đầu kiểm kho (UC06)
@@ -54,9 +64,7 @@ def start_inventory():
         return error_response("Warehouse not found", 404)
     
     # Generate phiếu kiểm kho
-    ma_phieu = generate_id('PKK', 6)
-    while PhieuKiemKho.query.get(ma_phieu):
-        ma_phieu = generate_id('PKK', 6)
+    ma_phieu = id_allocator.next_id('PKK')
     
     phieu = PhieuKiemKho(
         MaPhieu=ma_phieu,
@@ -68,12 +76,11 @@ def start_inventory():
     db.session.add(phieu)
     
     # Get all batches in this warehouse (snapshot at start time)
-    batches = LoSP.query.filter_by(MaKho=data['MaKho']).all()
+    batches = LoSP.query.options(joinedload(LoSP.san_pham)).filter_by(MaKho=data['MaKho']).all()
     
     batch_list = []
     for batch in batches:
-        from app.models import SanPham
-        san_pham = SanPham.query.get(batch.MaSP)
+        san_pham = batch.san_pham
         
         batch_data = {
             'MaSP': batch.MaSP,
@@ -125,33 +132,29 @@ def scan_batch_for_inventory():
     if not ma_vach or not ma_kho:
         return error_response("MaVach and MaKho are required", 400)
     
-    # Find batch by barcode
-    batch = LoSP.query.filter_by(MaVach=ma_vach, MaKho=ma_kho).first()
+    # Find batch by barcode (in-memory index, DB fallback)
+    batch, san_pham = barcode_index.lookup(ma_vach)
     
-    if not batch:
+    if not batch or batch['MaKho'] != ma_kho:
         return error_response(
             f"Barcode {ma_vach} not found in warehouse {ma_kho}", 
             404
         )
     
-    # Get product info
-    from app.models import SanPham
-    san_pham = SanPham.query.get(batch.MaSP)
-    
     # Check expiry status
     is_expired = False
     days_to_expiry = None
-    if batch.HSD:
-        days_to_expiry = (batch.HSD - datetime.utcnow().date()).days
+    if batch['HSD']:
+        days_to_expiry = (date.fromisoformat(batch['HSD']) - datetime.utcnow().date()).days
         is_expired = days_to_expiry < 0
     
     return success_response({
         'batch_info': {
-            **batch.to_dict(),
+            **batch,
             'days_to_expiry': days_to_expiry,
             'is_expired': is_expired
         },
-        'product_info': san_pham.to_dict() if san_pham else None,
+        'product_info': san_pham,
         'scan_timestamp': datetime.utcnow().isoformat()
     })
 
@@ -224,9 +227,7 @@ def record_inventory():
         chenh_lech = sl_thuc_te - sl_he_thong
         
         # Generate report ID
-        ma_bao_cao = generate_id('BC', 6)
-        while BaoCao.query.filter_by(MaPhieu=ma_phieu, MaBaoCao=ma_bao_cao).first():
-            ma_bao_cao = generate_id('BC', 6)
+        ma_bao_cao = id_allocator.next_id('BC')
         
         # Create report entry
         bao_cao = BaoCao(
@@ -282,6 +283,7 @@ def record_inventory():
 
 @warehouse_inventory_bp.route('/inventory', methods=['GET'])
 @jwt_required()
+@read_replica
 def get_inventories():
     """Get all inventory checks"""
     try:
@@ -632,9 +634,7 @@ def adjust_inventory():
         
         if chenh_lech > 0:
             # Surplus -> Create import receipt
-            ma_phieu_nhap = generate_id('PNK', 6)
-            while PhieuNhapKho.query.get(ma_phieu_nhap):
-                ma_phieu_nhap = generate_id('PNK', 6)
+            ma_phieu_nhap = id_allocator.next_id('PNK')
             
             phieu_nhap = PhieuNhapKho(
                 MaPhieu=ma_phieu_nhap,
@@ -645,9 +645,14 @@ def adjust_inventory():
             
             db.session.add(phieu_nhap)
             
-            # Update batch
-            batch.SLTon = sl_thuc_te
-            batch.MaPhieuNK = ma_phieu_nhap
+            # Update batch (relative, so concurrent sales are not overwritten)
+            increment_batches(
+                [(batch, chenh_lech)],
+                ma_phieu_nk=ma_phieu_nhap,
+                loai=LoaiBienDong.DIEU_CHINH,
+                ma_tham_chieu=ma_phieu_kiem,
+                ly_do=phieu_nhap.MucDich
+            )
             
             tao_phieu = TaoPhieu(MaNV=ma_nv, MaPhieuTao=ma_phieu_nhap)
             db.session.add(tao_phieu)
@@ -662,9 +667,7 @@ def adjust_inventory():
             })
         else:  # chenh_lech < 0
             # Shortage -> Create export receipt
-            ma_phieu_xuat = generate_id('PXK', 6)
-            while PhieuXuatKho.query.get(ma_phieu_xuat):
-                ma_phieu_xuat = generate_id('PXK', 6)
+            ma_phieu_xuat = id_allocator.next_id('PXK')
             
             phieu_xuat = PhieuXuatKho(
                 MaPhieu=ma_phieu_xuat,
@@ -675,9 +678,18 @@ def adjust_inventory():
             
             db.session.add(phieu_xuat)
             
-            # Update batch
-            batch.SLTon = sl_thuc_te
-            batch.MaPhieuXK = ma_phieu_xuat
+            # Update batch (relative, so concurrent sales are not overwritten)
+            try:
+                decrement_batches(
+                    [(batch, -chenh_lech)],
+                    ma_phieu_xk=ma_phieu_xuat,
+                    loai=LoaiBienDong.DIEU_CHINH,
+                    ma_tham_chieu=ma_phieu_kiem,
+                    ly_do=phieu_xuat.MucDich
+                )
+            except InsufficientStockError as e:
+                db.session.rollback()
+                return error_response(str(e), 400)
             
             tao_phieu = TaoPhieu(MaNV=ma_nv, MaPhieuTao=ma_phieu_xuat)
             db.session.add(tao_phieu)
@@ -708,6 +720,7 @@ def adjust_inventory():
 
 @warehouse_inventory_bp.route('/adjustment/history', methods=['GET'])
 @jwt_required()
+@read_replica
 def get_adjustment_history():
     """
     Get history of all adjustments made
@@ -765,6 +778,7 @@ def get_adjustment_history():
 
 @warehouse_inventory_bp.route('/discard/error-warehouse-inventory', methods=['GET'])
 @jwt_required()
+@query_budget(2)
 def get_error_warehouse_inventory():
     """
     Get inventory in error warehouse for discarding
@@ -772,23 +786,23 @@ def get_error_warehouse_inventory():
     Response: List of batches in error warehouse with expiry info
     """
     try:
-        from app.models import KhoHang, LoaiKho, SanPham
+        from app.models import LoaiKho
         
-        # Find error warehouse
-        kho_loi = KhoHang.query.filter_by(Loai=LoaiKho.KHO_LOI).first()
+        # Find error warehouses
+        kho_loi_list = warehouse_registry.get_by_type(LoaiKho.KHO_LOI)
         
-        if not kho_loi:
+        if not kho_loi_list:
             return error_response("Error warehouse not found", 404)
         
-        # Get all batches in error warehouse with stock > 0
-        batches = LoSP.query.filter(
-            LoSP.MaKho == kho_loi.MaKho,
+        # Get all batches in error warehouses with stock > 0
+        batches = LoSP.query.options(joinedload(LoSP.san_pham)).filter(
+            LoSP.MaKho.in_([kho['MaKho'] for kho in kho_loi_list]),
             LoSP.SLTon > 0
         ).order_by(LoSP.HSD.asc()).all()
         
         result = []
         for batch in batches:
-            san_pham = SanPham.query.get(batch.MaSP)
+            san_pham = batch.san_pham
             if not san_pham:
                 continue
             
@@ -825,7 +839,8 @@ def get_error_warehouse_inventory():
             })
         
         return success_response({
-            'warehouse': kho_loi.to_dict(),
+            'warehouse': kho_loi_list[0],
+            'warehouses': kho_loi_list,
             'batches': result,
             'total_batches': len(result),
             'total_items': sum(b['SLTon'] for b in result)
@@ -859,15 +874,15 @@ def validate_discard():
     if not data.get('LyDo') or not data.get('items'):
         return error_response("LyDo and items are required", 400)
     
-    from app.models import KhoHang, LoaiKho, SanPham
+    from app.models import LoaiKho, SanPham
     
     warnings = []
     errors = []
     validated_items = []
     
-    # Find error warehouse
-    kho_loi = KhoHang.query.filter_by(Loai=LoaiKho.KHO_LOI).first()
-    if not kho_loi:
+    # Find error warehouses
+    kho_loi_ids = warehouse_registry.get_ids(LoaiKho.KHO_LOI)
+    if not kho_loi_ids:
         return error_response("Error warehouse not found", 404)
     
     for idx, item in enumerate(data['items']):
@@ -876,10 +891,10 @@ def validate_discard():
         so_luong = item.get('SoLuong', 0)
         
         # Find batch in error warehouse
-        batch = LoSP.query.filter_by(
-            MaSP=ma_sp,
-            MaLo=ma_lo,
-            MaKho=kho_loi.MaKho
+        batch = LoSP.query.filter(
+            LoSP.MaSP == ma_sp,
+            LoSP.MaLo == ma_lo,
+            LoSP.MaKho.in_(kho_loi_ids)
         ).first()
         
         if not batch:
@@ -923,7 +938,8 @@ def validate_discard():
         'summary': {
             'total_items': len(data['items']),
             'total_quantity': sum(item.get('SoLuong', 0) for item in data['items']),
-            'warehouse': kho_loi.MaKho,
+            'warehouse': sorted(kho_loi_ids)[0],
+            'warehouses': sorted(kho_loi_ids),
             'reason': data['LyDo']
         }
     })
@@ -963,18 +979,16 @@ def discard_goods():
         return error_response("items and LyDo are required", 400)
     
     try:
-        from app.models import KhoHang, LoaiKho, SanPham
+        from app.models import LoaiKho, SanPham
         
-        # Find error warehouse
-        kho_loi = KhoHang.query.filter_by(Loai=LoaiKho.KHO_LOI).first()
-        if not kho_loi:
+        # Find error warehouses
+        kho_loi_ids = warehouse_registry.get_ids(LoaiKho.KHO_LOI)
+        if not kho_loi_ids:
             db.session.rollback()
             return error_response("Error warehouse not found", 404)
         
         # Generate phiếu xuất kho for discarding
-        ma_phieu = generate_id('PXK', 6)
-        while PhieuXuatKho.query.get(ma_phieu):
-            ma_phieu = generate_id('PXK', 6)
+        ma_phieu = id_allocator.next_id('PXK')
         
         phieu = PhieuXuatKho(
             MaPhieu=ma_phieu,
@@ -986,6 +1000,7 @@ def discard_goods():
         db.session.add(phieu)
         
         discarded_items = []
+        allocations = []
         
         for item in data['items']:
             ma_sp = item.get('MaSP')
@@ -993,10 +1008,10 @@ def discard_goods():
             so_luong = item.get('SoLuong', 0)
             
             # Find batch in error warehouse
-            batch = LoSP.query.filter_by(
-                MaSP=ma_sp,
-                MaLo=ma_lo,
-                MaKho=kho_loi.MaKho
+            batch = LoSP.query.filter(
+                LoSP.MaSP == ma_sp,
+                LoSP.MaLo == ma_lo,
+                LoSP.MaKho.in_(kho_loi_ids)
             ).first()
             
             if not batch:
@@ -1013,12 +1028,9 @@ def discard_goods():
                     400
                 )
             
-            # Deduct stock
-            batch.SLTon -= so_luong
-            batch.MaPhieuXK = ma_phieu
-            
             san_pham = SanPham.query.get(ma_sp)
             
+            allocations.append((batch, so_luong))
             discarded_items.append({
                 'MaSP': ma_sp,
                 'TenSP': san_pham.TenSP if san_pham else ma_sp,
@@ -1028,10 +1040,23 @@ def discard_goods():
                 'NSX': batch.NSX.isoformat() if batch.NSX else None,
                 'HSD': batch.HSD.isoformat() if batch.HSD else None,
                 'SoLuong': so_luong,
-                'SLTonConLai': batch.SLTon,
                 'MaKho': batch.MaKho
             })
         
+        # Remaining stock from the values read above: the UPDATE expires SLTon
+        con_lai = {}
+        for batch, so_luong in allocations:
+            key = (batch.MaSP, batch.MaLo)
+            con_lai[key] = con_lai.get(key, batch.SLTon) - so_luong
+        
+        # Deduct stock (conditional - fails if the batch was drained meanwhile)
+        decrement_batches(
+            allocations, ma_phieu_xk=ma_phieu, ma_kho_ids=kho_loi_ids,
+            loai=LoaiBienDong.HUY_HANG, ly_do=f"Hủy hàng: {data['LyDo']}"
+        )
+        for (batch, _), discarded_item in zip(allocations, discarded_items):
+            discarded_item['SLTonConLai'] = con_lai[(batch.MaSP, batch.MaLo)]
+        
         # Record who created (for audit log)
         tao_phieu = TaoPhieu(MaNV=ma_nv, MaPhieuTao=ma_phieu)
         db.session.add(tao_phieu)
@@ -1047,6 +1072,9 @@ def discard_goods():
             'created_by': ma_nv
         }, message="Goods discarded successfully", status=201)
         
+    except InsufficientStockError as e:
+        db.session.rollback()
+        return error_response(str(e), 400)
     except Exception as e:
         db.session.rollback()
         print(f"Discard error: {str(e)}")
@@ -1057,6 +1085,7 @@ def discard_goods():
 
 @warehouse_inventory_bp.route('/discard/history', methods=['GET'])
 @jwt_required()
+@read_replica
 def get_discard_history():
     """
     Get history of all discard operations (for audit)
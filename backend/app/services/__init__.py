@@ -0,0 +1,38 @@
+"""Service layer - shared business logic used by several route modules"""
+
+from app.services.warehouse_registry import warehouse_registry
+from app.services.barcode_index import barcode_index
+from app.services.stock import (
+    InsufficientStockError, decrement_batches, increment_batches, move_batch
+)
+from app.services.fefo import allocate_fefo
+from app.services.product_search import product_search
+from app.services.invoice_cache import invoice_cache
+from app.services.id_allocator import id_allocator
+from app.services.barcode_allocator import barcode_allocator, BarcodeRangeExhausted
+from app.services import (
+    goods_receipt, stock_ledger, stock_summary, sales_rollup, sales_report
+)
+from app.services.exporters import exporters, UnknownExportFormat
+
+__all__ = [
+    'warehouse_registry',
+    'barcode_index',
+    'InsufficientStockError',
+    'decrement_batches',
+    'increment_batches',
+    'move_batch',
+    'allocate_fefo',
+    'product_search',
+    'invoice_cache',
+    'id_allocator',
+    'barcode_allocator',
+    'BarcodeRangeExhausted',
+    'goods_receipt',
+    'stock_ledger',
+    'stock_summary',
+    'sales_rollup',
+    'sales_report',
+    'exporters',
+    'UnknownExportFormat',
+]
@@ -0,0 +1,110 @@
+"""
+Barcode allocator - EAN-13 codes under the company prefix, reserved in blocks
+
+Mã vạch cho lô mới được cấp từ dải BARCODE_COMPANY_PREFIX + số thứ tự + số
+kiểm tra EAN-13, thay cho 13 chữ số ngẫu nhiên và vòng lặp kiểm tra trùng
+LoSP.MaVach cho từng lô.
+
+- Số thứ tự lấy từ bộ đếm BoDemMa ('EAN13') theo khối (id_allocator.reserve),
+  nên các worker không cấp trùng mã.
+- Mã đã có trong LoSP bị bỏ qua bằng một truy vấn IN cho mỗi khối; allocate(n)
+  trả về n mã trong một lần gọi.
+"""
+
+import threading
+
+from flask import current_app
+from sqlalchemy import select
+
+from app import db
+from app.models import LoSP
+from app.services.id_allocator import id_allocator
+from app.utils.helpers import ean13_check_digit
+
+_COUNTER = 'EAN13'
+
+
+class BarcodeRangeExhausted(Exception):
+    """Raised when every item reference under the company prefix is used"""
+
+
+class BarcodeAllocator:
+    """Process-wide allocator of EAN-13 barcodes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._free = []        # reversed list of unused codes
+        self._prefix = None    # company prefix the free codes were built with
+
+    def _company_prefix(self):
+        prefix = str(current_app.config.get('BARCODE_COMPANY_PREFIX', '8930000'))
+        if not prefix.isdigit() or not 1 <= len(prefix) <= 11:
+            raise ValueError(f"Invalid BARCODE_COMPANY_PREFIX: {prefix!r}")
+        return prefix
+
+    def _block_size(self):
+        return max(1, current_app.config.get('BARCODE_BLOCK_SIZE', 200))
+
+    def _refill(self, prefix, minimum):
+        """Reserve a block of item references and turn them into free codes"""
+        ref_digits = 12 - len(prefix)
+        size = max(self._block_size(), minimum)
+        start = id_allocator.reserve(_COUNTER, size)
+        stop = min(start + size, 10 ** ref_digits)
+        if start >= stop:
+            raise BarcodeRangeExhausted(
+                f"No EAN-13 item references left under company prefix {prefix}"
+            )
+
+        codes = []
+        for n in range(start, stop):
+            digits12 = f"{prefix}{n:0{ref_digits}d}"
+            codes.append(digits12 + ean13_check_digit(digits12))
+
+        taken = set()
+        for i in range(0, len(codes), 1000):
+            chunk = codes[i:i + 1000]
+            taken.update(db.session.execute(
+                select(LoSP.MaVach).where(LoSP.MaVach.in_(chunk))
+            ).scalars())
+
+        codes = [code for code in codes if code not in taken]
+        codes.reverse()
+        self._free = codes + self._free
+
+    def allocate(self, n=1):
+        """
+        Hand out ``n`` unused barcodes
+
+        Returns:
+            list: EAN-13 codes (strings)
+
+        Raises:
+            BarcodeRangeExhausted
+        """
+        if n <= 0:
+            return []
+
+        prefix = self._company_prefix()
+        with self._lock:
+            if self._prefix != prefix:
+                self._free = []
+                self._prefix = prefix
+            while len(self._free) < n:
+                self._refill(prefix, n - len(self._free))
+            codes = self._free[-n:]
+            del self._free[-n:]
+        codes.reverse()
+        return codes
+
+    def next_barcode(self):
+        """Hand out one unused barcode"""
+        return self.allocate(1)[0]
+
+    def reset(self):
+        """Drop the in-memory codes (the unused ones are skipped)"""
+        with self._lock:
+            self._free = []
+
+
+barcode_allocator = BarcodeAllocator()
@@ -0,0 +1,282 @@
+"""
+Barcode index - MaVach -> (batch, product) lookups served from memory
+
+Các endpoint quét mã vạch (bán hàng, xuất kho, chuyển kho, kiểm kho) tra
+cứu chỉ mục này thay vì truy vấn LoSP + SanPham cho mỗi lần quét.
+
+- Chỉ mục được nạp sẵn (warm) khi khởi động với các lô còn tồn.
+- Mọi thay đổi LoSP/SanPham qua ORM được ghi nhận bằng SQLAlchemy events
+  và áp dụng vào chỉ mục sau khi transaction commit (rollback thì bỏ qua).
+- Thay đổi tồn bằng Core UPDATE (app.services.stock) cập nhật SLTon, MaKho,
+  phiếu của mục đã có sau khi commit, nên lần quét kế tiếp vẫn không cần DB.
+- Mục không có trong chỉ mục hoặc đã quá BARCODE_INDEX_TTL giây sẽ được
+  nạp lại từ DB (một truy vấn) rồi lưu lại.
+"""
+
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import LoSP, SanPham
+
+
+class BarcodeIndex:
+    """Process-wide in-memory index of LoSP keyed by MaVach"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._batches = {}     # MaVach -> (batch_dict, loaded_at)
+        self._products = {}    # MaSP -> product_dict
+        self._warmed_at = None
+
+    # -----------------------------------------
+    # Loading
+    # -----------------------------------------
+
+    def _ttl(self):
+        return current_app.config.get('BARCODE_INDEX_TTL', 60)
+
+    def _is_fresh(self, loaded_at):
+        ttl = self._ttl()
+        return ttl <= 0 or time.monotonic() - loaded_at <= ttl
+
+    def warm(self):
+        """
+        Load every batch with stock plus its product (two queries)
+
+        Returns:
+            int: Number of indexed barcodes
+        """
+        now = time.monotonic()
+        products = {p.MaSP: p.to_dict() for p in SanPham.query.all()}
+        batches = {}
+        for batch in LoSP.query.filter(LoSP.MaVach.isnot(None), LoSP.SLTon > 0).all():
+            batches[batch.MaVach] = (batch.to_dict(), now)
+
+        with self._lock:
+            self._products = products
+            self._batches = batches
+            self._warmed_at = now
+
+        return len(batches)
+
+    def _load_one(self, ma_vach):
+        """DB fallback for a single barcode (one query)"""
+        row = db.session.query(LoSP, SanPham)\
+            .outerjoin(SanPham, LoSP.MaSP == SanPham.MaSP)\
+            .filter(LoSP.MaVach == ma_vach)\
+            .first()
+
+        if not row:
+            self.remove(ma_vach)
+            return None, None
+
+        batch, product = row
+        batch_data = batch.to_dict()
+        product_data = product.to_dict() if product else None
+        with self._lock:
+            self._batches[ma_vach] = (batch_data, time.monotonic())
+            if product_data:
+                self._products[product.MaSP] = product_data
+
+        return batch_data, product_data
+
+    # -----------------------------------------
+    # Lookups
+    # -----------------------------------------
+
+    def lookup(self, ma_vach):
+        """
+        Find batch and product info by barcode
+
+        Args:
+            ma_vach: Barcode
+
+        Returns:
+            tuple: (batch_dict, product_dict), (None, None) if not found
+        """
+        entry = self._batches.get(ma_vach)
+        if entry and self._is_fresh(entry[1]):
+            batch_data = entry[0]
+            product_data = self._products.get(batch_data['MaSP'])
+            if product_data is not None:
+                return dict(batch_data), dict(product_data)
+
+        batch_data, product_data = self._load_one(ma_vach)
+        if batch_data is None:
+            return None, None
+        return dict(batch_data), dict(product_data) if product_data else None
+
+    def stats(self):
+        """Basic size information (for diagnostics)"""
+        return {
+            'barcodes': len(self._batches),
+            'products': len(self._products),
+            'warmed': self._warmed_at is not None,
+        }
+
+    # -----------------------------------------
+    # Incremental updates
+    # -----------------------------------------
+
+    def put_batch(self, batch_data):
+        """Insert/replace a batch snapshot (dict from LoSP.to_dict())"""
+        if not batch_data.get('MaVach'):
+            return
+        with self._lock:
+            self._batches[batch_data['MaVach']] = (dict(batch_data), time.monotonic())
+
+    def update_stock(self, ma_vach, delta, **fields):
+        """
+        Apply a committed stock change to an indexed barcode
+
+        ``delta`` is added to SLTon and ``fields`` (MaKho, MaPhieuNK...)
+        replace the cached values. loaded_at is kept, so the TTL still
+        bounds drift from changes committed by other workers; barcodes that
+        are not indexed are left to the DB fallback.
+        """
+        with self._lock:
+            entry = self._batches.get(ma_vach)
+            if entry:
+                batch_data = dict(entry[0])
+                batch_data['SLTon'] = (batch_data.get('SLTon') or 0) + delta
+                batch_data.update(fields)
+                self._batches[ma_vach] = (batch_data, entry[1])
+
+    def put_product(self, product_data):
+        """Insert/replace a product snapshot (dict from SanPham.to_dict())"""
+        with self._lock:
+            self._products[product_data['MaSP']] = dict(product_data)
+
+    def remove(self, ma_vach):
+        with self._lock:
+            self._batches.pop(ma_vach, None)
+
+    def remove_product(self, ma_sp):
+        with self._lock:
+            self._products.pop(ma_sp, None)
+
+    def update_stock_on_commit(self, session, changes):
+        """
+        Apply stock changes once the session commits
+
+        For Core-level UPDATEs (the set-based stock changes in
+        app.services.stock) which don't go through the mapper events below.
+
+        Args:
+            changes: Iterable of (MaVach, delta, fields), see update_stock()
+        """
+        pending = _pending(session)
+        for ma_vach, delta, fields in changes:
+            if ma_vach:
+                pending.append(('stock', (ma_vach, delta, fields)))
+
+    def evict_on_commit(self, session, barcodes):
+        """
+        Drop barcodes once the session commits
+
+        For Core-level DELETEs of batches, which don't go through the
+        mapper events below.
+        """
+        pending = _pending(session)
+        for ma_vach in barcodes:
+            if ma_vach:
+                pending.append(('remove', ma_vach))
+
+    def invalidate(self):
+        """Drop all entries; lookups fall back to the DB until re-warmed"""
+        with self._lock:
+            self._batches = {}
+            self._products = {}
+            self._warmed_at = None
+
+
+barcode_index = BarcodeIndex()
+
+
+# =============================================
+# SQLAlchemy hooks - collect changes per session, apply after commit
+# =============================================
+
+def _pending(session):
+    return session.info.setdefault('barcode_index_pending', [])
+
+
+@event.listens_for(LoSP, 'after_insert')
+@event.listens_for(LoSP, 'after_update')
+def _batch_changed(mapper, connection, target):
+    session = inspect(target).session
+    if session is None:
+        return
+    pending = _pending(session)
+
+    # Barcode was changed - drop the old key
+    old_codes = inspect(target).attrs.MaVach.history.deleted
+    for old_code in old_codes or ():
+        if old_code:
+            pending.append(('remove', old_code))
+
+    pending.append(('batch', target.to_dict()))
+
+
+@event.listens_for(LoSP, 'after_delete')
+def _batch_deleted(mapper, connection, target):
+    session = inspect(target).session
+    if session is not None and target.MaVach:
+        _pending(session).append(('remove', target.MaVach))
+
+
+@event.listens_for(SanPham, 'after_insert')
+@event.listens_for(SanPham, 'after_update')
+def _product_changed(mapper, connection, target):
+    session = inspect(target).session
+    if session is not None:
+        _pending(session).append(('product', target.to_dict()))
+
+
+@event.listens_for(SanPham, 'after_delete')
+def _product_deleted(mapper, connection, target):
+    session = inspect(target).session
+    if session is not None:
+        _pending(session).append(('remove_product', target.MaSP))
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def _bulk_changed(update_context):
+    """Query.update()/delete() bypass mapper events - reset the index"""
+    if update_context.mapper.class_ in (LoSP, SanPham):
+        _pending(update_context.session).append(('reset', None))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pending(session):
+    pending = session.info.pop('barcode_index_pending', None)
+    if not pending:
+        return
+
+    for action, payload in pending:
+        if action == 'batch':
+            barcode_index.put_batch(payload)
+        elif action == 'stock':
+            ma_vach, delta, fields = payload
+            barcode_index.update_stock(ma_vach, delta, **fields)
+        elif action == 'remove':
+            barcode_index.remove(payload)
+        elif action == 'product':
+            barcode_index.put_product(payload)
+        elif action == 'remove_product':
+            barcode_index.remove_product(payload)
+        elif action == 'reset':
+            barcode_index.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    if session.in_nested_transaction():
+        return  # Savepoint only: the enclosing transaction may still commit
+    session.info.pop('barcode_index_pending', None)
@@ -0,0 +1,251 @@
+"""
+Excel exporters (openpyxl)
+
+Chỉ được import qua exporter registry (app.services.exporters) ở lần xuất
+Excel đầu tiên.
+"""
+
+import io
+from datetime import datetime
+
+from openpyxl import Workbook
+from openpyxl.styles import Font, Alignment, PatternFill
+from openpyxl.utils import get_column_letter
+
+# Sales report group_by -> (sheet title, period column header)
+SALES_PERIOD_LABELS = {
+    'day': ('Theo ngày', 'Ngày'),
+    'week': ('Theo tuần', 'Tuần từ ngày'),
+    'month': ('Theo tháng', 'Tháng từ ngày'),
+}
+
+
+def inventory_report(data):
+    """Inventory report (GET /reports/export/inventory) as XLSX"""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Báo cáo tồn kho"
+    
+    # Header style
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    header_font = Font(bold=True, color="FFFFFF", size=12)
+    header_alignment = Alignment(horizontal="center", vertical="center")
+    
+    # Title
+    ws.merge_cells('A1:I1')
+    ws['A1'] = 'BÁO CÁO TỒN KHO'
+    ws['A1'].font = Font(bold=True, size=16)
+    ws['A1'].alignment = header_alignment
+    
+    # Date
+    ws.merge_cells('A2:I2')
+    ws['A2'] = f'Ngày tạo: {datetime.now().strftime("%d/%m/%Y %H:%M")}'
+    ws['A2'].alignment = header_alignment
+    
+    # Headers
+    headers = ['Mã kho', 'Mã SP', 'Tên sản phẩm', 'Loại', 'ĐVT', 'Số lô', 'Tồn kho', 'HSD gần nhất', 'Trạng thái']
+    ws.append([])  # Empty row
+    ws.append(headers)
+    
+    # Style headers
+    for col_num, header in enumerate(headers, 1):
+        cell = ws.cell(row=4, column=col_num)
+        cell.fill = header_fill
+        cell.font = header_font
+        cell.alignment = header_alignment
+    
+    # Data rows
+    for item in data['inventory']:
+        ws.append([
+            item['MaKho'],
+            item['MaSP'],
+            item['TenSP'],
+            item['LoaiSP'],
+            item['DVT'],
+            item['total_batches'],
+            item['total_stock'],
+            item['earliest_expiry'] or '',
+            item['status']
+        ])
+    
+    # Summary
+    ws.append([])
+    ws.append(['TỔNG KẾT'])
+    ws.append(['Tổng sản phẩm:', data['summary']['total_products']])
+    ws.append(['Tổng tồn kho:', data['summary']['total_stock']])
+    
+    # Auto-adjust column widths
+    for column in ws.columns:
+        max_length = 0
+        column = [cell for cell in column]
+        for cell in column:
+            try:
+                if len(str(cell.value)) > max_length:
+                    max_length = len(cell.value)
+            except:
+                pass
+        adjusted_width = (max_length + 2)
+        # column[0] is a MergedCell (no column_letter) under the merged title
+        ws.column_dimensions[get_column_letter(column[0].column)].width = adjusted_width
+    
+    # Save to bytes
+    excel_file = io.BytesIO()
+    wb.save(excel_file)
+    excel_file.seek(0)
+    return excel_file
+
+
+def sales_report(data):
+    """Sales report (GET /reports/export/sales) as XLSX"""
+    wb = Workbook()
+    
+    # Sheet 1: Summary
+    ws1 = wb.active
+    ws1.title = "Tổng quan"
+    
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    header_font = Font(bold=True, color="FFFFFF")
+    
+    ws1['A1'] = 'BÁO CÁO BÁN HÀNG'
+    ws1['A1'].font = Font(bold=True, size=16)
+    ws1.merge_cells('A1:D1')
+    
+    ws1['A2'] = f'Từ ngày: {data["period"]["from_date"]} đến {data["period"]["to_date"]}'
+    ws1.merge_cells('A2:D2')
+    
+    ws1.append([])
+    ws1.append(['Chỉ tiêu', 'Giá trị'])
+    ws1['A4'].fill = header_fill
+    ws1['A4'].font = header_font
+    ws1['B4'].fill = header_fill
+    ws1['B4'].font = header_font
+    
+    summary = data['summary']
+    ws1.append(['Tổng doanh thu', f"{summary['total_revenue']:,.0f} VNĐ"])
+    ws1.append(['Tổng số lượng', summary['total_quantity']])
+    ws1.append(['Số hóa đơn', summary['total_invoices']])
+    ws1.append(['TB doanh thu/ngày', f"{summary['average_revenue_per_day']:,.0f} VNĐ"])
+    ws1.append(['TB giá trị hóa đơn', f"{summary['average_invoice_value']:,.0f} VNĐ"])
+    
+    # Sheet 2: Daily Sales
+    if data.get('daily_sales'):
+        sheet_title, period_header = SALES_PERIOD_LABELS.get(
+            data.get('group_by'), SALES_PERIOD_LABELS['day']
+        )
+        ws2 = wb.create_sheet(title=sheet_title)
+        ws2.append([period_header, 'Doanh thu', 'Số lượng', 'Số hóa đơn'])
+        
+        for col_num in range(1, 5):
+            cell = ws2.cell(row=1, column=col_num)
+            cell.fill = header_fill
+            cell.font = header_font
+        
+        for sale in data['daily_sales']:
+            ws2.append([
+                sale['date'],
+                sale['total_revenue'],
+                sale['total_quantity'],
+                sale['total_invoices']
+            ])
+    
+    # Sheet 3: Top Products
+    if data.get('top_products'):
+        ws3 = wb.create_sheet(title="Sản phẩm bán chạy")
+        ws3.append(['#', 'Mã SP', 'Tên sản phẩm', 'Giá bán', 'Đã bán', 'Doanh thu'])
+        
+        for col_num in range(1, 7):
+            cell = ws3.cell(row=1, column=col_num)
+            cell.fill = header_fill
+            cell.font = header_font
+        
+        for idx, product in enumerate(data['top_products'], 1):
+            ws3.append([
+                idx,
+                product['MaSP'],
+                product['TenSP'],
+                product['GiaBan'],
+                product['total_quantity'],
+                product['total_revenue']
+            ])
+    
+    excel_file = io.BytesIO()
+    wb.save(excel_file)
+    excel_file.seek(0)
+    return excel_file
+
+
+def expiry_report(data):
+    """Expiry report (GET /reports/export/expiry) as XLSX"""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Báo cáo HSD"
+    
+    header_fill = PatternFill(start_color="C00000", end_color="C00000", fill_type="solid")
+    header_font = Font(bold=True, color="FFFFFF")
+    
+    ws['A1'] = 'BÁO CÁO HẠN SỬ DỤNG'
+    ws['A1'].font = Font(bold=True, size=16)
+    ws.merge_cells('A1:H1')
+    
+    ws['A2'] = f'Ngày tạo: {datetime.now().strftime("%d/%m/%Y %H:%M")}'
+    ws.merge_cells('A2:H2')
+    
+    # Summary
+    ws.append([])
+    ws.append(['Đã hết hạn:', data['summary']['total_expired'], 'Sắp hết hạn:', data['summary']['total_expiring']])
+    
+    # Expired items
+    if data['expired']:
+        ws.append([])
+        ws.append(['ĐÃ HẾT HẠN'])
+        ws.cell(row=ws.max_row, column=1).font = Font(bold=True, color="C00000", size=14)
+        
+        headers = ['Mã kho', 'Sản phẩm', 'Mã lô', 'Barcode', 'HSD', 'SL tồn', 'Quá hạn (ngày)']
+        ws.append(headers)
+        
+        for col_num in range(1, len(headers) + 1):
+            cell = ws.cell(row=ws.max_row, column=col_num)
+            cell.fill = header_fill
+            cell.font = header_font
+        
+        for item in data['expired']:
+            ws.append([
+                item['MaKho'],
+                item['TenSP'],
+                item['MaLo'],
+                item['MaVach'],
+                item['HSD'],
+                item['SLTon'],
+                abs(item['days_to_expiry'])
+            ])
+    
+    # Expiring soon
+    if data['expiring']:
+        ws.append([])
+        ws.append(['SẮP HẾT HẠN'])
+        ws.cell(row=ws.max_row, column=1).font = Font(bold=True, color="FF6600", size=14)
+        
+        headers = ['Mã kho', 'Sản phẩm', 'Mã lô', 'Barcode', 'HSD', 'SL tồn', 'Còn lại (ngày)']
+        ws.append(headers)
+        
+        header_fill2 = PatternFill(start_color="FF6600", end_color="FF6600", fill_type="solid")
+        for col_num in range(1, len(headers) + 1):
+            cell = ws.cell(row=ws.max_row, column=col_num)
+            cell.fill = header_fill2
+            cell.font = header_font
+        
+        for item in data['expiring']:
+            ws.append([
+                item['MaKho'],
+                item['TenSP'],
+                item['MaLo'],
+                item['MaVach'],
+                item['HSD'],
+                item['SLTon'],
+                item['days_to_expiry']
+            ])
+    
+    excel_file = io.BytesIO()
+    wb.save(excel_file)
+    excel_file.seek(0)
+    return excel_file
@@ -0,0 +1,57 @@
+"""
+PDF exporters (reportlab)
+
+Chỉ được import qua exporter registry (app.services.exporters) ở lần xuất
+PDF đầu tiên.
+"""
+
+import io
+from datetime import datetime
+
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4
+
+
+def simple_report(title, data, headers, filename):
+    """Create a simple PDF report"""
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    
+    # Title
+    p.setFont("Helvetica-Bold", 16)
+    p.drawString(100, height - 50, title)
+    
+    # Date
+    p.setFont("Helvetica", 10)
+    p.drawString(100, height - 70, f'Ngay tao: {datetime.now().strftime("%d/%m/%Y %H:%M")}')
+    
+    # Note about Vietnamese characters
+    p.setFont("Helvetica", 8)
+    p.drawString(100, height - 85, '(Xuat Excel de xem day du tieng Viet)')
+    
+    # Simple data display
+    y_position = height - 120
+    p.setFont("Helvetica", 10)
+    p.drawString(100, y_position, f'Total records: {len(data)}')
+    
+    p.showPage()
+    p.save()
+    
+    buffer.seek(0)
+    return buffer
+
+
+def inventory_report(data):
+    """Inventory report (GET /reports/export/inventory) as PDF"""
+    return simple_report('BAO CAO TON KHO', data['inventory'], ['MaKho', 'MaSP', 'TenSP'], 'inventory')
+
+
+def sales_report(data):
+    """Sales report (GET /reports/export/sales) as PDF"""
+    return simple_report('BAO CAO BAN HANG', data['daily_sales'], ['date', 'total_revenue'], 'sales')
+
+
+def expiry_report(data):
+    """Expiry report (GET /reports/export/expiry) as PDF"""
+    return simple_report('BAO CAO HAN SU DUNG', data['expired'] + data['expiring'], ['MaKho', 'TenSP', 'HSD'], 'expiry')
@@ -0,0 +1,100 @@
+"""
+Exporter registry - report/format -> export function, loaded on first use
+
+reportlab và openpyxl nặng (thời gian import và bộ nhớ), trong khi đa số
+worker và mọi lệnh CLI (flask db upgrade, seed_passwords.py) không bao giờ
+xuất file. Registry chỉ lưu đường dẫn "module:function"; module backend
+(export_excel, export_pdf) chỉ được import ở lần xuất đầu tiên của định dạng
+đó rồi giữ lại.
+
+- exporters.register('inventory', 'excel', 'app.services.export_excel:inventory_report',
+  mimetype, 'xlsx') thêm hoặc thay một exporter (có thể truyền thẳng hàm).
+- exporters.export(report, fmt, data) trả về (BytesIO, mimetype, extension).
+"""
+
+import importlib
+import threading
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+PDF_MIMETYPE = 'application/pdf'
+
+
+class UnknownExportFormat(Exception):
+    """Raised when no exporter is registered for a report/format pair"""
+
+    def __init__(self, report, fmt, available):
+        self.report = report
+        self.format = fmt
+        self.available = available
+        super().__init__(f"No '{fmt}' exporter for report '{report}' (available: {', '.join(available)})")
+
+
+class ExporterRegistry:
+    """Process-wide mapping of (report, format) to lazily imported export functions"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._exporters = {}    # (report, format) -> {'target', 'mimetype', 'extension'}
+        self._resolved = {}     # target -> callable
+
+    def register(self, report, fmt, target, mimetype, extension):
+        """
+        Register an exporter
+
+        Args:
+            report: Report name ('inventory', 'sales', ...)
+            fmt: Format name as used in ?format= ('excel', 'pdf', ...)
+            target: 'module:function' (imported on first use) or a callable
+                taking the report data and returning a BytesIO
+            mimetype: Response mimetype
+            extension: File extension without the dot
+        """
+        with self._lock:
+            self._exporters[(report, fmt)] = {
+                'target': target, 'mimetype': mimetype, 'extension': extension
+            }
+
+    def formats(self, report):
+        """Formats registered for a report"""
+        return sorted(fmt for (name, fmt) in self._exporters if name == report)
+
+    def supports(self, report, fmt):
+        return (report, fmt) in self._exporters
+
+    def _resolve(self, target):
+        if callable(target):
+            return target
+        fn = self._resolved.get(target)
+        if fn is None:
+            module_name, _, attr = target.partition(':')
+            fn = getattr(importlib.import_module(module_name), attr)
+            with self._lock:
+                self._resolved[target] = fn
+        return fn
+
+    def export(self, report, fmt, data):
+        """
+        Render report data with the registered exporter
+
+        Returns:
+            tuple: (BytesIO, mimetype, extension)
+
+        Raises:
+            UnknownExportFormat: nothing registered for (report, fmt)
+        """
+        entry = self._exporters.get((report, fmt))
+        if entry is None:
+            raise UnknownExportFormat(report, fmt, self.formats(report))
+        buffer = self._resolve(entry['target'])(data)
+        return buffer, entry['mimetype'], entry['extension']
+
+    def loaded(self):
+        """Targets imported so far (for diagnostics)"""
+        return sorted(t for t in self._resolved if isinstance(t, str))
+
+
+exporters = ExporterRegistry()
+
+for _report in ('inventory', 'sales', 'expiry'):
+    exporters.register(_report, 'excel', f'app.services.export_excel:{_report}_report', XLSX_MIMETYPE, 'xlsx')
+    exporters.register(_report, 'pdf', f'app.services.export_pdf:{_report}_report', PDF_MIMETYPE, 'pdf')
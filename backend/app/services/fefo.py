@@ -0,0 +1,74 @@
+"""
+FEFO allocation (First Expired, First Out)
+
+Phân bổ số lượng bán của từng sản phẩm vào các lô còn hạn theo HSD gần
+nhất trước. Toàn bộ giỏ hàng chỉ cần một truy vấn có sắp xếp.
+"""
+
+from datetime import date
+
+from app.models import LoSP
+from app.services.stock import InsufficientStockError
+
+
+def allocate_fefo(quantities, ma_kho_ids, reserved=None, today=None):
+    """
+    Split requested quantities over non-expired batches, earliest HSD first
+
+    Batches without HSD are used last.
+
+    Args:
+        quantities: dict {MaSP: so_luong}
+        ma_kho_ids: Warehouses to allocate from
+        reserved: dict {(MaSP, MaLo): so_luong} already taken from a batch
+            by other lines of the same basket (optional)
+        today: Reference date for expiry (default: date.today())
+
+    Returns:
+        dict: {MaSP: [(LoSP, so_luong), ...]} in FEFO order
+
+    Raises:
+        InsufficientStockError: one shortage per product (MaLo is None)
+    """
+    if not quantities:
+        return {}
+
+    reserved = reserved or {}
+    today = today or date.today()
+
+    batches = LoSP.query.filter(
+        LoSP.MaSP.in_(list(quantities)),
+        LoSP.MaKho.in_(list(ma_kho_ids)),
+        LoSP.SLTon > 0,
+        (LoSP.HSD.is_(None)) | (LoSP.HSD >= today)
+    ).order_by(LoSP.MaSP, LoSP.HSD.is_(None), LoSP.HSD.asc(), LoSP.MaLo).all()
+
+    allocations = {ma_sp: [] for ma_sp in quantities}
+    remaining = dict(quantities)
+    available = {ma_sp: 0 for ma_sp in quantities}
+
+    for batch in batches:
+        free = batch.SLTon - reserved.get((batch.MaSP, batch.MaLo), 0)
+        if free <= 0:
+            continue
+        available[batch.MaSP] += free
+
+        need = remaining[batch.MaSP]
+        if need > 0:
+            take = min(free, need)
+            allocations[batch.MaSP].append((batch, take))
+            remaining[batch.MaSP] = need - take
+
+    shortages = [
+        {
+            'MaSP': ma_sp,
+            'MaLo': None,
+            'requested': quantities[ma_sp],
+            'available': available[ma_sp],
+        }
+        for ma_sp, need in remaining.items() if need > 0
+    ]
+    if shortages:
+        raise InsufficientStockError(shortages)
+
+    return allocations
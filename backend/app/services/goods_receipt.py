@@ -0,0 +1,303 @@
+"""
+Bulk goods receipt - large supplier deliveries imported in chunks
+
+Nhập kho hàng nghìn dòng (CSV/XLSX hoặc JSON lớn) theo từng khối:
+
+- Mỗi khối: một truy vấn IN cho sản phẩm, một truy vấn (MaSP, MaLo) IN cho
+  lô đã có, một UPDATE cộng tồn cho các lô đã có và một INSERT executemany
+  cho lô mới; mã lô/mã vạch lấy từ id_allocator/barcode_allocator (không
+  kiểm tra trùng từng dòng).
+- Mỗi khối commit riêng. Nếu dừng giữa chừng, phiếu nhập và các khối trước
+  đó vẫn được giữ; gửi lại cùng dữ liệu với MaPhieu và resume_from =
+  completed_lines + 1 để nhập tiếp. MaPhieu gửi lại phải là phiếu nhập đã
+  có và chỉ nhập vào cùng kho, được kiểm tra trước khối đầu tiên.
+- Dòng lỗi (thiếu mã, sai số lượng, sản phẩm không tồn tại...) được ghi vào
+  báo cáo từng dòng và bỏ qua, không làm hỏng cả phiếu.
+"""
+
+import csv
+import io
+from datetime import date, datetime
+from itertools import islice
+
+from sqlalchemy import insert, select, tuple_
+
+from app import db
+from app.models import LoSP, SanPham, PhieuNhapKho, TaoPhieu, BienDongKho, LoaiBienDong
+from app.services import stock_ledger
+from app.services.id_allocator import id_allocator
+from app.services.barcode_allocator import barcode_allocator
+from app.services.stock import increment_batches
+
+
+
+class ReceiptNotFound(LookupError):
+    """Raised when the slip given for a resume does not exist"""
+
+
+class ReceiptWarehouseMismatch(ValueError):
+    """Raised when the slip given for a resume received goods into another warehouse"""
+
+
+# Accepted column names (case-insensitive) -> field
+_COLUMNS = {
+    'masp': 'MaSP', 'ma_sp': 'MaSP',
+    'soluong': 'SoLuong', 'so_luong': 'SoLuong',
+    'nsx': 'NSX',
+    'hsd': 'HSD',
+    'malo': 'MaLo', 'ma_lo': 'MaLo',
+}
+
+
+# =============================================
+# Row sources
+# =============================================
+
+def _normalize_header(header):
+    return [_COLUMNS.get(str(h or '').strip().lower()) for h in header]
+
+
+def iter_csv_rows(stream):
+    """Yield row dicts from a CSV file (UTF-8, optional BOM)"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.reader(text)
+    header = _normalize_header(next(reader, []))
+    for values in reader:
+        if not any(v.strip() for v in values):
+            continue
+        yield {field: value for field, value in zip(header, values) if field}
+
+
+def iter_xlsx_rows(stream):
+    """Yield row dicts from the first sheet of an XLSX file (read-only mode)"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = _normalize_header(next(rows, ()))
+        for values in rows:
+            if all(v is None or str(v).strip() == '' for v in values):
+                continue
+            yield {field: value for field, value in zip(header, values) if field}
+    finally:
+        workbook.close()
+
+
+# =============================================
+# Line validation
+# =============================================
+
+def _parse_date(value):
+    if value in (None, ''):
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value).strip()[:10], '%Y-%m-%d').date()
+
+
+def _clean_line(row):
+    """
+    Validate one input row
+
+    Returns:
+        tuple: (line dict, None) or (None, error message)
+    """
+    ma_sp = str(row.get('MaSP') or '').strip()
+    if not ma_sp:
+        return None, "MaSP is required"
+
+    try:
+        so_luong = int(float(row.get('SoLuong') or 0))
+    except (TypeError, ValueError):
+        return None, f"Invalid SoLuong: {row.get('SoLuong')!r}"
+    if so_luong <= 0:
+        return None, "SoLuong must be positive"
+
+    try:
+        nsx = _parse_date(row.get('NSX'))
+        hsd = _parse_date(row.get('HSD'))
+    except ValueError:
+        return None, "Dates must be YYYY-MM-DD"
+
+    ma_lo = str(row.get('MaLo') or '').strip() or None
+    return {'MaSP': ma_sp, 'SoLuong': so_luong, 'NSX': nsx, 'HSD': hsd, 'MaLo': ma_lo}, None
+
+
+# =============================================
+# Import
+# =============================================
+
+def _import_chunk(numbered_rows, ma_kho, ma_phieu):
+    """Import one chunk; returns per-line results (caller commits)"""
+    results = {}
+    lines = []
+    for line_no, row in numbered_rows:
+        line, error = _clean_line(row)
+        if error:
+            results[line_no] = {'line': line_no, 'status': 'error', 'error': error}
+        else:
+            lines.append((line_no, line))
+
+    # Products (one query)
+    known = set(db.session.execute(
+        select(SanPham.MaSP).where(SanPham.MaSP.in_({l['MaSP'] for _, l in lines}))
+    ).scalars()) if lines else set()
+
+    valid = []
+    for line_no, line in lines:
+        if line['MaSP'] in known:
+            valid.append((line_no, line))
+        else:
+            results[line_no] = {
+                'line': line_no, 'status': 'error', 'error': f"Product {line['MaSP']} not found"
+            }
+
+    # Existing batches (one query)
+    keys = {(l['MaSP'], l['MaLo']) for _, l in valid if l['MaLo']}
+    existing = {}
+    if keys:
+        for batch in LoSP.query.filter(tuple_(LoSP.MaSP, LoSP.MaLo).in_(list(keys))):
+            existing[(batch.MaSP, batch.MaLo)] = batch
+
+    increments = []
+    new_batches = {}           # (MaSP, MaLo) -> insert row
+    new_lines = []
+    for line_no, line in valid:
+        key = (line['MaSP'], line['MaLo'])
+        batch = existing.get(key) if line['MaLo'] else None
+        if batch is not None:
+            increments.append((batch, line['SoLuong']))
+            results[line_no] = {
+                'line': line_no, 'status': 'updated', 'MaSP': key[0], 'MaLo': key[1],
+                'MaVach': batch.MaVach, 'SoLuong': line['SoLuong']
+            }
+        elif line['MaLo'] and key in new_batches:
+            # Same new batch repeated within the chunk
+            new_batches[key]['SLTon'] += line['SoLuong']
+            new_lines.append((line_no, key, line['SoLuong']))
+        else:
+            if not line['MaLo']:
+                key = (line['MaSP'], id_allocator.next_id('LO'))
+            new_batches[key] = {
+                'MaSP': key[0],
+                'MaLo': key[1],
+                'MaVach': None,
+                'NSX': line['NSX'],
+                'HSD': line['HSD'],
+                'SLTon': line['SoLuong'],
+                'MaKho': ma_kho,
+                'MaPhieuNK': ma_phieu,
+            }
+            new_lines.append((line_no, key, line['SoLuong']))
+
+    # Barcodes for all new batches (one call)
+    for row, ma_vach in zip(new_batches.values(), barcode_allocator.allocate(len(new_batches))):
+        row['MaVach'] = ma_vach
+
+    if increments:
+        increment_batches(increments, ma_phieu_nk=ma_phieu, loai=LoaiBienDong.NHAP_KHO)
+    if new_batches:
+        db.session.execute(insert(LoSP.__table__), list(new_batches.values()))
+        stock_ledger.record(
+            LoaiBienDong.NHAP_KHO,
+            [(r['MaSP'], r['MaLo'], ma_kho, r['SLTon']) for r in new_batches.values()],
+            ma_phieu=ma_phieu
+        )
+
+    for line_no, key, so_luong in new_lines:
+        results[line_no] = {
+            'line': line_no, 'status': 'created', 'MaSP': key[0], 'MaLo': key[1],
+            'MaVach': new_batches[key]['MaVach'], 'SoLuong': so_luong
+        }
+
+    return [results[line_no] for line_no, _ in numbered_rows]
+
+
+def _check_resumable(ma_phieu, ma_kho):
+    """The slip to resume must exist and hold receipts into ``ma_kho`` only"""
+    if not PhieuNhapKho.query.get(ma_phieu):
+        raise ReceiptNotFound(f"Import receipt {ma_phieu} not found")
+
+    other_kho = db.session.execute(
+        select(BienDongKho.MaKho)
+        .where(
+            BienDongKho.MaPhieu == ma_phieu,
+            BienDongKho.Loai == LoaiBienDong.NHAP_KHO,
+            BienDongKho.MaKho != ma_kho
+        )
+        .limit(1)
+    ).scalar()
+    if other_kho is not None:
+        raise ReceiptWarehouseMismatch(
+            f"Import receipt {ma_phieu} belongs to warehouse {other_kho}, not {ma_kho}"
+        )
+
+
+def import_goods_receipt(rows, ma_kho, ma_nv, ma_phieu=None, muc_dich=None,
+                         ma_tham_chieu=None, chunk_size=500, resume_from=1):
+    """
+    Import a large delivery chunk by chunk, committing after each chunk
+
+    Args:
+        rows: Iterable of row dicts (MaSP, SoLuong, NSX, HSD, MaLo)
+        ma_kho: Destination warehouse
+        ma_nv: Staff creating the slip
+        ma_phieu: Existing slip to resume (optional; a new one is created)
+        muc_dich, ma_tham_chieu: Slip fields for a new slip
+        chunk_size: Lines per transaction
+        resume_from: First line number (1-based) to import
+
+    Returns:
+        dict: MaPhieu, completed_lines, summary counts, per-line results and,
+        if a chunk failed, the error (earlier chunks stay committed)
+
+    Raises:
+        ReceiptNotFound, ReceiptWarehouseMismatch: ``ma_phieu`` can't be
+            resumed into ``ma_kho`` (nothing is imported)
+    """
+    if ma_phieu:
+        _check_resumable(ma_phieu, ma_kho)
+    else:
+        ma_phieu = id_allocator.next_id('PNK')
+        db.session.add(PhieuNhapKho(
+            MaPhieu=ma_phieu,
+            NgayTao=datetime.utcnow(),
+            MucDich=muc_dich or 'Nhập hàng từ nhà cung cấp',
+            MaThamChieu=ma_tham_chieu
+        ))
+        db.session.add(TaoPhieu(MaNV=ma_nv, MaPhieuTao=ma_phieu))
+        db.session.commit()
+
+    report = {
+        'MaPhieu': ma_phieu,
+        'completed_lines': resume_from - 1,
+        'summary': {'created': 0, 'updated': 0, 'error': 0},
+        'lines': [],
+        'error': None,
+    }
+
+    numbered = (
+        (line_no, row) for line_no, row in enumerate(rows, start=1)
+        if line_no >= resume_from
+    )
+    while True:
+        chunk = list(islice(numbered, max(1, chunk_size)))
+        if not chunk:
+            break
+        try:
+            results = _import_chunk(chunk, ma_kho, ma_phieu)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            report['error'] = f"Lines {chunk[0][0]}-{chunk[-1][0]}: {str(e)}"
+            break
+
+        report['completed_lines'] = chunk[-1][0]
+        report['lines'].extend(results)
+        for result in results:
+            report['summary'][result['status']] += 1
+
+    return report
@@ -0,0 +1,136 @@
+"""
+ID allocator - collision-free document codes handed out in blocks
+
+Thay cho generate_id() ngẫu nhiên + vòng lặp Model.query.get() cho đến khi
+gặp mã chưa dùng. Bảng BoDemMa giữ số tiếp theo của mỗi tiền tố; mỗi worker
+lấy một khối ID_BLOCK_SIZE số bằng một UPDATE nguyên tử rồi cấp dần trong
+bộ nhớ, nên trung bình không tốn truy vấn nào cho mỗi mã.
+
+- Khối được lấy trong transaction riêng (commit ngay), hai worker không bao
+  giờ nhận cùng một khối và rollback của request không trả số về bộ đếm.
+- Khi lấy khối, các mã đã tồn tại (mã ngẫu nhiên cũ) bị bỏ qua bằng một
+  truy vấn IN.
+- Định dạng giữ nguyên: tiền tố + số đệm 0 (HD000123, SP0042).
+"""
+
+import threading
+
+from flask import current_app
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import (
+    BoDemMa, HoaDon, PhieuXuatKho, PhieuNhapKho, PhieuChuyenKho, PhieuKiemKho,
+    BaoCao, YeuCauTraHang, DatHang, SanPham, LoSP
+)
+
+# Prefix -> key column, used to skip codes that are already taken
+_ID_COLUMNS = {
+    'HD': HoaDon.MaHD,
+    'PXK': PhieuXuatKho.MaPhieu,
+    'PNK': PhieuNhapKho.MaPhieu,
+    'PCK': PhieuChuyenKho.MaPhieu,
+    'PKK': PhieuKiemKho.MaPhieu,
+    'BC': BaoCao.MaBaoCao,
+    'YC': YeuCauTraHang.MaYC,
+    'DH': DatHang.MaDonHang,
+    'SP': SanPham.MaSP,
+    'LO': LoSP.MaLo,
+}
+
+
+def _bump(conn, prefix, size):
+    """
+    Advance the counter of a prefix by ``size``
+
+    Returns:
+        int: First number of the reserved block
+    """
+    table = BoDemMa.__table__
+    result = conn.execute(
+        update(table)
+        .where(table.c.TienTo == prefix)
+        .values(GiaTriTiep=table.c.GiaTriTiep + size)
+    )
+    if result.rowcount == 0:
+        conn.execute(insert(table).values(TienTo=prefix, GiaTriTiep=1 + size))
+        return 1
+
+    end = conn.execute(
+        select(table.c.GiaTriTiep).where(table.c.TienTo == prefix)
+    ).scalar_one()
+    return end - size
+
+
+class IdAllocator:
+    """Process-wide allocator of prefixed codes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._blocks = {}      # (prefix, length) -> list of free codes (reversed)
+
+    def _block_size(self):
+        return max(1, current_app.config.get('ID_BLOCK_SIZE', 50))
+
+    def reserve(self, prefix, size):
+        """
+        Reserve ``size`` consecutive numbers of a counter
+
+        Returns:
+            int: First number of the block
+        """
+        if db.engine.dialect.name == 'sqlite':
+            # Single-writer database: a second connection would wait on the
+            # request's own write lock. Taken codes are skipped on refill.
+            return _bump(db.session.connection(), prefix, size)
+
+        for attempt in range(2):
+            try:
+                with db.engine.begin() as conn:
+                    return _bump(conn, prefix, size)
+            except IntegrityError:
+                # Another worker created the counter row first - retry the UPDATE
+                if attempt:
+                    raise
+
+    def _refill(self, prefix, length):
+        size = self._block_size()
+        start = self.reserve(prefix, size)
+        codes = [f"{prefix}{n:0{length}d}" for n in range(start, start + size)]
+
+        column = _ID_COLUMNS.get(prefix)
+        if column is not None:
+            taken = set(db.session.execute(
+                select(column).where(column.in_(codes))
+            ).scalars())
+            codes = [code for code in codes if code not in taken]
+
+        codes.reverse()
+        return codes
+
+    def next_id(self, prefix, length=6):
+        """
+        Allocate the next code for a prefix
+
+        Args:
+            prefix: Code prefix (e.g. 'HD', 'PXK')
+            length: Minimum number of digits
+
+        Returns:
+            str: e.g. 'HD000124'
+        """
+        key = (prefix, length)
+        with self._lock:
+            codes = self._blocks.get(key)
+            while not codes:
+                codes = self._blocks[key] = self._refill(prefix, length)
+            return codes.pop()
+
+    def reset(self):
+        """Drop the in-memory blocks (the unused numbers are skipped)"""
+        with self._lock:
+            self._blocks = {}
+
+
+id_allocator = IdAllocator()
@@ -0,0 +1,165 @@
+"""
+Invoice detail cache - serialized responses with strong ETags
+
+Hóa đơn gần như bất biến sau khi tạo: chỉ MaYCTraHang thay đổi khi khách
+trả hàng. Chi tiết hóa đơn (in lại hóa đơn, tra cứu trả hàng tại quầy)
+được lưu sẵn dưới dạng JSON đã mã hóa cùng ETag (SHA-256 của nội dung).
+
+- Thay đổi HoaDon/HoaDonSP/PhieuXuatKho qua ORM (ví dụ create_return gán
+  MaYCTraHang) loại mục tương ứng khỏi cache sau khi commit.
+- Đổi tên/đơn vị sản phẩm hoặc Query.update()/delete() xóa toàn bộ cache.
+- Mục quá INVOICE_CACHE_TTL giây bị bỏ để nhận thay đổi từ worker khác;
+  tối đa INVOICE_CACHE_SIZE mục (LRU).
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.models import HoaDon, HoaDonSP, PhieuXuatKho, SanPham
+
+
+class InvoiceCache:
+    """Process-wide LRU cache of serialized invoice detail responses"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # MaHD -> (body, etag, stored_at)
+
+    def _ttl(self):
+        return current_app.config.get('INVOICE_CACHE_TTL', 300)
+
+    def _max_size(self):
+        return current_app.config.get('INVOICE_CACHE_SIZE', 2000)
+
+    @staticmethod
+    def make_etag(body):
+        """Strong ETag value (unquoted) for a response body"""
+        return hashlib.sha256(body).hexdigest()[:32]
+
+    def get(self, ma_hd):
+        """
+        Cached response for an invoice
+
+        Returns:
+            tuple: (body bytes, etag), None if missing or expired
+        """
+        ttl = self._ttl()
+        with self._lock:
+            entry = self._entries.get(ma_hd)
+            if entry is None:
+                return None
+            body, etag, stored_at = entry
+            if ttl > 0 and time.monotonic() - stored_at > ttl:
+                del self._entries[ma_hd]
+                return None
+            self._entries.move_to_end(ma_hd)
+            return body, etag
+
+    def put(self, ma_hd, body):
+        """
+        Store a serialized response
+
+        Returns:
+            tuple: (body bytes, etag)
+        """
+        etag = self.make_etag(body)
+        max_size = self._max_size()
+        with self._lock:
+            self._entries[ma_hd] = (body, etag, time.monotonic())
+            self._entries.move_to_end(ma_hd)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+        return body, etag
+
+    def remove(self, ma_hd):
+        with self._lock:
+            self._entries.pop(ma_hd, None)
+
+    def invalidate(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Basic size information (for diagnostics)"""
+        return {'invoices': len(self._entries)}
+
+
+invoice_cache = InvoiceCache()
+
+
+# =============================================
+# SQLAlchemy hooks - collect changes per session, apply after commit
+# =============================================
+
+def _pending(session):
+    return session.info.setdefault('invoice_cache_pending', [])
+
+
+@event.listens_for(HoaDon, 'after_update')
+@event.listens_for(HoaDon, 'after_delete')
+def _invoice_changed(mapper, connection, target):
+    session = inspect(target).session
+    if session is not None:
+        _pending(session).append(('remove', target.MaHD))
+
+
+@event.listens_for(HoaDonSP, 'after_insert')
+@event.listens_for(HoaDonSP, 'after_update')
+@event.listens_for(HoaDonSP, 'after_delete')
+def _line_changed(mapper, connection, target):
+    session = inspect(target).session
+    if session is not None:
+        _pending(session).append(('remove', target.MaHD))
+
+
+@event.listens_for(PhieuXuatKho, 'after_insert')
+@event.listens_for(PhieuXuatKho, 'after_update')
+@event.listens_for(PhieuXuatKho, 'after_delete')
+def _export_slip_changed(mapper, connection, target):
+    session = inspect(target).session
+    if session is not None and target.MaThamChieu:
+        _pending(session).append(('remove', target.MaThamChieu))
+
+
+@event.listens_for(SanPham, 'after_update')
+@event.listens_for(SanPham, 'after_delete')
+def _product_changed(mapper, connection, target):
+    """Details embed TenSP/DVT - drop everything"""
+    session = inspect(target).session
+    if session is not None:
+        _pending(session).append(('reset', None))
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def _bulk_changed(update_context):
+    """Query.update()/delete() bypass mapper events - reset the cache"""
+    if update_context.mapper.class_ in (HoaDon, HoaDonSP, PhieuXuatKho, SanPham):
+        _pending(update_context.session).append(('reset', None))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pending(session):
+    pending = session.info.pop('invoice_cache_pending', None)
+    if not pending:
+        return
+
+    for action, payload in pending:
+        if action == 'remove':
+            invoice_cache.remove(payload)
+        elif action == 'reset':
+            invoice_cache.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    if session.in_nested_transaction():
+        return  # Savepoint only: the enclosing transaction may still commit
+    session.info.pop('invoice_cache_pending', None)
@@ -0,0 +1,382 @@
+"""
+Product search index - accent-insensitive, ranked search over TenSP/MaSP
+
+Tìm kiếm bằng LIKE '%x%' phải quét toàn bảng và không tìm được "sua" cho
+"Sữa tươi". Chỉ mục này giữ trong bộ nhớ:
+
+- Tên/mã sản phẩm đã bỏ dấu tiếng Việt (đ -> d) và chuyển chữ thường,
+  tách thành từ (token).
+- Từ điển token đã sắp xếp để tìm theo tiền tố bằng bisect, và chỉ mục
+  trigram trên token để tìm chuỗi con (n-gram).
+- Thay đổi SanPham qua ORM được áp dụng sau khi commit (SQLAlchemy events);
+  ngoài ra chỉ mục nạp lại sau PRODUCT_SEARCH_TTL giây để nhận thay đổi từ
+  các worker khác.
+"""
+
+import bisect
+import heapq
+import re
+import threading
+import time
+import unicodedata
+
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import SanPham
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# Token match scores
+_EXACT = 3
+_PREFIX = 2
+_SUBSTRING = 1
+
+
+def _strip_marks(text):
+    text = unicodedata.normalize('NFD', text)
+    return ''.join(ch for ch in text if unicodedata.category(ch) != 'Mn')
+
+
+# Precomposed Latin letters (Latin-1 .. Latin Extended Additional) -> base letter
+_FOLD_TABLE = {
+    code: _strip_marks(chr(code))
+    for block in (range(0x00C0, 0x0250), range(0x1E00, 0x1F00))
+    for code in block
+    if _strip_marks(chr(code)) != chr(code)
+}
+_FOLD_TABLE.update({ord('đ'): 'd', ord('Đ'): 'D'})
+
+
+def fold(text):
+    """
+    Lowercase and strip Vietnamese diacritics
+
+    Example: "Sữa tươi Đà Lạt" -> "sua tuoi da lat"
+    """
+    if not text:
+        return ''
+    folded = text.translate(_FOLD_TABLE)
+    if not folded.isascii():
+        # Decomposed input (combining marks) or other scripts
+        folded = _strip_marks(folded)
+    return folded.lower()
+
+
+def tokenize(text):
+    """Split folded text into alphanumeric tokens"""
+    return _TOKEN_RE.findall(fold(text))
+
+
+def _trigrams(token):
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+def _enum_value(value):
+    return value.value if hasattr(value, 'value') else value
+
+
+class ProductSearchIndex:
+    """Process-wide in-memory inverted index of SanPham"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._docs = {}        # MaSP -> {'name': folded TenSP, 'tokens': set, 'LoaiSP', 'TrangThai'}
+        self._postings = {}    # token -> set(MaSP)
+        self._vocab = []       # sorted tokens
+        self._grams = {}       # trigram -> set(token)
+        self._loaded_at = None
+        self._refreshing = False
+
+    # -----------------------------------------
+    # Loading / invalidation
+    # -----------------------------------------
+
+    def invalidate(self):
+        """Force a full reload on the next search"""
+        with self._lock:
+            self._loaded_at = None
+
+    def _is_stale(self):
+        if self._loaded_at is None:
+            return True
+        ttl = current_app.config.get('PRODUCT_SEARCH_TTL', 300)
+        return ttl > 0 and time.monotonic() - self._loaded_at > ttl
+
+    def load(self):
+        """
+        Build the index from the database (one query)
+
+        The new index is built aside and swapped in, so searches keep using
+        the previous one meanwhile.
+        """
+        rows = db.session.query(
+            SanPham.MaSP, SanPham.TenSP, SanPham.LoaiSP, SanPham.TrangThai
+        ).all()
+
+        fresh = ProductSearchIndex()
+        for row in rows:
+            fresh._add(row.MaSP, row.TenSP, row.LoaiSP, _enum_value(row.TrangThai), bulk=True)
+        fresh._vocab = sorted(fresh._postings)
+
+        with self._lock:
+            self._docs = fresh._docs
+            self._postings = fresh._postings
+            self._vocab = fresh._vocab
+            self._grams = fresh._grams
+            self._loaded_at = time.monotonic()
+
+        return len(rows)
+
+    def _refresh_in_background(self):
+        app = current_app._get_current_object()
+
+        def run():
+            try:
+                with app.app_context():
+                    self.load()
+            except Exception:
+                app.logger.exception("Product search index refresh failed")
+            finally:
+                self._refreshing = False
+
+        self._refreshing = True
+        threading.Thread(target=run, name='product-search-refresh', daemon=True).start()
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None:
+            self.load()
+        elif self._is_stale() and not self._refreshing:
+            # Expired by TTL - serve the current index while rebuilding
+            self._refresh_in_background()
+
+    # -----------------------------------------
+    # Index maintenance (caller holds the lock)
+    # -----------------------------------------
+
+    def _add(self, ma_sp, ten_sp, loai_sp, trang_thai, bulk=False):
+        name = fold(ten_sp)
+        code = fold(ma_sp)
+        tokens = set(_TOKEN_RE.findall(name)) | set(_TOKEN_RE.findall(code))
+        self._docs[ma_sp] = {
+            'name': name,
+            'code': code,
+            'tokens': tokens,
+            'LoaiSP': loai_sp,
+            'TrangThai': trang_thai,
+        }
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = set()
+                for gram in _trigrams(token):
+                    self._grams.setdefault(gram, set()).add(token)
+                if not bulk:
+                    bisect.insort(self._vocab, token)
+            postings.add(ma_sp)
+
+    def _remove(self, ma_sp):
+        doc = self._docs.pop(ma_sp, None)
+        if not doc:
+            return
+        for token in doc['tokens']:
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.discard(ma_sp)
+            if not postings:
+                del self._postings[token]
+                for gram in _trigrams(token):
+                    tokens = self._grams.get(gram)
+                    if tokens is not None:
+                        tokens.discard(token)
+                        if not tokens:
+                            del self._grams[gram]
+                i = bisect.bisect_left(self._vocab, token)
+                if i < len(self._vocab) and self._vocab[i] == token:
+                    del self._vocab[i]
+
+    def upsert(self, ma_sp, ten_sp, loai_sp=None, trang_thai=None):
+        """Add or replace one product"""
+        with self._lock:
+            if self._loaded_at is None:
+                return  # Not built yet - the next search loads everything
+            self._remove(ma_sp)
+            self._add(ma_sp, ten_sp, loai_sp, _enum_value(trang_thai))
+
+    def remove(self, ma_sp):
+        """Remove one product"""
+        with self._lock:
+            if self._loaded_at is not None:
+                self._remove(ma_sp)
+
+    # -----------------------------------------
+    # Search
+    # -----------------------------------------
+
+    def _match_token(self, query_token):
+        """
+        Return {MaSP: score} of documents containing a token that matches
+
+        Exact token > token prefix > substring (trigram lookup, >= 3 chars)
+        """
+        scores = {}
+
+        def credit(token, score):
+            for ma_sp in self._postings.get(token, ()):
+                if scores.get(ma_sp, 0) < score:
+                    scores[ma_sp] = score
+
+        i = bisect.bisect_left(self._vocab, query_token)
+        while i < len(self._vocab) and self._vocab[i].startswith(query_token):
+            token = self._vocab[i]
+            credit(token, _EXACT if token == query_token else _PREFIX)
+            i += 1
+
+        if len(query_token) >= 3:
+            grams = _trigrams(query_token)
+            candidates = None
+            for gram in grams:
+                tokens = self._grams.get(gram, set())
+                candidates = set(tokens) if candidates is None else candidates & tokens
+                if not candidates:
+                    break
+            for token in candidates or ():
+                if query_token in token and not token.startswith(query_token):
+                    credit(token, _SUBSTRING)
+
+        return scores
+
+    def search(self, text, loai=None, trang_thai=None, limit=None):
+        """
+        Ranked search
+
+        Every query word must match a word of TenSP or MaSP (as the whole
+        word, a prefix or - for 3+ characters - a substring). Results are
+        ordered by match quality, then by name.
+
+        Args:
+            text: Search text (with or without diacritics)
+            loai: Filter by LoaiSP (optional)
+            trang_thai: Filter by TrangThai value (optional)
+            limit: Max number of results (optional)
+
+        Returns:
+            tuple: (list of MaSP in rank order, total number of matches)
+        """
+        self._ensure_loaded()
+
+        query_tokens = tokenize(text)
+        if not query_tokens:
+            return [], 0
+
+        with self._lock:
+            scores = None
+            for query_token in dict.fromkeys(query_tokens):
+                matches = self._match_token(query_token)
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {
+                        ma_sp: score + matches[ma_sp]
+                        for ma_sp, score in scores.items() if ma_sp in matches
+                    }
+                if not scores:
+                    return [], 0
+
+            folded_query = ' '.join(query_tokens)
+            ranked = []
+            for ma_sp, score in scores.items():
+                doc = self._docs[ma_sp]
+                if loai and doc['LoaiSP'] != loai:
+                    continue
+                if trang_thai and doc['TrangThai'] != trang_thai:
+                    continue
+                if doc['code'] == folded_query:
+                    score += 10          # Exact product code
+                elif doc['name'].startswith(folded_query):
+                    score += 2           # Name starts with the whole query
+                ranked.append((-score, doc['name'], ma_sp))
+
+        total = len(ranked)
+        if limit:
+            ranked = heapq.nsmallest(limit, ranked)
+        else:
+            ranked.sort()
+        return [ma_sp for _, _, ma_sp in ranked], total
+
+    def count(self, loai=None, trang_thai=None):
+        """
+        Number of indexed products matching the filters (no DB query)
+
+        Used as a cheap estimate of catalog-wide totals.
+        """
+        self._ensure_loaded()
+        if not loai and not trang_thai:
+            return len(self._docs)
+        return sum(
+            1 for doc in list(self._docs.values())
+            if (not loai or doc['LoaiSP'] == loai)
+            and (not trang_thai or doc['TrangThai'] == trang_thai)
+        )
+
+
+product_search = ProductSearchIndex()
+
+
+# =============================================
+# SQLAlchemy hooks - keep the index in sync after commit
+# =============================================
+
+def _pending(session):
+    return session.info.setdefault('product_search_pending', [])
+
+
+@event.listens_for(SanPham, 'after_insert')
+@event.listens_for(SanPham, 'after_update')
+def _product_changed(mapper, connection, target):
+    session = inspect(target).session
+    if session is not None:
+        _pending(session).append((
+            'upsert',
+            (target.MaSP, target.TenSP, target.LoaiSP, target.TrangThai)
+        ))
+
+
+@event.listens_for(SanPham, 'after_delete')
+def _product_deleted(mapper, connection, target):
+    session = inspect(target).session
+    if session is not None:
+        _pending(session).append(('remove', target.MaSP))
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def _bulk_changed(update_context):
+    """Query.update()/delete() bypass mapper events - rebuild the index"""
+    if update_context.mapper.class_ is SanPham:
+        _pending(update_context.session).append(('reset', None))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pending(session):
+    pending = session.info.pop('product_search_pending', None)
+    if not pending:
+        return
+
+    for action, payload in pending:
+        if action == 'upsert':
+            product_search.upsert(*payload)
+        elif action == 'remove':
+            product_search.remove(payload)
+        elif action == 'reset':
+            product_search.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    if session.in_nested_transaction():
+        return  # Savepoint only: the enclosing transaction may still commit
+    session.info.pop('product_search_pending', None)
@@ -0,0 +1,170 @@
+"""
+Sales report aggregation - revenue buckets and top products computed in SQL
+
+Báo cáo bán hàng từng nạp mọi dòng hóa đơn trong khoảng ngày về Python và
+gom theo ngày bằng dict (kèm một set MaHD mỗi ngày), nên một năm dữ liệu tốn
+bộ nhớ và thời gian tỉ lệ với số dòng. Ở đây cơ sở dữ liệu làm việc gom nhóm
+trên bảng tổng hợp TongHopBanHang (app.services.sales_rollup):
+
+- Một truy vấn GROUP BY theo kỳ (ngày, tuần bắt đầu thứ Hai, tháng) trên dòng
+  tổng hợp theo thu ngân trả về doanh thu, số lượng, số hóa đơn và số ngày có
+  bán của từng kỳ.
+- Một truy vấn GROUP BY MaSP trên dòng tổng hợp theo sản phẩm lấy top sản
+  phẩm (LIMIT trong SQL); /reports/top-products dùng chung hàm này.
+- Python chỉ định dạng vài trăm dòng; /reports/sales và /reports/export/sales
+  dùng chung build().
+"""
+
+from sqlalchemy import desc, func, literal
+
+from app import db
+from app.models import ChieuTongHop, SanPham, TongHopBanHang
+from app.services import sales_rollup
+
+GROUP_BY = ('day', 'week', 'month')
+
+
+def _bucket(column, group_by):
+    """Period start of ``column`` as a DATE/'YYYY-MM-DD' expression"""
+    if db.engine.dialect.name == 'sqlite':
+        if group_by == 'week':
+            return func.date(column, 'weekday 0', '-6 days')
+        if group_by == 'month':
+            return func.strftime('%Y-%m-01', column)
+        return func.date(column)
+
+    if group_by == 'week':
+        return func.subdate(func.date(column), func.weekday(column))
+    if group_by == 'month':
+        return func.date_format(column, '%Y-%m-01')
+    return func.date(column)
+
+
+def _label(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)[:10]
+
+
+def period_sales(from_date, to_date, group_by='day'):
+    """
+    Revenue per period, oldest first (from the per-cashier rollup)
+
+    Args:
+        from_date: Inclusive start (datetime)
+        to_date: Exclusive end (datetime)
+        group_by: 'day', 'week' or 'month'
+
+    Returns:
+        list: {'date' (period start), 'total_revenue', 'total_quantity',
+            'total_invoices', 'sales_days'}
+    """
+    bucket = _bucket(TongHopBanHang.ThoiDiem, group_by).label('bucket')
+    if group_by == 'day':
+        sales_days = literal(1)
+    else:
+        sales_days = func.count(func.distinct(func.date(TongHopBanHang.ThoiDiem)))
+
+    # Every invoice has exactly one cashier, so cashier rows sum to exact totals
+    rows = db.session.query(
+        bucket,
+        func.sum(TongHopBanHang.DoanhThu).label('total_revenue'),
+        func.sum(TongHopBanHang.SoLuong).label('total_quantity'),
+        func.sum(TongHopBanHang.SoHoaDon).label('total_invoices'),
+        sales_days.label('sales_days')
+    ).filter(
+        sales_rollup.window(ChieuTongHop.THU_NGAN, from_date, to_date),
+        TongHopBanHang.SoHoaDon > 0
+    ).group_by(bucket)\
+     .order_by(bucket)\
+     .all()
+
+    return [
+        {
+            'date': _label(row.bucket),
+            'total_revenue': float(row.total_revenue or 0),
+            'total_quantity': int(row.total_quantity or 0),
+            'total_invoices': int(row.total_invoices or 0),
+            'sales_days': row.sales_days,
+        }
+        for row in rows
+    ]
+
+
+def top_products(from_date, to_date, limit=10, order_by='revenue'):
+    """
+    Best sellers in [from_date, to_date) from the per-product rollup
+
+    Args:
+        order_by: 'revenue' or 'quantity'
+
+    Returns:
+        list: {'MaSP', 'TenSP', 'LoaiSP', 'DVT', 'GiaBan', 'total_quantity',
+            'total_invoices', 'total_revenue'}
+    """
+    sales = db.session.query(
+        TongHopBanHang.Khoa.label('MaSP'),
+        func.sum(TongHopBanHang.SoLuong).label('total_quantity'),
+        func.sum(TongHopBanHang.SoHoaDon).label('total_invoices'),
+        func.sum(TongHopBanHang.DoanhThu).label('total_revenue')
+    ).filter(
+        sales_rollup.window(ChieuTongHop.SAN_PHAM, from_date, to_date),
+        TongHopBanHang.SoHoaDon > 0
+    ).group_by(TongHopBanHang.Khoa)\
+     .subquery()
+
+    ranking = sales.c.total_quantity if order_by == 'quantity' else sales.c.total_revenue
+    rows = db.session.query(
+        SanPham.MaSP,
+        SanPham.TenSP,
+        SanPham.LoaiSP,
+        SanPham.DVT,
+        SanPham.GiaBan,
+        sales.c.total_quantity,
+        sales.c.total_invoices,
+        sales.c.total_revenue
+    ).join(sales, SanPham.MaSP == sales.c.MaSP)\
+     .order_by(desc(ranking), SanPham.MaSP)\
+     .limit(limit)\
+     .all()
+
+    return [
+        {
+            'MaSP': row.MaSP,
+            'TenSP': row.TenSP,
+            'LoaiSP': row.LoaiSP,
+            'DVT': row.DVT,
+            'GiaBan': float(row.GiaBan),
+            'total_quantity': int(row.total_quantity or 0),
+            'total_invoices': int(row.total_invoices or 0),
+            'total_revenue': float(row.total_revenue or 0),
+        }
+        for row in rows
+    ]
+
+
+def build(from_date, to_date, group_by='day', top_n=10):
+    """
+    Full sales report payload (without 'period')
+
+    Returns:
+        dict: {'group_by', 'daily_sales', 'top_products', 'summary'}
+    """
+    periods = period_sales(from_date, to_date, group_by)
+
+    total_revenue = sum(p['total_revenue'] for p in periods)
+    total_quantity = sum(p['total_quantity'] for p in periods)
+    # An invoice and a day fall into exactly one period, so the sums are exact
+    total_invoices = sum(p['total_invoices'] for p in periods)
+    sales_days = sum(p.pop('sales_days') for p in periods)
+
+    return {
+        'group_by': group_by,
+        'daily_sales': periods,
+        'top_products': top_products(from_date, to_date, top_n),
+        'summary': {
+            'total_revenue': total_revenue,
+            'total_quantity': total_quantity,
+            'total_invoices': total_invoices,
+            'average_revenue_per_day': total_revenue / sales_days if sales_days else 0,
+            'average_invoice_value': total_revenue / total_invoices if total_invoices > 0 else 0
+        },
+    }
@@ -0,0 +1,284 @@
+"""
+Sales rollups - hourly and daily totals per product, cashier and category
+
+Báo cáo doanh thu, sản phẩm bán chạy, thống kê ngày và dự báo hết hàng từng
+quét HoaDon ⨝ HoaDonSP ⨝ SanPham ở mỗi request, nên chi phí tăng theo số
+dòng hóa đơn. TongHopBanHang giữ sẵn tổng theo (Ky, Chieu, ThoiDiem, Khoa):
+
+- create_invoice gọi record_sale(), create_return gọi record_return() trong
+  cùng transaction: một câu upsert (cộng dồn) cho mọi dòng tổng hợp của
+  chứng từ, chạy ngay trước commit và theo thứ tự khóa chính để các quầy
+  không deadlock khi cùng cập nhật một dòng ngày/loại SP.
+- Trả hàng ghi vào SoLuongTra/GiaTriTra tại thời điểm trả (theo giá trên hóa
+  đơn); SoLuong/DoanhThu luôn là hàng đã bán như trên HoaDonSP.
+- window() chọn dòng ngày khi khoảng thời gian tròn ngày, ngược lại dòng
+  giờ, nên chi phí đọc tỉ lệ với số ngày (giờ) được hỏi.
+- rebuild() (lệnh ``flask rollups rebuild``, migration cũng làm như vậy)
+  dựng lại toàn bộ từ lịch sử hóa đơn và các phiếu nhập trả hàng
+  (YeuCauTraHang → HoaDon → PhieuNhapKho); số lượng trả lấy từ dòng "Trả
+  hàng" của sổ biến động, phiếu chưa có trong sổ thì theo các lô của phiếu.
+"""
+
+from sqlalchemy import and_, delete, func, insert, literal, select, union_all
+from sqlalchemy.dialects import mysql, sqlite
+
+from app import db
+from app.models import (
+    BienDongKho, ChieuTongHop, HoaDon, HoaDonSP, KyTongHop, LoaiBienDong, LoSP,
+    PhieuNhapKho, SanPham, TongHopBanHang, YeuCauTraHang
+)
+
+ROLLUP = TongHopBanHang.__table__
+MEASURES = ('SoHoaDon', 'SoLuong', 'DoanhThu', 'SoLuongTra', 'GiaTriTra')
+_KEY = ('Ky', 'Chieu', 'ThoiDiem', 'Khoa')
+
+# Rows per upsert statement when rebuilding returns
+_CHUNK = 1000
+
+
+def _period_start(ts, ky):
+    if ky == KyTongHop.GIO:
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _add(deltas, chieu, khoa, **measures):
+    row = deltas.setdefault((chieu, khoa or ''), dict.fromkeys(MEASURES, 0))
+    for name, value in measures.items():
+        row[name] += value
+
+
+def _upsert(thoi_gian, deltas):
+    """Add ``deltas`` {(Chieu, Khoa): measures} to the hour and day rows of ``thoi_gian``"""
+    rows = [
+        {'Ky': ky, 'Chieu': chieu, 'ThoiDiem': _period_start(thoi_gian, ky), 'Khoa': khoa, **measures}
+        for ky in KyTongHop
+        for (chieu, khoa), measures in deltas.items()
+    ]
+    _execute_upsert(rows)
+
+
+def _execute_upsert(rows):
+    if not rows:
+        return
+    # Same lock order in every transaction
+    rows.sort(key=lambda r: (r['Ky'].value, r['Chieu'].value, r['ThoiDiem'], r['Khoa']))
+
+    if db.engine.dialect.name == 'sqlite':
+        stmt = sqlite.insert(ROLLUP)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(_KEY),
+            set_={name: ROLLUP.c[name] + stmt.excluded[name] for name in MEASURES}
+        )
+    else:
+        stmt = mysql.insert(ROLLUP)
+        stmt = stmt.on_duplicate_key_update(
+            {name: ROLLUP.c[name] + stmt.inserted[name] for name in MEASURES}
+        )
+    db.session.execute(stmt, rows)
+
+
+def record_sale(thoi_gian, ma_nv, lines):
+    """
+    Add an invoice to the rollups (caller commits)
+
+    Args:
+        thoi_gian: HoaDon.NgayTao
+        ma_nv: Cashier (HoaDon.MaNVThuNgan)
+        lines: Iterable of (MaSP, LoaiSP, so_luong, don_gia), one per HoaDonSP row
+    """
+    deltas = {}
+    categories = set()
+    for ma_sp, loai_sp, so_luong, don_gia in lines:
+        doanh_thu = don_gia * so_luong
+        _add(deltas, ChieuTongHop.SAN_PHAM, ma_sp, SoHoaDon=1, SoLuong=so_luong, DoanhThu=doanh_thu)
+        _add(deltas, ChieuTongHop.LOAI_SP, loai_sp, SoLuong=so_luong, DoanhThu=doanh_thu)
+        _add(deltas, ChieuTongHop.THU_NGAN, ma_nv, SoLuong=so_luong, DoanhThu=doanh_thu)
+        categories.add(loai_sp or '')
+    if not deltas:
+        return
+
+    _add(deltas, ChieuTongHop.THU_NGAN, ma_nv, SoHoaDon=1)
+    for loai_sp in categories:
+        _add(deltas, ChieuTongHop.LOAI_SP, loai_sp, SoHoaDon=1)
+    _upsert(thoi_gian, deltas)
+
+
+def record_return(thoi_gian, ma_nv, lines):
+    """
+    Add returned goods to the rollups (caller commits)
+
+    Args:
+        thoi_gian: Time of the return
+        ma_nv: Cashier of the original invoice
+        lines: Iterable of (MaSP, LoaiSP, so_luong, don_gia at sale time)
+    """
+    deltas = {}
+    for ma_sp, loai_sp, so_luong, don_gia in lines:
+        gia_tri = don_gia * so_luong
+        for chieu, khoa in (
+            (ChieuTongHop.SAN_PHAM, ma_sp),
+            (ChieuTongHop.LOAI_SP, loai_sp),
+            (ChieuTongHop.THU_NGAN, ma_nv),
+        ):
+            _add(deltas, chieu, khoa, SoLuongTra=so_luong, GiaTriTra=gia_tri)
+    if deltas:
+        _upsert(thoi_gian, deltas)
+
+
+def window(chieu, from_date, to_date):
+    """
+    Filter selecting the rollup rows of a dimension in [from_date, to_date)
+
+    Daily rows when both bounds fall on midnight, hourly rows otherwise
+    (hour precision: the hour containing from_date is included).
+    """
+    midnight = all(
+        (d.hour, d.minute, d.second, d.microsecond) == (0, 0, 0, 0) for d in (from_date, to_date)
+    )
+    ky = KyTongHop.NGAY if midnight else KyTongHop.GIO
+    return and_(
+        TongHopBanHang.Ky == ky,
+        TongHopBanHang.Chieu == chieu,
+        TongHopBanHang.ThoiDiem >= _period_start(from_date, ky),
+        TongHopBanHang.ThoiDiem < to_date
+    )
+
+
+def _truncate(column, ky):
+    """SQL period start of ``column``, stored like the ORM stores DateTime"""
+    if db.engine.dialect.name == 'sqlite':
+        fmt = '%Y-%m-%d %H:00:00.000000' if ky == KyTongHop.GIO else '%Y-%m-%d 00:00:00.000000'
+        return func.strftime(fmt, column)
+    fmt = '%Y-%m-%d %H:00:00' if ky == KyTongHop.GIO else '%Y-%m-%d 00:00:00'
+    return func.date_format(column, fmt)
+
+
+def _rebuild_sales(ky, chieu):
+    """INSERT ... SELECT the sales of one (granularity, dimension) from the invoice tables"""
+    thoi_diem = _truncate(HoaDon.NgayTao, ky)
+    if chieu == ChieuTongHop.SAN_PHAM:
+        khoa = HoaDonSP.MaSP
+        so_hoa_don = func.count()
+    elif chieu == ChieuTongHop.THU_NGAN:
+        khoa = func.coalesce(HoaDon.MaNVThuNgan, '')
+        so_hoa_don = func.count(func.distinct(HoaDon.MaHD))
+    else:
+        khoa = func.coalesce(SanPham.LoaiSP, '')
+        so_hoa_don = func.count(func.distinct(HoaDon.MaHD))
+
+    source = select(
+        literal(ky.value),
+        literal(chieu.value),
+        thoi_diem,
+        khoa,
+        so_hoa_don,
+        func.sum(HoaDonSP.SoLuong),
+        func.sum(HoaDonSP.DonGia * HoaDonSP.SoLuong),
+        literal(0),
+        literal(0)
+    ).select_from(HoaDonSP)\
+     .join(HoaDon, HoaDonSP.MaHD == HoaDon.MaHD)
+    if chieu == ChieuTongHop.LOAI_SP:
+        source = source.join(SanPham, HoaDonSP.MaSP == SanPham.MaSP)
+    source = source.group_by(thoi_diem, khoa)
+
+    return db.session.execute(
+        insert(ROLLUP).from_select(list(_KEY) + list(MEASURES), source)
+    ).rowcount
+
+
+def _returned_quantities():
+    """
+    Returned quantity per (slip, product)
+
+    From the 'Trả hàng' ledger rows of each slip. Slips without such rows
+    (written before the ledger) count the stock of the batches pointing to
+    them, as the slip-based reports did.
+    """
+    ledger = select(
+        BienDongKho.MaPhieu.label('MaPhieu'),
+        BienDongKho.MaSP.label('MaSP'),
+        func.sum(BienDongKho.SoLuong).label('SoLuong')
+    ).where(
+        BienDongKho.Loai == LoaiBienDong.TRA_HANG,
+        BienDongKho.MaPhieu.isnot(None)
+    ).group_by(BienDongKho.MaPhieu, BienDongKho.MaSP)
+
+    in_ledger = select(BienDongKho.MaBienDong).where(
+        BienDongKho.MaPhieu == LoSP.MaPhieuNK,
+        BienDongKho.Loai == LoaiBienDong.TRA_HANG
+    ).exists()
+    batches = select(
+        LoSP.MaPhieuNK,
+        LoSP.MaSP,
+        func.sum(LoSP.SLTon)
+    ).where(LoSP.MaPhieuNK.isnot(None), ~in_ledger)\
+     .group_by(LoSP.MaPhieuNK, LoSP.MaSP)
+
+    return union_all(ledger, batches).subquery()
+
+
+def _rebuild_returns():
+    """Fold the return slips into the rollups, at the time of the return"""
+    returned = _returned_quantities()
+    rows = db.session.execute(
+        select(
+            YeuCauTraHang.NgayTao,
+            HoaDon.MaNVThuNgan,
+            returned.c.MaSP,
+            SanPham.LoaiSP,
+            returned.c.SoLuong,
+            HoaDonSP.SoLuong,
+            func.coalesce(HoaDonSP.DonGia, SanPham.GiaBan)
+        ).select_from(returned)
+        .join(PhieuNhapKho, PhieuNhapKho.MaPhieu == returned.c.MaPhieu)
+        .join(HoaDon, PhieuNhapKho.MaThamChieu == HoaDon.MaHD)
+        .join(YeuCauTraHang, HoaDon.MaYCTraHang == YeuCauTraHang.MaYC)
+        .join(SanPham, returned.c.MaSP == SanPham.MaSP)
+        .join(HoaDonSP, and_(HoaDonSP.MaHD == HoaDon.MaHD, HoaDonSP.MaSP == returned.c.MaSP))
+        .where(PhieuNhapKho.MucDich.like('%trả hàng%'))
+    ).all()
+
+    totals = {}
+    for ngay_tra, ma_nv, ma_sp, loai_sp, so_luong, so_luong_mua, don_gia in rows:
+        # Never more than the invoice line (batch stock of old slips may be)
+        so_luong = min(so_luong, so_luong_mua)
+        for ky in KyTongHop:
+            thoi_diem = _period_start(ngay_tra, ky)
+            for chieu, khoa in (
+                (ChieuTongHop.SAN_PHAM, ma_sp),
+                (ChieuTongHop.LOAI_SP, loai_sp),
+                (ChieuTongHop.THU_NGAN, ma_nv),
+            ):
+                key = (ky, chieu, thoi_diem, khoa or '')
+                qty, value = totals.get(key, (0, 0))
+                totals[key] = (qty + so_luong, value + don_gia * so_luong)
+
+    upserts = [
+        {
+            'Ky': ky, 'Chieu': chieu, 'ThoiDiem': thoi_diem, 'Khoa': khoa,
+            'SoHoaDon': 0, 'SoLuong': 0, 'DoanhThu': 0,
+            'SoLuongTra': qty, 'GiaTriTra': value,
+        }
+        for (ky, chieu, thoi_diem, khoa), (qty, value) in totals.items()
+    ]
+    for start in range(0, len(upserts), _CHUNK):
+        _execute_upsert(upserts[start:start + _CHUNK])
+    return len(upserts)
+
+
+def rebuild():
+    """
+    Regenerate every rollup row from history (one transaction, caller commits)
+
+    Returns:
+        dict: Rows written per (Ky, Chieu) and for returns
+    """
+    db.session.execute(delete(ROLLUP))
+    written = {}
+    for ky in KyTongHop:
+        for chieu in ChieuTongHop:
+            written[f'{ky.value}/{chieu.value}'] = _rebuild_sales(ky, chieu)
+    written['Trả hàng'] = _rebuild_returns()
+    return written
@@ -0,0 +1,264 @@
+"""
+Stock mutations - atomic, set-based updates of LoSP.SLTon
+
+Mọi thay đổi tồn kho (bán hàng, xuất kho, chuyển kho, hủy hàng, nhập kho,
+trả hàng) đi qua module này thay vì đọc batch.SLTon rồi ghi lại từ Python.
+
+- Trừ tồn dùng UPDATE có điều kiện (SLTon >= số lượng cần trừ) và kiểm tra
+  rowcount, nên hai quầy cùng bán những đơn vị cuối của một lô không thể
+  cùng thành công. Không cần khóa toàn cục: chỉ các dòng LoSP liên quan bị
+  khóa trong thời gian transaction.
+- Cộng tồn dùng SLTon = SLTon + :n để không mất cập nhật đồng thời.
+- Các câu lệnh là Core UPDATE, nên đối tượng ORM đã nạp được expire; số
+  lượng thay đổi được áp vào barcode_index sau khi commit (không phải nạp
+  lại từ DB ở lần quét sau).
+- Mỗi thay đổi được ghi vào sổ biến động (app.services.stock_ledger) trong
+  cùng transaction; loai là bắt buộc để không thay đổi nào bị bỏ sót.
+"""
+
+from sqlalchemy import and_, case, select, tuple_, update
+
+from app import db
+from app.models import LoaiBienDong, LoSP
+from app.services import stock_ledger
+from app.services.barcode_index import barcode_index
+
+
+class InsufficientStockError(Exception):
+    """Raised when a conditional decrement does not match every batch"""
+
+    def __init__(self, shortages):
+        self.shortages = shortages  # [{'MaSP', 'MaLo', 'requested', 'available'}]
+        details = ', '.join(
+            f"{s['MaSP']}/{s['MaLo'] or 'FEFO'} (available: {s['available']}, requested: {s['requested']})"
+            for s in shortages
+        )
+        super().__init__(f"Insufficient stock: {details}")
+
+
+def _sum_by_batch(allocations):
+    """Group (LoSP, so_luong) pairs by batch key, summing quantities"""
+    quantities = {}
+    batches = {}
+    for batch, so_luong in allocations:
+        key = (batch.MaSP, batch.MaLo)
+        quantities[key] = quantities.get(key, 0) + so_luong
+        batches[key] = batch
+    return quantities, batches
+
+
+def _per_batch(quantities):
+    """CASE expression yielding the quantity of the current row"""
+    return case(
+        *[
+            (and_(LoSP.MaSP == ma_sp, LoSP.MaLo == ma_lo), so_luong)
+            for (ma_sp, ma_lo), so_luong in quantities.items()
+        ],
+        else_=0
+    )
+
+
+def _after_update(batches, attrs, changes):
+    """Expire loaded objects and queue the new stock for the scan index"""
+    for batch in batches.values():
+        db.session.expire(batch, attrs)
+    barcode_index.update_stock_on_commit(db.session, changes)
+
+
+def _find_shortages(quantities, ma_kho_ids):
+    """Read committed stock to report which batches could not be decremented"""
+    rows = db.session.execute(
+        select(LoSP.MaSP, LoSP.MaLo, LoSP.SLTon, LoSP.MaKho)
+        .where(tuple_(LoSP.MaSP, LoSP.MaLo).in_(list(quantities)))
+    ).all()
+    current = {(r.MaSP, r.MaLo): r for r in rows}
+
+    shortages = []
+    for key, so_luong in quantities.items():
+        row = current.get(key)
+        available = 0
+        if row is not None and (ma_kho_ids is None or row.MaKho in ma_kho_ids):
+            available = row.SLTon
+        if available < so_luong:
+            shortages.append({
+                'MaSP': key[0],
+                'MaLo': key[1],
+                'requested': so_luong,
+                'available': available,
+            })
+    return shortages
+
+
+def decrement_batches(allocations, ma_phieu_xk=None, ma_kho_ids=None, *,
+                      loai, ma_tham_chieu=None, ly_do=None):
+    """
+    Atomically subtract quantities from several batches in one UPDATE
+
+    The statement only matches rows that still hold enough stock (and are
+    still in one of ``ma_kho_ids``). If any batch does not match, nothing
+    is decremented and InsufficientStockError is raised; rolling back the
+    rest of the unit of work is left to the caller.
+
+    Args:
+        allocations: list of (LoSP, so_luong); the same batch may appear
+            more than once, quantities are summed
+        ma_phieu_xk: Export slip to record on the batches (optional)
+        ma_kho_ids: Warehouses the batches must be in (optional)
+        loai: LoaiBienDong written to the movement ledger
+        ma_tham_chieu, ly_do: Ledger reference and reason (optional)
+
+    Returns:
+        int: Number of updated batches
+
+    Raises:
+        InsufficientStockError
+    """
+    quantities, batches = _sum_by_batch(allocations)
+    if not quantities:
+        return 0
+
+    per_batch = _per_batch(quantities)
+    values = {'SLTon': LoSP.SLTon - per_batch}
+    if ma_phieu_xk:
+        values['MaPhieuXK'] = ma_phieu_xk
+
+    stmt = update(LoSP.__table__)\
+        .where(tuple_(LoSP.MaSP, LoSP.MaLo).in_(list(quantities)))\
+        .where(LoSP.SLTon >= per_batch)
+    if ma_kho_ids is not None:
+        stmt = stmt.where(LoSP.MaKho.in_(list(ma_kho_ids)))
+
+    # The batches may match only in part: the savepoint undoes just this
+    # statement, not the caller's unit of work
+    savepoint = db.session.begin_nested()
+    result = db.session.execute(stmt.values(**values))
+
+    if result.rowcount != len(quantities):
+        savepoint.rollback()
+        shortages = _find_shortages(quantities, ma_kho_ids)
+        if not shortages:
+            # Stock was freed between the UPDATE and the check - report all
+            shortages = [
+                {'MaSP': k[0], 'MaLo': k[1], 'requested': n, 'available': None}
+                for k, n in quantities.items()
+            ]
+        raise InsufficientStockError(shortages)
+    savepoint.commit()
+
+    stock_ledger.record(
+        loai,
+        [(k[0], k[1], batches[k].MaKho, -n) for k, n in quantities.items()],
+        ma_phieu=ma_phieu_xk, ma_tham_chieu=ma_tham_chieu, ly_do=ly_do
+    )
+    fields = {name: value for name, value in values.items() if name != 'SLTon'}
+    _after_update(batches, ['SLTon', 'MaPhieuXK'], [
+        (batches[k].MaVach, -n, fields) for k, n in quantities.items()
+    ])
+    return result.rowcount
+
+
+def increment_batches(allocations, ma_phieu_nk=None, ma_kho=None, *,
+                      loai, ma_tham_chieu=None, ly_do=None):
+    """
+    Atomically add quantities to several batches in one UPDATE
+
+    Args:
+        allocations: list of (LoSP, so_luong)
+        ma_phieu_nk: Import slip to record on the batches (optional)
+        ma_kho: Move the batches to this warehouse (optional); the stock
+            they already hold is written to the ledger as a transfer
+        loai: LoaiBienDong written to the movement ledger
+        ma_tham_chieu, ly_do: Ledger reference and reason (optional)
+
+    Returns:
+        int: Number of updated batches
+    """
+    quantities, batches = _sum_by_batch(allocations)
+    if not quantities:
+        return 0
+
+    moved = [k for k, batch in batches.items() if ma_kho and batch.MaKho != ma_kho]
+    if moved:
+        current = db.session.execute(
+            select(LoSP.MaSP, LoSP.MaLo, LoSP.MaKho, LoSP.SLTon)
+            .where(tuple_(LoSP.MaSP, LoSP.MaLo).in_(moved))
+            .with_for_update()
+        ).all()
+        ly_do_chuyen = f"Chuyển lô sang {ma_kho} ({ly_do or loai.value})"
+        stock_ledger.record(
+            LoaiBienDong.CHUYEN_DI, [(r.MaSP, r.MaLo, r.MaKho, -r.SLTon) for r in current],
+            ma_phieu=ma_phieu_nk, ma_tham_chieu=ma_tham_chieu, ly_do=ly_do_chuyen
+        )
+        stock_ledger.record(
+            LoaiBienDong.CHUYEN_DEN, [(r.MaSP, r.MaLo, ma_kho, r.SLTon) for r in current],
+            ma_phieu=ma_phieu_nk, ma_tham_chieu=ma_tham_chieu, ly_do=ly_do_chuyen
+        )
+
+    values = {'SLTon': LoSP.SLTon + _per_batch(quantities)}
+    if ma_phieu_nk:
+        values['MaPhieuNK'] = ma_phieu_nk
+    if ma_kho:
+        values['MaKho'] = ma_kho
+
+    result = db.session.execute(
+        update(LoSP.__table__)
+        .where(tuple_(LoSP.MaSP, LoSP.MaLo).in_(list(quantities)))
+        .values(**values)
+    )
+
+    stock_ledger.record(
+        loai,
+        [(k[0], k[1], ma_kho or batches[k].MaKho, n) for k, n in quantities.items()],
+        ma_phieu=ma_phieu_nk, ma_tham_chieu=ma_tham_chieu, ly_do=ly_do
+    )
+    fields = {name: value for name, value in values.items() if name != 'SLTon'}
+    _after_update(batches, ['SLTon', 'MaPhieuNK', 'MaKho'], [
+        (batches[k].MaVach, n, fields) for k, n in quantities.items()
+    ])
+    return result.rowcount
+
+
+def move_batch(batch, so_luong, ma_kho_xuat, ma_kho_nhap, ma_phieu_nk=None,
+               ma_phieu_xk=None, ma_tham_chieu=None, ly_do=None):
+    """
+    Move a whole batch to another warehouse
+
+    Only succeeds if the batch is still in ``ma_kho_xuat`` and still holds
+    exactly ``so_luong`` units; otherwise nothing changes and
+    InsufficientStockError is raised (the caller rolls back). Written to
+    the ledger as a transfer out of ``ma_kho_xuat`` (ma_phieu_xk) and into
+    ``ma_kho_nhap`` (ma_phieu_nk).
+
+    Raises:
+        InsufficientStockError
+    """
+    values = {'MaKho': ma_kho_nhap}
+    if ma_phieu_nk:
+        values['MaPhieuNK'] = ma_phieu_nk
+
+    result = db.session.execute(
+        update(LoSP.__table__)
+        .where(LoSP.MaSP == batch.MaSP, LoSP.MaLo == batch.MaLo)
+        .where(LoSP.MaKho == ma_kho_xuat, LoSP.SLTon == so_luong)
+        .values(**values)
+    )
+
+    if result.rowcount != 1:
+        key = (batch.MaSP, batch.MaLo)
+        shortages = _find_shortages({key: so_luong}, {ma_kho_xuat}) or [{
+            'MaSP': key[0], 'MaLo': key[1], 'requested': so_luong, 'available': None
+        }]
+        raise InsufficientStockError(shortages)
+
+    stock_ledger.record(
+        LoaiBienDong.CHUYEN_DI, [(batch.MaSP, batch.MaLo, ma_kho_xuat, -so_luong)],
+        ma_phieu=ma_phieu_xk, ma_tham_chieu=ma_tham_chieu, ly_do=ly_do
+    )
+    stock_ledger.record(
+        LoaiBienDong.CHUYEN_DEN, [(batch.MaSP, batch.MaLo, ma_kho_nhap, so_luong)],
+        ma_phieu=ma_phieu_nk, ma_tham_chieu=ma_tham_chieu, ly_do=ly_do
+    )
+    _after_update({(batch.MaSP, batch.MaLo): batch}, ['MaKho', 'MaPhieuNK'], [
+        (batch.MaVach, 0, values)
+    ])
+    return result.rowcount
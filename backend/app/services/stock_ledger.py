@@ -0,0 +1,109 @@
+"""
+Stock movement ledger - append-only BienDongKho rows for every stock change
+
+LoSP chỉ giữ tồn hiện tại và phiếu nhập/xuất gần nhất, nên không thể dựng
+lại lịch sử từ đó. Mỗi thay đổi SLTon (nhập, xuất, chuyển kho, bán, trả
+hàng, điều chỉnh kiểm kho, hủy hàng) ghi thêm một dòng có dấu vào
+BienDongKho trong cùng transaction:
+
+- SoLuong > 0 là hàng vào MaKho, < 0 là hàng ra; chuyển kho ghi hai dòng.
+- Không sửa, không xóa dòng cũ; tổng SoLuong của một lô luôn bằng SLTon
+  (migration dựng lại lịch sử từ các phiếu nhập/xuất cũ, phần còn lại
+  thành một dòng "Tồn đầu kỳ").
+- Các hàm trong app.services.stock tự ghi sổ khi được truyền loai; chỗ tạo
+  lô mới trực tiếp (nhập kho, tách lô khi chuyển kho) gọi record().
+- Số lượng của mỗi lần ghi cũng được chuyển cho bảng tồn tổng hợp
+  (app.services.stock_summary), cập nhật trước khi transaction commit.
+- Báo cáo xuất nhập, hoạt động kho, trả hàng và lịch sử lô đọc sổ này theo
+  các index (ThoiGian), (MaKho, ThoiGian), (Loai, ThoiGian), (MaSP, MaLo, ThoiGian).
+"""
+
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from app import db
+from app.models import BienDongKho, LoaiBienDong
+from app.services import stock_summary
+
+# Movement type -> code used in report payloads
+TYPE_CODES = {
+    LoaiBienDong.TON_DAU: 'opening_balance',
+    LoaiBienDong.NHAP_KHO: 'import',
+    LoaiBienDong.XUAT_KHO: 'export',
+    LoaiBienDong.CHUYEN_DI: 'transfer_out',
+    LoaiBienDong.CHUYEN_DEN: 'transfer_in',
+    LoaiBienDong.BAN_HANG: 'sale',
+    LoaiBienDong.TRA_HANG: 'return',
+    LoaiBienDong.DIEU_CHINH: 'adjustment',
+    LoaiBienDong.HUY_HANG: 'discard',
+}
+
+
+def record(loai, rows, ma_phieu=None, ma_tham_chieu=None, ly_do=None):
+    """
+    Append movements to the ledger (one INSERT, caller commits)
+
+    Args:
+        loai: LoaiBienDong
+        rows: Iterable of (MaSP, MaLo, MaKho, so_luong); so_luong is signed
+        ma_phieu: PNK/PXK slip of the movement
+        ma_tham_chieu: Document behind the slip (invoice, transfer, stock check...)
+        ly_do: Reason (defaults to the movement type)
+
+    Returns:
+        int: Number of rows written (zero quantities are skipped)
+    """
+    now = datetime.utcnow()
+    values = [
+        {
+            'MaSP': ma_sp,
+            'MaLo': ma_lo,
+            'MaKho': ma_kho,
+            'Loai': loai,
+            'SoLuong': so_luong,
+            'MaPhieu': ma_phieu,
+            'MaThamChieu': ma_tham_chieu,
+            'ThoiGian': now,
+            'LyDo': (ly_do or loai.value)[:200],
+        }
+        for ma_sp, ma_lo, ma_kho, so_luong in rows
+        if so_luong
+    ]
+    if values:
+        db.session.execute(insert(BienDongKho.__table__), values)
+        stock_summary.track(
+            db.session, loai, [(v['MaSP'], v['MaKho'], v['SoLuong']) for v in values]
+        )
+    return len(values)
+
+
+def record_deleted(batches, ma_phieu=None, ly_do=None):
+    """Write off the remaining stock of batches about to be deleted"""
+    stock_summary.recount(db.session, {b.MaSP for b in batches})
+    return record(
+        LoaiBienDong.DIEU_CHINH,
+        [(b.MaSP, b.MaLo, b.MaKho, -(b.SLTon or 0)) for b in batches],
+        ma_phieu=ma_phieu, ly_do=ly_do
+    )
+
+
+def batch_timeline(ma_sp, ma_lo):
+    """
+    Every movement of a batch in order, with the running balance
+
+    Returns:
+        list: BienDongKho dicts plus 'TonSau' (stock after the movement)
+    """
+    rows = BienDongKho.query.filter(
+        BienDongKho.MaSP == ma_sp,
+        BienDongKho.MaLo == ma_lo
+    ).order_by(BienDongKho.ThoiGian, BienDongKho.MaBienDong).all()
+
+    balance = 0
+    timeline = []
+    for row in rows:
+        balance += row.SoLuong
+        timeline.append({**row.to_dict(), 'TonSau': balance})
+    return timeline
+
@@ -0,0 +1,251 @@
+"""
+Stock summary - TonKhoTongHop, one row per (MaSP, MaKho)
+
+Cảnh báo tồn thấp, gợi ý đặt hàng, báo cáo tồn kho, dashboard, tìm kiếm bán
+hàng và xóa sản phẩm đều cộng SUM(LoSP.SLTon) theo sản phẩm ở mỗi request.
+TonKhoTongHop giữ sẵn tổng tồn, số lô, HSD sớm nhất và giá trị tồn
+(SLTon × GiaBan) cho từng cặp sản phẩm/kho, nên các chỗ đó chỉ còn đọc theo
+khóa chính:
+
+- Mọi thay đổi SLTon đều ghi sổ biến động (stock_ledger.record), sổ báo số
+  lượng có dấu cho module này; chênh lệch được cộng dồn trong session và
+  upsert một lần ngay trước commit, theo thứ tự khóa chính.
+- Thay đổi cấu trúc (tạo lô, chuyển lô sang kho khác, xóa lô, đổi GiaBan,
+  xóa sản phẩm) đánh dấu cả sản phẩm để tính lại từ LoSP trước commit
+  (đọc có khóa, để không ghi đè thay đổi của transaction khác).
+- Rollback thì bỏ phần chưa áp dụng; bảng luôn đi cùng transaction của LoSP.
+- check() (``flask stock-summary check``) so bảng với LoSP, rebuild()
+  (``flask stock-summary rebuild``) dựng lại toàn bộ.
+"""
+
+from decimal import Decimal
+
+from sqlalchemy import delete, event, func, insert, inspect, select
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import LoaiBienDong, LoSP, SanPham, TonKhoTongHop
+
+SUMMARY = TonKhoTongHop.__table__
+_COLUMNS = ('MaSP', 'MaKho', 'SLTon', 'SoLo', 'HSDSomNhat', 'GiaTri')
+
+# Movements that only change quantities of existing batches in place
+_QUANTITY_ONLY = frozenset({
+    LoaiBienDong.BAN_HANG,
+    LoaiBienDong.TRA_HANG,
+    LoaiBienDong.XUAT_KHO,
+    LoaiBienDong.HUY_HANG,
+    LoaiBienDong.DIEU_CHINH,
+})
+
+
+def _pending(session):
+    return session.info.setdefault('stock_summary_pending', {'delta': {}, 'recount': set()})
+
+
+def track(session, loai, rows):
+    """
+    Note ledger movements for the summary (called by stock_ledger.record)
+
+    Args:
+        loai: LoaiBienDong of the movements
+        rows: Iterable of (MaSP, MaKho, so_luong) with signed quantities
+    """
+    pending = _pending(session)
+    delta = pending['delta']
+    for ma_sp, ma_kho, so_luong in rows:
+        key = (ma_sp, ma_kho or '')
+        delta[key] = delta.get(key, 0) + so_luong
+        if loai not in _QUANTITY_ONLY:
+            pending['recount'].add(ma_sp)
+
+
+def recount(session, ma_sp_list):
+    """Recompute these products from LoSP at commit (batches created/moved/deleted)"""
+    _pending(session)['recount'].update(ma_sp_list)
+
+
+def _aggregate(ma_sp_list=None):
+    """Summary rows computed from LoSP: (MaSP, MaKho, SLTon, SoLo, HSDSomNhat)"""
+    ma_kho = func.coalesce(LoSP.MaKho, '')
+    query = select(
+        LoSP.MaSP,
+        ma_kho.label('MaKho'),
+        func.coalesce(func.sum(LoSP.SLTon), 0).label('SLTon'),
+        func.count().label('SoLo'),
+        func.min(LoSP.HSD).label('HSDSomNhat')
+    )
+    if ma_sp_list is not None:
+        query = query.where(LoSP.MaSP.in_(sorted(ma_sp_list)))
+    return query.group_by(LoSP.MaSP, ma_kho)
+
+
+def _prices(ma_sp_list):
+    return dict(db.session.execute(
+        select(SanPham.MaSP, SanPham.GiaBan).where(SanPham.MaSP.in_(sorted(ma_sp_list)))
+    ).all())
+
+
+def _add_deltas(delta, prices):
+    """Add quantity changes to existing rows (creating missing ones), in key order"""
+    rows = [
+        {
+            'MaSP': ma_sp, 'MaKho': ma_kho, 'SLTon': so_luong, 'SoLo': 0, 'HSDSomNhat': None,
+            'GiaTri': so_luong * (prices.get(ma_sp) or 0),
+        }
+        for (ma_sp, ma_kho), so_luong in sorted(delta.items())
+        if so_luong
+    ]
+    if not rows:
+        return
+
+    if db.engine.dialect.name == 'sqlite':
+        stmt = sqlite.insert(SUMMARY)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['MaSP', 'MaKho'],
+            set_={name: SUMMARY.c[name] + stmt.excluded[name] for name in ('SLTon', 'GiaTri')}
+        )
+    else:
+        stmt = mysql.insert(SUMMARY)
+        stmt = stmt.on_duplicate_key_update(
+            {name: SUMMARY.c[name] + stmt.inserted[name] for name in ('SLTon', 'GiaTri')}
+        )
+    db.session.execute(stmt, rows)
+
+
+def _recount(ma_sp_list, prices):
+    """Replace the rows of these products with a fresh aggregate of LoSP"""
+    # Locking read: sees stock committed by concurrent transactions (no-op on SQLite)
+    fresh = db.session.execute(_aggregate(ma_sp_list).with_for_update(read=True)).all()
+    db.session.execute(delete(SUMMARY).where(SUMMARY.c.MaSP.in_(sorted(ma_sp_list))))
+    if fresh:
+        db.session.execute(insert(SUMMARY), [
+            {**row._asdict(), 'GiaTri': row.SLTon * (prices.get(row.MaSP) or 0)}
+            for row in fresh
+        ])
+
+
+def flush(session):
+    """Apply the pending changes of ``session`` (runs before every commit)"""
+    pending = session.info.pop('stock_summary_pending', None)
+    if not pending:
+        return
+    recounted = pending['recount']
+    delta = {key: n for key, n in pending['delta'].items() if key[0] not in recounted}
+    if not delta and not recounted:
+        return
+
+    prices = _prices({key[0] for key in delta} | recounted)
+    _add_deltas(delta, prices)
+    if recounted:
+        _recount(recounted, prices)
+
+
+# =============================================
+# SQLAlchemy hooks - apply before commit, drop on rollback
+# =============================================
+
+@event.listens_for(SanPham, 'after_update')
+def _product_changed(mapper, connection, target):
+    """A new GiaBan changes the value of every row of the product"""
+    state = inspect(target)
+    if state.session is not None and state.attrs.GiaBan.history.has_changes():
+        recount(state.session, [target.MaSP])
+
+
+@event.listens_for(SanPham, 'after_delete')
+def _product_deleted(mapper, connection, target):
+    session = inspect(target).session
+    if session is not None:
+        recount(session, [target.MaSP])
+
+
+@event.listens_for(Session, 'before_commit')
+def _before_commit(session):
+    # Flush first: ORM batch/product changes must reach LoSP (and the events above)
+    session.flush()
+    flush(session)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    if session.in_nested_transaction():
+        return  # Savepoint only: the enclosing transaction may still commit
+    session.info.pop('stock_summary_pending', None)
+
+
+# =============================================
+# Consistency check / rebuild
+# =============================================
+
+def check():
+    """
+    Compare TonKhoTongHop with a full aggregate of LoSP
+
+    Returns:
+        list: {'MaSP', 'MaKho', 'expected', 'actual'} per differing row
+            (a missing row is None on that side)
+    """
+    fresh = _aggregate().subquery()
+    expected = {
+        (r.MaSP, r.MaKho): r._asdict()
+        for r in db.session.execute(
+            select(fresh, (fresh.c.SLTon * SanPham.GiaBan).label('GiaTri'))
+            .join(SanPham, SanPham.MaSP == fresh.c.MaSP)
+        ).all()
+    }
+    actual = {
+        (r.MaSP, r.MaKho): r._asdict()
+        for r in db.session.execute(select(*[SUMMARY.c[name] for name in _COLUMNS])).all()
+    }
+
+    def same(a, b):
+        if a is None or b is None:
+            return a is b
+        return all(
+            Decimal(str(a[name])).quantize(Decimal('0.01')) == Decimal(str(b[name])).quantize(Decimal('0.01'))
+            if name == 'GiaTri' else a[name] == b[name]
+            for name in _COLUMNS
+        )
+
+    return [
+        {'MaSP': key[0], 'MaKho': key[1], 'expected': expected.get(key), 'actual': actual.get(key)}
+        for key in sorted(expected.keys() | actual.keys())
+        if not same(expected.get(key), actual.get(key))
+    ]
+
+
+def rebuild():
+    """
+    Regenerate TonKhoTongHop from LoSP (one transaction, caller commits)
+
+    Returns:
+        int: Rows written
+    """
+    db.session.info.pop('stock_summary_pending', None)
+    db.session.execute(delete(SUMMARY))
+
+    fresh = _aggregate().subquery()
+    source = select(
+        *[fresh.c[name] for name in _COLUMNS[:-1]],
+        fresh.c.SLTon * SanPham.GiaBan
+    ).join(SanPham, SanPham.MaSP == fresh.c.MaSP)
+    return db.session.execute(insert(SUMMARY).from_select(list(_COLUMNS), source)).rowcount
+
+
+def totals(ma_sp_list=None, ma_kho_ids=None):
+    """
+    Stock per product over the given warehouses (all by default)
+
+    Returns:
+        dict: {MaSP: SLTon}, products without summary rows left out
+    """
+    query = select(TonKhoTongHop.MaSP, func.sum(TonKhoTongHop.SLTon))
+    if ma_sp_list is not None:
+        if not ma_sp_list:
+            return {}
+        query = query.where(TonKhoTongHop.MaSP.in_(list(ma_sp_list)))
+    if ma_kho_ids is not None:
+        query = query.where(TonKhoTongHop.MaKho.in_(list(ma_kho_ids)))
+    return dict(db.session.execute(query.group_by(TonKhoTongHop.MaSP)).all())
@@ -0,0 +1,127 @@
+"""
+Warehouse registry - resolves warehouses by LoaiKho without a DB round trip
+
+KhoHang hầu như không thay đổi trong lúc vận hành, nên mỗi worker chỉ nạp
+bảng này một lần rồi tra cứu trong bộ nhớ. Registry bị đánh dấu hết hạn khi
+có thay đổi trên KhoHang (qua SQLAlchemy events) hoặc khi quá TTL cấu hình
+(WAREHOUSE_REGISTRY_TTL) để các worker khác cũng nhận thay đổi.
+"""
+
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app.models import KhoHang, LoaiKho
+
+
+class WarehouseRegistry:
+    """Process-wide, in-memory index of KhoHang grouped by LoaiKho"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_id = {}
+        self._by_type = {}
+        self._loaded_at = None
+
+    # -----------------------------------------
+    # Loading / invalidation
+    # -----------------------------------------
+
+    def invalidate(self):
+        """Force a reload on the next lookup"""
+        with self._lock:
+            self._loaded_at = None
+
+    def _is_stale(self):
+        if self._loaded_at is None:
+            return True
+        ttl = current_app.config.get('WAREHOUSE_REGISTRY_TTL', 300)
+        return ttl > 0 and time.monotonic() - self._loaded_at > ttl
+
+    def load(self):
+        """Load all warehouses from the database (one query)"""
+        warehouses = KhoHang.query.order_by(KhoHang.MaKho).all()
+
+        by_id = {}
+        by_type = {loai: [] for loai in LoaiKho}
+        for kho in warehouses:
+            data = kho.to_dict()
+            by_id[kho.MaKho] = data
+            if kho.Loai is not None:
+                by_type[kho.Loai].append(data)
+
+        with self._lock:
+            self._by_id = by_id
+            self._by_type = by_type
+            self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        if self._is_stale():
+            self.load()
+
+    # -----------------------------------------
+    # Lookups
+    # -----------------------------------------
+
+    @staticmethod
+    def _coerce_type(loai):
+        """Accept LoaiKho members as well as their string values ('Kho thường')"""
+        if isinstance(loai, LoaiKho):
+            return loai
+        return LoaiKho(loai)
+
+    def get(self, ma_kho):
+        """Get warehouse dict by MaKho (None if not found)"""
+        self._ensure_loaded()
+        return self._by_id.get(ma_kho)
+
+    def get_by_type(self, loai):
+        """Get all warehouses of a type, ordered by MaKho"""
+        self._ensure_loaded()
+        return list(self._by_type.get(self._coerce_type(loai), []))
+
+    def get_ids(self, loai):
+        """Get the set of MaKho for a warehouse type"""
+        return {kho['MaKho'] for kho in self.get_by_type(loai)}
+
+    def get_default(self, loai):
+        """Get the default (lowest MaKho) warehouse of a type, or None"""
+        warehouses = self.get_by_type(loai)
+        return warehouses[0] if warehouses else None
+
+    def is_type(self, ma_kho, loai):
+        """Check whether a warehouse belongs to the given type"""
+        kho = self.get(ma_kho)
+        return kho is not None and kho['Loai'] == self._coerce_type(loai).value
+
+    def normal_ids(self):
+        """MaKho of all 'Kho thường' warehouses"""
+        return self.get_ids(LoaiKho.KHO_THUONG)
+
+    def defect_ids(self):
+        """MaKho of all 'Kho lỗi' warehouses"""
+        return self.get_ids(LoaiKho.KHO_LOI)
+
+
+warehouse_registry = WarehouseRegistry()
+
+
+@event.listens_for(KhoHang, 'after_insert')
+@event.listens_for(KhoHang, 'after_update')
+@event.listens_for(KhoHang, 'after_delete')
+def _mark_warehouses_changed(mapper, connection, target):
+    """Flag the session so the registry is reloaded after commit"""
+    warehouse_registry.invalidate()
+    session = object_session(target)
+    if session is not None:
+        session.info['warehouses_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    """Reload once the change is visible to other connections as well"""
+    if session.info.pop('warehouses_changed', False):
+        warehouse_registry.invalidate()
@@ -0,0 +1,233 @@
+"""
+Per-request database metrics: query count, DB time and pool wait
+
+Mỗi request đếm số câu lệnh SQL, tổng thời gian chạy trong DB và thời gian
+chờ lấy kết nối từ pool (mọi engine, kể cả replica):
+
+- Trả về trong header Server-Timing (xem trực tiếp ở tab Network của trình
+  duyệt): db;dur=..;desc="N queries", db-pool;dur=..
+- Cộng dồn theo endpoint (số request, số truy vấn trung bình/tối đa, thời
+  gian DB, thời gian chờ pool) và xem qua GET /api/metrics/db.
+- Chỉ tính trong request; công việc nền (làm mới cache...) không được đếm.
+- @query_budget(n) khai báo số câu lệnh tối đa của một route để bắt lỗi N+1:
+  vượt ngân sách thì raise QueryBudgetExceeded khi QUERY_BUDGET_STRICT
+  (TestingConfig), còn production chỉ ghi cảnh báo theo tỉ lệ
+  QUERY_BUDGET_SAMPLE_RATE và đếm vào over_budget của endpoint.
+"""
+
+import random
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+
+_G_KEY = 'db_metrics'
+_START_KEY = 'db_metrics_query_start'
+
+
+def _current():
+    """Counters of the current request, or None outside a request"""
+    if not has_app_context():
+        return None
+    return g.get(_G_KEY)
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised in strict mode when a route runs more statements than its budget"""
+
+
+class DbMetrics:
+    """Per-endpoint aggregates; process-wide"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._instrumented = set()
+
+    # -----------------------------------------
+    # Engine instrumentation
+    # -----------------------------------------
+
+    def instrument(self, engine):
+        """Attach statement and checkout timing to an engine (once)"""
+        if id(engine) in self._instrumented:
+            return
+        self._instrumented.add(id(engine))
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault(_START_KEY, []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            started = conn.info[_START_KEY].pop()
+            metrics = _current()
+            if metrics is not None:
+                metrics['queries'] += 1
+                metrics['db'] += time.perf_counter() - started
+
+        @event.listens_for(engine, 'handle_error')
+        def _on_error(context):
+            starts = context.connection.info.get(_START_KEY) if context.connection else None
+            if starts:
+                started = starts.pop()
+                metrics = _current()
+                if metrics is not None:
+                    metrics['queries'] += 1
+                    metrics['db'] += time.perf_counter() - started
+
+        # Pool checkout (waiting for a free connection, opening a new one,
+        # pre-ping). Wrapping the engine keeps working after engine.dispose().
+        raw_connection = engine.raw_connection
+
+        def timed_raw_connection():
+            started = time.perf_counter()
+            try:
+                return raw_connection()
+            finally:
+                metrics = _current()
+                if metrics is not None:
+                    metrics['pool_wait'] += time.perf_counter() - started
+
+        engine.raw_connection = timed_raw_connection
+
+    # -----------------------------------------
+    # Request hooks
+    # -----------------------------------------
+
+    @staticmethod
+    def start_request():
+        g.setdefault(_G_KEY, {
+            'queries': 0, 'db': 0.0, 'pool_wait': 0.0, 'started': time.perf_counter()
+        })
+
+    def finish_request(self, response, server_timing=True):
+        metrics = g.pop(_G_KEY, None)
+        if metrics is None:
+            return response
+
+        total = time.perf_counter() - metrics['started']
+        if server_timing:
+            response.headers.add(
+                'Server-Timing',
+                f'db;dur={metrics["db"] * 1000:.2f};desc="{metrics["queries"]} queries", '
+                f'db-pool;dur={metrics["pool_wait"] * 1000:.2f}, '
+                f'app;dur={total * 1000:.2f}'
+            )
+
+        endpoint = request.endpoint or '<unmatched>'
+        with self._lock:
+            agg = self._endpoints.get(endpoint)
+            if agg is None:
+                agg = self._endpoints[endpoint] = {
+                    'requests': 0, 'queries': 0, 'max_queries': 0,
+                    'db': 0.0, 'pool_wait': 0.0, 'total': 0.0, 'max_total': 0.0,
+                    'budget': None, 'over_budget': 0,
+                }
+            agg['requests'] += 1
+            agg['queries'] += metrics['queries']
+            agg['max_queries'] = max(agg['max_queries'], metrics['queries'])
+            agg['db'] += metrics['db']
+            agg['pool_wait'] += metrics['pool_wait']
+            agg['total'] += total
+            agg['max_total'] = max(agg['max_total'], total)
+            if metrics.get('budget') is not None:
+                agg['budget'] = metrics['budget']
+                agg['over_budget'] += metrics['queries_in_view'] > metrics['budget']
+        return response
+
+    # -----------------------------------------
+    # Reporting
+    # -----------------------------------------
+
+    def stats(self):
+        """Per-endpoint aggregates (times in milliseconds), slowest DB time first"""
+        with self._lock:
+            items = [(endpoint, dict(agg)) for endpoint, agg in self._endpoints.items()]
+
+        rows = []
+        for endpoint, agg in items:
+            n = agg['requests']
+            rows.append({
+                'endpoint': endpoint,
+                'requests': n,
+                'queries_avg': round(agg['queries'] / n, 2),
+                'queries_max': agg['max_queries'],
+                'db_ms_total': round(agg['db'] * 1000, 2),
+                'db_ms_avg': round(agg['db'] * 1000 / n, 2),
+                'pool_wait_ms_avg': round(agg['pool_wait'] * 1000 / n, 2),
+                'request_ms_avg': round(agg['total'] * 1000 / n, 2),
+                'request_ms_max': round(agg['max_total'] * 1000, 2),
+                'query_budget': agg['budget'],
+                'over_budget': agg['over_budget'],
+            })
+        rows.sort(key=lambda row: row['db_ms_total'], reverse=True)
+        return rows
+
+    def reset(self):
+        """Clear the aggregates"""
+        with self._lock:
+            self._endpoints = {}
+
+
+db_metrics = DbMetrics()
+
+
+def _over_budget(budget, used):
+    message = f"{request.endpoint} ran {used} SQL statements (budget {budget})"
+    if current_app.config.get('QUERY_BUDGET_STRICT', False):
+        raise QueryBudgetExceeded(message)
+    if random.random() < current_app.config.get('QUERY_BUDGET_SAMPLE_RATE', 0.1):
+        current_app.logger.warning(f"Query budget exceeded: {message}")
+
+
+def query_budget(max_queries):
+    """
+    Decorator declaring the most SQL statements a route may run
+
+    Usage:
+        @query_budget(3)
+        def get_batches():
+            ...
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            metrics = _current()
+            if metrics is None:
+                return fn(*args, **kwargs)
+
+            before = metrics['queries']
+            response = fn(*args, **kwargs)
+            used = metrics['queries'] - before
+            metrics['budget'] = max_queries
+            metrics['queries_in_view'] = used
+            if used > max_queries:
+                _over_budget(max_queries, used)
+            return response
+
+        wrapper.query_budget = max_queries
+        return wrapper
+    return decorator
+
+
+def init_db_metrics(app, db):
+    """Instrument every engine of ``db`` and register the request hooks"""
+    if not app.config.get('DB_METRICS_ENABLED', True):
+        return
+
+    with app.app_context():
+        for engine in db.engines.values():
+            db_metrics.instrument(engine)
+
+    server_timing = app.config.get('DB_METRICS_SERVER_TIMING', True)
+
+    @app.before_request
+    def _start_db_metrics():
+        db_metrics.start_request()
+
+    @app.after_request
+    def _finish_db_metrics(response):
+        return db_metrics.finish_request(response, server_timing)
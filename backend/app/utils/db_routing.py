@@ -0,0 +1,158 @@
+"""
+Read-replica routing for report and read-only list endpoints
+
+Báo cáo cuối tháng chạy các truy vấn tổng hợp lớn; nếu chạy trên cùng DB
+chính với create_invoice thì quầy thu ngân bị chậm. Khi cấu hình
+SQLALCHEMY_BINDS['replica'] (REPLICA_DATABASE_URL), các SELECT của endpoint
+được đánh dấu bằng @read_replica (và toàn bộ reports_bp) chạy trên replica.
+
+- Replica được kiểm tra định kỳ (REPLICA_CHECK_INTERVAL giây): không kết nối
+  được hoặc trễ quá REPLICA_MAX_LAG giây thì quay về DB chính.
+- Ghi (flush) và đọc khi session còn thay đổi chưa flush luôn dùng DB chính.
+"""
+
+import threading
+import time
+from functools import wraps
+
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.sql import Select
+
+REPLICA = 'replica'
+_FLAG = 'read_replica'
+
+
+class ReplicaRouter:
+    """Tracks replica health; process-wide"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._healthy = False
+        self._checked_at = None
+        self._lag = None
+        self._watched = set()
+
+    def configured(self):
+        return REPLICA in (current_app.config.get('SQLALCHEMY_BINDS') or {})
+
+    def mark_down(self):
+        """Stop using the replica until the next health check"""
+        with self._lock:
+            self._healthy = False
+            self._checked_at = time.monotonic()
+
+    @staticmethod
+    def _read_lag(conn):
+        """Replication lag in seconds (0 if not a MySQL replica)"""
+        if conn.dialect.name != 'mysql':
+            conn.execute(text('SELECT 1'))
+            return 0
+
+        for statement, column in (
+            ('SHOW REPLICA STATUS', 'Seconds_Behind_Source'),
+            ('SHOW SLAVE STATUS', 'Seconds_Behind_Master'),
+        ):
+            try:
+                row = conn.execute(text(statement)).mappings().first()
+            except Exception:
+                continue
+            if row is None:
+                return 0        # Stand-alone instance used as a replica
+            return row.get(column)   # None = replication stopped
+        return None
+
+    def _watch(self, engine):
+        """Mark the replica down as soon as a connection to it fails"""
+        if id(engine) in self._watched:
+            return
+        self._watched.add(id(engine))
+
+        @event.listens_for(engine, 'handle_error')
+        def _on_error(context):
+            if context.is_disconnect:
+                self.mark_down()
+
+    def _check(self, engine):
+        max_lag = current_app.config.get('REPLICA_MAX_LAG', 5)
+        try:
+            with engine.connect() as conn:
+                lag = self._read_lag(conn)
+            healthy = lag is not None and lag <= max_lag
+        except Exception:
+            lag, healthy = None, False
+
+        if not healthy:
+            current_app.logger.warning(f"Read replica unavailable (lag: {lag}) - using primary")
+        with self._lock:
+            self._healthy = healthy
+            self._lag = lag
+            self._checked_at = time.monotonic()
+
+    def engine(self, engines):
+        """Replica engine if configured and healthy, otherwise None"""
+        engine = engines.get(REPLICA)
+        if engine is None:
+            return None
+        self._watch(engine)
+
+        interval = current_app.config.get('REPLICA_CHECK_INTERVAL', 10)
+        if self._checked_at is None or time.monotonic() - self._checked_at > interval:
+            self._check(engine)
+        return engine if self._healthy else None
+
+    def stats(self):
+        """Health information (for diagnostics)"""
+        return {'healthy': self._healthy, 'lag': self._lag}
+
+
+replica_router = ReplicaRouter()
+
+
+class RoutingSession(Session):
+    """Session that sends SELECTs to the replica while read_replica is on"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and self.info.get(_FLAG)
+            and isinstance(clause, Select)
+            and not self._flushing
+            and not (self.new or self.dirty or self.deleted)
+        ):
+            engine = replica_router.engine(self._db.engines)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def use_read_replica():
+    """Route the current session's SELECTs to the replica (before_request hook)"""
+    from app import db
+    db.session.info[_FLAG] = True
+
+
+def release_read_replica(exc=None):
+    """Undo use_read_replica() (teardown_request hook)"""
+    from app import db
+    db.session.info.pop(_FLAG, None)
+
+
+def read_replica(fn):
+    """
+    Decorator for read-only endpoints whose SELECTs may run on the replica
+
+    Usage:
+        @read_replica
+        def get_invoices():
+            ...
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        use_read_replica()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            release_read_replica()
+    return wrapper
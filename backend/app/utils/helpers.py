@@ -1,6 +1,8 @@
 """Utility functions for the application"""
 
 from datetime import datetime, date
+import base64
+import json
 import random
 import string
 
@@ -20,14 +22,31 @@ def generate_id(prefix, length=6):
     return f"{prefix}{random_part}"
 
 
+def ean13_check_digit(digits12):
+    """
+    Compute the EAN-13 check digit
+    
+    Args:
+        digits12: First 12 digits (string)
+    
+    Returns:
+        str: Check digit
+    """
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits12))
+    return str((10 - total % 10) % 10)
+
+
 def generate_barcode():
     """
-    Generate a unique barcode (EAN-13 format)
+    Generate a random barcode (EAN-13 format, valid check digit)
+    
+    New batches get their codes from app.services.barcode_allocator instead.
     
     Returns:
         str: 13-digit barcode
     """
-    return ''.join(random.choices(string.digits, k=13))
+    digits12 = ''.join(random.choices(string.digits, k=12))
+    return digits12 + ean13_check_digit(digits12)
 
 
 def parse_date(date_str):
@@ -124,7 +143,7 @@ def days_until_expiry(hsd):
     return delta.days
 
 
-def paginate(query, page=1, per_page=20):
+def paginate(query, page=1, per_page=20, serialize=None):
     """
     Paginate query results
     
@@ -132,6 +151,7 @@ def paginate(query, page=1, per_page=20):
         query: SQLAlchemy query
         page: Page number (1-indexed)
         per_page: Items per page
+        serialize: Function mapping a row to a dict (default: row.to_dict())
     
     Returns:
         dict: Pagination result with items, total, page info
@@ -145,8 +165,10 @@ def paginate(query, page=1, per_page=20):
         error_out=False
     )
     
+    serialize = serialize or (lambda item: item.to_dict())
+    
     return {
-        'items': [item.to_dict() for item in pagination.items],
+        'items': [serialize(item) for item in pagination.items],
         'total': pagination.total,
         'page': pagination.page,
         'per_page': pagination.per_page,
@@ -156,6 +178,43 @@ def paginate(query, page=1, per_page=20):
     }
 
 
+def encode_cursor(data):
+    """
+    Encode a pagination cursor (keyset position) as an opaque string
+    
+    Args:
+        data: JSON-serializable position, e.g. {'k': ['Sữa tươi', 'SP004']}
+    
+    Returns:
+        str: URL-safe cursor
+    """
+    raw = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor
+    
+    Args:
+        cursor: Cursor string
+    
+    Returns:
+        Decoded position, or None if the cursor is empty
+    
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    if not cursor:
+        return None
+    
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
 def success_response(data=None, message="Success", status=200):
     """
     Create a success response
@@ -179,18 +238,24 @@ def success_response(data=None, message="Success", status=200):
     return response, status
 
 
-def error_response(message="Error", status=400):
+def error_response(message="Error", status=400, data=None):
     """
     Create an error response
     
     Args:
         message: Error message
         status: HTTP status code
+        data: Partial result to return with the error (optional)
     
     Returns:
         tuple: (response_dict, status_code)
     """
-    return {
+    response = {
         "success": False,
         "error": message,
-    }, status
+    }
+    
+    if data is not None:
+        response["data"] = data
+    
+    return response, status
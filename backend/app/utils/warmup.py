@@ -0,0 +1,147 @@
+"""
+Warm-up before serving: mappers, pooled connections, caches, hot statements
+
+Worker mới phải trả giá cho lần cấu hình mapper đầu tiên, kết nối DB đầu
+tiên, cache rỗng và biên dịch SQL lần đầu ngay trên request của khách hàng.
+wsgi.py gọi warm_up() một lần trong master trước khi fork (gunicorn
+preload_app), nên các worker thừa hưởng mapper, cache và compiled cache đã
+sẵn sàng; mỗi worker chỉ cần mở lại kết nối của riêng mình (after_fork).
+
+- configure_mappers() và nạp warehouse_registry, barcode_index,
+  product_search.
+- Chạy các câu truy vấn nóng (FEFO, quét mã vạch, chi tiết hóa đơn) với tham
+  số không khớp dòng nào để SQLAlchemy biên dịch và lưu vào compiled cache.
+- Mở sẵn WARMUP_POOL_CONNECTIONS kết nối cho mỗi engine.
+- GET /api/health/ready trả 503 cho tới khi warm-up xong.
+"""
+
+import threading
+import time
+
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+
+
+class WarmupState:
+    """Readiness of this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ready = False
+        self.stages = {}       # stage -> milliseconds
+        self.errors = {}       # stage -> message
+
+    def reset(self):
+        with self._lock:
+            self.ready = False
+            self.stages = {}
+            self.errors = {}
+
+    def record(self, stage, elapsed, error=None):
+        with self._lock:
+            self.stages[stage] = round(elapsed * 1000, 2)
+            if error is not None:
+                self.errors[stage] = error
+
+    def mark_ready(self):
+        with self._lock:
+            self.ready = True
+
+    def stats(self):
+        with self._lock:
+            return {'ready': self.ready, 'stages': dict(self.stages), 'errors': dict(self.errors)}
+
+
+warmup_state = WarmupState()
+
+
+def _run(app, stage, fn):
+    """Run one stage; a failing stage is logged and does not stop the others"""
+    started = time.perf_counter()
+    try:
+        result = fn()
+    except Exception as e:
+        warmup_state.record(stage, time.perf_counter() - started, str(e))
+        app.logger.exception(f"Warm-up stage '{stage}' failed")
+        return None
+    warmup_state.record(stage, time.perf_counter() - started)
+    return result
+
+
+def warm_pool(app, db):
+    """Open WARMUP_POOL_CONNECTIONS connections per engine and return them to the pool"""
+    wanted = app.config.get('WARMUP_POOL_CONNECTIONS', 2)
+    for engine in db.engines.values():
+        size = getattr(engine.pool, 'size', None)
+        n = min(wanted, size()) if callable(size) else min(wanted, 1)
+        connections = []
+        try:
+            for _ in range(n):
+                conn = engine.connect()
+                conn.execute(text('SELECT 1'))
+                connections.append(conn)
+        finally:
+            for conn in connections:
+                conn.close()
+
+
+def _prime_caches():
+    from app.services import barcode_index, product_search, warehouse_registry
+
+    warehouse_registry.load()
+    return {
+        'barcodes': barcode_index.warm(),
+        'products': product_search.load(),
+    }
+
+
+def _compile_hot_statements(db):
+    """Execute the hot read paths once with keys that match nothing"""
+    from app.models import HoaDon, HoaDonSP, SanPham
+    from app.services import InsufficientStockError, allocate_fefo, barcode_index, warehouse_registry
+
+    try:
+        try:
+            allocate_fefo({'': 1}, warehouse_registry.normal_ids() or [''])
+        except InsufficientStockError:
+            pass
+        barcode_index._load_one('')
+        db.session.get(HoaDon, '')
+        HoaDonSP.query.filter(HoaDonSP.MaHD == '').all()
+        db.session.get(SanPham, '')
+    finally:
+        db.session.rollback()
+
+
+def warm_up(app, db):
+    """
+    Run every warm-up stage and mark the process ready
+
+    Returns:
+        dict: Readiness with per-stage timings in milliseconds
+    """
+    warmup_state.reset()
+    with app.app_context():
+        _run(app, 'mappers', configure_mappers)
+        _run(app, 'pool', lambda: warm_pool(app, db))
+        counts = _run(app, 'caches', _prime_caches)
+        _run(app, 'statements', lambda: _compile_hot_statements(db))
+        db.session.remove()
+
+    warmup_state.mark_ready()
+    stats = warmup_state.stats()
+    app.logger.info(f"Warm-up complete: {stats['stages']} ms, caches: {counts}")
+    return stats
+
+
+def after_fork(app, db):
+    """
+    Give a forked worker its own connections
+
+    Connections inherited from the master are dropped without closing them
+    (the master still owns the sockets), then the worker's pool is opened.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+        _run(app, 'pool', lambda: warm_pool(app, db))
@@ -0,0 +1,20 @@
+"""
+Endpoint benchmarks on a synthetic large-store dataset
+
+Sinh dữ liệu giả lập một chuỗi cửa hàng lớn (sản phẩm, lô theo nhiều kho với
+HSD thực tế, hóa đơn nhiều tháng) trên SQLite bằng BenchmarkConfig, rồi đo
+p50/p95/p99 và số truy vấn của từng route, lưu JSON và so sánh với baseline.
+
+Usage (from backend/):
+    python -m benchmarks.run --scale small --output results.json
+    python -m benchmarks.run --scale small --baseline baseline.json
+    python -m benchmarks.run --scale large --products 50000 --batches 2000000 \\
+        --invoice-lines 10000000 --db /data/bench-large.sqlite
+
+benchmarks.loadsim chạy nhiều quầy thu ngân song song trên cùng dữ liệu và
+đối soát tồn kho sau khi chạy:
+    python -m benchmarks.loadsim --lanes 8 --duration 60
+
+benchmarks.startup đo thời gian khởi động và RSS của một tiến trình mới:
+    python -m benchmarks.startup --repeat 7
+"""
@@ -0,0 +1,273 @@
+"""
+Seedable synthetic dataset for the benchmarks
+
+Dữ liệu được sinh theo seed nên hai lần chạy cùng tham số cho cùng dữ liệu:
+
+- Sản phẩm thuộc các nhóm hàng có hạn dùng khác nhau (sữa vài tuần, đồ khô
+  một-hai năm...); NSX rải đều trong vòng đời nên có lô sắp hết hạn và một
+  phần nhỏ đã hết hạn, như ở cửa hàng thật.
+- Lô chia cho các kho thường, khoảng 3% nằm ở kho lỗi; một phần lô hết tồn.
+  Mỗi lô có một dòng "Nhập kho" trong sổ biến động (BienDongKho) vào ngày
+  NSX, nên tổng sổ của lô bằng SLTon.
+- Hóa đơn trong DAYS_OF_SALES ngày gần nhất, sản phẩm bán chạy theo phân phối
+  kiểu Zipf, mỗi hóa đơn 1-8 dòng với DonGia/TongTien snapshot; bảng tổng
+  hợp TongHopBanHang được dựng lại từ các hóa đơn này.
+- Bộ đếm BoDemMa được đặt sau các mã đã sinh để id_allocator không phải bỏ
+  qua hàng triệu mã cũ.
+"""
+
+import random
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from sqlalchemy import insert, select, text
+
+from app import db
+from app.services import sales_rollup, stock_summary
+from app.models import (
+    BienDongKho, BoDemMa, DatHang, HoaDon, HoaDonSP, KhoHang, LoaiBienDong,
+    LoaiKho, LoSP, NhaCungCap, NhanVienKho, PhieuNhapKho, PhieuXuatKho,
+    RoleNV, SanPham, ThuNgan, TrangThaiDonHang
+)
+from app.utils.helpers import ean13_check_digit
+
+# Category -> (unit, shelf life range in days, price range)
+CATEGORIES = {
+    'Sữa & chế phẩm': ('Hộp', (10, 45), (6_000, 60_000)),
+    'Bánh mì & bánh tươi': ('Cái', (3, 10), (5_000, 40_000)),
+    'Đồ uống': ('Chai', (180, 365), (8_000, 50_000)),
+    'Thực phẩm khô': ('Gói', (270, 720), (5_000, 150_000)),
+    'Đồ hộp': ('Lon', (540, 1080), (15_000, 90_000)),
+    'Gia vị': ('Chai', (365, 720), (7_000, 70_000)),
+    'Hóa mỹ phẩm': ('Chai', (720, 1095), (20_000, 250_000)),
+}
+
+DAYS_OF_SALES = 180
+BARCODE_PREFIX = '8931'   # + 8-digit sequence; distinct from BARCODE_COMPANY_PREFIX
+CHUNK = 10_000
+
+
+def _insert(model, rows):
+    """Insert rows in chunks (executemany), committing each chunk"""
+    for i in range(0, len(rows), CHUNK):
+        db.session.execute(insert(model.__table__), rows[i:i + CHUNK])
+        db.session.commit()
+
+
+def _generate(total, make_rows, model):
+    """Insert ``total`` generated rows without holding them all in memory"""
+    done = 0
+    while done < total:
+        n = min(CHUNK, total - done)
+        db.session.execute(insert(model.__table__), make_rows(done, n))
+        db.session.commit()
+        done += n
+
+
+def generate(products, warehouses, batches, invoice_lines, seed=42, today=None):
+    """
+    Create the schema and fill it with a synthetic store
+
+    Args:
+        products: Number of SanPham rows
+        warehouses: Number of normal warehouses (one error warehouse is added)
+        batches: Number of LoSP rows
+        invoice_lines: Number of HoaDonSP rows
+        seed: Random seed
+        today: Reference date (defaults to today)
+
+    Returns:
+        dict: Row counts and sample keys for parameterised routes
+    """
+    rng = random.Random(seed)
+    today = today or date.today()
+    now = datetime.combine(today, datetime.min.time()) + timedelta(hours=20)
+
+    db.drop_all()
+    db.create_all()
+    if db.engine.dialect.name == 'sqlite':
+        db.session.execute(text('PRAGMA synchronous=OFF'))
+        db.session.execute(text('PRAGMA journal_mode=MEMORY'))
+
+    # Staff, suppliers, warehouses
+    cashiers = [f'TN{i:03d}' for i in range(1, 11)]
+    _insert(ThuNgan, [
+        {'MaNV': ma, 'Ten': f'Thu ngân {ma}', 'TaiKhoanNV': ma.lower()} for ma in cashiers
+    ])
+    _insert(NhanVienKho, [
+        {'MaNV': 'NVK001', 'Ten': 'Quản lý kho', 'TaiKhoanNV': 'nvk001', 'Role': RoleNV.QUAN_LY},
+        {'MaNV': 'NVK002', 'Ten': 'Nhân viên kho', 'TaiKhoanNV': 'nvk002', 'Role': RoleNV.NHAN_VIEN},
+    ])
+    suppliers = [f'Nhà cung cấp {i:02d}' for i in range(1, 21)]
+    _insert(NhaCungCap, [{'Ten': ten, 'PhuongThucLienHe': f'0900{i:06d}'} for i, ten in enumerate(suppliers)])
+
+    kho_ids = [f'KHO{i:03d}' for i in range(1, warehouses + 1)]
+    kho_loi = f'KHO{warehouses + 1:03d}'
+    _insert(KhoHang, [
+        {'MaKho': ma, 'DiaChi': f'Kho {ma}', 'Loai': LoaiKho.KHO_THUONG, 'SucChua': 1_000_000}
+        for ma in kho_ids
+    ] + [{'MaKho': kho_loi, 'DiaChi': 'Kho lỗi', 'Loai': LoaiKho.KHO_LOI, 'SucChua': 100_000}])
+
+    # Products
+    category_names = list(CATEGORIES)
+    catalog = []
+    for i in range(1, products + 1):
+        loai = rng.choice(category_names)
+        dvt, _, (low, high) = CATEGORIES[loai]
+        price = Decimal(rng.randrange(low, high, 500))
+        catalog.append({
+            'MaSP': f'SP{i:06d}',
+            'TenSP': f'{loai} mẫu {i}',
+            'LoaiSP': loai,
+            'DVT': dvt,
+            'GiaBan': price,
+            'MucCanhBaoDatHang': rng.choice((10, 20, 50, 100, 200)),
+        })
+    _insert(SanPham, catalog)
+
+    # Import slips (one per ~50 batches) and a few export slips
+    n_imports = max(1, batches // 50)
+    _generate(n_imports, lambda start, n: [{
+        'MaPhieu': f'PNK{start + k + 1:07d}',
+        'NgayTao': now - timedelta(days=rng.randint(0, 365), minutes=rng.randint(0, 600)),
+        'MucDich': 'Nhập hàng từ nhà cung cấp',
+    } for k in range(n)], PhieuNhapKho)
+    n_exports = max(1, batches // 500)
+    _generate(n_exports, lambda start, n: [{
+        'MaPhieu': f'PXK{start + k + 1:07d}',
+        'NgayTao': now - timedelta(days=rng.randint(0, 180)),
+        'MucDich': 'Xuất bán',
+    } for k in range(n)], PhieuXuatKho)
+
+    # Batches: NSX spread over the shelf life, so a small share is expired
+    def batch_rows(start, n):
+        rows = []
+        for k in range(start, start + n):
+            product = catalog[rng.randrange(products)]
+            low, high = CATEGORIES[product['LoaiSP']][1]
+            shelf = rng.randint(low, high)
+            nsx = today - timedelta(days=int(rng.triangular(0, shelf * 1.05, shelf * 0.3)))
+            digits12 = f'{BARCODE_PREFIX}{k + 1:08d}'
+            rows.append({
+                'MaSP': product['MaSP'],
+                'MaLo': f'LO{k + 1:07d}',
+                'MaVach': digits12 + ean13_check_digit(digits12),
+                'NSX': nsx,
+                'HSD': nsx + timedelta(days=shelf),
+                'SLTon': 0 if rng.random() < 0.08 else int(rng.expovariate(1 / 60)) + 1,
+                'MaKho': kho_loi if rng.random() < 0.03 else rng.choice(kho_ids),
+                'MaPhieuNK': f'PNK{rng.randint(1, n_imports):07d}',
+                'MaPhieuXK': f'PXK{rng.randint(1, n_exports):07d}' if rng.random() < 0.05 else None,
+            })
+        return rows
+
+    done = 0
+    while done < batches:
+        rows = batch_rows(done, min(CHUNK, batches - done))
+        db.session.execute(insert(LoSP.__table__), rows)
+        db.session.execute(insert(BienDongKho.__table__), [{
+            'MaSP': r['MaSP'],
+            'MaLo': r['MaLo'],
+            'MaKho': r['MaKho'],
+            'Loai': LoaiBienDong.NHAP_KHO,
+            'SoLuong': r['SLTon'],
+            'MaPhieu': r['MaPhieuNK'],
+            'ThoiGian': datetime.combine(r['NSX'], datetime.min.time()) + timedelta(hours=9),
+            'LyDo': 'Nhập hàng từ nhà cung cấp',
+        } for r in rows if r['SLTon']])
+        db.session.commit()
+        done += len(rows)
+
+    # Invoices: Zipf-like popularity, busier evenings
+    cum_weights = list(accumulate(1 / (rank ** 0.9) for rank in range(1, products + 1)))
+    hours = list(range(7, 22))
+    hour_weights = [1, 1, 2, 2, 2, 3, 3, 2, 2, 3, 4, 5, 5, 4, 2]
+    lines_done = 0
+    invoice_no = 0
+    while lines_done < invoice_lines:
+        invoices, lines = [], []
+        while len(lines) < CHUNK and lines_done + len(lines) < invoice_lines:
+            invoice_no += 1
+            ma_hd = f'HD{invoice_no:08d}'
+            k = min(rng.randint(1, 8), invoice_lines - lines_done - len(lines))
+            picked = {
+                catalog[i]['MaSP']: catalog[i]['GiaBan']
+                for i in rng.choices(range(products), cum_weights=cum_weights, k=k)
+            }
+            total = Decimal(0)
+            for ma_sp, price in picked.items():
+                so_luong = rng.choice((1, 1, 1, 2, 2, 3, 5))
+                total += price * so_luong
+                lines.append({'MaSP': ma_sp, 'MaHD': ma_hd, 'SoLuong': so_luong, 'DonGia': price})
+            day = today - timedelta(days=rng.randrange(DAYS_OF_SALES))
+            invoices.append({
+                'MaHD': ma_hd,
+                'NgayTao': datetime.combine(day, datetime.min.time()) + timedelta(
+                    hours=rng.choices(hours, weights=hour_weights)[0], minutes=rng.randint(0, 59)
+                ),
+                'MaNVThuNgan': rng.choice(cashiers),
+                'TongTien': total,
+            })
+        db.session.execute(insert(HoaDon.__table__), invoices)
+        db.session.execute(insert(HoaDonSP.__table__), lines)
+        db.session.commit()
+        lines_done += len(lines)
+
+    # Sales rollups from the generated history, as `flask rollups rebuild` does
+    sales_rollup.rebuild()
+    db.session.commit()
+    # Stock summary from the generated batches (`flask stock-summary rebuild`)
+    stock_summary.rebuild()
+    db.session.commit()
+
+    # A few supplier orders
+    _insert(DatHang, [{
+        'TenNCC': suppliers[i % len(suppliers)],
+        'MaNV': 'NVK002',
+        'MaDonHang': f'DH{i + 1:06d}',
+        'NgayDat': now - timedelta(days=i),
+        'MucDich': 'Bổ sung hàng',
+        'TrangThai': TrangThaiDonHang.CHO_DUYET if i % 3 else TrangThaiDonHang.DA_DUYET,
+        'ChiTietDonHang': '[]',
+    } for i in range(len(suppliers))])
+
+    # Counters continue after the generated codes
+    _insert(BoDemMa, [
+        {'TienTo': 'HD', 'GiaTriTiep': invoice_no + 1},
+        {'TienTo': 'SP', 'GiaTriTiep': products + 1},
+        {'TienTo': 'LO', 'GiaTriTiep': batches + 1},
+        {'TienTo': 'PNK', 'GiaTriTiep': n_imports + 1},
+        {'TienTo': 'PXK', 'GiaTriTiep': n_exports + 1},
+        {'TienTo': 'DH', 'GiaTriTiep': len(suppliers) + 1},
+    ])
+
+    popular = catalog[0]['MaSP']
+    sample_batch = db.session.execute(
+        select(LoSP.MaLo, LoSP.MaVach).where(LoSP.MaSP == popular, LoSP.SLTon > 0).limit(1)
+    ).first()
+    return {
+        'counts': {
+            'products': products,
+            'warehouses': warehouses + 1,
+            'batches': batches,
+            'invoices': invoice_no,
+            'invoice_lines': lines_done,
+            'imports': n_imports,
+            'exports': n_exports,
+        },
+        'samples': {
+            'ma_kho': kho_ids[0],
+            'ma_sp': popular,
+            'ma_hd': f'HD{invoice_no:08d}',
+            'ma_don_hang': 'DH000001',
+            'ten': suppliers[0],
+            'ma_phieu_nk': 'PNK0000001',
+            'ma_phieu_xk': 'PXK0000001',
+            'ma_lo': sample_batch.MaLo if sample_batch else None,
+            'ma_vach': sample_batch.MaVach if sample_batch else None,
+            'search': 'Sữa',
+            'from_date': (today - timedelta(days=30)).isoformat(),
+            'to_date': today.isoformat(),
+        },
+    }
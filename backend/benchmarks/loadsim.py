@@ -0,0 +1,377 @@
+"""
+Multi-lane POS load simulator with stock reconciliation
+
+Mô phỏng nhiều quầy thu ngân chạy song song (mỗi quầy một thread, HTTP thật):
+đăng nhập qua /api/auth/login, rồi lặp lại quét mã vạch -> xem lô FEFO ->
+tạo hóa đơn (lô đã quét hoặc để hệ thống tự chọn lô) -> thỉnh thoảng trả
+hàng. Mã vạch tập trung vào --hot-batches lô để các quầy tranh nhau cùng tồn.
+
+- Báo cáo thông lượng (hóa đơn/giây) và p50/p95/p99/max của từng bước.
+- Cuối cùng đối soát: tồn đầu - bán (HoaDonSP của các hóa đơn đã tạo) + trả
+  phải bằng tồn cuối theo từng sản phẩm; lệch là mất cập nhật, lô có SLTon
+  âm hoặc hóa đơn báo thành công nhưng không có trong DB là bán vượt/mất ghi.
+- Đối soát chỉ đúng khi không có giao dịch nào khác trong lúc chạy.
+
+Usage (from backend/):
+    python -m benchmarks.loadsim --lanes 8 --duration 60
+    python -m benchmarks.loadsim --base-url http://pos-api:8000 --config production \\
+        --lanes 32 --duration 300
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from datetime import date
+
+from benchmarks.run import add_dataset_arguments, open_dataset, percentile
+
+LANE_PASSWORD = 'lane-123456'
+
+
+class Lane(threading.Thread):
+    """One cashier lane driving the POS flow over HTTP"""
+
+    def __init__(self, number, sim):
+        super().__init__(name=f'lane-{number}', daemon=True)
+        self.sim = sim
+        self.username = sim.args.username_format.format(number)
+        self.rng = random.Random(sim.args.seed * 1000 + number)
+        self.token = None
+        self.invoices = []         # (MaHD, [(MaSP, MaLo, SoLuong)])
+
+    def request(self, step, method, path, body=None):
+        """Send a JSON request; records latency under ``step``"""
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        req = urllib.request.Request(self.sim.base_url + path, data=data, headers=headers, method=method)
+
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=self.sim.args.timeout) as response:
+                status, payload = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, payload = e.code, e.read()
+        except (urllib.error.URLError, OSError) as e:
+            status, payload = 0, str(e).encode('utf-8')
+        self.sim.record(step, status, (time.perf_counter() - started) * 1000)
+
+        try:
+            return status, json.loads(payload or b'{}')
+        except ValueError:
+            return status, {}
+
+    def login(self):
+        status, body = self.request('login', 'POST', '/api/auth/login', {
+            'username': self.username, 'password': self.sim.args.password, 'type': 'ThuNgan'
+        })
+        if status == 200:
+            self.token = (body.get('data') or body).get('access_token')
+        return self.token is not None
+
+    def checkout(self):
+        """Scan a basket, look up batches, then create the invoice"""
+        items = []
+        for barcode in self.rng.sample(self.sim.barcodes, k=min(len(self.sim.barcodes), self.rng.randint(1, 5))):
+            status, body = self.request('scan', 'POST', '/api/sales/scan-barcode', {'barcode': barcode})
+            if status != 200:
+                continue
+            batch = body['data']['batch']
+            self.request('batch_lookup', 'GET', f"/api/sales/products/{batch['MaSP']}/batches")
+            item = {'MaSP': batch['MaSP'], 'SoLuong': self.rng.choice((1, 1, 1, 2, 3))}
+            if self.rng.random() < 0.5:
+                item['MaLo'] = batch['MaLo']    # scanned batch; otherwise FEFO
+            items.append(item)
+        if not items:
+            return
+
+        status, body = self.request('create_invoice', 'POST', '/api/sales/invoices', {'items': items})
+        if status == 201:
+            data = body['data']
+            lines = [(line['MaSP'], line['MaLo'], line['SoLuong']) for line in data['items']]
+            self.invoices.append((data['MaHD'], lines))
+            self.sim.invoice_created(data['MaHD'], lines)
+        elif status == 400:
+            self.sim.count('rejected_out_of_stock')
+
+    def maybe_return(self):
+        if not self.invoices or self.rng.random() >= self.sim.args.return_rate:
+            return
+        ma_hd, lines = self.invoices.pop(self.rng.randrange(len(self.invoices)))
+        ma_sp, ma_lo, so_luong = lines[0]
+        status, body = self.request('create_return', 'POST', '/api/sales/returns', {
+            'ma_hd': ma_hd,
+            'ly_do': 'Load test',
+            'items': [{'MaSP': ma_sp, 'MaLo': ma_lo, 'SoLuong': so_luong}],
+        })
+        if status == 201:
+            self.sim.item_returned(ma_sp, so_luong)
+
+    def run(self):
+        if not self.login():
+            self.sim.count('login_failed')
+            return
+        while not self.sim.stopped():
+            self.checkout()
+            self.maybe_return()
+            if self.sim.args.think_time:
+                time.sleep(self.rng.uniform(0, self.sim.args.think_time))
+
+
+class Simulation:
+    """Shared state and results of a run"""
+
+    def __init__(self, args, base_url, barcodes):
+        self.args = args
+        self.base_url = base_url.rstrip('/')
+        self.barcodes = barcodes
+        self._lock = threading.Lock()
+        self._latencies = defaultdict(list)
+        self._statuses = defaultdict(lambda: defaultdict(int))
+        self.counters = defaultdict(int)
+        self.created = {}                    # MaHD -> lines reported by the API
+        self.returned = defaultdict(int)     # MaSP -> quantity
+        self._deadline = None
+
+    def record(self, step, status, elapsed_ms):
+        with self._lock:
+            self._latencies[step].append(elapsed_ms)
+            self._statuses[step][status] += 1
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def invoice_created(self, ma_hd, lines):
+        with self._lock:
+            self.created[ma_hd] = lines
+
+    def item_returned(self, ma_sp, so_luong):
+        with self._lock:
+            self.returned[ma_sp] += so_luong
+
+    def stopped(self):
+        return time.monotonic() >= self._deadline
+
+    def run(self):
+        lanes = [Lane(n, self) for n in range(1, self.args.lanes + 1)]
+        self._deadline = time.monotonic() + self.args.duration
+        started = time.perf_counter()
+        for lane in lanes:
+            lane.start()
+        for lane in lanes:
+            lane.join()
+        return time.perf_counter() - started
+
+    def summary(self, elapsed):
+        steps = {}
+        for step, values in self._latencies.items():
+            values = sorted(values)
+            steps[step] = {
+                'requests': len(values),
+                'statuses': {str(k): v for k, v in sorted(self._statuses[step].items())},
+                'p50_ms': round(percentile(values, 50), 2),
+                'p95_ms': round(percentile(values, 95), 2),
+                'p99_ms': round(percentile(values, 99), 2),
+                'max_ms': round(values[-1], 2),
+            }
+        return {
+            'lanes': self.args.lanes,
+            'duration_s': round(elapsed, 2),
+            'invoices': len(self.created),
+            'invoices_per_s': round(len(self.created) / elapsed, 2) if elapsed else None,
+            'requests_per_s': round(sum(len(v) for v in self._latencies.values()) / elapsed, 2),
+            'counters': dict(self.counters),
+            'steps': steps,
+        }
+
+
+# =============================================
+# Database side: lane accounts, hot barcodes, reconciliation
+# =============================================
+
+def ensure_lane_users(lanes, username_format, password):
+    """Create ThuNgan accounts for the lanes that do not exist yet"""
+    import bcrypt
+    from app import db
+    from app.models import ThuNgan
+
+    usernames = [username_format.format(n) for n in range(1, lanes + 1)]
+    existing = {
+        u for (u,) in db.session.query(ThuNgan.TaiKhoanNV).filter(ThuNgan.TaiKhoanNV.in_(usernames))
+    }
+    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=4)).decode('utf-8')
+    for username in usernames:
+        if username not in existing:
+            db.session.add(ThuNgan(
+                MaNV=username.upper()[:20], Ten=f'Quầy {username}', TaiKhoanNV=username, MatKhau=hashed
+            ))
+    db.session.commit()
+
+
+def hot_barcodes(n, seed):
+    """Barcodes of ``n`` sellable batches (normal warehouses, in stock, not expired)"""
+    from app import db
+    from app.models import KhoHang, LoaiKho, LoSP
+
+    rows = db.session.query(LoSP.MaVach).join(KhoHang, LoSP.MaKho == KhoHang.MaKho).filter(
+        KhoHang.Loai == LoaiKho.KHO_THUONG,
+        LoSP.SLTon > 0,
+        LoSP.MaVach.isnot(None),
+        (LoSP.HSD.is_(None)) | (LoSP.HSD >= date.today()),
+    ).order_by(LoSP.MaVach).limit(max(n * 20, n)).all()
+    barcodes = [code for (code,) in rows]
+    random.Random(seed).shuffle(barcodes)
+    return barcodes[:n]
+
+
+def stock_by_product():
+    from app import db
+    from app.models import LoSP
+    from sqlalchemy import func
+
+    return {ma_sp: int(total or 0) for ma_sp, total in
+            db.session.query(LoSP.MaSP, func.sum(LoSP.SLTon)).group_by(LoSP.MaSP)}
+
+
+def reconcile(before, sim):
+    """
+    Compare the stock change with what the API reported
+
+    Returns:
+        dict: Mismatched products, negative batches and missing invoices
+    """
+    from app import db
+    from app.models import HoaDon, HoaDonSP, LoSP
+    from sqlalchemy import func
+
+    db.session.remove()
+    after = stock_by_product()
+
+    sold = defaultdict(int)
+    created = list(sim.created)
+    found = set()
+    for i in range(0, len(created), 500):
+        chunk = created[i:i + 500]
+        found.update(h for (h,) in db.session.query(HoaDon.MaHD).filter(HoaDon.MaHD.in_(chunk)))
+        for ma_sp, total in db.session.query(HoaDonSP.MaSP, func.sum(HoaDonSP.SoLuong)) \
+                .filter(HoaDonSP.MaHD.in_(chunk)).group_by(HoaDonSP.MaSP):
+            sold[ma_sp] += int(total)
+
+    mismatches = []
+    for ma_sp in sorted(set(before) | set(after) | set(sold)):
+        expected = before.get(ma_sp, 0) - sold.get(ma_sp, 0) + sim.returned.get(ma_sp, 0)
+        if after.get(ma_sp, 0) != expected:
+            mismatches.append({
+                'MaSP': ma_sp, 'before': before.get(ma_sp, 0), 'sold': sold.get(ma_sp, 0),
+                'returned': sim.returned.get(ma_sp, 0), 'expected': expected, 'after': after.get(ma_sp, 0),
+            })
+
+    negative = [
+        {'MaSP': b.MaSP, 'MaLo': b.MaLo, 'SLTon': b.SLTon}
+        for b in LoSP.query.filter(LoSP.SLTon < 0).all()
+    ]
+    return {
+        'ok': not mismatches and not negative and len(found) == len(created),
+        'products_checked': len(set(before) | set(after)),
+        'stock_mismatches': mismatches,
+        'negative_batches': negative,
+        'missing_invoices': sorted(set(created) - found),
+    }
+
+
+# =============================================
+# Entry point
+# =============================================
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--base-url', help='Running server; default: serve the benchmark dataset in-process')
+    parser.add_argument('--config', default='production',
+                        help='App config used for DB access with --base-url')
+    parser.add_argument('--port', type=int, default=5055, help='Port of the in-process server')
+    parser.add_argument('--lanes', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30, help='Seconds')
+    parser.add_argument('--think-time', type=float, default=0.0, help='Max pause between baskets (s)')
+    parser.add_argument('--return-rate', type=float, default=0.05, help='Share of invoices returned')
+    parser.add_argument('--hot-batches', type=int, default=50, help='Batches the lanes compete for')
+    parser.add_argument('--username-format', default='lane{:03d}')
+    parser.add_argument('--password', default=LANE_PASSWORD)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--output', help='Write the report as JSON')
+    add_dataset_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def _serve(app, port):
+    """Threaded WSGI server in a background thread"""
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+
+    server = None
+    if args.base_url:
+        from app import create_app
+        app, base_url = create_app(args.config), args.base_url
+    else:
+        app, _, _ = open_dataset(args)
+        server = _serve(app, args.port)
+        base_url = f'http://127.0.0.1:{args.port}'
+
+    with app.app_context():
+        ensure_lane_users(args.lanes, args.username_format, args.password)
+        barcodes = hot_barcodes(args.hot_batches, args.seed)
+        before = stock_by_product()
+    if not barcodes:
+        print("No sellable batches found")
+        return 1
+
+    print(f"{args.lanes} lanes x {args.duration} s against {base_url} ({len(barcodes)} hot batches)")
+    sim = Simulation(args, base_url, barcodes)
+    elapsed = sim.run()
+    if server is not None:
+        server.shutdown()
+
+    with app.app_context():
+        report = {'load': sim.summary(elapsed), 'reconciliation': reconcile(before, sim)}
+
+    load = report['load']
+    print(f"\n{load['invoices']} invoices in {load['duration_s']} s: "
+          f"{load['invoices_per_s']} invoices/s, {load['requests_per_s']} requests/s")
+    for step, stats in sorted(load['steps'].items()):
+        print(f"  {step:15s} {stats['requests']:7d} req  p50 {stats['p50_ms']:8.2f}  "
+              f"p95 {stats['p95_ms']:8.2f}  p99 {stats['p99_ms']:8.2f}  max {stats['max_ms']:8.2f} ms  "
+              f"{stats['statuses']}")
+    if load['counters']:
+        print(f"  {load['counters']}")
+
+    check = report['reconciliation']
+    print(f"\nReconciliation: {'OK' if check['ok'] else 'FAILED'} ({check['products_checked']} products)")
+    for row in check['stock_mismatches'][:20]:
+        print(f"  stock mismatch {row}")
+    for row in check['negative_batches'][:20]:
+        print(f"  oversold batch {row}")
+    if check['missing_invoices']:
+        print(f"  {len(check['missing_invoices'])} invoices reported as created are missing")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0 if check['ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
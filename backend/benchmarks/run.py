@@ -0,0 +1,328 @@
+"""
+Run the endpoint benchmarks
+
+Mỗi route GET (và các thao tác POST trong POST_SCENARIOS) được gọi
+--requests lần sau --warmup lần khởi động qua test client; kết quả gồm
+p50/p95/p99, trung bình, số truy vấn và ngân sách @query_budget, ghi ra JSON.
+Với --baseline, route có --metric (mặc định p50, ổn định hơn p95 khi số mẫu
+ít) chậm hơn --threshold lần và hơn --min-delta ms, chạy nhiều truy vấn hơn
+hoặc đổi mã trạng thái so với baseline bị báo hồi quy, lệnh trả về mã 1.
+
+Dữ liệu được giữ trong file SQLite (--db) kèm file .json mô tả tham số; lần
+chạy sau cùng tham số dùng lại, đổi tham số hoặc --regenerate thì sinh lại.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+from datetime import datetime
+
+# app (and its config) is imported in main(), after BENCHMARK_DATABASE_URL is set
+SCALES = {
+    'tiny': {'products': 200, 'warehouses': 3, 'batches': 2_000, 'invoice_lines': 10_000},
+    'small': {'products': 5_000, 'warehouses': 4, 'batches': 100_000, 'invoice_lines': 500_000},
+    'large': {'products': 50_000, 'warehouses': 6, 'batches': 2_000_000, 'invoice_lines': 10_000_000},
+}
+
+# Path parameters by endpoint (falls back to the parameter name)
+PATH_SAMPLES = {
+    'warehouse.get_import': {'ma_phieu': 'ma_phieu_nk'},
+    'warehouse.get_export': {'ma_phieu': 'ma_phieu_xk'},
+}
+
+QUERY_ARGS = {
+    'sales.search_products': lambda s: {'search': s['search']},
+    'sales.search_invoice_for_return': lambda s: {'ma_hd': s['ma_hd']},
+    'reports.get_batch_history': lambda s: {'ma_sp': s['ma_sp'], 'ma_lo': s['ma_lo']},
+    'reports.get_sales_report': lambda s: {'from_date': s['from_date'], 'to_date': s['to_date']},
+    'reports.export_sales_report': lambda s: {'from_date': s['from_date'], 'to_date': s['to_date']},
+    'reports.get_warehouse_movements': lambda s: {'from_date': s['from_date'], 'to_date': s['to_date']},
+}
+
+# Non-GET routes worth timing: endpoint -> body factory
+POST_SCENARIOS = {
+    'sales.scan_barcode': lambda s: {'barcode': s['ma_vach']},
+    'sales.create_invoice': lambda s: {'items': [{'MaSP': s['ma_sp'], 'SoLuong': 1}]},
+    'warehouse.scan_barcode_for_export': lambda s: {'MaVach': s['ma_vach'], 'MaKho': s['ma_kho']},
+    'warehouse.get_fefo_batches': lambda s: {'MaSP': s['ma_sp'], 'MaKho': s['ma_kho'], 'SoLuong': 5},
+    'warehouse.import_warehouse': lambda s: {
+        'MaKho': s['ma_kho'], 'items': [{'MaSP': s['ma_sp'], 'SoLuong': 10}]
+    },
+    'warehouse_inventory.start_inventory': lambda s: {'MaKho': s['ma_kho']},
+}
+
+SKIP = {'static', 'metrics.get_db_metrics', 'auth.get_current_user'}
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * q // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def add_dataset_arguments(parser):
+    """Dataset options shared by the benchmark tools"""
+    parser.add_argument('--scale', choices=sorted(SCALES), default='tiny')
+    parser.add_argument('--products', type=int)
+    parser.add_argument('--warehouses', type=int)
+    parser.add_argument('--batches', type=int)
+    parser.add_argument('--invoice-lines', type=int)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--db', default='benchmark.sqlite', help='SQLite file for the dataset')
+    parser.add_argument('--regenerate', action='store_true', help='Rebuild the dataset')
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_dataset_arguments(parser)
+    parser.add_argument('--requests', type=int, default=20, help='Timed requests per route')
+    parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per route')
+    parser.add_argument('--only', help='Comma-separated endpoint prefixes (e.g. sales.,reports.)')
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--baseline', help='Results file to compare against')
+    parser.add_argument('--metric', choices=('p50', 'p95', 'p99'), default='p50')
+    parser.add_argument('--threshold', type=float, default=1.5, help='Allowed latency ratio')
+    parser.add_argument('--min-delta', type=float, default=2.0, help='Ignore changes below (ms)')
+    return parser.parse_args(argv)
+
+
+def _dataset_params(args):
+    params = dict(SCALES[args.scale])
+    for key in ('products', 'warehouses', 'batches', 'invoice_lines'):
+        if getattr(args, key) is not None:
+            params[key] = getattr(args, key)
+    params['seed'] = args.seed
+    return params
+
+
+def _saved_dataset(db_path, params):
+    """Info of the saved dataset if it was built with the same parameters"""
+    info_path = db_path + '.json'
+    if not (os.path.exists(db_path) and os.path.exists(info_path)):
+        return None
+    with open(info_path, encoding='utf-8') as f:
+        info = json.load(f)
+    return info if info.get('params') == params else None
+
+
+def _generate_dataset(app, db_path, work_path, params):
+    """Build the dataset in the working copy, then save it as ``db_path``"""
+    from app import db
+    from benchmarks import dataset
+
+    print(f"Generating dataset {params} ...")
+    started = time.perf_counter()
+    with app.app_context():
+        info = dataset.generate(**params)
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    info['params'] = params
+    info['generated_in_s'] = round(time.perf_counter() - started, 1)
+
+    shutil.copyfile(work_path, db_path)
+    with open(db_path + '.json', 'w', encoding='utf-8') as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+    print(f"Generated in {info['generated_in_s']} s: {info['counts']}")
+    return info
+
+
+def _targets(app, samples, only):
+    """(endpoint, method, url, query, body) for every route, plus skipped routes"""
+    targets, skipped = [], {}
+    for rule in sorted(app.url_map.iter_rules(), key=lambda r: r.rule):
+        endpoint = rule.endpoint
+        if endpoint in SKIP or (only and not endpoint.startswith(only)):
+            continue
+
+        if 'GET' in rule.methods:
+            method, body = 'GET', None
+        elif endpoint in POST_SCENARIOS:
+            method, body = 'POST', POST_SCENARIOS[endpoint](samples)
+        else:
+            skipped[endpoint] = 'write route without a scenario'
+            continue
+
+        names = PATH_SAMPLES.get(endpoint, {})
+        values = {}
+        for arg in rule.arguments:
+            value = samples.get(names.get(arg, arg))
+            if value is None:
+                break
+            values[arg] = value
+        else:
+            query = QUERY_ARGS[endpoint](samples) if endpoint in QUERY_ARGS else {}
+            targets.append((endpoint, method, rule.build(values)[1], query, body))
+            continue
+        skipped[endpoint] = f'no sample for {sorted(set(rule.arguments) - set(values))}'
+    return targets, skipped
+
+
+def _measure(app, client, targets, headers, n_requests, warmup):
+    from sqlalchemy import event
+    from app import db
+
+    executed = [0]
+
+    def count(*args, **kwargs):
+        executed[0] += 1
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', count)
+
+    results = {}
+    try:
+        for endpoint, method, url, query, body in targets:
+            token = headers['TN'] if endpoint.startswith('sales.') else headers['QL']
+            call = getattr(client, method.lower())
+            timings, queries, status = [], 0, None
+            gc.collect()
+            for i in range(warmup + n_requests):
+                executed[0] = 0
+                started = time.perf_counter()
+                response = call(url, query_string=query, json=body, headers=token)
+                elapsed = (time.perf_counter() - started) * 1000
+                status = response.status_code
+                if i >= warmup:
+                    timings.append(elapsed)
+                    queries = max(queries, executed[0])
+
+            timings.sort()
+            view = app.view_functions[endpoint]
+            results[endpoint] = {
+                'method': method,
+                'path': url,
+                'status': status,
+                'requests': len(timings),
+                'p50_ms': round(percentile(timings, 50), 2),
+                'p95_ms': round(percentile(timings, 95), 2),
+                'p99_ms': round(percentile(timings, 99), 2),
+                'mean_ms': round(sum(timings) / len(timings), 2),
+                'queries': queries,
+                'query_budget': getattr(view, 'query_budget', None),
+            }
+            print(f"{endpoint:55s} {status} p50 {results[endpoint]['p50_ms']:9.2f} ms  "
+                  f"p95 {results[endpoint]['p95_ms']:9.2f} ms  {queries:4d} queries")
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', count)
+    return results
+
+
+def compare(results, baseline, metric='p50', threshold=1.5, min_delta=2.0):
+    """
+    Compare a run against a baseline run
+
+    Returns:
+        list: Regression messages (empty if none)
+    """
+    regressions = []
+    if baseline.get('meta', {}).get('dataset') != results.get('meta', {}).get('dataset'):
+        print("Warning: baseline was recorded with a different dataset")
+
+    for endpoint, base in baseline.get('results', {}).items():
+        current = results['results'].get(endpoint)
+        if current is None:
+            continue
+        key = f'{metric}_ms'
+        if current[key] > base[key] * threshold and current[key] - base[key] > min_delta:
+            regressions.append(
+                f"{endpoint}: {metric} {base[key]} -> {current[key]} ms"
+            )
+        if current['queries'] > base['queries']:
+            regressions.append(
+                f"{endpoint}: queries {base['queries']} -> {current['queries']}"
+            )
+        if current['status'] != base['status']:
+            regressions.append(
+                f"{endpoint}: status {base['status']} -> {current['status']}"
+            )
+    return regressions
+
+
+def open_dataset(args):
+    """
+    Create the benchmark app on a fresh working copy of the dataset
+
+    Returns:
+        tuple: (app, dataset info, dataset parameters)
+    """
+    db_path = os.path.abspath(args.db)
+    params = _dataset_params(args)
+
+    # Write scenarios change the data: each run works on a fresh copy
+    work_path = db_path + '.run'
+    info = None if args.regenerate else _saved_dataset(db_path, params)
+    if info is not None:
+        print(f"Reusing dataset {db_path}")
+        shutil.copyfile(db_path, work_path)
+    os.environ['BENCHMARK_DATABASE_URL'] = f'sqlite:///{work_path}'
+
+    from app import create_app
+
+    app = create_app('benchmark')
+    if info is None:
+        info = _generate_dataset(app, db_path, work_path, params)
+    return app, info, params
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    app, info, params = open_dataset(args)
+
+    from flask_jwt_extended import create_access_token
+
+    with app.app_context():
+        headers = {
+            'TN': {'Authorization': 'Bearer ' + create_access_token(
+                identity='TN001', additional_claims={'type': 'ThuNgan', 'role': 'ThuNgan'}
+            )},
+            'QL': {'Authorization': 'Bearer ' + create_access_token(
+                identity='NVK001', additional_claims={'type': 'NhanVienKho', 'role': 'Quản lý'}
+            )},
+        }
+
+    only = tuple(p.strip() for p in args.only.split(',')) if args.only else None
+    targets, skipped = _targets(app, info['samples'], only)
+    results = {
+        'meta': {
+            'dataset': params,
+            'counts': info['counts'],
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'recorded_at': datetime.now().isoformat(timespec='seconds'),
+        },
+        'results': _measure(app, app.test_client(), targets, headers, args.requests, args.warmup),
+        'skipped': skipped,
+    }
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Results written to {args.output} ({len(results['results'])} routes, {len(skipped)} skipped)")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.metric, args.threshold, args.min_delta)
+        if regressions:
+            print("Regressions:")
+            for message in regressions:
+                print(f"  - {message}")
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
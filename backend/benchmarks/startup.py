@@ -0,0 +1,125 @@
+"""
+Cold-start benchmark: import + create_app time and peak RSS
+
+Mỗi kịch bản chạy trong một tiến trình Python mới (lặp --repeat lần, lấy
+trung vị) để đo đúng chi phí một worker hoặc một lệnh CLI phải trả:
+
+- interpreter: chỉ Python, làm mốc RSS.
+- create_app: import app và create_app() - export backend nạp lười (hiện tại).
+- create_app+eager_exporters: như trên rồi import openpyxl/reportlab như
+  reports.py từng làm ở module level (trước thay đổi).
+- first_export: create_app() rồi xuất một báo cáo Excel và một PDF (chi phí
+  dời sang request xuất đầu tiên).
+
+Usage (from backend/):
+    python -m benchmarks.startup --repeat 7 --output startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SCENARIOS = {
+    'interpreter': '',
+    'create_app': '''
+from app import create_app
+create_app(CONFIG)
+''',
+    'create_app+eager_exporters': '''
+from app import create_app
+create_app(CONFIG)
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.lib.units import cm
+from openpyxl import Workbook
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+''',
+    'first_export': '''
+from app import create_app
+from app.services import exporters
+create_app(CONFIG)
+exporters.export('sales', 'excel', {
+    'daily_sales': [], 'top_products': [],
+    'summary': {'total_revenue': 0, 'total_quantity': 0, 'total_invoices': 0,
+                'average_revenue_per_day': 0, 'average_invoice_value': 0},
+    'period': {'from_date': '', 'to_date': ''},
+})
+exporters.export('sales', 'pdf', {'daily_sales': []})
+''',
+}
+
+_PROBE = '''
+import json, resource, sys, time
+started = time.perf_counter()
+CONFIG = {config!r}
+{body}
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    'seconds': elapsed,
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'modules': len(sys.modules),
+}}))
+'''
+
+
+def _run_once(body, config):
+    code = _PROBE.format(config=config, body=body)
+    out = subprocess.run(
+        [sys.executable, '-c', code], capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def measure(config='production', repeat=5, only=None):
+    """
+    Median wall time, peak RSS and module count per scenario
+
+    Returns:
+        dict: {scenario: {'ms', 'max_rss_mb', 'modules'}}
+    """
+    results = {}
+    for name, body in SCENARIOS.items():
+        if only and name not in only:
+            continue
+        runs = [_run_once(body, config) for _ in range(repeat)]
+        results[name] = {
+            'ms': round(statistics.median(r['seconds'] for r in runs) * 1000, 1),
+            'max_rss_mb': round(statistics.median(r['max_rss_kb'] for r in runs) / 1024, 1),
+            'modules': int(statistics.median(r['modules'] for r in runs)),
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--config', default='production', help='App config passed to create_app')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', nargs='*', choices=list(SCENARIOS))
+    parser.add_argument('--output', help='Write the results as JSON')
+    args = parser.parse_args(argv)
+
+    results = measure(args.config, args.repeat, args.only)
+
+    print(f"{'scenario':30s} {'time (ms)':>10s} {'max RSS (MB)':>13s} {'modules':>8s}")
+    for name, row in results.items():
+        print(f"{name:30s} {row['ms']:10.1f} {row['max_rss_mb']:13.1f} {row['modules']:8d}")
+
+    lazy, eager = results.get('create_app'), results.get('create_app+eager_exporters')
+    if lazy and eager:
+        print(f"\nLazy exporters save {eager['ms'] - lazy['ms']:.1f} ms and "
+              f"{eager['max_rss_mb'] - lazy['max_rss_mb']:.1f} MB per process start")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'config': args.config, 'repeat': args.repeat, 'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,32 @@
+"""
+Gunicorn settings for the production server (see wsgi.py)
+
+preload_app builds and warms the app in the master before forking; each
+worker then replaces the inherited DB connections with its own pool.
+"""
+
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', 4))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+preload_app = True
+
+
+def post_fork(server, worker):
+    from app import db
+    from app.utils.warmup import after_fork
+    from wsgi import app
+
+    after_fork(app, db)
+
+
+def post_worker_init(worker):
+    worker.log.info(f"Worker {worker.pid} ready")
+
+
+def when_ready(server):
+    from app.utils.warmup import warmup_state
+
+    server.log.info(f"Warm-up finished, accepting connections: {warmup_state.stats()}")
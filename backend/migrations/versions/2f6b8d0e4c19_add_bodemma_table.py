@@ -0,0 +1,57 @@
+"""Add BoDemMa ID sequence table
+
+Revision ID: 2f6b8d0e4c19
+Revises: e9a05c3d7f12
+Create Date: 2026-10-17 14:22:18.930117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2f6b8d0e4c19'
+down_revision = 'e9a05c3d7f12'
+branch_labels = None
+depends_on = None
+
+# Prefix -> (table, key column), as in app.services.id_allocator
+_ID_COLUMNS = {
+    'HD': ('HoaDon', 'MaHD'),
+    'PXK': ('PhieuXuatKho', 'MaPhieu'),
+    'PNK': ('PhieuNhapKho', 'MaPhieu'),
+    'PCK': ('PhieuChuyenKho', 'MaPhieu'),
+    'PKK': ('PhieuKiemKho', 'MaPhieu'),
+    'BC': ('BaoCao', 'MaBaoCao'),
+    'YC': ('YeuCauTraHang', 'MaYC'),
+    'DH': ('DatHang', 'MaDonHang'),
+    'SP': ('SanPham', 'MaSP'),
+    'LO': ('LoSP', 'MaLo'),
+}
+
+
+def upgrade():
+    op.create_table('BoDemMa',
+    sa.Column('TienTo', sa.String(length=10), nullable=False),
+    sa.Column('GiaTriTiep', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('TienTo')
+    )
+
+    # Seed each counter past the highest code already in use, so the
+    # allocator continues the existing numbering instead of starting at 1
+    bind = op.get_bind()
+    counters = sa.table('BoDemMa', sa.column('TienTo'), sa.column('GiaTriTiep'))
+    rows = []
+    for prefix, (table_name, column_name) in _ID_COLUMNS.items():
+        column = sa.column(column_name)
+        last = bind.execute(
+            sa.select(sa.func.max(sa.cast(sa.func.substr(column, len(prefix) + 1), sa.Integer)))
+            .select_from(sa.table(table_name, column))
+            .where(column.like(f"{prefix}%"))
+        ).scalar()
+        rows.append({'TienTo': prefix, 'GiaTriTiep': (last or 0) + 1})
+    op.bulk_insert(counters, rows)
+
+
+def downgrade():
+    op.drop_table('BoDemMa')
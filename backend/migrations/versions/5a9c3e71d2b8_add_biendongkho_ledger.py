@@ -0,0 +1,90 @@
+"""Add BienDongKho stock movement ledger
+
+Revision ID: 5a9c3e71d2b8
+Revises: 2f6b8d0e4c19
+Create Date: 2026-10-17 19:02:44.518306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a9c3e71d2b8'
+down_revision = '2f6b8d0e4c19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('BienDongKho',
+    sa.Column('MaBienDong', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), autoincrement=True, nullable=False),
+    sa.Column('MaSP', sa.String(length=20), nullable=False),
+    sa.Column('MaLo', sa.String(length=20), nullable=False),
+    sa.Column('MaKho', sa.String(length=20), nullable=True),
+    sa.Column('Loai', sa.Enum('Tồn đầu kỳ', 'Nhập kho', 'Xuất kho', 'Chuyển kho đi', 'Chuyển kho đến', 'Bán hàng', 'Trả hàng', 'Điều chỉnh', 'Hủy hàng', name='loaibiendong'), nullable=False),
+    sa.Column('SoLuong', sa.Integer(), nullable=False),
+    sa.Column('MaPhieu', sa.String(length=20), nullable=True),
+    sa.Column('MaThamChieu', sa.String(length=50), nullable=True),
+    sa.Column('ThoiGian', sa.DateTime(), nullable=False),
+    sa.Column('LyDo', sa.String(length=200), nullable=True),
+    sa.PrimaryKeyConstraint('MaBienDong')
+    )
+    op.create_index('idx_biendong_lo', 'BienDongKho', ['MaSP', 'MaLo', 'ThoiGian'], unique=False)
+    op.create_index('idx_biendong_thoigian', 'BienDongKho', ['ThoiGian'], unique=False)
+    op.create_index('idx_biendong_kho_thoigian', 'BienDongKho', ['MaKho', 'ThoiGian'], unique=False)
+    op.create_index('idx_biendong_loai_thoigian', 'BienDongKho', ['Loai', 'ThoiGian'], unique=False)
+    op.create_index('idx_biendong_phieu', 'BienDongKho', ['MaPhieu'], unique=False)
+
+    # History from the slips. Per-slip quantities were never stored, so each
+    # batch gets its current SLTon on the import/export slip it points to -
+    # the same figures the slip-based reports showed before the ledger.
+    op.execute(
+        "INSERT INTO BienDongKho (MaSP, MaLo, MaKho, Loai, SoLuong, MaPhieu, MaThamChieu, ThoiGian, LyDo) "
+        "SELECT l.MaSP, l.MaLo, COALESCE(ck.KhoNhap, l.MaKho), "
+        "CASE WHEN p.MaPhieuCK IS NOT NULL THEN 'Chuyển kho đến' "
+        "WHEN p.MucDich LIKE '%trả hàng%' THEN 'Trả hàng' "
+        "WHEN p.MucDich LIKE 'Điều chỉnh%' THEN 'Điều chỉnh' "
+        "ELSE 'Nhập kho' END, "
+        "l.SLTon, p.MaPhieu, COALESCE(p.MaThamChieu, p.MaPhieuCK), "
+        "COALESCE(p.NgayTao, CURRENT_TIMESTAMP), SUBSTR(COALESCE(p.MucDich, 'Nhập kho'), 1, 200) "
+        "FROM LoSP l JOIN PhieuNhapKho p ON p.MaPhieu = l.MaPhieuNK "
+        "LEFT JOIN PhieuChuyenKho ck ON ck.MaPhieu = p.MaPhieuCK "
+        "WHERE l.SLTon <> 0"
+    )
+    op.execute(
+        "INSERT INTO BienDongKho (MaSP, MaLo, MaKho, Loai, SoLuong, MaPhieu, MaThamChieu, ThoiGian, LyDo) "
+        "SELECT l.MaSP, l.MaLo, COALESCE(ck.KhoXuat, l.MaKho), "
+        "CASE WHEN p.MaPhieuCK IS NOT NULL THEN 'Chuyển kho đi' "
+        "WHEN hd.MaHD IS NOT NULL THEN 'Bán hàng' "
+        "WHEN p.MucDich LIKE '%hủy%' THEN 'Hủy hàng' "
+        "WHEN p.MucDich LIKE 'Điều chỉnh%' THEN 'Điều chỉnh' "
+        "ELSE 'Xuất kho' END, "
+        "-l.SLTon, p.MaPhieu, COALESCE(p.MaThamChieu, p.MaPhieuCK), "
+        "COALESCE(p.NgayTao, CURRENT_TIMESTAMP), SUBSTR(COALESCE(p.MucDich, 'Xuất kho'), 1, 200) "
+        "FROM LoSP l JOIN PhieuXuatKho p ON p.MaPhieu = l.MaPhieuXK "
+        "LEFT JOIN PhieuChuyenKho ck ON ck.MaPhieu = p.MaPhieuCK "
+        "LEFT JOIN HoaDon hd ON hd.MaHD = p.MaThamChieu "
+        "WHERE l.SLTon <> 0"
+    )
+
+    # Opening balance: whatever the history above does not explain, so
+    # every batch timeline sums to the current SLTon
+    op.execute(
+        "INSERT INTO BienDongKho (MaSP, MaLo, MaKho, Loai, SoLuong, MaPhieu, ThoiGian, LyDo) "
+        "SELECT l.MaSP, l.MaLo, l.MaKho, 'Tồn đầu kỳ', l.SLTon - COALESCE(h.SoLuong, 0), "
+        "l.MaPhieuNK, CURRENT_TIMESTAMP, 'Số dư khi mở sổ biến động' "
+        "FROM LoSP l LEFT JOIN ("
+        "SELECT MaSP, MaLo, SUM(SoLuong) AS SoLuong FROM BienDongKho GROUP BY MaSP, MaLo"
+        ") h ON h.MaSP = l.MaSP AND h.MaLo = l.MaLo "
+        "WHERE l.SLTon - COALESCE(h.SoLuong, 0) <> 0"
+    )
+
+
+def downgrade():
+    op.drop_index('idx_biendong_phieu', table_name='BienDongKho')
+    op.drop_index('idx_biendong_loai_thoigian', table_name='BienDongKho')
+    op.drop_index('idx_biendong_kho_thoigian', table_name='BienDongKho')
+    op.drop_index('idx_biendong_thoigian', table_name='BienDongKho')
+    op.drop_index('idx_biendong_lo', table_name='BienDongKho')
+    op.drop_table('BienDongKho')
@@ -0,0 +1,23 @@
+"""Add SanPham (TenSP, MaSP) index for keyset pagination
+
+Revision ID: 7c1e4b9a2d05
+Revises: 3340d6e011ed
+Create Date: 2026-10-17 09:12:40.118302
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1e4b9a2d05'
+down_revision = '3340d6e011ed'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('idx_sanpham_tensp_masp', 'SanPham', ['TenSP', 'MaSP'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_sanpham_tensp_masp', table_name='SanPham')
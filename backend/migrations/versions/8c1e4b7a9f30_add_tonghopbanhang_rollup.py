@@ -0,0 +1,103 @@
+"""Add TongHopBanHang sales rollup
+
+Revision ID: 8c1e4b7a9f30
+Revises: 5a9c3e71d2b8
+Create Date: 2026-10-17 21:15:07.402913
+
+The upgrade fills the rollup from the existing invoices and return slips,
+like ``flask rollups rebuild``.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1e4b7a9f30'
+down_revision = '5a9c3e71d2b8'
+branch_labels = None
+depends_on = None
+
+# Returned quantity per (return slip, product): 'Trả hàng' ledger rows, or the
+# stock of the slip's batches for slips missing from the ledger; capped at the
+# invoice line (as app.services.sales_rollup._rebuild_returns)
+_RETURNS = (
+    "SELECT yc.NgayTao AS NgayTra, hd.MaNVThuNgan AS MaNV, r.MaSP AS MaSP, sp.LoaiSP AS LoaiSP, "
+    "CASE WHEN r.SoLuong < hs.SoLuong THEN r.SoLuong ELSE hs.SoLuong END AS SoLuongTra, "
+    "COALESCE(hs.DonGia, sp.GiaBan) AS DonGia "
+    "FROM ("
+    "SELECT b.MaPhieu AS MaPhieu, b.MaSP AS MaSP, SUM(b.SoLuong) AS SoLuong FROM BienDongKho b "
+    "WHERE b.Loai = 'Trả hàng' AND b.MaPhieu IS NOT NULL GROUP BY b.MaPhieu, b.MaSP "
+    "UNION ALL "
+    "SELECT l.MaPhieuNK, l.MaSP, SUM(l.SLTon) FROM LoSP l "
+    "WHERE l.MaPhieuNK IS NOT NULL AND NOT EXISTS ("
+    "SELECT 1 FROM BienDongKho b WHERE b.MaPhieu = l.MaPhieuNK AND b.Loai = 'Trả hàng'"
+    ") GROUP BY l.MaPhieuNK, l.MaSP"
+    ") r "
+    "JOIN PhieuNhapKho p ON p.MaPhieu = r.MaPhieu "
+    "JOIN HoaDon hd ON hd.MaHD = p.MaThamChieu "
+    "JOIN YeuCauTraHang yc ON yc.MaYC = hd.MaYCTraHang "
+    "JOIN SanPham sp ON sp.MaSP = r.MaSP "
+    "JOIN HoaDonSP hs ON hs.MaHD = hd.MaHD AND hs.MaSP = r.MaSP "
+    "WHERE p.MucDich LIKE '%trả hàng%'"
+)
+
+# Chieu -> (sales key, invoice count, extra join, returns key)
+_DIMENSIONS = {
+    'Sản phẩm': ("s.MaSP", "COUNT(*)", "", "r.MaSP"),
+    'Thu ngân': ("COALESCE(h.MaNVThuNgan, '')", "COUNT(DISTINCT h.MaHD)", "", "COALESCE(r.MaNV, '')"),
+    'Loại sản phẩm': (
+        "COALESCE(sp.LoaiSP, '')", "COUNT(DISTINCT h.MaHD)",
+        "JOIN SanPham sp ON sp.MaSP = s.MaSP ", "COALESCE(r.LoaiSP, '')"
+    ),
+}
+
+
+def upgrade():
+    op.create_table('TongHopBanHang',
+    sa.Column('Ky', sa.Enum('Giờ', 'Ngày', name='kytonghop'), nullable=False),
+    sa.Column('Chieu', sa.Enum('Sản phẩm', 'Thu ngân', 'Loại sản phẩm', name='chieutonghop'), nullable=False),
+    sa.Column('ThoiDiem', sa.DateTime(), nullable=False),
+    sa.Column('Khoa', sa.String(length=100), nullable=False),
+    sa.Column('SoHoaDon', sa.Integer(), nullable=False),
+    sa.Column('SoLuong', sa.Integer(), nullable=False),
+    sa.Column('DoanhThu', sa.Numeric(precision=15, scale=2), nullable=False),
+    sa.Column('SoLuongTra', sa.Integer(), nullable=False),
+    sa.Column('GiaTriTra', sa.Numeric(precision=15, scale=2), nullable=False),
+    sa.PrimaryKeyConstraint('Ky', 'Chieu', 'ThoiDiem', 'Khoa')
+    )
+    op.create_index('idx_tonghop_khoa', 'TongHopBanHang', ['Ky', 'Chieu', 'Khoa', 'ThoiDiem'], unique=False)
+
+    # Same rows as sales_rollup.rebuild(): sales and returns per period/key
+    sqlite = op.get_bind().dialect.name == 'sqlite'
+    for ky, hour in (('Giờ', True), ('Ngày', False)):
+        if sqlite:
+            fmt = '%Y-%m-%d %H:00:00.000000' if hour else '%Y-%m-%d 00:00:00.000000'
+            truncate = "strftime('" + fmt + "', {})"
+        else:
+            fmt = '%Y-%m-%d %H:00:00' if hour else '%Y-%m-%d 00:00:00'
+            truncate = "DATE_FORMAT({}, '" + fmt + "')"
+
+        for chieu, (khoa, so_hoa_don, join, khoa_tra) in _DIMENSIONS.items():
+            sales_at = truncate.format('h.NgayTao')
+            returns_at = truncate.format('r.NgayTra')
+            op.execute(
+                "INSERT INTO TongHopBanHang "
+                "(Ky, Chieu, ThoiDiem, Khoa, SoHoaDon, SoLuong, DoanhThu, SoLuongTra, GiaTriTra) "
+                f"SELECT '{ky}', '{chieu}', t.ThoiDiem, t.Khoa, SUM(t.SoHoaDon), SUM(t.SoLuong), "
+                "SUM(t.DoanhThu), SUM(t.SoLuongTra), SUM(t.GiaTriTra) FROM ("
+                f"SELECT {sales_at} AS ThoiDiem, {khoa} AS Khoa, {so_hoa_don} AS SoHoaDon, "
+                "SUM(s.SoLuong) AS SoLuong, COALESCE(SUM(s.DonGia * s.SoLuong), 0) AS DoanhThu, "
+                "0 AS SoLuongTra, 0 AS GiaTriTra "
+                f"FROM HoaDonSP s JOIN HoaDon h ON h.MaHD = s.MaHD {join}"
+                f"GROUP BY {sales_at}, {khoa} "
+                "UNION ALL "
+                f"SELECT {returns_at}, {khoa_tra}, 0, 0, 0, SUM(r.SoLuongTra), SUM(r.SoLuongTra * r.DonGia) "
+                f"FROM ({_RETURNS}) r "
+                f"GROUP BY {returns_at}, {khoa_tra}"
+                ") t GROUP BY t.ThoiDiem, t.Khoa"
+            )
+
+
+def downgrade():
+    op.drop_index('idx_tonghop_khoa', table_name='TongHopBanHang')
+    op.drop_table('TongHopBanHang')
@@ -0,0 +1,45 @@
+"""Add HoaDonSP.DonGia and HoaDon.TongTien snapshots
+
+Revision ID: b4d2f81c6a37
+Revises: 7c1e4b9a2d05
+Create Date: 2026-10-17 11:40:05.602914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4d2f81c6a37'
+down_revision = '7c1e4b9a2d05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('HoaDonSP', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('DonGia', sa.Numeric(precision=15, scale=2), nullable=True))
+
+    with op.batch_alter_table('HoaDon', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('TongTien', sa.Numeric(precision=15, scale=2), nullable=True))
+
+    # Backfill existing invoices with the current catalog price
+    op.execute(
+        "UPDATE HoaDonSP SET DonGia = "
+        "(SELECT SanPham.GiaBan FROM SanPham WHERE SanPham.MaSP = HoaDonSP.MaSP) "
+        "WHERE DonGia IS NULL"
+    )
+    op.execute(
+        "UPDATE HoaDon SET TongTien = COALESCE("
+        "(SELECT SUM(HoaDonSP.SoLuong * HoaDonSP.DonGia) FROM HoaDonSP "
+        "WHERE HoaDonSP.MaHD = HoaDon.MaHD), 0) "
+        "WHERE TongTien IS NULL"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('HoaDon', schema=None) as batch_op:
+        batch_op.drop_column('TongTien')
+
+    with op.batch_alter_table('HoaDonSP', schema=None) as batch_op:
+        batch_op.drop_column('DonGia')
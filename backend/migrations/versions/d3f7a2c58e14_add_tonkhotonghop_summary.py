@@ -0,0 +1,41 @@
+"""Add TonKhoTongHop stock summary
+
+Revision ID: d3f7a2c58e14
+Revises: 8c1e4b7a9f30
+Create Date: 2026-10-17 23:40:18.226971
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3f7a2c58e14'
+down_revision = '8c1e4b7a9f30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('TonKhoTongHop',
+    sa.Column('MaSP', sa.String(length=20), nullable=False),
+    sa.Column('MaKho', sa.String(length=20), nullable=False),
+    sa.Column('SLTon', sa.Integer(), nullable=False),
+    sa.Column('SoLo', sa.Integer(), nullable=False),
+    sa.Column('HSDSomNhat', sa.Date(), nullable=True),
+    sa.Column('GiaTri', sa.Numeric(precision=15, scale=2), nullable=False),
+    sa.PrimaryKeyConstraint('MaSP', 'MaKho')
+    )
+
+    # Same aggregate as stock_summary.rebuild()
+    op.execute(
+        "INSERT INTO TonKhoTongHop (MaSP, MaKho, SLTon, SoLo, HSDSomNhat, GiaTri) "
+        "SELECT l.MaSP, COALESCE(l.MaKho, ''), COALESCE(SUM(l.SLTon), 0), COUNT(*), MIN(l.HSD), "
+        "COALESCE(SUM(l.SLTon), 0) * MAX(s.GiaBan) "
+        "FROM LoSP l JOIN SanPham s ON s.MaSP = l.MaSP "
+        "GROUP BY l.MaSP, COALESCE(l.MaKho, '')"
+    )
+
+
+def downgrade():
+    op.drop_table('TonKhoTongHop')
@@ -0,0 +1,25 @@
+"""Add MaThamChieu indexes on PhieuNhapKho/PhieuXuatKho
+
+Revision ID: e9a05c3d7f12
+Revises: b4d2f81c6a37
+Create Date: 2026-10-17 13:05:51.274480
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e9a05c3d7f12'
+down_revision = 'b4d2f81c6a37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('idx_phieunhap_thamchieu', 'PhieuNhapKho', ['MaThamChieu'], unique=False)
+    op.create_index('idx_phieuxuat_thamchieu', 'PhieuXuatKho', ['MaThamChieu'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_phieuxuat_thamchieu', table_name='PhieuXuatKho')
+    op.drop_index('idx_phieunhap_thamchieu', table_name='PhieuNhapKho')
@@ -1,4 +1,4 @@
-"""Entry point for running the Flask application"""
+"""Entry point for running the Flask development server (production: wsgi.py)"""
 
 import os
 from app import create_app, db
@@ -14,6 +14,10 @@ if __name__ == '__main__':
         # Create tables if they don't exist
         # Note: Use Flask-Migrate for production
         db.create_all()
+        
+        # Warm in-memory caches so the first scans don't hit the database
+        from app.utils.warmup import warm_up
+        warm_up(app, db)
     
     # Run the app
     app.run(
@@ -0,0 +1,157 @@
+"""
+Shared fixtures - one TestingConfig app, a fresh in-memory database per test
+
+Dữ liệu mẫu (theo db/init.sql, rút gọn):
+- KHO001 kho thường, KHO002 kho lỗi
+- TN001 thu ngân, NVK001 quản lý kho
+- SP001 (LO001: 500), SP004 (LO004: 10, HSD gần; LO004B: 100), SP003 (LO003: 50, kho lỗi)
+
+Request chạy ngoài app context của test (không chung session), nên các
+truy vấn N+1 không bị identity map che đi; kiểm tra DB trong test dùng
+``with app_context():``.
+"""
+
+import importlib.util
+import re
+from datetime import date, timedelta
+from pathlib import Path
+
+import pytest
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from flask_jwt_extended import create_access_token
+
+from app import create_app, db
+from app.models import (
+    KhoHang, LoaiKho, ThuNgan, NhanVienKho, RoleNV, SanPham, LoSP, LoaiBienDong
+)
+from app.services import (
+    warehouse_registry, barcode_index, product_search, invoice_cache,
+    id_allocator, barcode_allocator, stock_ledger
+)
+
+
+def _seed():
+    db.session.add_all([
+        KhoHang(MaKho='KHO001', Loai=LoaiKho.KHO_THUONG, SucChua=5000),
+        KhoHang(MaKho='KHO002', Loai=LoaiKho.KHO_LOI, SucChua=1000),
+        ThuNgan(MaNV='TN001', Ten='Dung', TaiKhoanNV='tn'),
+        NhanVienKho(MaNV='NVK001', Ten='An', TaiKhoanNV='ql', Role=RoleNV.QUAN_LY),
+        SanPham(MaSP='SP001', TenSP='Gạo ST25', LoaiSP='Thực phẩm', DVT='Kg',
+                GiaBan=25000, MucCanhBaoDatHang=100),
+        SanPham(MaSP='SP003', TenSP='Nước ngọt Coca Cola', LoaiSP='Đồ uống', DVT='Lon',
+                GiaBan=12000, MucCanhBaoDatHang=200),
+        SanPham(MaSP='SP004', TenSP='Sữa tươi Vinamilk', LoaiSP='Đồ uống', DVT='Hộp',
+                GiaBan=8000, MucCanhBaoDatHang=150),
+    ])
+    db.session.flush()
+
+    today = date.today()
+    batches = [
+        LoSP(MaSP='SP001', MaLo='LO001', MaVach='8936012345001',
+             HSD=today + timedelta(days=300), SLTon=500, MaKho='KHO001'),
+        LoSP(MaSP='SP004', MaLo='LO004', MaVach='8936012345004',
+             HSD=today + timedelta(days=20), SLTon=10, MaKho='KHO001'),
+        LoSP(MaSP='SP004', MaLo='LO004B', MaVach='8936012345014',
+             HSD=today + timedelta(days=60), SLTon=100, MaKho='KHO001'),
+        LoSP(MaSP='SP003', MaLo='LO003', MaVach='8936012345003',
+             HSD=today + timedelta(days=100), SLTon=50, MaKho='KHO002'),
+    ]
+    db.session.add_all(batches)
+    stock_ledger.record(
+        LoaiBienDong.TON_DAU, [(b.MaSP, b.MaLo, b.MaKho, b.SLTon) for b in batches]
+    )
+    db.session.commit()
+
+
+def _reset_caches():
+    """Process-wide caches outlive the per-test database"""
+    warehouse_registry.invalidate()
+    barcode_index.invalidate()
+    product_search.invalidate()
+    invoice_cache.invalidate()
+    id_allocator.reset()
+    barcode_allocator.reset()
+
+
+@pytest.fixture(scope='session')
+def flask_app():
+    return create_app('testing')
+
+
+@pytest.fixture
+def database(flask_app):
+    with flask_app.app_context():
+        db.create_all()
+        _seed()
+        _reset_caches()
+    yield db
+    with flask_app.app_context():
+        db.session.remove()
+        db.drop_all()
+        _reset_caches()
+
+
+@pytest.fixture
+def app_context(flask_app, database):
+    """Push an app context (for direct DB checks inside a test)"""
+    return flask_app.app_context
+
+
+@pytest.fixture
+def client(flask_app, database):
+    return flask_app.test_client()
+
+
+@pytest.fixture
+def tokens(flask_app):
+    with flask_app.app_context():
+        return {
+            'cashier': create_access_token(
+                identity='TN001', additional_claims={'type': 'ThuNgan', 'role': 'ThuNgan'}
+            ),
+            'manager': create_access_token(
+                identity='NVK001', additional_claims={'type': 'NhanVienKho', 'role': 'Quản lý'}
+            ),
+        }
+
+
+@pytest.fixture
+def api(client, tokens):
+    """``api('get', url, json=..., as_='manager')`` -> response"""
+    def call(method, url, as_='manager', headers=None, **kwargs):
+        headers = {'Authorization': f"Bearer {tokens[as_]}", **(headers or {})}
+        return getattr(client, method)(url, headers=headers, **kwargs)
+    return call
+
+
+@pytest.fixture
+def queries():
+    """Number of SQL statements a response ran (from its Server-Timing header)"""
+    def count(response):
+        match = re.search(r'desc="(\d+) queries"', response.headers['Server-Timing'])
+        return int(match.group(1))
+    return count
+
+
+@pytest.fixture
+def migrate_up(flask_app, database):
+    """
+    ``migrate_up(revision, drop=[...])``: run one migration's upgrade() on
+    the test database, after dropping the tables it creates
+    """
+    versions = Path(__file__).resolve().parent.parent / 'migrations' / 'versions'
+
+    def run(revision, drop=()):
+        path = next(versions.glob(f'{revision}_*.py'))
+        spec = importlib.util.spec_from_file_location(path.stem, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+
+        with flask_app.app_context():
+            with db.engine.begin() as conn:
+                for name in drop:
+                    db.metadata.tables[name].drop(conn)
+                with Operations.context(MigrationContext.configure(conn)):
+                    module.upgrade()
+    return run
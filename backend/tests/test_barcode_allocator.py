@@ -0,0 +1,53 @@
+"""Block-reserved EAN-13 barcodes for new batches (user-012)"""
+
+import pytest
+
+from app import db
+from app.models import LoSP
+from app.services import BarcodeRangeExhausted, barcode_allocator
+from app.utils.helpers import ean13_check_digit
+
+
+def test_check_digit():
+    assert ean13_check_digit('400638133393') == '1'
+    assert ean13_check_digit('501234567890') == '0'
+
+
+def test_allocated_codes_are_valid_and_under_the_company_prefix(flask_app, app_context, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'BARCODE_COMPANY_PREFIX', '8936012')
+    with app_context():
+        codes = barcode_allocator.allocate(3)
+
+    assert codes == ['8936012000016', '8936012000023', '8936012000030']
+    assert all(code[-1] == ean13_check_digit(code[:12]) for code in codes)
+
+
+def test_codes_in_use_are_skipped(flask_app, app_context, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'BARCODE_COMPANY_PREFIX', '8936012')
+    with app_context():
+        db.session.add(LoSP(MaSP='SP001', MaLo='LOX', MaVach='8936012000016', SLTon=1))
+        db.session.commit()
+        assert barcode_allocator.next_barcode() == '8936012000023'
+
+
+def test_range_exhaustion_is_reported(flask_app, app_context, monkeypatch):
+    # One digit left for the item reference: 9 codes (0 is never handed out)
+    monkeypatch.setitem(flask_app.config, 'BARCODE_COMPANY_PREFIX', '89360123456')
+    with app_context():
+        assert len(barcode_allocator.allocate(9)) == 9
+        with pytest.raises(BarcodeRangeExhausted):
+            barcode_allocator.allocate(1)
+
+
+def test_imported_batches_get_distinct_valid_barcodes(api, app_context):
+    response = api('post', '/api/warehouse/import', json={'MaKho': 'KHO001', 'items': [
+        {'MaSP': 'SP001', 'SoLuong': 5, 'HSD': '2030-01-01'},
+        {'MaSP': 'SP004', 'SoLuong': 5, 'HSD': '2030-01-01'},
+    ]})
+    assert response.status_code == 201, response.get_json()
+    with app_context():
+        codes = [b.MaVach for b in LoSP.query.filter(LoSP.MaLo.notin_(
+            ['LO001', 'LO003', 'LO004', 'LO004B']
+        ))]
+    assert len(codes) == len(set(codes)) == 2
+    assert all(len(code) == 13 and code[-1] == ean13_check_digit(code[:12]) for code in codes)
@@ -0,0 +1,74 @@
+"""In-memory barcode index shared by the scan endpoints (user-002)"""
+
+from app import db
+from app.models import LoSP
+from app.services import barcode_index, move_batch
+
+
+def _scan(api, barcode):
+    return api('post', '/api/sales/scan-barcode', json={'barcode': barcode}, as_='cashier')
+
+
+def test_scan_is_served_from_memory_after_warm(api, app_context, queries):
+    with app_context():
+        assert barcode_index.warm() == 4
+    _scan(api, '8936012345001')  # first request warms the warehouse registry too
+
+    response = _scan(api, '8936012345001')
+    assert response.status_code == 200
+    assert response.get_json()['data']['batch']['SLTon'] == 500
+    assert queries(response) == 0
+
+
+def test_sale_updates_cached_stock_without_reloading(api, app_context, queries):
+    with app_context():
+        barcode_index.warm()
+    _scan(api, '8936012345001')
+
+    sale = api('post', '/api/sales/invoices', as_='cashier', json={
+        'items': [{'MaSP': 'SP001', 'MaLo': 'LO001', 'SoLuong': 3}],
+    })
+    assert sale.status_code == 201, sale.get_json()
+
+    response = _scan(api, '8936012345001')
+    batch = response.get_json()['data']['batch']
+    assert batch['SLTon'] == 497
+    assert batch['MaPhieuXK'] == sale.get_json()['data']['MaPhieuXK']
+    assert queries(response) == 0
+
+
+def test_failed_sale_leaves_index_untouched(api, app_context):
+    with app_context():
+        barcode_index.warm()
+
+    sale = api('post', '/api/sales/invoices', as_='cashier', json={
+        'items': [{'MaSP': 'SP004', 'MaLo': 'LO004', 'SoLuong': 11}],
+    })
+    assert sale.status_code == 400
+
+    with app_context():
+        batch, _ = barcode_index.lookup('8936012345004')
+    assert batch['SLTon'] == 10
+
+
+def test_moved_batch_keeps_its_entry(app_context):
+    with app_context():
+        barcode_index.warm()
+        batch = db.session.get(LoSP, ('SP004', 'LO004'))
+        move_batch(batch, 10, 'KHO001', 'KHO002', ly_do='Chuyển test')
+        db.session.commit()
+
+        cached, _ = barcode_index.lookup('8936012345004')
+        assert cached['MaKho'] == 'KHO002'
+        assert cached['SLTon'] == 10
+
+
+def test_rollback_discards_pending_stock_changes(app_context):
+    with app_context():
+        barcode_index.warm()
+        batch = db.session.get(LoSP, ('SP001', 'LO001'))
+        move_batch(batch, 500, 'KHO001', 'KHO002')
+        db.session.rollback()
+
+        cached, _ = barcode_index.lookup('8936012345001')
+        assert cached['MaKho'] == 'KHO001'
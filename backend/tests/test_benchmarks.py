@@ -0,0 +1,74 @@
+"""Synthetic store dataset and benchmark helpers (user-017)"""
+
+from datetime import date
+
+from sqlalchemy import func
+
+from app import db
+from app.models import BienDongKho, HoaDon, HoaDonSP, LoSP, TongHopBanHang
+from app.utils.helpers import ean13_check_digit
+from benchmarks import dataset
+from benchmarks.run import compare, percentile, _targets
+
+PARAMS = dict(products=40, warehouses=2, batches=300, invoice_lines=400, seed=7, today=date(2026, 1, 15))
+
+
+def _fingerprint():
+    return (
+        db.session.query(func.sum(LoSP.SLTon), func.count(LoSP.MaVach)).one(),
+        [tuple(r) for r in db.session.query(HoaDonSP.MaHD, HoaDonSP.MaSP, HoaDonSP.SoLuong)
+         .order_by(HoaDonSP.MaHD, HoaDonSP.MaSP).all()],
+    )
+
+
+def test_dataset_is_consistent_and_reproducible(app_context):
+    with app_context():
+        info = dataset.generate(**PARAMS)
+        assert info['counts']['batches'] == LoSP.query.count() == 300
+        assert info['counts']['invoice_lines'] == HoaDonSP.query.count() == 400
+        assert info['counts']['invoices'] == HoaDon.query.count()
+
+        # Ledger totals match batch stock, barcodes are valid EAN-13
+        ledger = dict(db.session.query(BienDongKho.MaLo, func.sum(BienDongKho.SoLuong))
+                      .group_by(BienDongKho.MaLo).all())
+        assert all(ledger.get(b.MaLo, 0) == b.SLTon for b in LoSP.query.all())
+        assert all(b.MaVach[-1] == ean13_check_digit(b.MaVach[:12]) for b in LoSP.query.all())
+
+        # Invoice totals are the sum of their lines
+        totals = dict(db.session.query(HoaDonSP.MaHD, func.sum(HoaDonSP.SoLuong * HoaDonSP.DonGia))
+                      .group_by(HoaDonSP.MaHD).all())
+        assert all(totals[h.MaHD] == h.TongTien for h in HoaDon.query.all())
+
+        rollup_total = db.session.query(func.sum(TongHopBanHang.SoLuong)).filter(
+            TongHopBanHang.Ky == 'Ngày', TongHopBanHang.Chieu == 'Sản phẩm'
+        ).scalar()
+        assert rollup_total == db.session.query(func.sum(HoaDonSP.SoLuong)).scalar()
+
+        first = _fingerprint()
+        dataset.generate(**PARAMS)
+        assert _fingerprint() == first
+        db.session.remove()
+
+
+def test_every_route_is_timed_or_skipped_with_a_reason(flask_app, app_context):
+    with app_context():
+        samples = dataset.generate(**PARAMS)['samples']
+        db.session.remove()
+
+    targets, skipped = _targets(flask_app, samples, None)
+    endpoints = {target[0] for target in targets}
+    assert {'sales.create_invoice', 'sales.scan_barcode', 'reports.get_sales_report'} <= endpoints
+    assert not endpoints & set(skipped)
+    assert all(skipped.values())
+
+
+def test_percentile_and_regression_check():
+    assert percentile([1, 2, 3, 4], 50) == 2
+    assert percentile([1, 2, 3, 4], 99) == 4
+    assert percentile([], 50) is None
+
+    base = {'meta': {}, 'results': {'a': {'p50_ms': 10, 'queries': 3, 'status': 200}}}
+    same = {'meta': {}, 'results': {'a': {'p50_ms': 11, 'queries': 3, 'status': 200}}}
+    worse = {'meta': {}, 'results': {'a': {'p50_ms': 30, 'queries': 5, 'status': 200}}}
+    assert compare(same, base) == []
+    assert compare(worse, base) == ['a: p50 10 -> 30 ms', 'a: queries 3 -> 5']
@@ -0,0 +1,154 @@
+"""Query budgets (user-016) and per-request DB metrics (user-015)"""
+
+import pytest
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import SanPham
+from app.utils.db_metrics import query_budget
+
+
+def _import(api, items, ma_kho='KHO001'):
+    response = api('post', '/api/warehouse/import', json={'MaKho': ma_kho, 'items': items})
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['data']['phieu']['MaPhieu']
+
+
+def _export(api, ma_sp, ma_lo, so_luong, ma_kho='KHO001'):
+    response = api('post', '/api/warehouse/export', json={
+        'MaKho': ma_kho, 'MucDich': 'Xuất test',
+        'items': [{'MaSP': ma_sp, 'MaLo': ma_lo, 'SoLuong': so_luong}],
+    })
+    assert response.status_code in (200, 201), response.get_json()
+    return response.get_json()['data']['phieu']['MaPhieu']
+
+
+@pytest.fixture
+def slips(api):
+    """Several import/export slips with batches of different products"""
+    imports = [
+        _import(api, [
+            {'MaSP': 'SP001', 'SoLuong': 20, 'HSD': '2030-01-01'},
+            {'MaSP': 'SP004', 'SoLuong': 30, 'HSD': '2030-01-01'},
+        ]),
+        _import(api, [{'MaSP': 'SP003', 'SoLuong': 5, 'HSD': '2030-01-01'}]),
+        _import(api, [{'MaSP': 'SP004', 'SoLuong': 7, 'HSD': '2031-01-01'}]),
+    ]
+    exports = [
+        _export(api, 'SP001', 'LO001', 3),
+        _export(api, 'SP004', 'LO004B', 4),
+        _export(api, 'SP004', 'LO004', 2),
+    ]
+    return imports, exports
+
+
+@pytest.mark.parametrize('url', [
+    '/api/warehouse/import',
+    '/api/warehouse/export',
+    '/api/warehouse/batches',
+    '/api/warehouse/transfer',
+    '/api/warehouse/warehouses/KHO001/inventory',
+])
+def test_slip_lists_stay_within_budget(api, slips, url):
+    # Strict mode (TestingConfig): an over-budget route answers 500
+    response = api('get', url)
+    assert response.status_code == 200, response.get_json()
+
+
+def test_slip_details_stay_within_budget(api, slips):
+    imports, exports = slips
+    for ma_phieu in imports:
+        response = api('get', f'/api/warehouse/import/{ma_phieu}')
+        assert response.status_code == 200, response.get_json()
+        assert response.get_json()['data']['items']
+        assert all('product' in item for item in response.get_json()['data']['items'])
+    for ma_phieu in exports:
+        response = api('get', f'/api/warehouse/export/{ma_phieu}')
+        assert response.status_code == 200, response.get_json()
+        assert all(item['TenSP'] for item in response.get_json()['data']['items'])
+
+
+def test_export_list_includes_items(api, slips):
+    _, exports = slips
+    data = api('get', '/api/warehouse/export').get_json()['data']
+    by_code = {phieu['MaPhieu']: phieu for phieu in data['exports']}
+    assert set(exports) <= set(by_code)
+    assert by_code[exports[0]]['items'][0]['DVT'] == 'Kg'
+
+
+def test_server_timing_header_reports_queries(api, slips):
+    response = api('get', '/api/warehouse/import')
+    timing = response.headers['Server-Timing']
+    assert 'queries' in timing and 'db-pool' in timing
+
+
+def test_metrics_endpoint_lists_budgets(api, slips):
+    api('get', '/api/warehouse/export')
+    stats = api('get', '/api/metrics/db').get_json()['data']
+    rows = stats['endpoints'] if isinstance(stats, dict) else stats
+    row = next(r for r in rows if r['endpoint'] == 'warehouse.get_exports')
+    assert row['query_budget'] == 3
+    assert row['over_budget'] == 0
+    assert row['queries_max'] <= 3
+
+
+def test_server_timing_counts_every_statement(api, flask_app, slips, queries):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with flask_app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        response = api('get', '/api/warehouse/batches')
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    assert queries(response) == len(statements) > 0
+
+
+def test_metrics_are_aggregated_per_endpoint_until_reset(api, slips):
+    assert api('delete', '/api/metrics/db').status_code == 200
+    for _ in range(2):
+        api('get', '/api/warehouse/import')
+
+    rows = api('get', '/api/metrics/db').get_json()['data']['endpoints']
+    # The reset request itself finishes after the reset
+    assert {r['endpoint']: r['requests'] for r in rows} == {
+        'metrics.reset_db_metrics': 1, 'warehouse.get_imports': 2
+    }
+    assert api('get', '/api/metrics/db', as_='cashier').status_code == 403
+
+
+@pytest.fixture
+def budget_app():
+    """Separate app with a route that runs one statement more than its budget"""
+    app = create_app('testing')
+
+    @app.route('/over-budget')
+    @query_budget(1)
+    def over_budget():
+        SanPham.query.count()
+        SanPham.query.count()
+        return {'success': True}
+
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def test_over_budget_route_fails_in_strict_mode(budget_app):
+    response = budget_app.test_client().get('/over-budget')
+    assert response.status_code == 500
+    assert 'ran 2 SQL statements (budget 1)' in response.get_json()['message']
+
+
+def test_over_budget_route_is_only_counted_when_not_strict(budget_app):
+    budget_app.config['QUERY_BUDGET_STRICT'] = False
+    budget_app.config['QUERY_BUDGET_SAMPLE_RATE'] = 0.0
+    response = budget_app.test_client().get('/over-budget')
+    assert response.status_code == 200
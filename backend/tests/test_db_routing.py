@@ -0,0 +1,76 @@
+"""Read-replica routing for list and report endpoints (user-014)"""
+
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import insert
+
+from app import create_app, db
+from app.config import TestingConfig, config
+from app.models import SanPham
+
+
+def _product(ma_sp):
+    return {'MaSP': ma_sp, 'TenSP': f'Sản phẩm {ma_sp}', 'GiaBan': 1000, 'TrangThai': 'Còn hàng'}
+
+
+@pytest.fixture
+def replica_app(tmp_path, monkeypatch):
+    """
+    ``replica_app(replica_url)``: app whose primary holds SP100, and a
+    replica (when reachable) that holds SP900
+    """
+    apps = []
+    # init_app registers a MetaData for each bind key on the shared extension
+    monkeypatch.setattr(db, 'metadatas', dict(db.metadatas))
+
+    def build(replica_url):
+        class ReplicaConfig(TestingConfig):
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'primary.db'}"
+            SQLALCHEMY_BINDS = {'replica': replica_url}
+            REPLICA_CHECK_INTERVAL = 0
+
+        monkeypatch.setitem(config, 'replica-test', ReplicaConfig)
+        app = create_app('replica-test')
+        with app.app_context():
+            db.create_all(bind_key=None)
+            db.session.execute(insert(SanPham.__table__), [_product('SP100')])
+            db.session.commit()
+        apps.append(app)
+        return app
+
+    yield build
+    for app in apps:
+        with app.app_context():
+            db.session.remove()
+            db.drop_all(bind_key=None)
+            for engine in db.engines.values():
+                engine.dispose()
+
+
+def _list_products(app):
+    with app.app_context():
+        token = create_access_token(
+            identity='NVK001', additional_claims={'type': 'NhanVienKho', 'role': 'Quản lý'}
+        )
+    response = app.test_client().get('/api/products', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200, response.get_json()
+    return [item['MaSP'] for item in response.get_json()['data']['items']]
+
+
+def test_list_reads_run_on_the_replica(replica_app, tmp_path):
+    app = replica_app(f"sqlite:///{tmp_path / 'replica.db'}")
+    with app.app_context():
+        replica = db.engines['replica']
+        db.metadata.create_all(replica)
+        with replica.begin() as conn:
+            conn.execute(insert(SanPham.__table__), [_product('SP900')])
+
+    assert _list_products(app) == ['SP900']
+    with app.app_context():
+        # Outside @read_replica endpoints the primary is used
+        assert [p.MaSP for p in SanPham.query.all()] == ['SP100']
+
+
+def test_unreachable_replica_falls_back_to_primary(replica_app, tmp_path):
+    app = replica_app(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    assert _list_products(app) == ['SP100']
@@ -0,0 +1,53 @@
+"""Lazily imported report exporters (user-020)"""
+
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from app.services.exporters import ExporterRegistry, UnknownExportFormat
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+
+def test_create_app_does_not_import_export_backends():
+    probe = (
+        "import sys; from app import create_app; create_app('testing'); "
+        "print(sorted(m for m in ('openpyxl', 'reportlab') if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', probe], cwd=BACKEND, capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == '[]'
+
+
+def test_string_targets_are_imported_on_first_export():
+    registry = ExporterRegistry()
+    registry.register('raw', 'bin', 'io:BytesIO', 'application/octet-stream', 'bin')
+    assert registry.loaded() == []
+
+    buffer, mimetype, extension = registry.export('raw', 'bin', b'data')
+    assert buffer.getvalue() == b'data'
+    assert (mimetype, extension) == ('application/octet-stream', 'bin')
+    assert registry.loaded() == ['io:BytesIO']
+
+
+def test_unknown_format_lists_the_available_ones():
+    registry = ExporterRegistry()
+    registry.register('sales', 'csv', lambda data: data, 'text/csv', 'csv')
+    with pytest.raises(UnknownExportFormat) as error:
+        registry.export('sales', 'xml', {})
+    assert error.value.available == ['csv']
+
+
+def test_export_routes_render_and_reject_formats(api):
+    excel = api('get', '/api/reports/export/inventory?format=excel')
+    assert excel.status_code == 200
+    assert excel.data[:2] == b'PK'  # xlsx is a zip archive
+
+    pdf = api('get', '/api/reports/export/inventory?format=pdf')
+    assert pdf.status_code == 200
+    assert pdf.data.startswith(b'%PDF')
+
+    assert api('get', '/api/reports/export/inventory?format=csv').status_code == 400
@@ -0,0 +1,47 @@
+"""Server-side FEFO allocation at checkout (user-005)"""
+
+from datetime import date, timedelta
+
+import pytest
+
+from app import db
+from app.models import LoSP
+from app.services import InsufficientStockError, allocate_fefo
+
+
+def _sell(api, items):
+    return api('post', '/api/sales/invoices', as_='cashier', json={'items': items})
+
+
+def test_checkout_splits_a_line_over_batches_by_expiry(api, app_context):
+    with app_context():
+        db.session.add(LoSP(MaSP='SP004', MaLo='LOEXP', MaVach='8936012345021',
+                            HSD=date.today() - timedelta(days=1), SLTon=50, MaKho='KHO001'))
+        db.session.commit()
+
+    response = _sell(api, [{'MaSP': 'SP004', 'SoLuong': 15}])
+    assert response.status_code == 201, response.get_json()
+    allocation = response.get_json()['data']['allocation']
+    assert [(b['MaLo'], b['SoLuong']) for b in allocation[0]['batches']] == [
+        ('LO004', 10), ('LO004B', 5)
+    ]
+    with app_context():
+        assert db.session.get(LoSP, ('SP004', 'LOEXP')).SLTon == 50
+
+
+def test_checkout_reports_the_unexpired_stock_when_short(api):
+    response = _sell(api, [{'MaSP': 'SP004', 'SoLuong': 111}])
+    assert response.status_code == 400
+    assert 'tồn: 110' in response.get_json()['error']
+
+
+def test_allocation_skips_units_reserved_by_explicit_lines(app_context):
+    with app_context():
+        allocations = allocate_fefo({'SP004': 5}, {'KHO001'}, reserved={('SP004', 'LO004'): 8})
+        assert [(b.MaLo, n) for b, n in allocations['SP004']] == [('LO004', 2), ('LO004B', 3)]
+
+        with pytest.raises(InsufficientStockError) as error:
+            allocate_fefo({'SP003': 1}, {'KHO001'})
+        assert error.value.shortages == [
+            {'MaSP': 'SP003', 'MaLo': None, 'requested': 1, 'available': 0}
+        ]
@@ -0,0 +1,63 @@
+"""Vectorized stock-out forecasting (user-024)"""
+
+import math
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import ChieuTongHop, KyTongHop, TongHopBanHang
+from app.services import forecast as forecast_engine
+
+TODAY = date(2026, 1, 12)  # Monday
+
+
+@pytest.fixture
+def daily_sales(app_context):
+    """28 days: SP001 sells 10 every day, SP004 2 on weekdays, 10 on Saturdays, 6 on Sundays"""
+    with app_context():
+        for offset in range(1, 29):
+            day = datetime.combine(TODAY - timedelta(days=offset), datetime.min.time())
+            sales = {'SP001': 10, 'SP004': {5: 10, 6: 6}.get(day.weekday(), 2)}
+            for ma_sp, so_luong in sales.items():
+                db.session.add(TongHopBanHang(
+                    Ky=KyTongHop.NGAY, Chieu=ChieuTongHop.SAN_PHAM, ThoiDiem=day, Khoa=ma_sp,
+                    SoHoaDon=1, SoLuong=so_luong, DoanhThu=0, SoLuongTra=0, GiaTriTra=0
+                ))
+        db.session.commit()
+
+
+def _by_product(result, key):
+    return {p.MaSP: value for p, value in zip(result['products'], result[key])}
+
+
+def test_flat_methods(app_context, daily_sales):
+    with app_context():
+        for method in ('average', 'ewma'):
+            result = forecast_engine.forecast(days=28, method=method, today=TODAY)
+            days = _by_product(result, 'days_until_out')
+            assert days['SP001'] == pytest.approx(50)     # 500 in stock
+            assert math.isinf(days['SP003'])               # never sold
+
+        result = forecast_engine.forecast(days=28, method='average', today=TODAY)
+        assert _by_product(result, 'days_until_out')['SP004'] == pytest.approx(110 / (26 / 7))
+        # No variance: the band collapses onto the estimate
+        assert _by_product(result, 'earliest')['SP001'] == pytest.approx(50)
+        assert _by_product(result, 'latest')['SP001'] == pytest.approx(50)
+        assert _by_product(result, 'earliest')['SP004'] < 29 < 30 < _by_product(result, 'latest')['SP004']
+
+
+def test_seasonal_method_follows_the_weekday_pattern(app_context, daily_sales):
+    with app_context():
+        result = forecast_engine.forecast(days=28, method='seasonal', today=TODAY)
+    assert result['seasonal']
+    days = _by_product(result, 'days_until_out')
+    # 4 weeks sell 104 of 110; the last 6 go by the end of the 3rd weekday
+    assert days['SP004'] == pytest.approx(4 * 7 + 3)
+    assert days['SP001'] == pytest.approx(50)
+
+
+def test_forecast_route(api, daily_sales):
+    response = api('get', '/api/reports/stock-forecast?method=seasonal&days=28')
+    assert response.status_code == 200, response.get_json()
+    assert api('get', '/api/reports/stock-forecast?method=median').status_code == 400
@@ -0,0 +1,94 @@
+"""Chunked bulk goods receipt (user-013)"""
+
+import io
+
+from app.models import LoSP, BienDongKho
+from app.services import goods_receipt
+
+LINES = [
+    {'MaSP': 'SP001', 'SoLuong': 10, 'HSD': '2030-01-01'},
+    {'MaSP': 'SP004', 'SoLuong': 5, 'MaLo': 'LO004B'},
+    {'MaSP': 'SP999', 'SoLuong': 1},
+    {'MaSP': 'SP003', 'SoLuong': 0},
+    {'MaSP': 'SP003', 'SoLuong': 7, 'MaLo': 'LONEW', 'HSD': '2030-06-01'},
+]
+
+
+def _bulk(api, **body):
+    return api('post', '/api/warehouse/import/bulk', json={'MaKho': 'KHO001', **body})
+
+
+def test_bulk_import_in_chunks(api, app_context):
+    response = _bulk(api, items=LINES, chunk_size=2)
+    assert response.status_code == 201
+    report = response.get_json()['data']
+    assert report['completed_lines'] == 5
+    assert report['summary'] == {'created': 2, 'updated': 1, 'error': 2}
+    assert [line['status'] for line in report['lines']] == [
+        'created', 'updated', 'error', 'error', 'created'
+    ]
+
+    with app_context():
+        assert LoSP.query.get(('SP004', 'LO004B')).SLTon == 105
+        new_batch = LoSP.query.get(('SP003', 'LONEW'))
+        assert new_batch.MaKho == 'KHO001'
+        assert new_batch.MaPhieuNK == report['MaPhieu']
+        assert len(new_batch.MaVach) == 13
+
+
+def test_bulk_import_from_csv(api):
+    csv_file = io.BytesIO("MaSP,SoLuong,HSD\nSP001,3,2030-01-01\nSP004,4,2030-01-01\n".encode())
+    response = api('post', '/api/warehouse/import/bulk', data={
+        'MaKho': 'KHO001', 'file': (csv_file, 'delivery.csv'),
+    }, content_type='multipart/form-data')
+    assert response.status_code == 201
+    assert response.get_json()['data']['summary']['created'] == 2
+
+
+def test_failed_chunk_returns_partial_report(api, monkeypatch, app_context):
+    real_import_chunk = goods_receipt._import_chunk
+    calls = []
+
+    def failing_second_chunk(chunk, ma_kho, ma_phieu):
+        calls.append(chunk)
+        if len(calls) == 2:
+            raise RuntimeError("disk full")
+        return real_import_chunk(chunk, ma_kho, ma_phieu)
+
+    monkeypatch.setattr(goods_receipt, '_import_chunk', failing_second_chunk)
+    response = _bulk(api, items=LINES, chunk_size=2)
+
+    assert response.status_code == 207
+    body = response.get_json()
+    assert body['success'] is False
+    assert 'Lines 3-4: disk full' in body['error']
+    report = body['data']
+    assert set(report) == {'MaPhieu', 'completed_lines', 'summary', 'lines', 'error'}
+    assert report['completed_lines'] == 2
+
+    # Resume from the first line that was not committed
+    monkeypatch.setattr(goods_receipt, '_import_chunk', real_import_chunk)
+    response = _bulk(api, items=LINES, chunk_size=2, MaPhieu=report['MaPhieu'], resume_from=3)
+    assert response.status_code == 201
+    assert response.get_json()['data']['completed_lines'] == 5
+    with app_context():
+        assert LoSP.query.get(('SP003', 'LONEW')).MaPhieuNK == report['MaPhieu']
+
+
+def test_resume_with_unknown_slip_is_rejected(api):
+    response = _bulk(api, items=LINES, MaPhieu='PNK404404', resume_from=3)
+    assert response.status_code == 404
+
+
+def test_resume_into_another_warehouse_is_rejected(api, app_context):
+    ma_phieu = _bulk(api, items=LINES[:1]).get_json()['data']['MaPhieu']
+    with app_context():
+        before = BienDongKho.query.count()
+
+    response = api('post', '/api/warehouse/import/bulk', json={
+        'MaKho': 'KHO002', 'items': LINES, 'MaPhieu': ma_phieu, 'resume_from': 2,
+    })
+    assert response.status_code == 409
+    with app_context():
+        assert BienDongKho.query.count() == before
+        assert LoSP.query.get(('SP003', 'LONEW')) is None
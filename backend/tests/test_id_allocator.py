@@ -0,0 +1,49 @@
+"""Sequence-backed document code allocator (user-011)"""
+
+from datetime import datetime
+
+from app import db
+from app.models import BoDemMa, HoaDon
+from app.services import id_allocator
+
+
+def test_codes_are_sequential_and_reserved_in_blocks(flask_app, app_context):
+    with app_context():
+        assert [id_allocator.next_id('PKK') for _ in range(3)] == ['PKK000001', 'PKK000002', 'PKK000003']
+        block = flask_app.config.get('ID_BLOCK_SIZE', 50)
+        assert db.session.get(BoDemMa, 'PKK').GiaTriTiep == 1 + block
+
+        # A new block after a restart; unused numbers are skipped, never reused
+        id_allocator.reset()
+        assert id_allocator.next_id('PKK') == f'PKK{1 + block:06d}'
+
+
+def test_codes_already_in_use_are_skipped(app_context):
+    with app_context():
+        db.session.add(HoaDon(MaHD='HD000001', NgayTao=datetime.now(), MaNVThuNgan='TN001'))
+        db.session.commit()
+        assert id_allocator.next_id('HD') == 'HD000002'
+
+
+def test_invoices_get_distinct_codes(api):
+    codes = {
+        api('post', '/api/sales/invoices', as_='cashier', json={
+            'items': [{'MaSP': 'SP001', 'SoLuong': 1}],
+        }).get_json()['data']['MaHD']
+        for _ in range(3)
+    }
+    assert codes == {'HD000001', 'HD000002', 'HD000003'}
+
+
+def test_migration_seeds_counters_past_existing_codes(app_context, migrate_up):
+    with app_context():
+        db.session.add(HoaDon(MaHD='HD000041', NgayTao=datetime.now(), MaNVThuNgan='TN001'))
+        db.session.commit()
+    migrate_up('2f6b8d0e4c19', drop=['BoDemMa'])
+
+    with app_context():
+        counters = {row.TienTo: row.GiaTriTiep for row in BoDemMa.query.all()}
+        assert counters['HD'] == 42
+        assert counters['SP'] == 5      # SP004
+        assert counters['PNK'] == 1
+        assert id_allocator.next_id('HD') == 'HD000042'
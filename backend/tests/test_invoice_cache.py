@@ -0,0 +1,48 @@
+"""ETag-cached invoice detail responses (user-010)"""
+
+from app.services import invoice_cache
+
+
+def _sell(api):
+    response = api('post', '/api/sales/invoices', as_='cashier', json={
+        'items': [{'MaSP': 'SP004', 'SoLuong': 2}],
+    })
+    return response.get_json()['data']['MaHD']
+
+
+def _detail(api, ma_hd, etag=None):
+    headers = {'If-None-Match': f'"{etag}"'} if etag else None
+    return api('get', f'/api/sales/invoices/{ma_hd}', headers=headers)
+
+
+def test_unchanged_invoice_answers_304_from_cache(api, queries):
+    ma_hd = _sell(api)
+    first = _detail(api, ma_hd)
+    assert first.status_code == 200
+    etag = first.headers['ETag'].strip('"')
+
+    again = _detail(api, ma_hd, etag)
+    assert again.status_code == 304
+    assert again.data == b''
+    assert queries(again) == 0
+
+
+def test_return_invalidates_the_cached_detail(api):
+    ma_hd = _sell(api)
+    etag = _detail(api, ma_hd).headers['ETag'].strip('"')
+
+    returned = api('post', '/api/sales/returns', as_='cashier', json={
+        'ma_hd': ma_hd, 'items': [{'MaSP': 'SP004', 'SoLuong': 1}],
+    })
+    assert returned.status_code == 201
+
+    response = _detail(api, ma_hd, etag)
+    assert response.status_code == 200
+    assert response.get_json()['data']['MaYCTraHang'] == returned.get_json()['data']['MaYC']
+    assert response.headers['ETag'].strip('"') != etag
+
+
+def test_unknown_invoice_is_not_cached(api, app_context):
+    assert _detail(api, 'HD404').status_code == 404
+    with app_context():
+        assert invoice_cache.stats() == {'invoices': 0}
@@ -0,0 +1,47 @@
+"""Set-based invoice creation (user-003)"""
+
+from app.models import HoaDonSP, LoSP
+
+
+def _sell(api, items):
+    return api('post', '/api/sales/invoices', as_='cashier', json={'items': items})
+
+
+def test_repeated_scans_become_one_invoice_line(api, app_context):
+    response = _sell(api, [
+        {'MaSP': 'SP001', 'MaLo': 'LO001', 'SoLuong': 1},
+        {'MaSP': 'SP004', 'MaLo': 'LO004B', 'SoLuong': 2},
+        {'MaSP': 'SP001', 'MaLo': 'LO001', 'SoLuong': 1},
+    ])
+    assert response.status_code == 201, response.get_json()
+    data = response.get_json()['data']
+    assert data['TongTien'] == 2 * 25000 + 2 * 8000
+
+    with app_context():
+        lines = {l.MaSP: l.SoLuong for l in HoaDonSP.query.filter_by(MaHD=data['MaHD'])}
+        assert lines == {'SP001': 2, 'SP004': 2}
+        assert LoSP.query.get(('SP001', 'LO001')).SLTon == 498
+
+
+def test_query_count_does_not_grow_with_the_basket(api, queries):
+    _sell(api, [{'MaSP': 'SP001', 'MaLo': 'LO001', 'SoLuong': 1}])  # warm caches
+
+    small = _sell(api, [{'MaSP': 'SP001', 'MaLo': 'LO001', 'SoLuong': 1}])
+    large = _sell(api, [
+        {'MaSP': 'SP001', 'MaLo': 'LO001', 'SoLuong': 1},
+        {'MaSP': 'SP004', 'MaLo': 'LO004', 'SoLuong': 1},
+        {'MaSP': 'SP004', 'MaLo': 'LO004B', 'SoLuong': 1},
+    ])
+    assert small.status_code == large.status_code == 201
+    assert queries(large) == queries(small)
+
+
+def test_unknown_batch_creates_nothing(api, app_context):
+    response = _sell(api, [
+        {'MaSP': 'SP001', 'MaLo': 'LO001', 'SoLuong': 1},
+        {'MaSP': 'SP004', 'MaLo': 'LO404', 'SoLuong': 1},
+    ])
+    assert response.status_code == 404
+    with app_context():
+        assert HoaDonSP.query.count() == 0
+        assert LoSP.query.get(('SP001', 'LO001')).SLTon == 500
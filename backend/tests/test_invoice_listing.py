@@ -0,0 +1,32 @@
+"""Eager-loaded invoice listing (user-008)"""
+
+
+def _sell(api, items):
+    response = api('post', '/api/sales/invoices', as_='cashier', json={'items': items})
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['data']['MaHD']
+
+
+def _list(api):
+    return api('get', '/api/sales/invoices?per_page=50')
+
+
+def test_listing_query_count_does_not_grow_with_invoices(api, queries):
+    _sell(api, [{'MaSP': 'SP001', 'SoLuong': 1}])
+    one = queries(_list(api))
+
+    for _ in range(4):
+        _sell(api, [{'MaSP': 'SP001', 'SoLuong': 1}, {'MaSP': 'SP004', 'SoLuong': 1}])
+    response = _list(api)
+    assert response.status_code == 200
+    assert len(response.get_json()['data']['items']) == 5
+    assert queries(response) == one
+
+
+def test_listing_includes_lines_and_cashier(api):
+    ma_hd = _sell(api, [{'MaSP': 'SP001', 'SoLuong': 2}, {'MaSP': 'SP004', 'SoLuong': 1}])
+    invoice = _list(api).get_json()['data']['items'][0]
+    assert invoice['MaHD'] == ma_hd
+    assert invoice['TenThuNgan'] == 'Dung'
+    assert {item['TenSP'] for item in invoice['items']} == {'Gạo ST25', 'Sữa tươi Vinamilk'}
+    assert invoice['TongTien'] == 58000.0
@@ -0,0 +1,60 @@
+"""POS load simulator reconciliation (user-018)"""
+
+from argparse import Namespace
+
+from app import db
+from app.models import LoSP
+from benchmarks.loadsim import Simulation, hot_barcodes, reconcile, stock_by_product
+
+
+def _simulation():
+    return Simulation(Namespace(lanes=1, duration=0, seed=1), 'http://pos', [])
+
+
+def _sell(api, sim, ma_sp, so_luong):
+    response = api('post', '/api/sales/invoices', as_='cashier', json={
+        'items': [{'MaSP': ma_sp, 'SoLuong': so_luong}],
+    })
+    assert response.status_code == 201
+    data = response.get_json()['data']
+    sim.invoice_created(data['MaHD'], data['items'])
+
+
+def test_consistent_run_reconciles(api, app_context):
+    sim = _simulation()
+    with app_context():
+        before = stock_by_product()
+    _sell(api, sim, 'SP004', 12)
+    _sell(api, sim, 'SP001', 3)
+
+    with app_context():
+        report = reconcile(before, sim)
+    assert report['ok'], report
+    assert report['products_checked'] == 3
+
+
+def test_lost_updates_oversells_and_missing_invoices_are_reported(api, app_context):
+    sim = _simulation()
+    with app_context():
+        before = stock_by_product()
+    _sell(api, sim, 'SP004', 2)
+    sim.invoice_created('HD999999', [])
+    with app_context():
+        # A lost update put one unit back, another batch went negative
+        db.session.get(LoSP, ('SP004', 'LO004')).SLTon += 1
+        db.session.get(LoSP, ('SP001', 'LO001')).SLTon = -1
+        db.session.commit()
+        report = reconcile(before, sim)
+
+    assert not report['ok']
+    assert {(m['MaSP'], m['expected'], m['after']) for m in report['stock_mismatches']} == {
+        ('SP004', 108, 109), ('SP001', 500, -1)
+    }
+    assert report['negative_batches'] == [{'MaSP': 'SP001', 'MaLo': 'LO001', 'SLTon': -1}]
+    assert report['missing_invoices'] == ['HD999999']
+
+
+def test_hot_barcodes_are_sellable_batches(app_context):
+    with app_context():
+        barcodes = hot_barcodes(10, seed=1)
+    assert sorted(barcodes) == ['8936012345001', '8936012345004', '8936012345014']
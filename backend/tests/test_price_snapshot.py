@@ -0,0 +1,37 @@
+"""Price and total snapshots on invoices (user-009)"""
+
+from app import db
+from app.models import HoaDon, SanPham
+
+
+def test_invoice_keeps_the_price_paid(api, app_context):
+    sold = api('post', '/api/sales/invoices', as_='cashier', json={
+        'items': [{'MaSP': 'SP004', 'SoLuong': 3}],
+    })
+    ma_hd = sold.get_json()['data']['MaHD']
+    with app_context():
+        assert float(db.session.get(HoaDon, ma_hd).TongTien) == 24000.0
+        db.session.get(SanPham, 'SP004').GiaBan = 9500
+        db.session.commit()
+
+    detail = api('get', f'/api/sales/invoices/{ma_hd}').get_json()['data']
+    assert detail['items'][0]['DonGia'] == 8000.0
+    assert detail['TongTien'] == 24000.0
+
+    listed = api('get', '/api/sales/invoices').get_json()['data']['items'][0]
+    assert listed['TongTien'] == 24000.0
+
+
+def test_refund_uses_the_price_paid(api, app_context):
+    sold = api('post', '/api/sales/invoices', as_='cashier', json={
+        'items': [{'MaSP': 'SP004', 'SoLuong': 3}],
+    })
+    with app_context():
+        db.session.get(SanPham, 'SP004').GiaBan = 9500
+        db.session.commit()
+
+    returned = api('post', '/api/sales/returns', as_='cashier', json={
+        'ma_hd': sold.get_json()['data']['MaHD'], 'items': [{'MaSP': 'SP004', 'SoLuong': 2}],
+    })
+    assert returned.status_code == 201, returned.get_json()
+    assert returned.get_json()['data']['TongTienHoanTra'] == 16000.0
@@ -0,0 +1,57 @@
+"""Keyset pagination and optional counts for POS product search (user-007)"""
+
+from app import db
+from app.models import LoSP, SanPham
+
+
+def _page(api, query):
+    response = api('get', f'/api/sales/products/search?{query}', as_='cashier')
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['data']
+
+
+def _walk(api, query):
+    """MaSP of every page, following next_cursor"""
+    seen, cursor = [], ''
+    while True:
+        data = _page(api, f'{query}&cursor={cursor}')
+        seen.append([item['MaSP'] for item in data['items']])
+        if not data['has_more']:
+            return seen
+        cursor = data['next_cursor']
+
+
+def test_cursor_walks_products_in_name_order(api):
+    # SP003 only has stock in the defect warehouse
+    assert _walk(api, 'per_page=1') == [['SP001'], ['SP004']]
+
+
+def test_cursor_pages_do_not_shift_when_rows_are_added(api, app_context):
+    first = _page(api, 'per_page=1&cursor=')
+    with app_context():
+        db.session.add(SanPham(MaSP='SP000', TenSP='Bánh mì', GiaBan=5000))
+        db.session.flush()
+        db.session.add(LoSP(MaSP='SP000', MaLo='LO000', MaVach='8936012345000',
+                            SLTon=5, MaKho='KHO001'))
+        db.session.commit()
+
+    second = _page(api, f"per_page=1&cursor={first['next_cursor']}")
+    assert [item['MaSP'] for item in second['items']] == ['SP004']
+
+
+def test_search_results_are_paged_by_cursor(api):
+    pages = _walk(api, 'search=s&per_page=1')
+    assert len(pages) == 2
+    assert sorted(sum(pages, [])) == ['SP001', 'SP004']  # rank order, no repeats
+
+
+def test_count_modes(api):
+    assert _page(api, 'per_page=1&cursor=')['total'] is None
+    assert _page(api, 'per_page=1')['total'] == 2
+    estimate = _page(api, 'per_page=1&count=estimate')
+    assert estimate['total'] == 3 and estimate['total_is_estimate']
+
+
+def test_malformed_cursor_is_rejected(api):
+    response = api('get', '/api/sales/products/search?cursor=%%%', as_='cashier')
+    assert response.status_code == 400
@@ -0,0 +1,45 @@
+"""Accent-insensitive product search index (user-006)"""
+
+import unicodedata
+
+from app import db
+from app.models import SanPham
+from app.services import product_search
+from app.services.product_search import fold
+
+
+def _search(api, text):
+    response = api('get', f'/api/products?search={text}')
+    assert response.status_code == 200, response.get_json()
+    return [item['MaSP'] for item in response.get_json()['data']['items']]
+
+
+def test_fold_strips_vietnamese_marks():
+    assert fold('Sữa tươi Đà Lạt') == 'sua tuoi da lat'
+    assert fold(unicodedata.normalize('NFD', 'Nước ngọt')) == 'nuoc ngot'
+
+
+def test_search_ignores_accents_and_matches_prefixes(api):
+    assert _search(api, 'sua') == ['SP004']
+    assert _search(api, 'SỮA TƯƠI') == ['SP004']
+    assert _search(api, 'nuoc ng') == ['SP003']
+    assert _search(api, 'ola') == ['SP003']  # substring of "cola"
+    assert _search(api, 'sua gao') == []
+
+
+def test_exact_code_ranks_first(app_context):
+    with app_context():
+        db.session.add(SanPham(MaSP='SP0011', TenSP='SP001 bao lớn', LoaiSP='Thực phẩm', GiaBan=1))
+        db.session.commit()
+        ranked, total = product_search.search('sp001')
+        assert ranked == ['SP001', 'SP0011'] and total == 2
+
+
+def test_committed_changes_reach_the_index(app_context):
+    with app_context():
+        product_search.load()
+        db.session.get(SanPham, 'SP001').TenSP = 'Gạo Nàng Hương'
+        assert product_search.search('huong')[0] == []  # not committed yet
+        db.session.commit()
+        assert product_search.search('huong')[0] == ['SP001']
+        assert product_search.search('st25')[0] == []
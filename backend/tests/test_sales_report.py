@@ -0,0 +1,72 @@
+"""Sales report aggregated in SQL, honouring group_by (user-022)"""
+
+from datetime import datetime
+
+import pytest
+
+from app import db
+from app.models import HoaDon, HoaDonSP
+from app.services import sales_rollup
+
+INVOICES = [
+    ('HD000001', datetime(2024, 12, 30, 10), [('SP001', 2, 25000)]),               # Monday
+    ('HD000002', datetime(2025, 1, 1, 9), [('SP004', 3, 8000)]),
+    ('HD000003', datetime(2025, 1, 5, 18), [('SP001', 1, 25000), ('SP004', 1, 8000)]),  # Sunday
+    ('HD000004', datetime(2025, 1, 6, 8), [('SP004', 5, 8000)]),                   # next Monday
+]
+
+
+@pytest.fixture
+def history(app_context):
+    with app_context():
+        for ma_hd, ngay, lines in INVOICES:
+            db.session.add(HoaDon(MaHD=ma_hd, NgayTao=ngay, MaNVThuNgan='TN001',
+                                  TongTien=sum(n * gia for _, n, gia in lines)))
+            db.session.flush()
+            db.session.add_all(
+                HoaDonSP(MaHD=ma_hd, MaSP=ma_sp, SoLuong=n, DonGia=gia) for ma_sp, n, gia in lines
+            )
+        sales_rollup.rebuild()
+        db.session.commit()
+
+
+def _report(api, group_by):
+    response = api('get', '/api/reports/sales?from_date=2024-12-01&to_date=2025-01-31'
+                          f'&group_by={group_by}')
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['data']
+
+
+def _periods(data):
+    return [(p['date'], p['total_revenue'], p['total_quantity'], p['total_invoices'])
+            for p in data['daily_sales']]
+
+
+@pytest.mark.parametrize('group_by, expected', [
+    ('day', [
+        ('2024-12-30', 50000.0, 2, 1), ('2025-01-01', 24000.0, 3, 1),
+        ('2025-01-05', 33000.0, 2, 1), ('2025-01-06', 40000.0, 5, 1),
+    ]),
+    ('week', [('2024-12-30', 107000.0, 7, 3), ('2025-01-06', 40000.0, 5, 1)]),
+    ('month', [('2024-12-01', 50000.0, 2, 1), ('2025-01-01', 97000.0, 10, 3)]),
+])
+def test_periods_follow_group_by(api, history, group_by, expected):
+    data = _report(api, group_by)
+    assert data['group_by'] == group_by
+    assert _periods(data) == expected
+
+
+def test_summary_and_top_products(api, history):
+    data = _report(api, 'month')
+    assert data['summary']['total_revenue'] == 147000.0
+    assert data['summary']['total_invoices'] == 4
+    # Per day with sales, whatever the grouping
+    assert data['summary']['average_revenue_per_day'] == 36750.0
+    assert [(p['MaSP'], p['total_quantity'], p['total_revenue']) for p in data['top_products']] == [
+        ('SP001', 3, 75000.0), ('SP004', 9, 72000.0)
+    ]
+
+
+def test_unknown_group_by_is_rejected(api):
+    response = api('get', '/api/reports/sales?from_date=2025-01-01&to_date=2025-01-31&group_by=year')
+    assert response.status_code == 400
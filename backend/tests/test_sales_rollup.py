@@ -0,0 +1,69 @@
+"""Hourly/daily sales rollups (user-023)"""
+
+from datetime import datetime
+
+from app import db
+from app.models import ChieuTongHop, KyTongHop, TongHopBanHang
+from app.services import sales_rollup
+
+from tests.test_stock_ledger import _legacy_history
+
+
+def _rows():
+    return {
+        (r.Ky, r.Chieu, r.ThoiDiem, r.Khoa): (
+            r.SoHoaDon, r.SoLuong, float(r.DoanhThu), r.SoLuongTra, float(r.GiaTriTra)
+        )
+        for r in TongHopBanHang.query.all()
+    }
+
+
+def _day(rows, khoa, day):
+    return rows[(KyTongHop.NGAY, ChieuTongHop.SAN_PHAM, day, khoa)]
+
+
+def _rebuilt_rows():
+    sales_rollup.rebuild()
+    db.session.commit()
+    return _rows()
+
+
+def test_sale_and_return_update_rollups(api, app_context):
+    sold = api('post', '/api/sales/invoices', as_='cashier', json={
+        'items': [{'MaSP': 'SP004', 'SoLuong': 3}],
+    })
+    assert sold.status_code == 201
+    returned = api('post', '/api/sales/returns', as_='cashier', json={
+        'ma_hd': sold.get_json()['data']['MaHD'], 'ly_do': 'Hỏng',
+        'items': [{'MaSP': 'SP004', 'SoLuong': 2}],
+    })
+    assert returned.status_code == 201, returned.get_json()
+
+    with app_context():
+        rows = _rows()
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        assert _day(rows, 'SP004', today) == (1, 3, 24000.0, 2, 16000.0)
+        assert rows[(KyTongHop.NGAY, ChieuTongHop.THU_NGAN, today, 'TN001')][3] == 2
+        # Rebuilding from history gives the rows kept incrementally
+        assert _rebuilt_rows() == rows
+
+
+def test_rebuild_counts_returns_missing_from_the_ledger(app_context):
+    with app_context():
+        _legacy_history()
+        rows = _rebuilt_rows()
+        assert _day(rows, 'SP004', datetime(2024, 12, 2)) == (1, 4, 32000.0, 0, 0.0)
+        # PNK002's batch holds 10, capped at the 4 bought on HD001
+        assert _day(rows, 'SP004', datetime(2024, 12, 3)) == (0, 0, 0.0, 4, 32000.0)
+        assert rows[(KyTongHop.GIO, ChieuTongHop.LOAI_SP, datetime(2024, 12, 3, 10), 'Đồ uống')][3:] \
+            == (4, 32000.0)
+
+
+def test_migration_fills_the_rollup_like_rebuild(app_context, migrate_up):
+    with app_context():
+        _legacy_history()
+        expected = _rebuilt_rows()
+    migrate_up('8c1e4b7a9f30', drop=['TongHopBanHang'])
+
+    with app_context():
+        assert _rows() == expected
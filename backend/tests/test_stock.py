@@ -0,0 +1,107 @@
+"""Atomic conditional stock updates (user-004)"""
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.models import LoaiBienDong, LoSP, PhieuXuatKho
+from app.services import InsufficientStockError, decrement_batches, increment_batches
+
+
+def _stock(ma_sp, ma_lo):
+    return db.session.get(LoSP, (ma_sp, ma_lo), populate_existing=True).SLTon
+
+
+def test_decrement_is_all_or_nothing(app_context):
+    with app_context():
+        lo001 = db.session.get(LoSP, ('SP001', 'LO001'))
+        lo004 = db.session.get(LoSP, ('SP004', 'LO004'))
+        db.session.add(PhieuXuatKho(MaPhieu='PXK900', MucDich='Xuất kho'))
+        db.session.flush()
+
+        with pytest.raises(InsufficientStockError) as error:
+            decrement_batches([(lo001, 5), (lo004, 6), (lo004, 6)], loai=LoaiBienDong.XUAT_KHO)
+        assert error.value.shortages == [
+            {'MaSP': 'SP004', 'MaLo': 'LO004', 'requested': 12, 'available': 10}
+        ]
+        assert _stock('SP001', 'LO001') == 500
+        # The caller's unit of work is left to the caller
+        assert db.session.get(PhieuXuatKho, 'PXK900') is not None
+
+
+def test_decrement_checks_the_current_stock_not_the_loaded_one(app_context):
+    with app_context():
+        stale = db.session.get(LoSP, ('SP004', 'LO004'))
+        assert stale.SLTon == 10
+        # Another lane sells 8 units meanwhile
+        db.session.execute(
+            LoSP.__table__.update()
+            .where(LoSP.MaLo == 'LO004')
+            .values(SLTon=LoSP.SLTon - 8)
+        )
+
+        with pytest.raises(InsufficientStockError):
+            decrement_batches([(stale, 5)], loai=LoaiBienDong.BAN_HANG)
+        assert _stock('SP004', 'LO004') == 2
+
+
+def test_decrement_respects_the_warehouse_filter(app_context):
+    with app_context():
+        lo003 = db.session.get(LoSP, ('SP003', 'LO003'))
+        with pytest.raises(InsufficientStockError) as error:
+            decrement_batches([(lo003, 1)], ma_kho_ids={'KHO001'}, loai=LoaiBienDong.BAN_HANG)
+        assert error.value.shortages[0]['available'] == 0
+
+
+def test_increment_adds_to_the_stored_value(app_context):
+    with app_context():
+        batch = db.session.get(LoSP, ('SP004', 'LO004B'))
+        increment_batches([(batch, 5), (batch, 2)], ma_kho='KHO001', loai=LoaiBienDong.NHAP_KHO)
+        db.session.commit()
+        assert db.session.get(LoSP, ('SP004', 'LO004B')).SLTon == 107
+
+
+def test_last_units_are_sold_only_once(api, app_context):
+    first = api('post', '/api/sales/invoices', as_='cashier', json={
+        'items': [{'MaSP': 'SP004', 'MaLo': 'LO004', 'SoLuong': 6}],
+    })
+    second = api('post', '/api/sales/invoices', as_='cashier', json={
+        'items': [{'MaSP': 'SP004', 'MaLo': 'LO004', 'SoLuong': 6}],
+    })
+    assert first.status_code == 201
+    assert second.status_code == 400
+    assert 'tồn: 4' in second.get_json()['error']
+    with app_context():
+        assert db.session.get(LoSP, ('SP004', 'LO004')).SLTon == 4
+
+
+def test_export_reports_remaining_stock_without_rereading_batches(api, app_context):
+    statements = []
+
+    def capture(conn, cursor, statement, *args):
+        statements.append(' '.join(statement.split()))
+
+    with app_context():
+        event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        response = api('post', '/api/warehouse/export', json={'MaKho': 'KHO001', 'items': [
+            {'MaSP': 'SP001', 'MaLo': 'LO001', 'SoLuong': 5},
+            {'MaSP': 'SP004', 'MaLo': 'LO004B', 'SoLuong': 3},
+            {'MaSP': 'SP004', 'MaLo': 'LO004B', 'SoLuong': 4},
+        ]})
+    finally:
+        with app_context():
+            event.remove(db.engine, 'before_cursor_execute', capture)
+
+    assert response.status_code == 201, response.get_json()
+    assert [i['SLTonConLai'] for i in response.get_json()['data']['items']] == [495, 93, 93]
+    update = next(i for i, sql in enumerate(statements) if sql.startswith('UPDATE "LoSP"'))
+    assert not [sql for sql in statements[update:] if sql.startswith('SELECT') and 'FROM "LoSP"' in sql]
+
+
+def test_discard_reports_remaining_stock(api):
+    response = api('post', '/api/warehouse_inventory/discard', json={
+        'LyDo': 'Hỏng', 'items': [{'MaSP': 'SP003', 'MaLo': 'LO003', 'SoLuong': 20}],
+    })
+    assert response.status_code == 201, response.get_json()
+    assert response.get_json()['data']['discarded_items'][0]['SLTonConLai'] == 30
@@ -0,0 +1,98 @@
+"""Append-only stock movement ledger (user-021)"""
+
+from datetime import datetime
+
+from sqlalchemy import func
+
+from app import db
+from app.models import (
+    BienDongKho, LoaiBienDong, LoSP, HoaDon, HoaDonSP, PhieuNhapKho, PhieuXuatKho,
+    YeuCauTraHang
+)
+
+
+def _ledger_matches_stock():
+    sums = dict(
+        ((r.MaSP, r.MaLo), r.total) for r in db.session.query(
+            BienDongKho.MaSP, BienDongKho.MaLo, func.sum(BienDongKho.SoLuong).label('total')
+        ).group_by(BienDongKho.MaSP, BienDongKho.MaLo)
+    )
+    return all(sums.get((b.MaSP, b.MaLo), 0) == b.SLTon for b in LoSP.query.all())
+
+
+def test_every_stock_change_is_written_to_the_ledger(api, app_context):
+    imported = api('post', '/api/warehouse/import', json={
+        'MaKho': 'KHO001', 'items': [{'MaSP': 'SP004', 'MaLo': 'LO004B', 'SoLuong': 20}],
+    })
+    assert imported.status_code == 201
+    sold = api('post', '/api/sales/invoices', as_='cashier', json={
+        'items': [{'MaSP': 'SP004', 'SoLuong': 15}],
+    })
+    assert sold.status_code == 201
+
+    with app_context():
+        assert _ledger_matches_stock()
+        loai = [row.Loai for row in BienDongKho.query.filter_by(MaSP='SP004').all()]
+        assert loai.count(LoaiBienDong.NHAP_KHO) == 1
+        assert loai.count(LoaiBienDong.BAN_HANG) == 2  # FEFO: 10 from LO004, 5 from LO004B
+
+    history = api('get', '/api/reports/batch-history?ma_sp=SP004&ma_lo=LO004B').get_json()['data']
+    assert [h['type'] for h in history['history']] == ['opening_balance', 'import', 'sale']
+    assert history['history'][-1]['ton_sau'] == 115
+
+
+def test_movement_report_uses_ledger_quantities(api):
+    api('post', '/api/warehouse/import', json={
+        'MaKho': 'KHO001', 'items': [{'MaSP': 'SP001', 'MaLo': 'LO001', 'SoLuong': 40}],
+    })
+    today = datetime.utcnow().strftime('%Y-%m-%d')
+    data = api('get', f'/api/reports/warehouse-movements?from_date={today}&to_date={today}')\
+        .get_json()['data']
+    assert [m['SoLuong'] for m in data['movements']['imports']] == [40]
+
+
+def _legacy_history():
+    """Slips, invoice and return written the pre-ledger way (no BienDongKho rows)"""
+    db.session.add_all([
+        PhieuNhapKho(MaPhieu='PNK001', NgayTao=datetime(2024, 12, 1, 8), MucDich='Nhập hàng từ nhà cung cấp'),
+        PhieuXuatKho(MaPhieu='PXK001', NgayTao=datetime(2024, 12, 2, 9), MucDich='Xuất bán hàng',
+                     MaThamChieu='HD001'),
+        YeuCauTraHang(MaYC='YC001', NgayTao=datetime(2024, 12, 3, 10), LyDo='Hỏng'),
+        PhieuNhapKho(MaPhieu='PNK002', NgayTao=datetime(2024, 12, 3, 10), MucDich='Khách trả hàng',
+                     MaThamChieu='HD001'),
+    ])
+    db.session.flush()
+    db.session.add(HoaDon(MaHD='HD001', NgayTao=datetime(2024, 12, 2, 9), MaNVThuNgan='TN001',
+                          MaYCTraHang='YC001'))
+    db.session.add(HoaDonSP(MaHD='HD001', MaSP='SP004', SoLuong=4, DonGia=8000))
+    LoSP.query.get(('SP001', 'LO001')).MaPhieuNK = 'PNK001'
+    LoSP.query.get(('SP004', 'LO004B')).MaPhieuXK = 'PXK001'
+    LoSP.query.get(('SP004', 'LO004')).MaPhieuNK = 'PNK002'
+    db.session.commit()
+
+
+def test_migration_backfills_history_from_slips(api, app_context, migrate_up):
+    with app_context():
+        _legacy_history()
+    migrate_up('5a9c3e71d2b8', drop=['BienDongKho'])
+
+    with app_context():
+        assert _ledger_matches_stock()
+        rows = {(r.MaPhieu, r.Loai): r for r in BienDongKho.query.all() if r.MaPhieu}
+        assert rows[('PNK001', LoaiBienDong.NHAP_KHO)].SoLuong == 500
+        assert rows[('PNK001', LoaiBienDong.NHAP_KHO)].ThoiGian == datetime(2024, 12, 1, 8)
+        assert rows[('PXK001', LoaiBienDong.BAN_HANG)].SoLuong == -100
+        assert rows[('PNK002', LoaiBienDong.TRA_HANG)].MaThamChieu == 'HD001'
+
+    period = 'from_date=2024-12-01&to_date=2024-12-31'
+    movements = api('get', f'/api/reports/warehouse-movements?{period}').get_json()['data']
+    assert {m['MaPhieu'] for m in movements['movements']['imports']} == {'PNK001', 'PNK002'}
+    assert [m['MaPhieu'] for m in movements['movements']['exports']] == ['PXK001']
+
+    returns = api('get', f'/api/reports/returns?{period}').get_json()['data']
+    assert [(r['MaPhieu'], r['MaLo'], r['GiaBan']) for r in returns['returns']] == [
+        ('PNK002', 'LO004', 8000.0)
+    ]
+
+    activities = api('get', f'/api/reports/warehouse-activities?{period}').get_json()['data']
+    assert {a['MaPhieu'] for a in activities['activities']} == {'PNK001', 'PXK001', 'PNK002'}
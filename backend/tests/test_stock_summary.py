@@ -0,0 +1,77 @@
+"""Per product/warehouse stock summary kept with LoSP (user-025)"""
+
+from app import db
+from app.commands import stock_summary_cli
+from app.models import LoaiBienDong, LoSP, TonKhoTongHop
+from app.services import stock_summary
+
+
+def _row(ma_sp, ma_kho):
+    return db.session.get(TonKhoTongHop, (ma_sp, ma_kho))
+
+
+def test_stock_changes_keep_the_summary_in_step(api, app_context):
+    assert api('post', '/api/warehouse/import', json={
+        'MaKho': 'KHO001', 'items': [{'MaSP': 'SP004', 'MaLo': 'LO004B', 'SoLuong': 20}],
+    }).status_code == 201
+    assert api('post', '/api/sales/invoices', as_='cashier', json={
+        'items': [{'MaSP': 'SP004', 'SoLuong': 15}, {'MaSP': 'SP001', 'SoLuong': 2}],
+    }).status_code == 201
+    assert api('put', '/api/products/SP004', json={'GiaBan': 9000}).status_code == 200
+
+    with app_context():
+        assert stock_summary.check() == []
+        row = _row('SP004', 'KHO001')
+        assert (row.SLTon, row.SoLo) == (115, 2)
+        assert row.GiaTri == 115 * 9000
+        assert _row('SP001', 'KHO001').SLTon == 498
+        assert stock_summary.totals(['SP001', 'SP004']) == {'SP001': 498, 'SP004': 115}
+        assert stock_summary.totals(ma_kho_ids=['KHO002']) == {'SP003': 50}
+
+
+def test_rollback_discards_pending_changes(app_context):
+    with app_context():
+        db.session.get(LoSP, ('SP001', 'LO001')).SLTon = 1
+        stock_summary.track(db.session, LoaiBienDong.BAN_HANG, [('SP001', 'KHO001', -499)])
+        db.session.rollback()
+        db.session.commit()
+        assert _row('SP001', 'KHO001').SLTon == 500
+        assert stock_summary.check() == []
+
+
+def test_check_reports_drift_and_rebuild_repairs_it(flask_app, app_context):
+    with app_context():
+        _row('SP003', 'KHO002').SLTon = 7
+        db.session.delete(_row('SP001', 'KHO001'))
+        db.session.commit()
+
+        differences = {d['MaSP']: d for d in stock_summary.check()}
+        assert set(differences) == {'SP001', 'SP003'}
+        assert differences['SP001']['actual'] is None
+        assert differences['SP003']['expected']['SLTon'] == 50
+
+    runner = flask_app.test_cli_runner()
+    result = runner.invoke(stock_summary_cli, ['check'])
+    assert result.exit_code == 1
+    assert '2 rows differ' in result.output
+
+    result = runner.invoke(stock_summary_cli, ['rebuild'])
+    assert result.exit_code == 0, result.output
+    assert runner.invoke(stock_summary_cli, ['check']).exit_code == 0
+
+
+def test_migration_backfills_the_summary(app_context, migrate_up):
+    with app_context():
+        expected = sorted(
+            (r.MaSP, r.MaKho, r.SLTon, r.SoLo, r.HSDSomNhat, float(r.GiaTri))
+            for r in TonKhoTongHop.query.all()
+        )
+    migrate_up('d3f7a2c58e14', drop=['TonKhoTongHop'])
+
+    with app_context():
+        assert sorted(
+            (r.MaSP, r.MaKho, r.SLTon, r.SoLo, r.HSDSomNhat, float(r.GiaTri))
+            for r in TonKhoTongHop.query.all()
+        ) == expected
+        assert len(expected) == 3
+        assert stock_summary.check() == []
@@ -0,0 +1,49 @@
+"""Warehouse resolution by LoaiKho from an in-memory registry (user-001)"""
+
+from app import db
+from app.models import KhoHang, LoaiKho
+from app.services import warehouse_registry
+
+
+def _sell(api, ma_sp='SP004', so_luong=2):
+    response = api('post', '/api/sales/invoices', as_='cashier', json={
+        'items': [{'MaSP': ma_sp, 'SoLuong': so_luong}],
+    })
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['data']['MaHD']
+
+
+def test_registry_groups_warehouses_by_type(app_context):
+    with app_context():
+        assert warehouse_registry.normal_ids() == {'KHO001'}
+        assert warehouse_registry.defect_ids() == {'KHO002'}
+        assert warehouse_registry.get_default('Kho lỗi')['MaKho'] == 'KHO002'
+        assert warehouse_registry.is_type('KHO002', LoaiKho.KHO_LOI)
+        assert not warehouse_registry.is_type('KHO001', 'Kho lỗi')
+        assert warehouse_registry.get('KHO404') is None
+
+
+def test_new_warehouse_is_visible_after_commit(app_context):
+    with app_context():
+        warehouse_registry.load()
+        db.session.add(KhoHang(MaKho='KHO003', Loai=LoaiKho.KHO_THUONG, SucChua=100))
+        db.session.commit()
+        assert warehouse_registry.normal_ids() == {'KHO001', 'KHO003'}
+
+
+def test_return_goes_to_the_requested_warehouse_type(api):
+    ma_hd = _sell(api)
+    response = api('post', '/api/sales/returns', as_='cashier', json={
+        'ma_hd': ma_hd, 'items': [{'MaSP': 'SP004', 'SoLuong': 1}], 'kho_nhap': 'Kho lỗi',
+    })
+    assert response.status_code == 201, response.get_json()
+    assert response.get_json()['data']['MaKhoNhap'] == 'KHO002'
+
+
+def test_return_rejects_warehouse_of_another_type(api):
+    ma_hd = _sell(api)
+    response = api('post', '/api/sales/returns', as_='cashier', json={
+        'ma_hd': ma_hd, 'items': [{'MaSP': 'SP004', 'SoLuong': 1}],
+        'kho_nhap': 'Kho lỗi', 'ma_kho_nhap': 'KHO001',
+    })
+    assert response.status_code == 400
@@ -0,0 +1,35 @@
+"""Warm-up before accepting traffic (user-019)"""
+
+from app import db
+from app.services import barcode_index
+from app.utils.warmup import warm_up, warmup_state
+
+
+def test_ready_only_after_warm_up(flask_app, client, api, queries):
+    warmup_state.reset()
+    assert client.get('/api/health').status_code == 200
+    assert client.get('/api/health/ready').status_code == 503
+
+    stats = warm_up(flask_app, db)
+    assert set(stats['stages']) == {'mappers', 'pool', 'caches', 'statements'}
+    assert stats['errors'] == {}
+
+    ready = client.get('/api/health/ready')
+    assert ready.status_code == 200
+    assert ready.get_json()['data']['ready'] is True
+
+    # Caches are primed: the first scan needs no query
+    scan = api('post', '/api/sales/scan-barcode', as_='cashier', json={'barcode': '8936012345001'})
+    assert scan.status_code == 200
+    assert queries(scan) == 0
+
+
+def test_failing_stage_is_reported_without_blocking_readiness(flask_app, database, monkeypatch):
+    def broken():
+        raise RuntimeError("index unavailable")
+
+    monkeypatch.setattr(barcode_index, 'warm', broken)
+    stats = warm_up(flask_app, db)
+    assert stats['ready'] is True
+    assert stats['errors'] == {'caches': 'index unavailable'}
+    assert 'statements' in stats['stages']
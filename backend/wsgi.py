@@ -0,0 +1,16 @@
+"""
+Production WSGI entry point
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Ứng dụng được tạo và warm-up ngay khi import; với preload_app (gunicorn.conf.py)
+việc này chạy một lần trong master trước khi fork và trước khi mở cổng, nên
+server chỉ nhận request sau khi warm-up xong.
+"""
+
+import os
+from app import create_app, db
+from app.utils.warmup import warm_up
+
+app = create_app(os.getenv('FLASK_ENV', 'production'))
+warm_up(app, db)
@@ -97,7 +97,8 @@ export default function Reports() {
 
     const [forecastFilters, setForecastFilters] = useState({
         ma_sp: '',
-        days: 30
+        days: 30,
+        method: 'ewma'
     })
 
     const [activitiesFilters, setActivitiesFilters] = useState({
@@ -987,12 +988,14 @@ export default function Reports() {
                                     {/* Daily sales */}
                                     {salesReport.daily_sales?.length > 0 && (
                                         <div>
-                                            <h3 className="text-lg font-semibold mb-2">Doanh thu theo ngày</h3>
+                                            <h3 className="text-lg font-semibold mb-2">
+                                                Doanh thu theo {{ week: 'tuần', month: 'tháng' }[salesReport.group_by] || 'ngày'}
+                                            </h3>
                                             <div className="border rounded-lg">
                                                 <Table>
                                                     <TableHeader>
                                                         <TableRow>
-                                                            <TableHead>Ngày</TableHead>
+                                                            <TableHead>{{ week: 'Tuần từ ngày', month: 'Tháng từ ngày' }[salesReport.group_by] || 'Ngày'}</TableHead>
                                                             <TableHead className="text-right">Doanh thu</TableHead>
                                                             <TableHead className="text-right">Số lượng</TableHead>
                                                             <TableHead className="text-right">Số hóa đơn</TableHead>
@@ -1259,7 +1262,7 @@ export default function Reports() {
                         </CardHeader>
                         <CardContent className="space-y-4">
                             {/* Filters */}
-                            <div className="grid grid-cols-1 md:grid-cols-3 gap-4">
+                            <div className="grid grid-cols-1 md:grid-cols-4 gap-4">
                                 <div className="space-y-2">
                                     <Label>Mã sản phẩm</Label>
                                     <Input
@@ -1281,6 +1284,24 @@ export default function Reports() {
                                         min="7"
                                     />
                                 </div>
+                                <div className="space-y-2">
+                                    <Label>Phương pháp</Label>
+                                    <Select
+                                        value={forecastFilters.method}
+                                        onValueChange={(value) =>
+                                            setForecastFilters({ ...forecastFilters, method: value })
+                                        }
+                                    >
+                                        <SelectTrigger>
+                                            <SelectValue />
+                                        </SelectTrigger>
+                                        <SelectContent>
+                                            <SelectItem value="average">Trung bình</SelectItem>
+                                            <SelectItem value="ewma">Làm trơn lũy thừa</SelectItem>
+                                            <SelectItem value="seasonal">Theo thứ trong tuần</SelectItem>
+                                        </SelectContent>
+                                    </Select>
+                                </div>
                                 <div className="space-y-2">
                                     <Label>&nbsp;</Label>
                                     <Button onClick={loadStockForecast} className="w-full" disabled={loading}>
@@ -1347,9 +1368,16 @@ export default function Reports() {
                                                             <TableCell className="text-right">{item.daily_average_sales}</TableCell>
                                                             <TableCell className="text-right">
                                                                 {item.days_until_out_of_stock !== null ? (
-                                                                    <span className={item.urgency === 'critical' ? 'text-red-600 font-bold' : ''}>
-                                                                        {item.days_until_out_of_stock}
-                                                                    </span>
+                                                                    <>
+                                                                        <span className={item.urgency === 'critical' ? 'text-red-600 font-bold' : ''}>
+                                                                            {item.days_until_out_of_stock}
+                                                                        </span>
+                                                                        {item.confidence_band?.earliest != null && item.confidence_band?.latest != null && (
+                                                                            <div className="text-xs text-muted-foreground">
+                                                                                {item.confidence_band.earliest} - {item.confidence_band.latest}
+                                                                            </div>
+                                                                        )}
+                                                                    </>
                                                                 ) : (
                                                                     <span className="text-muted-foreground">-</span>
                                                                 )}
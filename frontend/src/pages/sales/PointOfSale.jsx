@@ -64,6 +64,7 @@ export default function PointOfSale() {
     const [searchQuery, setSearchQuery] = useState('')
     const [searchResults, setSearchResults] = useState([])
     const [searching, setSearching] = useState(false)
+    const [nextCursor, setNextCursor] = useState(null)
 
     // Barcode scanner
     const [barcodeInput, setBarcodeInput] = useState('')
@@ -111,10 +112,13 @@ export default function PointOfSale() {
         return new Date(dateString).toLocaleDateString('vi-VN')
     }
 
-    // Search products
-    const handleSearch = async () => {
+    // Search products (keyset pages, no exact count - type-ahead friendly)
+    const handleSearch = async (cursor = null) => {
+        const loadingMore = typeof cursor === 'string'
+
         if (!searchQuery.trim()) {
             setSearchResults([])
+            setNextCursor(null)
             return
         }
 
@@ -122,13 +126,17 @@ export default function PointOfSale() {
             setSearching(true)
             const response = await salesService.searchProducts({
                 search: searchQuery,
-                per_page: 10
+                per_page: 10,
+                cursor: loadingMore ? cursor : '',
+                count: 'none'
             })
 
-            const items = response.data?.items || response.items || []
-            setSearchResults(items)
+            const data = response.data || response
+            const items = data.items || []
+            setSearchResults(prev => loadingMore ? [...prev, ...items] : items)
+            setNextCursor(data.has_more ? data.next_cursor : null)
 
-            if (items.length === 0) {
+            if (!loadingMore && items.length === 0) {
                 toast({
                     title: 'Không tìm thấy',
                     description: 'Không có sản phẩm nào khớp với tìm kiếm',
@@ -141,7 +149,10 @@ export default function PointOfSale() {
                 description: error.response?.data?.message || 'Không thể tìm kiếm sản phẩm',
                 variant: 'destructive',
             })
-            setSearchResults([])
+            if (!loadingMore) {
+                setSearchResults([])
+            }
+            setNextCursor(null)
         } finally {
             setSearching(false)
         }
@@ -297,6 +308,7 @@ export default function PointOfSale() {
 
         setShowProductDialog(false)
         setSearchResults([])
+        setNextCursor(null)
         setSearchQuery('')
 
         setTimeout(() => {
@@ -540,6 +552,18 @@ export default function PointOfSale() {
                                             ))}
                                         </TableBody>
                                     </Table>
+                                    {nextCursor && (
+                                        <div className="p-2 text-center border-t">
+                                            <Button
+                                                variant="ghost"
+                                                size="sm"
+                                                onClick={() => handleSearch(nextCursor)}
+                                                disabled={searching}
+                                            >
+                                                Xem thêm
+                                            </Button>
+                                        </div>
+                                    )}
                                 </div>
                             )}
                         </CardContent>